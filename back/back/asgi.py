@@ -17,16 +17,16 @@ django_asgi_app = get_asgi_application()
 
 # Channelsのインポート
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
 
 # WebSocketルーティングのインポート
 from core import routing
+from core.ws_auth import TokenAuthMiddlewareStack
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
-        AuthMiddlewareStack(
+        TokenAuthMiddlewareStack(
             URLRouter(
                 routing.websocket_urlpatterns
             )
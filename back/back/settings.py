@@ -122,6 +122,8 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'core.profiling.PerfMiddleware',  # API のレイテンシ/SQL 計測（PERF_*）
+    'core.notification_buffer.NotificationBufferMiddleware',  # WebSocket 通知をリクエスト終了時にまとめて送信
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Railway用静的ファイル配信
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -156,17 +158,36 @@ WSGI_APPLICATION = 'back.wsgi.application'
 # Channels用ASGI設定
 ASGI_APPLICATION = 'back.asgi.application'
 
-# Channelsレイヤー設定（開発環境用）
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'  # 開発環境用
-        # 本番環境では以下を使用
-        # 'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        # 'CONFIG': {
-        #     "hosts": [('127.0.0.1', 6379)],
-        # },
-    },
-}
+# Channelsレイヤー設定
+# CHANNEL_REDIS_URL があれば Redis（全プロセス共有。通知が別ワーカーの WebSocket 接続にも届く）、
+# なければプロセス内（開発環境用）
+CHANNEL_REDIS_URL = os.getenv('CHANNEL_REDIS_URL', '')
+if CHANNEL_REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [CHANNEL_REDIS_URL],
+                'prefix': os.getenv('CHANNEL_LAYER_PREFIX', 'trumee'),
+                'capacity': int(os.getenv('CHANNEL_LAYER_CAPACITY', '100')),
+                'expiry': 60,
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        },
+    }
+
+# WebSocket 通知のバッファ（core.notification_buffer）
+NOTIFICATION_BUFFER_MAX = int(os.getenv('NOTIFICATION_BUFFER_MAX', '1000'))  # リクエスト内でこの件数を超えたら途中で送信
+NOTIFICATION_BATCH_MAX = int(os.getenv('NOTIFICATION_BATCH_MAX', '50'))  # 1回の group_send にまとめるイベント数
+
+# WebSocket 接続の生存確認（core.consumers）
+WS_HEARTBEAT_INTERVAL = int(os.getenv('WS_HEARTBEAT_INTERVAL', '30'))  # サーバーから heartbeat を送る間隔（秒）
+WS_IDLE_TIMEOUT = int(os.getenv('WS_IDLE_TIMEOUT', '90'))  # クライアントから何も届かなければ切断するまでの秒数（0 で無効）
 
 # ====== Database ======
 # 環境変数による動的データベース設定
@@ -251,16 +272,30 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # ====== REST Framework ======
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',  # DRF Token認証をメインに
+        'core.authentication.CachedTokenAuthentication',  # DRF Token認証をメインに（core.auth_cache）
         'rest_framework.authentication.SessionAuthentication',  # ブラウザ用セッション認証
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # ?cursor= 指定時はキーセット、それ以外は従来のページ番号方式
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.CursorOrPageNumberPagination',
     'PAGE_SIZE': 20,
+    # レート制限（core.ratelimit のスロットルが scope ごとに参照。'回数/期間' 例: 10/10m）
+    'DEFAULT_THROTTLE_RATES': {
+        'login': os.getenv('THROTTLE_LOGIN', '10/10m'),
+        'interview_personalize': os.getenv('THROTTLE_INTERVIEW_PERSONALIZE', '10/m'),
+        'resume_pdf_download': os.getenv('THROTTLE_RESUME_PDF_DOWNLOAD', '10/m'),
+        'resume_pdf_send': os.getenv('THROTTLE_RESUME_PDF_SEND', '5/10m'),
+    },
+    # X-Forwarded-For の信頼するプロキシ段数。既定 0 は REMOTE_ADDR を使う（ヘッダーは偽装できるため信頼しない）。
+    # Railway 等のリバースプロキシ配下ではプロキシの段数（通常 1）を NUM_PROXIES で指定する
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
 }
 
+# レート制限のバックエンド（auto: Redis キャッシュ設定時は Redis、それ以外はプロセス内）
+RATELIMIT_BACKEND = os.getenv('RATELIMIT_BACKEND', 'auto')
+
 # ====== Logging ======
 LOGGING = {
     'version': 1,
@@ -304,6 +339,27 @@ else:
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@trumeee.com')
 SERVER_EMAIL = os.getenv('SERVER_EMAIL', 'noreply@trumeee.com')
 
+# 送信キュー（EmailOutbox）: API は行を追加するだけで、送信は別プロセスの
+# `python manage.py send_outbox_emails --loop` が行う（Procfile の worker、Docker / railway では start_workers.sh が起動）
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '8'))
+EMAIL_OUTBOX_RETRY_BASE = int(os.getenv('EMAIL_OUTBOX_RETRY_BASE', '60'))  # 秒（失敗ごとに倍）
+EMAIL_OUTBOX_RETRY_MAX = int(os.getenv('EMAIL_OUTBOX_RETRY_MAX', '21600'))  # 秒
+EMAIL_OUTBOX_LOCK_TIMEOUT = int(os.getenv('EMAIL_OUTBOX_LOCK_TIMEOUT', '600'))  # sending のまま放置された行を戻すまでの秒数
+EMAIL_OUTBOX_POLL_INTERVAL = float(os.getenv('EMAIL_OUTBOX_POLL_INTERVAL', '5'))
+# 添付 PDF のレンダリング待ちで再試行するまでの秒数（attempts は増やさない）
+EMAIL_OUTBOX_ATTACHMENT_WAIT = int(os.getenv('EMAIL_OUTBOX_ATTACHMENT_WAIT', '15'))
+EMAIL_OUTBOX_ATTACHMENT_MAX_WAIT = int(os.getenv('EMAIL_OUTBOX_ATTACHMENT_MAX_WAIT', '3600'))  # これを過ぎたら通常の失敗
+
+# Stripe Webhook のイベントキュー（StripeEvent）: Webhook はイベントを登録するだけで、反映は別プロセスの
+# `python manage.py process_stripe_events --loop` が行う（Procfile の stripe_worker、Docker / railway では start_workers.sh が起動）
+# ワーカーを動かせない環境では STRIPE_EVENTS_PROCESS_INLINE=true で Webhook のコミット後にその場で反映する
+STRIPE_EVENTS_PROCESS_INLINE = os.getenv('STRIPE_EVENTS_PROCESS_INLINE', 'false').lower() == 'true'
+STRIPE_EVENTS_MAX_ATTEMPTS = int(os.getenv('STRIPE_EVENTS_MAX_ATTEMPTS', '10'))
+STRIPE_EVENTS_RETRY_BASE = int(os.getenv('STRIPE_EVENTS_RETRY_BASE', '30'))  # 秒（失敗ごとに倍）
+STRIPE_EVENTS_RETRY_MAX = int(os.getenv('STRIPE_EVENTS_RETRY_MAX', '3600'))  # 秒
+STRIPE_EVENTS_LOCK_TIMEOUT = int(os.getenv('STRIPE_EVENTS_LOCK_TIMEOUT', '300'))  # processing のまま放置された行を戻すまでの秒数
+STRIPE_EVENTS_POLL_INTERVAL = float(os.getenv('STRIPE_EVENTS_POLL_INTERVAL', '2'))
+
 # フロントエンドURL（メール内のリンク用）
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:3000')
 
@@ -311,12 +367,88 @@ DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@trumeee.com')
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:3000')
 
 # ====== Cache Configuration ======
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# REDIS_URL があれば全ワーカー共有の Redis、なければプロセス内の LocMemCache
+REDIS_URL = os.getenv('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'trumee'),
+            'TIMEOUT': 300,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                'SOCKET_CONNECT_TIMEOUT': 2,
+                'SOCKET_TIMEOUT': 2,
+                # Redis 障害時はキャッシュミスとして扱い、リクエストは失敗させない
+                'IGNORE_EXCEPTIONS': True,
+            },
+        }
     }
-}
+    DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
+    }
+
+# レスポンスキャッシュのヒット/ミス数を数えるリクエストの割合（0 で集計しない、1 で全件）
+RESPONSE_CACHE_STATS_RATE = float(os.getenv('RESPONSE_CACHE_STATS_RATE', '0.1'))
+
+# ====== Authentication Cache ======
+# トークン → ユーザーの解決結果をプロセス内にキャッシュ（core.auth_cache）
+# 失効（ユーザースタンプ）は上記キャッシュで共有するため、既定では Redis 設定時と DEBUG 時のみ有効
+AUTH_CACHE_ENABLED = os.getenv('AUTH_CACHE_ENABLED', 'true' if (REDIS_URL or DEBUG) else 'false').lower() == 'true'
+AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', '60'))  # 秒
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', '10000'))  # プロセスあたりのトークン数
+
+# ====== Message Long-polling ======
+# advice_messages / company_messages の ?wait=（core.message_sync）。同期ワーカーを塞ぐため短く保つ
+# （リアルタイムの新着は WebSocket の message_created で受け取る）
+MESSAGES_LONG_POLL_MAX = float(os.getenv('MESSAGES_LONG_POLL_MAX', '2'))  # wait の上限秒数（0 で待たない）
+
+# ====== Full-text Search ======
+# auto: DBに応じて自動選択（PostgreSQL: tsvector + pg_trgm / SQLite: FTS5）
+# 明示指定: postgres / sqlite_fts5 / basic（icontains フォールバック）
+FULLTEXT_BACKEND = os.getenv('FULLTEXT_BACKEND', 'auto')
+# fulltext.search() 単独で取得する最大件数（関連度順に上位のみ）。
+# 他の条件と組み合わせる求職者検索は fulltext.ranked_entries() で採点・ページングまで DB 側で行い、この上限はかからない
+FULLTEXT_MAX_RESULTS = int(os.getenv('FULLTEXT_MAX_RESULTS', '1000'))
+
+# ====== Matching Engine ======
+# ベクトル次元（build_matching_vectors 実行時の値が MLModel.parameters に記録される）
+MATCHING_VECTOR_DIM = int(os.getenv('MATCHING_VECTOR_DIM', '256'))
+# 件数が MATCHING_IVF_MIN_ROWS 以上なら IVF（近似）で探索。?exact=1 で全件走査
+MATCHING_USE_IVF = os.getenv('MATCHING_USE_IVF', 'true').lower() == 'true'
+MATCHING_IVF_MIN_ROWS = int(os.getenv('MATCHING_IVF_MIN_ROWS', '5000'))
+MATCHING_IVF_LISTS = int(os.getenv('MATCHING_IVF_LISTS', '0'))  # 0 = sqrt(件数)
+MATCHING_IVF_PROBES = int(os.getenv('MATCHING_IVF_PROBES', '8'))
+# 求人・求職者の変更後、各プロセスのインデックスをバックグラウンドで作り直す最短間隔（秒。変更がなければ作り直さない）
+MATCHING_INDEX_REFRESH_SECONDS = float(os.getenv('MATCHING_INDEX_REFRESH_SECONDS', '30'))
+# 再計算待ち（matching_stale）のベクトルを build_matching_vectors --stale --loop が確認する間隔（秒）
+MATCHING_STALE_POLL_INTERVAL = float(os.getenv('MATCHING_STALE_POLL_INTERVAL', '10'))
+
+# ====== Performance Instrumentation ======
+# /api/ 配下のリクエストを PERF_SAMPLE_RATE の割合で計測（/api/v2/admin/perf/ で確認）
+PERF_ENABLED = os.getenv('PERF_ENABLED', 'true').lower() == 'true'
+PERF_SAMPLE_RATE = float(os.getenv('PERF_SAMPLE_RATE', '1.0' if DEBUG else '0.05'))
+PERF_BUFFER_SIZE = int(os.getenv('PERF_BUFFER_SIZE', '1000'))  # URL 名ごとの保持件数
+PERF_PATH_PREFIXES = ('/api/',)
+# cProfile を取る割合（計測対象のうち）と出力先。0 で無効
+PERF_PROFILE_RATE = float(os.getenv('PERF_PROFILE_RATE', '0'))
+PERF_PROFILE_DIR = os.getenv('PERF_PROFILE_DIR', '')  # 空なら一時ディレクトリ/trumee-profiles
+PERF_PROFILE_KEEP = int(os.getenv('PERF_PROFILE_KEEP', '50'))
+
+# ====== Resume PDF Rendering ======
+# 同じ resumeData の PDF は内容ハッシュでキャッシュ（prune_pdf_cache で古いものを削除）
+# Web を複数台・ワーカーを別サービスで動かす場合は共有ボリュームを指定する（ジョブの状態もここに置く）
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', os.path.join(BASE_DIR, 'pdf_cache'))
+# レンダリング用プロセス数（0 ならリクエスト内で同期レンダリング）
+PDF_RENDER_WORKERS = int(os.getenv('PDF_RENDER_WORKERS', '2'))
+PDF_RENDER_TIMEOUT = int(os.getenv('PDF_RENDER_TIMEOUT', '120'))
+PDF_CACHE_MAX_AGE_DAYS = float(os.getenv('PDF_CACHE_MAX_AGE_DAYS', '7'))
 
 # ====== Session Configuration ======
 SESSION_COOKIE_AGE = 86400  # 24時間
@@ -9,8 +9,12 @@ from .models import (
     ActivityLog, MLModel, MLPrediction,
     InterviewQuestion, PromptTemplate,
     JobCapPlan, JobTicketLedger, TicketConsumption,
+    EmailOutbox, Notification, MessageThread, StripeEvent,
 )
 from .utils_templates import render_prompt_with_resume
+from .user_stats import rebuild_user_stats
+from .email_outbox import requeue_dead
+from .stripe_events import requeue_dead as requeue_dead_stripe_events
 from .models import Resume
 
 
@@ -92,16 +96,19 @@ class ApplicationAdmin(admin.ModelAdmin):
     
     def mark_as_viewed(self, request, queryset):
         queryset.update(status='viewed')
+        rebuild_user_stats(set(queryset.values_list('company_id', flat=True)))
         self.message_user(request, f"{queryset.count()}件の応募を閲覧済みにしました。")
     mark_as_viewed.short_description = "選択した応募を閲覧済みにする"
     
     def mark_as_accepted(self, request, queryset):
         queryset.update(status='accepted')
+        rebuild_user_stats(set(queryset.values_list('company_id', flat=True)))
         self.message_user(request, f"{queryset.count()}件の応募を採用にしました。")
     mark_as_accepted.short_description = "選択した応募を採用にする"
     
     def mark_as_rejected(self, request, queryset):
         queryset.update(status='rejected')
+        rebuild_user_stats(set(queryset.values_list('company_id', flat=True)))
         self.message_user(request, f"{queryset.count()}件の応募を不採用にしました。")
     mark_as_rejected.short_description = "選択した応募を不採用にする"
 
@@ -250,3 +257,56 @@ class TicketConsumptionAdmin(admin.ModelAdmin):
     list_filter = ['consumed_at']
     search_fields = ['seeker__email', 'ledger__job_posting__title']
     raw_id_fields = ['ledger', 'seeker', 'scout', 'application']
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    """メール送信キュー"""
+    list_display = ['subject', 'category', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status', 'category']
+    search_fields = ['subject', 'to']
+    readonly_fields = ['created_at', 'sent_at', 'locked_at', 'last_error']
+    exclude = ['attachments']
+
+    actions = ['requeue']
+
+    def requeue(self, request, queryset):
+        count = requeue_dead(queryset.values_list('id', flat=True))
+        self.message_user(request, f"{count}件の送信不可メールを再送対象に戻しました。")
+    requeue.short_description = "選択した送信不可メールを再送する"
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    """Stripe Webhook イベント（process_stripe_events コマンドが反映）"""
+    list_display = ['event_id', 'event_type', 'status', 'result', 'attempts', 'next_attempt_at', 'created_at', 'processed_at']
+    list_filter = ['status', 'event_type', 'result']
+    search_fields = ['event_id']
+    readonly_fields = ['event_id', 'event_type', 'payload', 'created_at', 'processed_at', 'locked_at', 'last_error']
+
+    actions = ['requeue']
+
+    def requeue(self, request, queryset):
+        count = requeue_dead_stripe_events(queryset.values_list('id', flat=True))
+        self.message_user(request, f"{count}件の処理不可イベントを再処理対象に戻しました。")
+    requeue.short_description = "選択した処理不可イベントを再処理する"
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    """ユーザー向け通知（未読件数は NotificationCounter。ずれたら rebuild_notification_counters）"""
+    list_display = ['user', 'kind', 'title', 'is_read', 'created_at']
+    list_filter = ['kind', 'is_read']
+    search_fields = ['user__email', 'title']
+    raw_id_fields = ['user']
+    readonly_fields = ['created_at', 'read_at']
+
+
+@admin.register(MessageThread)
+class MessageThreadAdmin(admin.ModelAdmin):
+    """添削スレッドの概要（Message から集計。ずれたら rebuild_message_threads）"""
+    list_display = ['user', 'subject', 'kind', 'thread_key', 'messages_count', 'unresolved', 'last_message_at']
+    list_filter = ['kind', 'subject', 'unresolved']
+    search_fields = ['user__email', 'thread_key']
+    raw_id_fields = ['user', 'staff', 'annotation', 'last_message']
+    readonly_fields = ['updated_at']
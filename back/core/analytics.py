@@ -0,0 +1,232 @@
+"""
+管理者分析の日次ロールアップ
+
+- build_rollups(): 日ごとのイベント件数（登録・ログイン・支払い）を TruncDate の GROUP BY で、
+  最終日の状態スナップショット（総数・プラン・ログイン状況・年齢分布）を条件付き集計
+  （Count(filter=Q(...))）でテーブルごとに1クエリずつ求め、AnalyticsDailyRollup に保存する
+- analytics_summary(): 昨日までのロールアップ + 今日分の差分（User / Payment に各1クエリ）で
+  admin_analytics_summary の応答を組み立てる
+"""
+import datetime
+from typing import Dict, Optional
+
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+# ロールアップを保持・参照する日数（payments_recent の最長期間）
+ROLLUP_DAYS = 90
+TREND_DAYS = 30
+PLAN_TIERS = ('starter', 'standard', 'premium')
+AGE_BUCKETS = (('under20', None, 20), ('20s', 20, 30), ('30s', 30, 40), ('40s', 40, 50), ('50_plus', 50, None))
+
+
+def day_start(day: datetime.date) -> datetime.datetime:
+    """現在のタイムゾーンでの day の 0:00"""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def _years_before(day: datetime.date, years: int) -> datetime.date:
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:  # 2/29
+        return day.replace(year=day.year - years, day=28)
+
+
+def _user_state_aggregates(prefix: str = '', base: Optional[Q] = None) -> dict:
+    """User の総数・プラン分布を求める条件付き集計式（base 指定時はその条件も満たす行のみ）"""
+    def count(condition: Optional[Q] = None) -> Count:
+        if base is not None:
+            condition = base if condition is None else base & condition
+        return Count('id', filter=condition) if condition is not None else Count('id')
+
+    aggregates = {
+        f'{prefix}users': count(),
+        f'{prefix}seekers': count(Q(role='user')),
+        f'{prefix}companies': count(Q(role='company')),
+        f'{prefix}active': count(Q(is_active=True)),
+        f'{prefix}premium': count(Q(is_premium=True)),
+        f'{prefix}plan_none': count(Q(plan_tier='')),
+    }
+    for tier in PLAN_TIERS:
+        aggregates[f'{prefix}plan_{tier}'] = count(Q(plan_tier=tier))
+    return aggregates
+
+
+def _split_state(row: dict, prefix: str = '') -> tuple:
+    totals = {k: row[f'{prefix}{k}'] or 0 for k in ('users', 'seekers', 'companies', 'active', 'premium')}
+    plans = {'none': row[f'{prefix}plan_none'] or 0}
+    plans.update({tier: row[f'{prefix}plan_{tier}'] or 0 for tier in PLAN_TIERS})
+    return totals, plans
+
+
+def compute_snapshot(day: datetime.date) -> dict:
+    """day 終了時点のスナップショット（User・SeekerProfile に各1クエリ）"""
+    from .models import User, SeekerProfile
+
+    ref = day_start(day + datetime.timedelta(days=1))
+    users = User.objects.filter(created_at__lt=ref).aggregate(
+        **_user_state_aggregates(),
+        login_within_7d=Count('id', filter=Q(last_login__gte=ref - datetime.timedelta(days=7))),
+        login_within_30d=Count('id', filter=Q(last_login__gte=ref - datetime.timedelta(days=30))),
+        login_within_90d=Count('id', filter=Q(last_login__gte=ref - datetime.timedelta(days=90))),
+        login_none=Count('id', filter=Q(last_login__isnull=True)),
+        login_older_90d=Count('id', filter=Q(last_login__lt=ref - datetime.timedelta(days=90))),
+    )
+    totals, plans = _split_state(users)
+
+    # 年齢 = 誕生日の範囲条件に置き換えて DB 側で集計
+    age_aggregates = {}
+    for name, min_age, max_age in AGE_BUCKETS:
+        condition = Q(birthday__isnull=False)
+        if min_age is not None:
+            condition &= Q(birthday__lte=_years_before(day, min_age))
+        if max_age is not None:
+            condition &= Q(birthday__gt=_years_before(day, max_age))
+        age_aggregates[name] = Count('id', filter=condition)
+    ages = SeekerProfile.objects.filter(user__created_at__lt=ref).aggregate(**age_aggregates)
+    ages = {name: ages[name] or 0 for name, _, _ in AGE_BUCKETS}
+    ages['unknown'] = max(0, totals['seekers'] - sum(ages.values()))
+
+    return {
+        'totals': totals,
+        'plan_distribution': plans,
+        'login_recency': {
+            'within_7d': users['login_within_7d'] or 0,
+            'within_30d': users['login_within_30d'] or 0,
+            'within_90d': users['login_within_90d'] or 0,
+            'none': users['login_none'] or 0,
+            'older_90d': users['login_older_90d'] or 0,
+        },
+        'age_buckets': ages,
+    }
+
+
+def compute_daily_events(start: datetime.date, end: datetime.date) -> Dict[datetime.date, dict]:
+    """start〜end（両端含む）の日別イベント件数"""
+    from .models import User, Payment
+
+    lower, upper = day_start(start), day_start(end + datetime.timedelta(days=1))
+    events: Dict[datetime.date, dict] = {}
+
+    def row(day):
+        return events.setdefault(day, {
+            'registrations': 0, 'seeker_registrations': 0, 'company_registrations': 0,
+            'logins': 0, 'payments': 0,
+        })
+
+    registrations = (
+        User.objects.filter(created_at__gte=lower, created_at__lt=upper)
+        .annotate(d=TruncDate('created_at')).values('d')
+        .annotate(total=Count('id'), seekers=Count('id', filter=Q(role='user')),
+                  companies=Count('id', filter=Q(role='company')))
+        .order_by()
+    )
+    for r in registrations:
+        row(r['d']).update(registrations=r['total'], seeker_registrations=r['seekers'],
+                           company_registrations=r['companies'])
+
+    logins = (
+        User.objects.filter(last_login__gte=lower, last_login__lt=upper)
+        .annotate(d=TruncDate('last_login')).values('d').annotate(total=Count('id')).order_by()
+    )
+    for r in logins:
+        row(r['d'])['logins'] = r['total']
+
+    payments = (
+        Payment.objects.filter(created_at__gte=lower, created_at__lt=upper)
+        .annotate(d=TruncDate('created_at')).values('d').annotate(total=Count('id')).order_by()
+    )
+    for r in payments:
+        row(r['d'])['payments'] = r['total']
+    return events
+
+
+def build_rollups(start: datetime.date, end: datetime.date) -> int:
+    """start〜end のロールアップを作成・更新する（スナップショットは end の行にのみ保存）"""
+    from .models import AnalyticsDailyRollup
+
+    events = compute_daily_events(start, end)
+    empty = {'registrations': 0, 'seeker_registrations': 0, 'company_registrations': 0, 'logins': 0, 'payments': 0}
+    rows = []
+    day = start
+    while day <= end:
+        rows.append(AnalyticsDailyRollup(date=day, computed_at=timezone.now(), **events.get(day, empty)))
+        day += datetime.timedelta(days=1)
+    AnalyticsDailyRollup.objects.bulk_create(
+        rows, batch_size=500, update_conflicts=True, unique_fields=['date'],
+        update_fields=list(empty.keys()) + ['computed_at'],
+    )
+    AnalyticsDailyRollup.objects.filter(date=end).update(snapshot=compute_snapshot(end), computed_at=timezone.now())
+    return len(rows)
+
+
+def ensure_rollups(today: Optional[datetime.date] = None) -> None:
+    """昨日分までのロールアップがなければ不足分を作成する（定期実行が止まっていた場合の保険）"""
+    from .models import AnalyticsDailyRollup
+
+    today = today or timezone.localdate()
+    yesterday = today - datetime.timedelta(days=1)
+    latest = AnalyticsDailyRollup.objects.exclude(snapshot={}).order_by('-date').values_list('date', flat=True).first()
+    if latest is not None and latest >= yesterday:
+        return
+    start = today - datetime.timedelta(days=ROLLUP_DAYS)
+    if latest is not None:
+        start = max(start, latest + datetime.timedelta(days=1))
+    build_rollups(start, yesterday)
+
+
+def analytics_summary(now: Optional[datetime.datetime] = None) -> dict:
+    """ロールアップ + 今日の差分から管理者分析サマリを作る"""
+    from .models import User, Payment, AnalyticsDailyRollup
+
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    ensure_rollups(today)
+
+    rollups = list(AnalyticsDailyRollup.objects.filter(date__gte=today - datetime.timedelta(days=ROLLUP_DAYS - 1), date__lt=today))
+    by_date = {r.date: r for r in rollups}
+    latest = max((r for r in rollups if r.snapshot), key=lambda r: r.date, default=None)
+    snapshot = latest.snapshot if latest else compute_snapshot(today - datetime.timedelta(days=1))
+
+    # 今日の差分（User / Payment に各1クエリ）
+    start = day_start(today)
+    delta = User.objects.filter(Q(created_at__gte=start) | Q(last_login__gte=start)).aggregate(
+        **_user_state_aggregates('new_', base=Q(created_at__gte=start)),
+        logins_today=Count('id', filter=Q(last_login__gte=start)),
+    )
+    new_totals, new_plans = _split_state(delta, 'new_')
+    payments_today = Payment.objects.filter(created_at__gte=start).count()
+
+    totals = {k: snapshot['totals'].get(k, 0) + new_totals[k] for k in new_totals}
+    plan_distribution = {k: snapshot['plan_distribution'].get(k, 0) + new_plans[k] for k in new_plans}
+
+    registrations_trend = []
+    for i in range(TREND_DAYS):
+        day = today - datetime.timedelta(days=TREND_DAYS - 1 - i)
+        count = new_totals['users'] if day == today else (by_date[day].registrations if day in by_date else 0)
+        registrations_trend.append({'date': day.isoformat(), 'count': int(count)})
+
+    def payments_since(days: int) -> int:
+        since = today - datetime.timedelta(days=days - 1)
+        return payments_today + sum(r.payments for r in rollups if r.date >= since)
+
+    return {
+        'totals': totals,
+        'plan_distribution': plan_distribution,
+        'login_recency': snapshot['login_recency'],
+        'registrations_trend': registrations_trend,
+        'age_buckets': snapshot['age_buckets'],
+        'payments_recent': {
+            'last_30d': payments_since(30),
+            'last_90d': payments_since(90),
+        },
+        'today': {
+            'registrations': new_totals['users'],
+            'logins': delta['logins_today'] or 0,
+            'payments': payments_today,
+        },
+        # login_recency / age_buckets はこの日付終了時点の値
+        'rollup_date': latest.date.isoformat() if latest else None,
+        'generated_at': now,
+    }
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # シグナルハンドラ（非正規化テーブルの同期など）を登録
+        from . import signals  # noqa: F401
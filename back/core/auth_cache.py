@@ -0,0 +1,237 @@
+"""
+認証結果のプロセス内キャッシュ（DRF Token / JWT）
+
+トークンごとの DB 参照（Token と User の JOIN、JWT の User 取得）を省く。
+
+- キー: トークンの SHA-256（トークン本体は保持しない）
+- 値: ユーザーの具体フィールドの値（リクエストごとに新しい User インスタンスに復元する）、
+  JWT の payload、キャッシュ時のユーザースタンプ
+- 失効: AUTH_CACHE_TTL 秒 / LRU（AUTH_CACHE_SIZE 件）/ ユーザースタンプの変化
+- ユーザースタンプ: Django キャッシュ（REDIS_URL 設定時は全ワーカー共有）に置くランダム値。
+  User の保存・削除、Token の削除（ログアウト）、QuerySet.update での変更時に bump_user_stamp で更新する。
+  スタンプが消えた（追い出された）場合も新しい値になるため、古いエントリは一致しない
+- 正しさのため、スタンプは必ず DB 参照より前に読む（DB 参照後に保存された変更を取りこぼさない）。
+  Token は初回リクエストでは所有者がわからないため、2回目以降からキャッシュが効く
+
+AUTH_CACHE_ENABLED の既定値は REDIS_URL 設定時または DEBUG 時のみ有効
+（プロセス内キャッシュしかない複数ワーカー構成では、他ワーカーでの失効が伝わらないため）。
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+STAMP_KEY_PREFIX = 'auth_user_stamp'
+
+
+class _Entry(NamedTuple):
+    user_id: object
+    stamp: Optional[str]  # None は所有者のヒントのみ（次回のリクエストからキャッシュする）
+    fields: Optional[dict]
+    payload: Optional[dict]
+    expires: float
+
+
+def enabled() -> bool:
+    return getattr(settings, 'AUTH_CACHE_ENABLED', False)
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+# ============================================================
+# ユーザースタンプ
+# ============================================================
+
+def _stamp_key(user_id) -> str:
+    return f'{STAMP_KEY_PREFIX}:{user_id}'
+
+
+def user_stamp(user_id) -> str:
+    """user_id の現在のスタンプ（未作成なら作成する）"""
+    key = _stamp_key(user_id)
+    stamp = cache.get(key)
+    if stamp is None:
+        fresh = uuid.uuid4().hex
+        if cache.add(key, fresh, timeout=None):
+            return fresh
+        # キャッシュ障害時は毎回新しい値になり、キャッシュは使われない（安全側）
+        stamp = cache.get(key) or fresh
+    return stamp
+
+
+def bump_user_stamp(*user_ids) -> None:
+    """ユーザーのキャッシュ済み認証情報を無効にする（全ワーカー）
+
+    保存の直後と、トランザクションのコミット後の2回更新する
+    （コミット前の古い値を読んだリクエストが新しいスタンプでキャッシュしないように）。
+    """
+    user_ids = [uid for uid in user_ids if uid]
+    if not user_ids:
+        return
+
+    def bump():
+        cache.set_many({_stamp_key(uid): uuid.uuid4().hex for uid in user_ids}, timeout=None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+# ============================================================
+# LRU / TTL キャッシュ
+# ============================================================
+
+class _LRU:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: _Entry) -> None:
+        size = max(1, getattr(settings, 'AUTH_CACHE_SIZE', 10000))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'enabled': enabled(),
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else None,
+            }
+
+
+_cache = _LRU()
+
+
+def stats() -> dict:
+    return _cache.stats()
+
+
+def clear() -> None:
+    _cache.clear()
+
+
+def discard_token(token: str) -> None:
+    _cache.discard(token_hash(token))
+
+
+def _snapshot(user) -> dict:
+    return {f.attname: getattr(user, f.attname) for f in user._meta.concrete_fields}
+
+
+def _restore(fields: dict):
+    from .models import User
+    return User.from_db('default', list(fields), list(fields.values()))
+
+
+def _store(key: str, user_id, stamp: Optional[str], user, payload: Optional[dict]) -> None:
+    ttl = getattr(settings, 'AUTH_CACHE_TTL', 60)
+    _cache.set(key, _Entry(
+        user_id=user_id,
+        stamp=stamp,
+        fields=_snapshot(user) if stamp is not None and user is not None else None,
+        payload=payload,
+        expires=time.monotonic() + ttl,
+    ))
+
+
+# ============================================================
+# 認証
+# ============================================================
+
+def user_for_token(key: str):
+    """DRF Token のキーからユーザーを返す（見つからなければ None。is_active の確認は呼び出し側）"""
+    from rest_framework.authtoken.models import Token
+
+    ck = token_hash(key)
+    entry = _cache.get(ck)
+    stamp = user_stamp(entry.user_id) if entry is not None else None
+    if entry is not None and entry.stamp is not None and entry.stamp == stamp:
+        _cache.count(True)
+        return _restore(entry.fields)
+
+    _cache.count(False)
+    token = Token.objects.select_related('user').filter(key=key).first()
+    if token is None:
+        _cache.discard(ck)
+        return None
+    # スタンプは DB 参照前に読んだもののみ使う（所有者が変わることはないが念のため一致を確認）
+    _store(ck, token.user_id, stamp if entry is not None and entry.user_id == token.user_id else None, token.user, None)
+    return token.user
+
+
+def user_for_jwt(token: str, decode):
+    """JWT からユーザーと payload を返す
+
+    decode(token) は検証済み payload を返すか jwt.InvalidTokenError を送出する。
+    ユーザーが見つからなければ (None, payload)。
+    """
+    from .models import User
+
+    ck = token_hash(token)
+    entry = _cache.get(ck)
+    if entry is not None and entry.payload is not None:
+        exp = entry.payload.get('exp')
+        if exp is not None and time.time() >= exp:
+            # 有効期限切れは decode に判定させる（ExpiredSignatureError）
+            _cache.discard(ck)
+            entry = None
+    payload = entry.payload if entry is not None else decode(token)
+    user_id = payload.get('user_id')
+    if not user_id:
+        return None, payload
+
+    stamp = user_stamp(user_id)
+    if entry is not None and entry.stamp == stamp and entry.fields is not None:
+        _cache.count(True)
+        return _restore(entry.fields), payload
+
+    _cache.count(False)
+    user = User.objects.filter(id=user_id).first()
+    if user is None:
+        _cache.discard(ck)
+        return None, payload
+    _store(ck, user_id, stamp, user, payload)
+    return user, payload
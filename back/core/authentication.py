@@ -1,13 +1,18 @@
 """
 Custom JWT Authentication for Django REST Framework
 Uses custom JWT tokens generated in views_api_v2.py
+
+Both classes resolve users through core.auth_cache when AUTH_CACHE_ENABLED is set.
 """
-from rest_framework.authentication import BaseAuthentication
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
 import jwt
 import os
 
+from . import auth_cache
+
 User = get_user_model()
 
 JWT_SECRET = os.getenv("JWT_SECRET_KEY", "default-secret-key-change-in-production")
@@ -37,27 +42,49 @@ class JWTAuthentication(BaseAuthentication):
         
         # Verify token using PyJWT (same as views_api_v2.py)
         try:
-            # Decode and validate the token
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-            
-            # Get user from database
-            user_id = payload.get('user_id')
-            if not user_id:
-                raise AuthenticationFailed("Token is invalid or expired")
-            
-            try:
-                user = User.objects.get(id=user_id)
-                if not user.is_active:
-                    raise AuthenticationFailed("User is not active")
-                
-                return (user, token)
-            except User.DoesNotExist:
-                raise AuthenticationFailed("User not found")
-                
+            if auth_cache.enabled():
+                user, payload = auth_cache.user_for_jwt(token, self._decode)
+            else:
+                payload = self._decode(token)
+                user_id = payload.get('user_id')
+                user = User.objects.filter(id=user_id).first() if user_id else None
         except jwt.ExpiredSignatureError:
             raise AuthenticationFailed("Token is invalid or expired")
         except jwt.InvalidTokenError:
             raise AuthenticationFailed("Token is invalid or expired")
+
+        if not payload.get('user_id'):
+            raise AuthenticationFailed("Token is invalid or expired")
+        if user is None:
+            raise AuthenticationFailed("User not found")
+        if not user.is_active:
+            raise AuthenticationFailed("User is not active")
+        return (user, token)
+    
+    @staticmethod
+    def _decode(token):
+        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     
     def authenticate_header(self, request):
-        return 'Bearer'
\ No newline at end of file
+        return 'Bearer'
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    DRF Token authentication that skips the Token/User join for recently seen tokens
+    (see core.auth_cache for how revocation is kept intact)
+    """
+    
+    def authenticate_credentials(self, key):
+        if not auth_cache.enabled():
+            return super().authenticate_credentials(key)
+        
+        user = auth_cache.user_for_token(key)
+        if user is None:
+            raise AuthenticationFailed(_('Invalid token.'))
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        
+        token = self.get_model()(key=key, user_id=user.pk)
+        token.user = user
+        return (user, token)
@@ -0,0 +1,100 @@
+"""
+条件付き GET（ETag / Last-Modified → 304 Not Modified）
+
+応答本文をシリアライズせずに、updated_at などの軽いクエリから検証子を作る。
+- 単体: ETag = (id, updated_at)、Last-Modified = updated_at
+- 一覧: ETag = (max(updated_at), count)、Last-Modified = max(updated_at)
+一致すれば 304 を返し、ビュー本体（とシリアライズ）を実行しない。
+判定は django.utils.cache.get_conditional_response（If-None-Match / If-Modified-Since）に任せる。
+
+- 関数ビュー: @conditional_get(validator)（@api_view / @permission_classes の内側、@cached_response の外側）
+- ViewSet: ConditionalGetMixin の get_validators() を実装する（list / retrieve に適用）
+
+validator は (etag の材料 or ETag 文字列, last_modified の datetime) か、判定しない場合 None を返す。
+材料（tuple）からの ETag にはパス・クエリ文字列・閲覧ユーザーを含める（同じ行でも応答が変わるため）。
+"""
+import functools
+import hashlib
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+CONDITIONAL_METHODS = ('GET', 'HEAD')
+
+
+def make_etag(request, *parts) -> str:
+    """parts とリクエスト（パス・クエリ・ユーザー）から弱い ETag を作る"""
+    user = getattr(request, 'user', None)
+    viewer = str(user.pk) if user is not None and user.is_authenticated else 'anon'
+    raw = '|'.join([request.path, request.META.get('QUERY_STRING', ''), viewer] + [str(p) for p in parts])
+    return 'W/' + quote_etag(hashlib.sha1(raw.encode('utf-8')).hexdigest())
+
+
+def _normalize(request, validators) -> Tuple[Optional[str], Optional[datetime]]:
+    etag, last_modified = validators
+    if etag is not None and not isinstance(etag, str):
+        etag = make_etag(request, *etag)
+    return etag, last_modified
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[int]:
+    return int(value.timestamp()) if value is not None else None
+
+
+def apply_validators(response, etag: Optional[str], last_modified: Optional[datetime]):
+    """200 応答に ETag / Last-Modified を付け、再検証を促す Cache-Control を設定する"""
+    if response.status_code != 200:
+        return response
+    if etag and not response.has_header('ETag'):
+        response['ETag'] = etag
+    if last_modified is not None and not response.has_header('Last-Modified'):
+        response['Last-Modified'] = http_date(_timestamp(last_modified))
+    # 認証ユーザーごとの応答を含むため共有キャッシュには置かせず、毎回検証させる
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def respond_conditionally(request, validators, render: Callable):
+    """validators が一致すれば 304、そうでなければ render() の応答に検証子を付けて返す"""
+    if request.method not in CONDITIONAL_METHODS or validators is None:
+        return render()
+    etag, last_modified = _normalize(request, validators)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=_timestamp(last_modified))
+    if not_modified is not None:
+        if etag:
+            not_modified['ETag'] = etag
+        patch_cache_control(not_modified, private=True, no_cache=True)
+        return not_modified
+    return apply_validators(render(), etag, last_modified)
+
+
+def conditional_get(validator: Callable):
+    """関数ビュー用デコレーター。validator(request, *args, **kwargs) は検証子か None を返す"""
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in CONDITIONAL_METHODS:
+                return view_func(request, *args, **kwargs)
+            return respond_conditionally(
+                request, validator(request, *args, **kwargs), lambda: view_func(request, *args, **kwargs)
+            )
+        return wrapper
+    return decorator
+
+
+class ConditionalGetMixin:
+    """ViewSet 用: list / retrieve で get_validators() による条件付き GET を行う"""
+
+    def get_validators(self):
+        """(etag の材料 or ETag, last_modified) か None（self.action で list / retrieve を判別する）"""
+        return None
+
+    def list(self, request, *args, **kwargs):
+        render = super().list
+        return respond_conditionally(request, self.get_validators(), lambda: render(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        render = super().retrieve
+        return respond_conditionally(request, self.get_validators(), lambda: render(request, *args, **kwargs))
@@ -1,21 +1,89 @@
+import asyncio
 import json
+import time
+import weakref
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from asgiref.sync import sync_to_async
+from rest_framework.utils.encoders import JSONEncoder
 
 User = get_user_model()
 
+# 切断時のクローズコード
+CLOSE_IDLE_TIMEOUT = 4408
+CLOSE_TOKEN_EXPIRED = 4401
+
+
+class _Heartbeat:
+    """イベントループごとに1つのタスクで、全接続へのハートビート送信とアイドル切断を行う
+
+    接続ごとにタイマーを持たないため、アイドル接続が数千あってもタスクは1つで済む。
+    """
+
+    def __init__(self):
+        self.consumers = set()
+        self.task = None
+
+    def register(self, consumer) -> None:
+        self.consumers.add(consumer)
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def unregister(self, consumer) -> None:
+        self.consumers.discard(consumer)
+
+    async def _run(self):
+        while self.consumers:
+            await asyncio.sleep(max(1.0, getattr(settings, 'WS_HEARTBEAT_INTERVAL', 30)))
+            now, wall = time.monotonic(), time.time()
+            await asyncio.gather(
+                *(consumer.heartbeat(now, wall) for consumer in list(self.consumers)),
+                return_exceptions=True,
+            )
+
+
+_heartbeats = weakref.WeakKeyDictionary()
+
+
+def _heartbeat() -> _Heartbeat:
+    loop = asyncio.get_running_loop()
+    heartbeat = _heartbeats.get(loop)
+    if heartbeat is None:
+        heartbeat = _heartbeats[loop] = _Heartbeat()
+    return heartbeat
+
 
 class NotificationConsumer(AsyncWebsocketConsumer):
     """
     WebSocketコンシューマー - リアルタイム通知用
+    
+    認証は core.ws_auth.TokenAuthMiddleware（接続時に1回だけユーザーを解決）。
+    接続中は scope のユーザーを使い回し、そのユーザーの通知グループにのみ参加する。
+    サーバーは WS_HEARTBEAT_INTERVAL 秒ごとに heartbeat を送り、
+    WS_IDLE_TIMEOUT 秒間クライアントから何も届かなければ切断する（クライアントは ping 等を返す）。
     """
     
+    room_group_name = None
+    
     async def connect(self):
         """WebSocket接続時の処理"""
-        self.user_id = self.scope['url_route']['kwargs']['user_id']
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        # URL の user_id は互換のため残す（認証ユーザー以外は拒否）
+        requested = self.scope['url_route']['kwargs'].get('user_id')
+        if requested and requested != str(user.id):
+            await self.close()
+            return
+        
+        self.user = user
+        self.user_id = str(user.id)
         self.room_group_name = f'notifications_{self.user_id}'
+        self.expires_at = self.scope.get('auth_expires_at')
+        self.last_seen = time.monotonic()
         
         # ユーザーを通知グループに追加
         await self.channel_layer.group_add(
@@ -23,24 +91,47 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
-        await self.accept()
+        await self.accept(subprotocol=self.scope.get('auth_subprotocol'))
+        _heartbeat().register(self)
         
         # 接続成功メッセージを送信
         await self.send(text_data=json.dumps({
             'type': 'connection_established',
-            'message': 'WebSocket connection established'
+            'message': 'WebSocket connection established',
+            'heartbeat_interval': getattr(settings, 'WS_HEARTBEAT_INTERVAL', 30),
+            'idle_timeout': getattr(settings, 'WS_IDLE_TIMEOUT', 90),
         }))
     
     async def disconnect(self, close_code):
         """WebSocket切断時の処理"""
+        if self.room_group_name is None:
+            return
+        _heartbeat().unregister(self)
         # ユーザーを通知グループから削除
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
     
-    async def receive(self, text_data):
+    async def heartbeat(self, now, wall):
+        """_Heartbeat から定期的に呼ばれる"""
+        idle_timeout = getattr(settings, 'WS_IDLE_TIMEOUT', 90)
+        if idle_timeout and now - self.last_seen > idle_timeout:
+            _heartbeat().unregister(self)
+            await self.close(code=CLOSE_IDLE_TIMEOUT)
+        elif self.expires_at and wall >= self.expires_at:
+            # JWT の有効期限切れ（再接続で新しいトークンを渡してもらう）
+            _heartbeat().unregister(self)
+            await self.close(code=CLOSE_TOKEN_EXPIRED)
+        else:
+            await self.send(text_data=json.dumps({'type': 'heartbeat', 'timestamp': int(wall)}))
+    
+    async def receive(self, text_data=None, bytes_data=None):
         """クライアントからメッセージを受信した時の処理"""
+        # どのフレームも生存確認として扱う（heartbeat への応答は任意の JSON でよい）
+        self.last_seen = time.monotonic()
+        if text_data is None:
+            return
         try:
             data = json.loads(text_data)
             message_type = data.get('type')
@@ -51,10 +142,25 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                     'type': 'pong',
                     'timestamp': data.get('timestamp')
                 }))
+            elif message_type == 'mark_read' and ('cursor' in data or 'until' in data or 'subject' in data):
+                # アドバイス系メッセージを cursor（メッセージ ID）/ until 以前まで一括で既読にする（subject 未指定なら全件名）
+                # 新しい未読件数は notifications_delta として全接続に届く
+                result = await self.mark_messages_read(data.get('subject'), data.get('cursor'), data.get('until'))
+                if result is None:
+                    await self.send(text_data=json.dumps({'type': 'error', 'message': 'Invalid cursor'}))
             elif message_type == 'mark_read':
-                # 通知を既読にする
-                notification_id = data.get('notification_id')
-                await self.mark_notification_read(notification_id)
+                # 通知を既読にする（notification_id / notification_ids / kind）
+                ids = data.get('notification_ids')
+                if ids is None and data.get('notification_id') is not None:
+                    ids = [data.get('notification_id')]
+                kinds = [data['kind']] if data.get('kind') else None
+                await self.mark_notification_read(ids, kinds)
+            elif message_type == 'sync':
+                # cursor より新しい通知と未読サマリを返す（以後は notifications_delta で差分を受け取る）
+                await self.send(text_data=json.dumps({
+                    'type': 'notifications_sync',
+                    **await self.notifications_since(data.get('cursor'))
+                }, cls=JSONEncoder))
         except json.JSONDecodeError:
             await self.send(text_data=json.dumps({
                 'type': 'error',
@@ -83,6 +189,13 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             'application': event['application']
         }))
     
+    async def application_status_update(self, event):
+        """応募ステータス更新通知"""
+        await self.send(text_data=json.dumps({
+            'type': 'application_status_update',
+            'application': event['application']
+        }))
+    
     async def message_notification(self, event):
         """メッセージ通知"""
         await self.send(text_data=json.dumps({
@@ -90,8 +203,64 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             'message': event['message']
         }))
     
+    async def message_created(self, event):
+        """会話の新着（core.message_sync）。本文は ?since= で取得してもらう"""
+        await self.send(text_data=json.dumps({
+            'type': 'message_created',
+            **{k: v for k, v in event.items() if k != 'type'}
+        }))
+    
+    async def notification_delta(self, event):
+        """永続化された通知の差分（作成・既読化。core.user_notifications）"""
+        await self.send(text_data=json.dumps({
+            'type': 'notifications_delta',
+            **{k: v for k, v in event.items() if k != 'type'}
+        }))
+    
+    async def notification_batch(self, event):
+        """まとめて送られた通知（core.notification_buffer）を1件ずつクライアントに送信"""
+        for item in event.get('events', []):
+            handler = getattr(self, str(item.get('type', '')).replace('.', '_'), None)
+            if handler is None or handler == self.notification_batch:
+                continue
+            await handler(item)
+    
+    @database_sync_to_async
+    def mark_notification_read(self, ids=None, kinds=None):
+        """通知を既読にする（結果は notifications_delta として全接続に届く）"""
+        from .user_notifications import mark_read
+        try:
+            ids = [int(i) for i in ids] if ids is not None else None
+        except (TypeError, ValueError):
+            return {}
+        return mark_read(self.user_id, ids=ids, kinds=kinds)
+    
     @database_sync_to_async
-    def mark_notification_read(self, notification_id):
-        """通知を既読にする（データベース操作）"""
-        # 実際の通知モデルがある場合はここで更新
-        pass
\ No newline at end of file
+    def mark_messages_read(self, subject=None, cursor=None, until=None):
+        """アドバイス系メッセージの範囲既読化（不正なカーソルなら None）"""
+        from django.utils import timezone
+        from django.utils.dateparse import parse_datetime
+        from .message_reads import CursorError, read_through
+        from .user_notifications import ADVICE_KINDS
+        try:
+            if until:
+                until = parse_datetime(str(until))
+                if until is None:
+                    return None
+                if timezone.is_naive(until):
+                    until = timezone.make_aware(until)
+            return read_through(
+                self.user_id, [subject] if subject in ADVICE_KINDS else ADVICE_KINDS, cursor=cursor, until=until,
+            )
+        except (CursorError, ValueError):
+            return None
+    
+    @database_sync_to_async
+    def notifications_since(self, cursor):
+        """cursor より新しい通知（データベース操作）"""
+        from .user_notifications import changes_since
+        try:
+            cursor = int(cursor or 0)
+        except (TypeError, ValueError):
+            cursor = 0
+        return changes_since(self.user_id, cursor)
\ No newline at end of file
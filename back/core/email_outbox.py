@@ -0,0 +1,249 @@
+"""
+メール送信キュー（アウトボックス）
+
+- enqueue(): API 側は EmailOutbox に1行追加するだけ（呼び出し元のトランザクションと一緒にコミットされる）
+- drain(): send_outbox_emails コマンドから呼ばれ、送信時刻に達した行をバッチで取り出し、
+  1つの SMTP 接続を使い回して送信する
+    - 失敗: attempts を増やし、EMAIL_OUTBOX_RETRY_BASE * 2^(attempts-1)（上限 EMAIL_OUTBOX_RETRY_MAX）
+      秒後に再試行。EMAIL_OUTBOX_MAX_ATTEMPTS 回失敗したら dead
+    - 送信中（sending）のままワーカーが落ちた行は EMAIL_OUTBOX_LOCK_TIMEOUT 秒後に pending へ戻す
+- 添付ファイル: content_b64（本体を base64 で保持）または pdf_job（core.pdf_render のジョブID。
+  送信時にレンダリング中なら attempts を増やさずに EMAIL_OUTBOX_ATTACHMENT_WAIT 秒後へ回す。
+  作成から EMAIL_OUTBOX_ATTACHMENT_MAX_WAIT 秒を過ぎたら通常の失敗として数える。
+  resume_data（元データ）も持つため、ジョブが見つからない（レンダリングした Web プロセスが落ちた、
+  PDF_CACHE_DIR を共有していない別サービスのワーカー）・失敗した場合はワーカーが自分でレンダリングする）
+"""
+import base64
+import datetime
+import logging
+import random
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50
+
+
+class AttachmentNotReady(Exception):
+    """添付する PDF のレンダリングが終わっていない（attempts を増やさずに再試行する）"""
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(to, subject: str, body: str = '', html_body: str = '', from_email: str = '',
+            attachments: Optional[List[dict]] = None, category: str = ''):
+    """送信待ちメールを1件登録して返す"""
+    from .models import EmailOutbox
+
+    recipients = [to] if isinstance(to, str) else [addr for addr in to if addr]
+    return EmailOutbox.objects.create(
+        to=recipients, subject=subject[:255], body=body, html_body=html_body,
+        from_email=from_email or '', attachments=attachments or [], category=category,
+    )
+
+
+def attachment_from_bytes(filename: str, content: bytes, mimetype: str = 'application/octet-stream') -> dict:
+    return {'filename': filename, 'mimetype': mimetype, 'content_b64': base64.b64encode(content).decode('ascii')}
+
+
+def attachment_from_pdf_job(filename: str, job_id: str, resume_data=None) -> dict:
+    """レンダリング中の PDF を添付する。resume_data（ジョブの元データ）があれば、ジョブが失われても送信時に作り直せる"""
+    spec = {'filename': filename, 'mimetype': 'application/pdf', 'pdf_job': job_id}
+    if resume_data is not None:
+        spec['resume_data'] = resume_data
+    return spec
+
+
+def retry_delay(attempts: int) -> float:
+    """attempts 回目の失敗後の待ち秒数（指数バックオフ + 最大 10% のジッタ）"""
+    base = _setting('EMAIL_OUTBOX_RETRY_BASE', 60)
+    delay = min(base * (2 ** max(0, attempts - 1)), _setting('EMAIL_OUTBOX_RETRY_MAX', 6 * 3600))
+    return delay * (1 + random.random() * 0.1)
+
+
+# ============================================================
+# 送信（ワーカー側）
+# ============================================================
+
+def release_stale_locks(now=None) -> int:
+    """sending のまま一定時間経った行を pending に戻す"""
+    from .models import EmailOutbox
+
+    now = now or timezone.now()
+    cutoff = now - datetime.timedelta(seconds=_setting('EMAIL_OUTBOX_LOCK_TIMEOUT', 600))
+    return EmailOutbox.objects.filter(status='sending', locked_at__lt=cutoff).update(
+        status='pending', locked_at=None, next_attempt_at=now,
+    )
+
+
+def claim_batch(batch_size: int = DEFAULT_BATCH_SIZE, now=None) -> list:
+    """送信時刻に達した行を sending にして返す（複数ワーカーでも同じ行を取らない）"""
+    from .models import EmailOutbox
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        # SQLite など行ロックがない DB 向けに status も条件に含める
+        EmailOutbox.objects.filter(id__in=ids, status='pending').update(status='sending', locked_at=now)
+    return list(EmailOutbox.objects.filter(id__in=ids, status='sending', locked_at=now).order_by('next_attempt_at'))
+
+
+def _resolve_attachment(spec: dict):
+    if 'pdf_job' in spec:
+        from . import pdf_render
+
+        job = pdf_render.job_status(spec['pdf_job'])
+        if job['status'] in (pdf_render.STATUS_UNKNOWN, pdf_render.STATUS_FAILED) and 'resume_data' in spec:
+            # レンダリングしたプロセスが落ちた・キャッシュを共有していない・プールで失敗した場合は、ここで作り直す
+            job = pdf_render.render_now(spec['resume_data'])
+        if job['status'] == pdf_render.STATUS_FAILED:
+            raise RuntimeError(f"PDF job {spec['pdf_job'][:12]} failed")
+        if job['status'] != pdf_render.STATUS_READY:
+            raise AttachmentNotReady(f"PDF job {spec['pdf_job'][:12]} is {job['status']}")
+        content = pdf_render.read_pdf(spec['pdf_job'])
+    else:
+        content = base64.b64decode(spec.get('content_b64') or '')
+    return spec.get('filename') or 'attachment', content, spec.get('mimetype') or 'application/octet-stream'
+
+
+def build_message(item, connection=None) -> EmailMultiAlternatives:
+    message = EmailMultiAlternatives(
+        subject=item.subject,
+        body=item.body,
+        from_email=item.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(item.to),
+        connection=connection,
+    )
+    if item.html_body:
+        message.attach_alternative(item.html_body, 'text/html')
+    for spec in item.attachments or []:
+        message.attach(*_resolve_attachment(spec))
+    return message
+
+
+def _mark_sent(item, now) -> None:
+    type(item).objects.filter(pk=item.pk).update(
+        status='sent', sent_at=now, attempts=item.attempts + 1, locked_at=None, last_error='',
+    )
+
+
+def _mark_deferred(item, error: Exception, now) -> None:
+    """添付の準備待ち: attempts を増やさずに EMAIL_OUTBOX_ATTACHMENT_WAIT 秒後に回す"""
+    type(item).objects.filter(pk=item.pk).update(
+        status='pending', locked_at=None,
+        next_attempt_at=now + datetime.timedelta(seconds=_setting('EMAIL_OUTBOX_ATTACHMENT_WAIT', 15)),
+        last_error=f'{error.__class__.__name__}: {error}'[:2000],
+    )
+
+
+def _attachment_wait_expired(item, now) -> bool:
+    # レンダリングが終わらないまま放置されたメールは通常の失敗として数える（無限に待たない）
+    limit = datetime.timedelta(seconds=_setting('EMAIL_OUTBOX_ATTACHMENT_MAX_WAIT', 3600))
+    return item.created_at is not None and now - item.created_at > limit
+
+
+def _mark_failed(item, error: Exception, now) -> str:
+    attempts = item.attempts + 1
+    status = 'dead' if attempts >= _setting('EMAIL_OUTBOX_MAX_ATTEMPTS', 8) else 'pending'
+    type(item).objects.filter(pk=item.pk).update(
+        status=status, attempts=attempts, locked_at=None,
+        next_attempt_at=now + datetime.timedelta(seconds=retry_delay(attempts)),
+        last_error=f'{error.__class__.__name__}: {error}'[:2000],
+    )
+    if status == 'dead':
+        logger.error(f"Email {item.pk} moved to dead letter after {attempts} attempts: {error}")
+    else:
+        logger.warning(f"Email {item.pk} failed (attempt {attempts}), will retry: {error}")
+    return status
+
+
+def deliver(items: Iterable, connection=None) -> dict:
+    """items を1つの接続で送信し、結果件数を返す"""
+    result = {'sent': 0, 'retry': 0, 'dead': 0}
+    items = list(items)
+    if not items:
+        return result
+    connection = connection or get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        # 接続できない場合はバッチ全体を再試行に回す
+        now = timezone.now()
+        for item in items:
+            result['dead' if _mark_failed(item, e, now) == 'dead' else 'retry'] += 1
+        return result
+    try:
+        for item in items:
+            now = timezone.now()
+            try:
+                build_message(item, connection).send()
+            except AttachmentNotReady as e:
+                if _attachment_wait_expired(item, now):
+                    result['dead' if _mark_failed(item, e, now) == 'dead' else 'retry'] += 1
+                else:
+                    _mark_deferred(item, e, now)
+                    result['retry'] += 1
+                continue
+            except Exception as e:
+                result['dead' if _mark_failed(item, e, now) == 'dead' else 'retry'] += 1
+                # SMTP 側で切断された可能性があるので接続し直す
+                try:
+                    connection.close()
+                    connection.open()
+                except Exception:
+                    pass
+                continue
+            _mark_sent(item, now)
+            result['sent'] += 1
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+    return result
+
+
+def drain(batch_size: int = DEFAULT_BATCH_SIZE, max_batches: Optional[int] = None) -> dict:
+    """送信可能な行がなくなる（または max_batches に達する）まで送信する"""
+    totals = {'sent': 0, 'retry': 0, 'dead': 0, 'released': release_stale_locks()}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        items = claim_batch(batch_size)
+        if not items:
+            break
+        for key, value in deliver(items).items():
+            totals[key] += value
+        batches += 1
+    return totals
+
+
+def requeue_dead(ids: Optional[Iterable] = None) -> int:
+    """dead の行を再送対象に戻す（ids 指定時はその行のみ）"""
+    from .models import EmailOutbox
+
+    qs = EmailOutbox.objects.filter(status='dead')
+    if ids is not None:
+        qs = qs.filter(id__in=list(ids))
+    return qs.update(status='pending', attempts=0, next_attempt_at=timezone.now(), last_error='')
+
+
+def purge_sent(older_than_days: float) -> int:
+    from .models import EmailOutbox
+
+    cutoff = timezone.now() - datetime.timedelta(days=older_than_days)
+    deleted, _ = EmailOutbox.objects.filter(status='sent', sent_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,167 @@
+"""
+管理者向け一覧のストリーミングエクスポート
+
+- ?format=ndjson|csv（または ?stream=1 で JSON 配列）で全件をストリーミングで返す
+- queryset.iterator(chunk_size) で行を読み、シリアライザーで1行ずつ変換して StreamingHttpResponse で返す
+  （prefetch_related はチャンク単位で実行される）。件数によらずメモリ使用量は一定
+- Accept-Encoding に gzip があればその場で gzip 圧縮する（?gzip=0 で無効）
+- DRF は ?format= をコンテンツネゴシエーションに使うため、対象ビューは
+  @renderer_classes(EXPORT_RENDERERS) で ndjson / csv を受け付ける
+"""
+import csv
+import io
+import json
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+DEFAULT_CHUNK_SIZE = 500
+# この大きさまで貯めてから圧縮・送信する
+FLUSH_BYTES = 64 * 1024
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json; charset=utf-8',
+}
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, cls=JSONEncoder, ensure_ascii=False)
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return _dumps(value)
+    return value
+
+
+# ============================================================
+# レンダラー（?format= のネゴシエーション用。エラー応答などの通常 Response もこれで描画される）
+# ============================================================
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(_dumps(row) + '\n' for row in rows).encode('utf-8')
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return ''.join(_csv_lines(data if isinstance(data, list) else [data])).encode('utf-8')
+
+
+EXPORT_RENDERERS = list(api_settings.DEFAULT_RENDERER_CLASSES) + [NDJSONRenderer, CSVRenderer]
+
+
+# ============================================================
+# 行のエンコード
+# ============================================================
+
+def _ndjson_lines(rows: Iterable[dict]) -> Iterator[str]:
+    for row in rows:
+        yield _dumps(row) + '\n'
+
+
+def _json_lines(rows: Iterable[dict]) -> Iterator[str]:
+    yield '['
+    for i, row in enumerate(rows):
+        yield (',\n' if i else '\n') + _dumps(row)
+    yield '\n]\n'
+
+
+def _csv_lines(rows: Iterable[dict]) -> Iterator[str]:
+    """1行目のキーを列とする（入れ子の値は JSON 文字列）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    columns = None
+    for row in rows:
+        if columns is None:
+            columns = list(row.keys())
+            writer.writerow(columns)
+        writer.writerow([_csv_value(row.get(c)) for c in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+ENCODERS = {'ndjson': _ndjson_lines, 'csv': _csv_lines, 'json': _json_lines}
+
+
+def _to_bytes(chunks: Iterable[str], compress: bool) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    pending, size = [], 0
+    for text in chunks:
+        data = text.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            out = b''.join(pending)
+            pending, size = [], 0
+            if compressor is not None:
+                out = compressor.compress(out)
+            if out:
+                yield out
+    out = b''.join(pending)
+    if compressor is not None:
+        out = compressor.compress(out) + compressor.flush()
+    if out:
+        yield out
+
+
+# ============================================================
+# ビューから使う
+# ============================================================
+
+def export_format(request) -> Optional[str]:
+    """ストリーミングで返すべきなら形式（ndjson / csv / json）、そうでなければ None"""
+    renderer = getattr(request, 'accepted_renderer', None)
+    fmt = getattr(renderer, 'format', None)
+    if fmt in ('ndjson', 'csv'):
+        return fmt
+    if request.query_params.get('stream') in ('1', 'true'):
+        return 'json' if fmt == 'json' else 'ndjson'
+    return None
+
+
+def serialize_rows(queryset, serializer_class, context=None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[dict]:
+    """queryset を chunk_size 件ずつ読み、1行ずつシリアライズする"""
+    serializer = serializer_class(context=context or {})
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield serializer.to_representation(obj)
+
+
+def streaming_export(request, queryset, serializer_class, filename: str, fmt: str,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE) -> StreamingHttpResponse:
+    """queryset を fmt 形式でストリーミングする StreamingHttpResponse を返す"""
+    compress = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '') and request.query_params.get('gzip') != '0'
+    rows = serialize_rows(queryset, serializer_class, {'request': request}, chunk_size)
+    response = StreamingHttpResponse(_to_bytes(ENCODERS[fmt](rows), compress), content_type=CONTENT_TYPES[fmt])
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = 'no-store'
+    # リバースプロキシ（nginx）でバッファリングさせない
+    response['X-Accel-Buffering'] = 'no'
+    stamp = timezone.localtime().strftime('%Y%m%d-%H%M%S')
+    response['Content-Disposition'] = f'attachment; filename="{filename}-{stamp}.{fmt}"'
+    return response
@@ -0,0 +1,571 @@
+"""
+全文検索エンジン（日本語対応のN-gramトークナイザ + 転置インデックス）
+
+- PostgreSQL: 生成列 tsv = to_tsvector('simple', tokens)（STORED）の GIN インデックス + pg_trgm（本文の部分一致）
+- SQLite: FTS5 仮想テーブル（外部コンテンツ: fulltext_entries, トリガーで同期）
+- basic: icontains によるフォールバック（FTS5 が使えない環境など）
+
+settings.FULLTEXT_BACKEND で 'auto' / 'postgres' / 'sqlite_fts5' / 'basic' を選択する。
+インデックス対象の文書は FullTextEntry(doc_type, object_id) としてシグナル経由で同期される。
+
+- matching_keys(): 一致した文書の object_id のサブクエリ（件数上限なし）。他テーブルの絞り込みは
+  pk__in=matching_keys(...) で DB 側で行い、上位 FULLTEXT_MAX_RESULTS 件で切り詰めない
+- ranked_entries(): 関連度（search_score）付きの FullTextEntry の QuerySet。採点・ORDER BY・
+  LIMIT/キーセットは DB 側で行い、取得したページの行だけを Python に読み込む
+- search(): 関連度順の上位 SearchHit（件数上限あり）
+"""
+import html
+import logging
+import unicodedata
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Length, Lower, Replace
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'fulltext_entries_fts'
+
+# ranked_entries() の並び順（関連度の高い順、同点は object_id 順でキーセットを安定させる）
+RANK_ORDERING = ('-search_score', 'object_id')
+
+# 文書種別
+DOC_SEEKER = 'seeker'      # object_id = SeekerProfile.id（全履歴書の skills / self_pr）
+DOC_MESSAGE = 'message'    # object_id = Message.id（本文）
+
+
+# ============================================================
+# トークナイザ
+# ============================================================
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        0x3041 <= code <= 0x30FA      # ひらがな・カタカナ（中黒 U+30FB は区切りとして扱う）
+        or 0x30FC <= code <= 0x30FF   # 長音符など
+        or 0x3400 <= code <= 0x4DBF   # CJK統合漢字拡張A
+        or 0x4E00 <= code <= 0x9FFF   # CJK統合漢字
+        or 0xF900 <= code <= 0xFAFF   # CJK互換漢字
+        or 0x3005 <= code <= 0x3007   # 々〆〇
+    )
+
+
+def _char_class(ch: str) -> str:
+    if _is_cjk(ch):
+        return 'cjk'
+    if ch.isalnum():
+        return 'word'
+    return 'sep'
+
+
+def _runs(text: str) -> List[Tuple[str, str]]:
+    """正規化済みテキストを (種別, 文字列) の連続区間に分割する"""
+    runs: List[Tuple[str, str]] = []
+    current_kind, buf = None, []
+    for ch in text:
+        kind = _char_class(ch)
+        if kind != current_kind and buf:
+            if current_kind != 'sep':
+                runs.append((current_kind, ''.join(buf)))
+            buf = []
+        current_kind = kind
+        buf.append(ch)
+    if buf and current_kind != 'sep':
+        runs.append((current_kind, ''.join(buf)))
+    return runs
+
+
+def normalize(text) -> str:
+    return unicodedata.normalize('NFKC', str(text or '')).lower()
+
+
+def _bigrams(run: str) -> List[str]:
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize_document(text) -> str:
+    """索引用のトークン列（空白区切り）。CJK はバイグラム＋末尾1文字、英数字は単語単位"""
+    tokens: List[str] = []
+    for kind, run in _runs(normalize(text)):
+        if kind == 'cjk':
+            tokens.extend(_bigrams(run))
+            if len(run) > 1:
+                # 1文字クエリ（前方一致）が区間末尾の文字にもヒットするように
+                tokens.append(run[-1])
+        else:
+            tokens.append(run)
+    return ' '.join(tokens)
+
+
+@dataclass
+class QueryTerm:
+    """クエリの1区間。CJK はバイグラムのフレーズ、英数字は前方一致の単語"""
+    text: str
+    tokens: List[str]
+    prefix: bool
+
+
+def parse_query(query) -> List[QueryTerm]:
+    terms: List[QueryTerm] = []
+    for kind, run in _runs(normalize(query)):
+        if kind == 'cjk' and len(run) > 1:
+            terms.append(QueryTerm(run, _bigrams(run), prefix=False))
+        else:
+            terms.append(QueryTerm(run, [run], prefix=True))
+    return terms
+
+
+# ============================================================
+# ハイライト
+# ============================================================
+
+def highlight(text, query, width: int = 80, start_tag: str = '<mark>', end_tag: str = '</mark>') -> str:
+    """クエリ語を含む周辺テキストを切り出し、該当箇所をタグで囲んだ HTML 断片を返す"""
+    text = str(text or '')
+    if not text:
+        return ''
+    # 正規化後の位置 → 元テキスト位置の対応表（NFKC で文字数が変わる場合に備える）
+    norm_chars: List[str] = []
+    origin: List[int] = []
+    for i, ch in enumerate(text):
+        for nch in normalize(ch):
+            norm_chars.append(nch)
+            origin.append(i)
+    norm_text = ''.join(norm_chars)
+
+    spans: List[Tuple[int, int]] = []
+    for term in parse_query(query):
+        start = norm_text.find(term.text)
+        while start != -1:
+            end = start + len(term.text)
+            spans.append((origin[start], origin[end - 1] + 1))
+            start = norm_text.find(term.text, end)
+    if not spans:
+        return html.escape(text[:width]) + ('…' if len(text) > width else '')
+
+    spans.sort()
+    merged: List[Tuple[int, int]] = []
+    for s, e in spans:
+        if merged and s <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(e, merged[-1][1]))
+        else:
+            merged.append((s, e))
+
+    first = merged[0][0]
+    window_start = max(0, first - width // 4)
+    window_end = min(len(text), window_start + width)
+    out: List[str] = ['…'] if window_start > 0 else []
+    pos = window_start
+    for s, e in merged:
+        if s >= window_end:
+            break
+        s, e = max(s, pos), min(e, window_end)
+        out.append(html.escape(text[pos:s]))
+        out.append(start_tag + html.escape(text[s:e]) + end_tag)
+        pos = e
+    out.append(html.escape(text[pos:window_end]))
+    if window_end < len(text):
+        out.append('…')
+    return ''.join(out)
+
+
+# ============================================================
+# バックエンド
+# ============================================================
+
+@dataclass
+class SearchHit:
+    object_id: str
+    score: float
+    body: str
+
+    def snippet(self, query, width: int = 80) -> str:
+        return highlight(self.body, query, width=width)
+
+
+def _like_escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class BasicBackend:
+    """icontains による全件走査（インデックスなし）"""
+    name = 'basic'
+
+    def entries(self, doc_type: str, terms: Sequence[QueryTerm]):
+        from django.db.models import Q
+        from .models import FullTextEntry
+
+        cond = Q()
+        for term in terms:
+            cond &= Q(body__icontains=term.text)
+        return FullTextEntry.objects.filter(doc_type=doc_type).filter(cond)
+
+    def ranked(self, doc_type: str, terms: Sequence[QueryTerm]):
+        """出現回数の合計を関連度とする（LENGTH と REPLACE で DB 側で数える）"""
+        body = Lower('body')
+        score = models.Value(0.0, output_field=models.FloatField())
+        for term in terms:
+            removed = Length(body) - Length(Replace(body, models.Value(term.text), models.Value('')))
+            score = score + Cast(removed, models.FloatField()) / models.Value(float(len(term.text)))
+        return self.entries(doc_type, terms).annotate(search_score=score)
+
+    def search(self, doc_type: str, query: str, limit: int) -> List[SearchHit]:
+        terms = parse_query(query)
+        if not terms:
+            return []
+        rows = self.entries(doc_type, terms).values_list('object_id', 'body')[:limit]
+        hits = []
+        for object_id, body in rows:
+            norm = normalize(body)
+            score = float(sum(norm.count(t.text) for t in terms))
+            hits.append(SearchHit(object_id, score, body))
+        hits.sort(key=lambda h: -h.score)
+        return hits
+
+
+class SQLiteFTS5Backend:
+    """SQLite FTS5（外部コンテンツテーブル + bm25 ランキング）"""
+    name = 'sqlite_fts5'
+
+    @staticmethod
+    def build_match(terms: Sequence[QueryTerm]) -> str:
+        parts = []
+        for term in terms:
+            phrase = ' '.join(t.replace('"', '') for t in term.tokens)
+            parts.append(f'"{phrase}"*' if term.prefix else f'"{phrase}"')
+        return ' AND '.join(parts)
+
+    def entries(self, doc_type: str, terms: Sequence[QueryTerm]):
+        from .models import FullTextEntry
+
+        return FullTextEntry.objects.filter(doc_type=doc_type, id__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [self.build_match(terms)],
+        ))
+
+    def ranked(self, doc_type: str, terms: Sequence[QueryTerm]):
+        """bm25（小さいほど関連度が高い）の符号を反転して search_score とする"""
+        score = RawSQL(
+            f"(SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = fulltext_entries.id)",
+            [self.build_match(terms)], output_field=models.FloatField(),
+        )
+        return self.entries(doc_type, terms).annotate(search_score=score)
+
+    def search(self, doc_type: str, query: str, limit: int) -> List[SearchHit]:
+        terms = parse_query(query)
+        if not terms:
+            return []
+        sql = (
+            f"SELECT e.object_id, bm25({FTS_TABLE}) AS score, e.body "
+            f"FROM {FTS_TABLE} JOIN fulltext_entries e ON e.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND e.doc_type = %s "
+            f"ORDER BY score LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.build_match(terms), doc_type, limit])
+            rows = cursor.fetchall()
+        # bm25 は小さいほど関連度が高い
+        return [SearchHit(str(object_id), -float(score), body) for object_id, score, body in rows]
+
+
+class PostgresBackend:
+    """PostgreSQL tsvector（生成列 tsv の GIN 索引）+ pg_trgm（本文の部分一致）"""
+    name = 'postgres'
+
+    @staticmethod
+    def build_tsquery(terms: Sequence[QueryTerm]) -> str:
+        parts = []
+        for term in terms:
+            lexemes = [f"'{t}'" for t in term.tokens]
+            if term.prefix:
+                lexemes[-1] += ':*'
+            phrase = ' <-> '.join(lexemes)
+            parts.append(f'({phrase})' if len(lexemes) > 1 else phrase)
+        return ' & '.join(parts)
+
+    MATCH_SQL = "(tsv @@ to_tsquery('simple', %s) OR body ILIKE %s)"
+
+    def _match_params(self, terms: Sequence[QueryTerm]) -> list:
+        return [self.build_tsquery(terms), '%' + _like_escape(' '.join(t.text for t in terms)) + '%']
+
+    def entries(self, doc_type: str, terms: Sequence[QueryTerm]):
+        from .models import FullTextEntry
+
+        return FullTextEntry.objects.filter(doc_type=doc_type, id__in=RawSQL(
+            f"SELECT id FROM fulltext_entries WHERE doc_type = %s AND {self.MATCH_SQL}",
+            [doc_type, *self._match_params(terms)],
+        ))
+
+    def ranked(self, doc_type: str, terms: Sequence[QueryTerm]):
+        score = RawSQL(
+            "ts_rank(fulltext_entries.tsv, to_tsquery('simple', %s))",
+            [self.build_tsquery(terms)], output_field=models.FloatField(),
+        )
+        return self.entries(doc_type, terms).annotate(search_score=score)
+
+    def search(self, doc_type: str, query: str, limit: int) -> List[SearchHit]:
+        terms = parse_query(query)
+        if not terms:
+            return []
+        tsquery, like = self._match_params(terms)
+        sql = (
+            "SELECT object_id, ts_rank(tsv, to_tsquery('simple', %s)) AS score, body "
+            f"FROM fulltext_entries WHERE doc_type = %s AND {self.MATCH_SQL} "
+            "ORDER BY score DESC LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [tsquery, doc_type, tsquery, like, limit])
+            rows = cursor.fetchall()
+        return [SearchHit(str(object_id), float(score), body) for object_id, score, body in rows]
+
+
+_BACKENDS = {
+    BasicBackend.name: BasicBackend,
+    SQLiteFTS5Backend.name: SQLiteFTS5Backend,
+    PostgresBackend.name: PostgresBackend,
+}
+_fts5_available: Optional[bool] = None
+
+
+def _sqlite_fts_table_exists() -> bool:
+    global _fts5_available
+    if _fts5_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _fts5_available = cursor.fetchone() is not None
+    return _fts5_available
+
+
+def get_backend():
+    """settings.FULLTEXT_BACKEND に従ってバックエンドを返す（auto は DB ベンダーで判定）"""
+    name = getattr(settings, 'FULLTEXT_BACKEND', 'auto') or 'auto'
+    if name == 'auto':
+        if connection.vendor == 'postgresql':
+            name = PostgresBackend.name
+        elif connection.vendor == 'sqlite' and _sqlite_fts_table_exists():
+            name = SQLiteFTS5Backend.name
+        else:
+            name = BasicBackend.name
+    backend_class = _BACKENDS.get(name)
+    if backend_class is None:
+        logger.warning(f"Unknown FULLTEXT_BACKEND '{name}', falling back to basic")
+        backend_class = BasicBackend
+    return backend_class()
+
+
+def search(doc_type: str, query: str, limit: Optional[int] = None) -> List[SearchHit]:
+    """関連度順の上位の検索結果（SearchHit のリスト）を返す（最大 FULLTEXT_MAX_RESULTS 件）
+
+    他の条件と組み合わせてページングする場合は ranked_entries() を使う。
+    """
+    if not (query or '').strip():
+        return []
+    limit = limit or getattr(settings, 'FULLTEXT_MAX_RESULTS', 1000)
+    return get_backend().search(doc_type, query, limit)
+
+
+def search_ids(doc_type: str, query: str, limit: Optional[int] = None) -> List[str]:
+    return [hit.object_id for hit in search(doc_type, query, limit)]
+
+
+def matching_entries(doc_type: str, query: str):
+    """クエリに一致する FullTextEntry の QuerySet（件数上限なし・関連度順ではない）"""
+    from .models import FullTextEntry
+
+    terms = parse_query(query)
+    if not terms:
+        return FullTextEntry.objects.none()
+    return get_backend().entries(doc_type, terms)
+
+
+def _key_expression(key_field: models.Field):
+    """object_id（文字列）を key_field の型に変換する式"""
+    if key_field.is_relation:
+        key_field = key_field.target_field
+    key = models.F('object_id')
+    if isinstance(key_field, models.UUIDField):
+        if connection.features.has_native_uuid_field:
+            key = Cast(key, models.UUIDField())
+        else:
+            # ネイティブの UUID 型がない DB では区切りなしの16進文字列で保存される
+            key = Replace(key, models.Value('-'), models.Value(''))
+    elif isinstance(key_field, models.IntegerField):
+        key = Cast(key, models.BigIntegerField())
+    return key
+
+
+def matching_keys(doc_type: str, query: str, key_field: models.Field):
+    """一致した文書の object_id を key_field の型に変換したサブクエリ（pk__in=... に渡す）
+
+    key_field: 絞り込み先の主キーのフィールド（例: SeekerSearchDocument._meta.pk）
+    """
+    return matching_entries(doc_type, query).values_list(_key_expression(key_field), flat=True)
+
+
+def ranked_entries(doc_type: str, query: str, within=None):
+    """一致した FullTextEntry を関連度順（RANK_ORDERING）に並べた QuerySet（search_score 注釈付き）
+
+    採点・並べ替え・件数制限は DB 側で行うため、スライスやキーセットで必要なページだけを取得する。
+    within: 絞り込み済みの QuerySet（主キー = object_id）。一致文書をその行に限定する
+    """
+    from .models import FullTextEntry
+
+    terms = parse_query(query)
+    if not terms:
+        rows = FullTextEntry.objects.none().annotate(search_score=models.Value(0.0, output_field=models.FloatField()))
+    else:
+        rows = get_backend().ranked(doc_type, terms)
+    if within is not None:
+        rows = rows.alias(key=_key_expression(within.model._meta.pk)).filter(key__in=within.values('pk'))
+    return rows.order_by(*RANK_ORDERING)
+
+
+# ============================================================
+# インデックス更新
+# ============================================================
+
+def index_document(doc_type: str, object_id, text: str) -> None:
+    """文書を登録/更新する（本文が空なら削除）。FTS5 側はトリガーで同期される"""
+    from .models import FullTextEntry
+
+    object_id = str(object_id)
+    if not (text or '').strip():
+        remove_document(doc_type, object_id)
+        return
+    FullTextEntry.objects.update_or_create(
+        doc_type=doc_type, object_id=object_id,
+        defaults={'body': text, 'tokens': tokenize_document(text)},
+    )
+
+
+def index_documents(doc_type: str, items: Iterable[Tuple[object, str]], batch_size: int = 500) -> int:
+    """複数文書の一括登録/更新（管理コマンド・マイグレーション用）"""
+    from .models import FullTextEntry
+
+    entries, empty_ids = [], []
+    for object_id, text in items:
+        if (text or '').strip():
+            entries.append(FullTextEntry(doc_type=doc_type, object_id=str(object_id), body=text, tokens=tokenize_document(text)))
+        else:
+            empty_ids.append(str(object_id))
+    if empty_ids:
+        FullTextEntry.objects.filter(doc_type=doc_type, object_id__in=empty_ids).delete()
+    FullTextEntry.objects.bulk_create(
+        entries, batch_size=batch_size,
+        update_conflicts=True, unique_fields=['doc_type', 'object_id'], update_fields=['body', 'tokens', 'updated_at'],
+    )
+    return len(entries)
+
+
+def remove_document(doc_type: str, object_id) -> None:
+    from .models import FullTextEntry
+    FullTextEntry.objects.filter(doc_type=doc_type, object_id=str(object_id)).delete()
+
+
+def schedule_index_document(doc_type: str, object_id, text: str) -> None:
+    def _index():
+        try:
+            index_document(doc_type, object_id, text)
+        except Exception as e:
+            logger.error(f"Full-text indexing failed for {doc_type}:{object_id}: {e}")
+    transaction.on_commit(_index)
+
+
+def schedule_remove_document(doc_type: str, object_id) -> None:
+    transaction.on_commit(lambda: remove_document(doc_type, object_id))
+
+
+def seeker_document_text(resumes) -> str:
+    """求職者文書の本文（全履歴書の skills / self_pr）"""
+    parts = []
+    for resume in resumes:
+        parts.extend(p for p in (resume.skills, resume.self_pr) if p)
+    return '\n'.join(parts)
+
+
+# ============================================================
+# DB 固有の索引（マイグレーション・管理コマンドから呼び出す）
+# ============================================================
+
+SQLITE_FTS_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"tokens, content='fulltext_entries', content_rowid='id', tokenize='unicode61 remove_diacritics 0')",
+    f"CREATE TRIGGER IF NOT EXISTS fulltext_entries_ai AFTER INSERT ON fulltext_entries BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, tokens) VALUES (new.id, new.tokens); END",
+    f"CREATE TRIGGER IF NOT EXISTS fulltext_entries_ad AFTER DELETE ON fulltext_entries BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, tokens) VALUES ('delete', old.id, old.tokens); END",
+    f"CREATE TRIGGER IF NOT EXISTS fulltext_entries_au AFTER UPDATE ON fulltext_entries BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, tokens) VALUES ('delete', old.id, old.tokens); "
+    f"INSERT INTO {FTS_TABLE}(rowid, tokens) VALUES (new.id, new.tokens); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS fulltext_entries_ai",
+    "DROP TRIGGER IF EXISTS fulltext_entries_ad",
+    "DROP TRIGGER IF EXISTS fulltext_entries_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# tsvector は生成列に保存し、採点（ts_rank）のたびに to_tsvector を計算しない
+POSTGRES_TSV_DDL = [
+    "ALTER TABLE fulltext_entries ADD COLUMN IF NOT EXISTS tsv tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', tokens)) STORED",
+    # 旧: to_tsvector('simple', tokens) の式インデックス
+    "DROP INDEX IF EXISTS fulltext_entries_tsv_gin",
+    "CREATE INDEX IF NOT EXISTS fulltext_entries_tsv_col_gin ON fulltext_entries USING GIN (tsv)",
+]
+
+POSTGRES_DDL = POSTGRES_TSV_DDL + [
+    "CREATE INDEX IF NOT EXISTS fulltext_entries_body_trgm ON fulltext_entries USING GIN (body gin_trgm_ops)",
+]
+
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS fulltext_entries_tsv_col_gin",
+    "DROP INDEX IF EXISTS fulltext_entries_body_trgm",
+    "ALTER TABLE fulltext_entries DROP COLUMN IF EXISTS tsv",
+]
+
+
+def install_search_structures(conn=None) -> bool:
+    """FTS5 仮想テーブル / GIN 索引を作成する。作成できない環境では False（basic で動作）"""
+    global _fts5_available
+    conn = conn or connection
+    try:
+        if conn.vendor == 'sqlite':
+            with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+                for sql in SQLITE_FTS_DDL:
+                    cursor.execute(sql)
+            _fts5_available = True
+            return True
+        if conn.vendor == 'postgresql':
+            with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+                try:
+                    with transaction.atomic(using=conn.alias):
+                        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                except Exception as e:
+                    logger.warning(f"pg_trgm extension unavailable: {e}")
+                    for sql in POSTGRES_TSV_DDL:
+                        cursor.execute(sql)
+                    return True
+                for sql in POSTGRES_DDL:
+                    cursor.execute(sql)
+            return True
+    except Exception as e:
+        logger.warning(f"Full-text index structures could not be created ({conn.vendor}): {e}")
+    return False
+
+
+def uninstall_search_structures(conn=None) -> None:
+    global _fts5_available
+    conn = conn or connection
+    statements = SQLITE_FTS_DROP if conn.vendor == 'sqlite' else POSTGRES_DROP if conn.vendor == 'postgresql' else []
+    with conn.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+    _fts5_available = None
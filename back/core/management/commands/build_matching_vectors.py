@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from core import matching
+
+
+class Command(BaseCommand):
+    help = ("Compute float32 matching vectors for experiences, resumes, seekers and jobs, then activate a new matching MLModel. "
+            "With --stale, only recompute seekers and jobs marked stale by saves (run with --loop as a long-lived worker).")
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--dim', type=int, default=None, help='Vector dimension (default: settings.MATCHING_VECTOR_DIM)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per bulk update (default: 500)')
+        parser.add_argument('--stale', action='store_true',
+                            help='Only recompute rows marked matching_stale, using the active model (no new model)')
+        parser.add_argument('--loop', action='store_true', help='With --stale: keep polling for stale rows until interrupted')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Seconds to sleep between polls with --loop (default: settings.MATCHING_STALE_POLL_INTERVAL)')
+
+    def handle(self, *args, **opts):
+        if not matching.NUMPY_AVAILABLE:
+            raise CommandError("numpy is required to build matching vectors")
+        if opts['loop'] and not opts['stale']:
+            raise CommandError("--loop requires --stale")
+        if opts['stale']:
+            self.refresh_stale(opts)
+            return
+        dim = opts['dim'] or matching.get_dim()
+        stats = matching.build_all_vectors(dim=dim, batch_size=opts['batch_size'], log=self.stdout.write)
+        model = matching.activate_new_model(dim, stats)
+        self.stdout.write(self.style.SUCCESS(f"Activated matching model {model.version} (dim={dim})"))
+
+    def refresh_stale(self, opts):
+        interval = opts['interval']
+        if interval is None:
+            interval = getattr(settings, 'MATCHING_STALE_POLL_INTERVAL', 10)
+        batch_size = max(1, opts['batch_size'])
+
+        while True:
+            stats = matching.refresh_stale_vectors(batch_size=batch_size, log=self.stdout.write)
+            if not opts['loop']:
+                self.stdout.write(self.style.SUCCESS(f"jobs={stats['jobs']} seekers={stats['seekers']}"))
+                break
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                break
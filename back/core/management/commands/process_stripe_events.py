@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+
+from core.stripe_events import DEFAULT_BATCH_SIZE, drain, purge_processed, requeue_dead
+
+
+class Command(BaseCommand):
+    help = ("Apply queued Stripe webhook events (credits, plans, job tickets) "
+            "(run with --loop as a long-lived worker, or from cron without it).")
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help=f'Events per batch (default: {DEFAULT_BATCH_SIZE})')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the event queue until interrupted')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Seconds to sleep between polls with --loop (default: settings.STRIPE_EVENTS_POLL_INTERVAL)')
+        parser.add_argument('--requeue-dead', action='store_true', help='Move dead-lettered events back to pending first')
+        parser.add_argument('--purge-payload-days', type=float, default=None,
+                            help='Drop the payload of events processed more than this many days ago (ids are kept)')
+
+    def handle(self, *args, **opts):
+        if opts['requeue_dead']:
+            self.stdout.write(f"Requeued {requeue_dead()} dead events")
+        if opts['purge_payload_days'] is not None:
+            self.stdout.write(f"Purged payloads of {purge_processed(opts['purge_payload_days'])} processed events")
+
+        interval = opts['interval']
+        if interval is None:
+            interval = getattr(settings, 'STRIPE_EVENTS_POLL_INTERVAL', 2)
+        batch_size = max(1, opts['batch_size'])
+
+        while True:
+            totals = drain(batch_size=batch_size)
+            if any(totals.values()) or not opts['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"processed={totals['processed']} retry={totals['retry']} dead={totals['dead']} "
+                    f"skipped={totals['skipped']} released={totals['released']}"
+                ))
+            if not opts['loop']:
+                break
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                break
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+
+from core.pdf_render import cache_dir, prune
+
+
+class Command(BaseCommand):
+    help = "Delete resume PDFs (and job marker files) not served recently from the PDF render cache."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--max-age-days', type=float, default=None,
+                            help='Delete files older than this (default: settings.PDF_CACHE_MAX_AGE_DAYS)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many files would be deleted')
+
+    def handle(self, *args, **opts):
+        max_age = opts['max_age_days']
+        if max_age is None:
+            max_age = getattr(settings, 'PDF_CACHE_MAX_AGE_DAYS', 7)
+        removed = prune(max_age, dry_run=opts['dry_run'])
+        verb = 'Would delete' if opts['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} files older than {max_age} days in {cache_dir()}"))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandParser
+
+from core import fulltext
+from core.models import FullTextEntry, Message
+from core.search_index import rebuild_all_seeker_search_documents
+
+
+class Command(BaseCommand):
+    help = "Create the full-text index structures for the current database and reindex seekers and messages."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--batch-size', type=int, default=1000, help='Documents per bulk upsert (default: 1000)')
+        parser.add_argument('--only', choices=[fulltext.DOC_SEEKER, fulltext.DOC_MESSAGE], help='Reindex a single document type')
+
+    def handle(self, *args, **opts):
+        batch_size = opts['batch_size']
+        if fulltext.install_search_structures():
+            self.stdout.write(f"Index structures ready ({fulltext.get_backend().name})")
+        else:
+            self.stdout.write(self.style.WARNING("Index structures unavailable, using the basic backend"))
+
+        if opts['only'] in (None, fulltext.DOC_SEEKER):
+            total = rebuild_all_seeker_search_documents(batch_size=batch_size)
+            self.stdout.write(f"Indexed {total} seekers")
+
+        if opts['only'] in (None, fulltext.DOC_MESSAGE):
+            FullTextEntry.objects.filter(doc_type=fulltext.DOC_MESSAGE).delete()
+            total, batch = 0, []
+            for item in Message.objects.values_list('id', 'content').iterator(chunk_size=batch_size):
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    total += fulltext.index_documents(fulltext.DOC_MESSAGE, batch, batch_size=batch_size)
+                    batch = []
+            total += fulltext.index_documents(fulltext.DOC_MESSAGE, batch, batch_size=batch_size)
+            self.stdout.write(f"Indexed {total} messages")
+
+        self.stdout.write(self.style.SUCCESS("Full-text index rebuilt"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandParser
+
+from core.message_threads import rebuild_threads
+
+
+class Command(BaseCommand):
+    help = "Rebuild the advice message thread summaries (MessageThread) from Message."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--user', action='append', dest='users', help='Only rebuild the given user id (repeatable)')
+
+    def handle(self, *args, **opts):
+        rows = rebuild_threads(opts['users'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} message threads"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandParser
+
+from core.user_notifications import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-kind unread notification counters (NotificationCounter) from Notification."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--user', action='append', dest='users', help='Only rebuild the given user id (repeatable)')
+
+    def handle(self, *args, **opts):
+        rows = rebuild_counters(opts['users'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} notification counters"))
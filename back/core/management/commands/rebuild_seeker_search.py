@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandParser
+
+from core.search_index import rebuild_all_seeker_search_documents
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized seeker search documents used by search_seekers_v2."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--batch-size', type=int, default=500, help='Profiles per bulk upsert (default: 500)')
+
+    def handle(self, *args, **opts):
+        total = rebuild_all_seeker_search_documents(batch_size=opts['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} seeker search documents"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandParser
+
+from core.message_threads import rebuild_threads
+from core.staff_roster import rebuild_staff_flags
+
+
+class Command(BaseCommand):
+    help = "Recompute Message.is_staff_message from the current staff users (and rebuild the thread summaries)."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--user', action='append', dest='users', help='Only messages sent or received by the given user id (repeatable)')
+        parser.add_argument('--skip-threads', action='store_true',
+                            help='Do not rebuild the message thread summaries afterwards')
+
+    def handle(self, *args, **opts):
+        rows = rebuild_staff_flags(opts['users'])
+        self.stdout.write(self.style.SUCCESS(f"Updated is_staff_message on {rows} messages"))
+        if rows and not opts['skip_threads']:
+            # スレッドの対象は is_staff_message で決まるため、フラグが変わったら作り直す
+            threads = rebuild_threads(opts['users'])
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {threads} message threads"))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandParser
+
+from core.user_stats import COUNTER_FIELDS, compute_counts, rebuild_user_stats
+from core.models import UserStats
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the denormalized UserStats counters from the source tables. Notification counters, "
+            "message threads and staff flags have their own rebuild_* commands.")
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--user', action='append', dest='users', help='Only rebuild the given user id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users per bulk upsert (default: 1000)')
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted counters without writing')
+
+    def handle(self, *args, **opts):
+        if opts['dry_run']:
+            stats = UserStats.objects.all()
+            if opts['users']:
+                stats = stats.filter(user_id__in=opts['users'])
+            drifted = 0
+            batch = []
+            for row in stats.iterator(chunk_size=opts['batch_size']):
+                batch.append(row)
+                if len(batch) >= opts['batch_size']:
+                    drifted += self._report_drift(batch)
+                    batch = []
+            if batch:
+                drifted += self._report_drift(batch)
+            self.stdout.write(f"{drifted} users drifted")
+            return
+
+        total = rebuild_user_stats(opts['users'], batch_size=opts['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {total} users"))
+
+    def _report_drift(self, rows) -> int:
+        """rows（UserStats）と実数の差を出力し、ずれていた件数を返す。集計はバッチで1回だけ行う"""
+        actual = compute_counts([row.user_id for row in rows])
+        drifted = 0
+        for row in rows:
+            counts = actual[row.user_id]
+            diff = {f: (getattr(row, f), counts[f]) for f in COUNTER_FIELDS if getattr(row, f) != counts[f]}
+            if diff:
+                drifted += 1
+                self.stdout.write(f"{row.user_id}: {diff}")
+        return drifted
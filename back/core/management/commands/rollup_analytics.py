@@ -0,0 +1,27 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.utils import timezone
+
+from core.analytics import ROLLUP_DAYS, build_rollups
+
+
+class Command(BaseCommand):
+    help = "Materialize daily admin analytics rollups (run once a day after midnight, e.g. from cron)."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--days', type=int, default=2, help=f'Number of days to (re)build ending yesterday (default: 2, max: {ROLLUP_DAYS})')
+        parser.add_argument('--date', help='Last day to roll up (YYYY-MM-DD, default: yesterday)')
+
+    def handle(self, *args, **opts):
+        if opts['date']:
+            try:
+                end = datetime.date.fromisoformat(opts['date'])
+            except ValueError:
+                raise CommandError("--date must be YYYY-MM-DD")
+        else:
+            end = timezone.localdate() - datetime.timedelta(days=1)
+        days = max(1, min(opts['days'], ROLLUP_DAYS))
+        start = end - datetime.timedelta(days=days - 1)
+        total = build_rollups(start, end)
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {total} days ({start} - {end})"))
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+
+from core.email_outbox import DEFAULT_BATCH_SIZE, drain, purge_sent, requeue_dead
+
+
+class Command(BaseCommand):
+    help = ("Send queued emails from the outbox in batches over one SMTP connection "
+            "(run with --loop as a long-lived worker, or from cron without it).")
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help=f'Emails per batch (default: {DEFAULT_BATCH_SIZE})')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox until interrupted')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Seconds to sleep between polls with --loop (default: settings.EMAIL_OUTBOX_POLL_INTERVAL)')
+        parser.add_argument('--requeue-dead', action='store_true', help='Move dead-lettered emails back to pending first')
+        parser.add_argument('--purge-sent-days', type=float, default=None, help='Delete sent emails older than this many days')
+
+    def handle(self, *args, **opts):
+        if opts['requeue_dead']:
+            self.stdout.write(f"Requeued {requeue_dead()} dead emails")
+        if opts['purge_sent_days'] is not None:
+            self.stdout.write(f"Purged {purge_sent(opts['purge_sent_days'])} sent emails")
+
+        interval = opts['interval']
+        if interval is None:
+            interval = getattr(settings, 'EMAIL_OUTBOX_POLL_INTERVAL', 5)
+        batch_size = max(1, opts['batch_size'])
+
+        while True:
+            totals = drain(batch_size=batch_size)
+            if any(totals.values()) or not opts['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"sent={totals['sent']} retry={totals['retry']} dead={totals['dead']} released={totals['released']}"
+                ))
+            if not opts['loop']:
+                break
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                break
@@ -0,0 +1,598 @@
+"""
+求職者 ↔ 求人マッチングエンジン
+
+- 特徴量: core.fulltext のトークナイザ（CJK バイグラム + 英数字単語）を
+  feature hashing で固定次元に写像し L2 正規化したベクトル（float32 バイナリで保存）
+- 検索: NumPy による全件内積（brute force）。件数が多い場合は IVF（k-means で分割した
+  転置リスト）で近傍クラスタのみを走査
+- 特徴量の計算は管理コマンド build_matching_vectors（オフライン）で行い、
+  実行ごとに MLModel(model_type='matching') を新バージョンとして有効化する
+- 求人・求職者（履歴書・職歴）の保存時はリクエスト内では計算せず matching_stale を立てるだけ。
+  ワーカー（build_matching_vectors --stale --loop）がまとめて計算し直し、インデックスの世代
+  （Django キャッシュのカウンタ。全ワーカー共有）をバッチごとに1回進める
+- 各プロセスのインデックスは世代が変わっていればバックグラウンドのスレッドで作り直して差し替える
+  （MATCHING_INDEX_REFRESH_SECONDS に1回まで）。リクエストは作り直しを待たず、その間は前の
+  インデックスで応答する。作り直しでは IVF のクラスタ中心を引き継ぎ、k-means はモデルごとに初回のみ
+- 推論結果（MLPrediction）はリクエストごとに1回の bulk_create で書き込む
+"""
+import logging
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .fulltext import tokenize_document
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:  # pragma: no cover - numpy は requirements.txt に含まれる
+    np = None
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'hashed-ngram-matching'
+PREDICTION_TYPE = 'job_seeker_match'
+DEFAULT_DIM = 256
+GENERATION_KEY = 'matching_index_gen:{target}'
+JOB_TEXT_FIELDS = frozenset({'title', 'skills_required', 'requirements', 'description', 'is_active'})
+
+
+def get_dim(model=None) -> int:
+    if model is not None:
+        try:
+            return int(model.parameters.get('dim', DEFAULT_DIM))
+        except (AttributeError, TypeError, ValueError):
+            pass
+    return int(getattr(settings, 'MATCHING_VECTOR_DIM', DEFAULT_DIM))
+
+
+# ============================================================
+# ベクトル化
+# ============================================================
+
+def vectorize(text: str, dim: int = DEFAULT_DIM):
+    """テキストを符号付き feature hashing で dim 次元の単位ベクトル（float32）にする"""
+    vec = np.zeros(dim, dtype=np.float32)
+    for token in tokenize_document(text).split():
+        h = zlib.crc32(token.encode('utf-8'))
+        vec[h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    # サブリニア TF（頻出語の影響を抑える）
+    vec = np.sign(vec) * np.log1p(np.abs(vec))
+    norm = float(np.linalg.norm(vec))
+    if norm > 0:
+        vec /= norm
+    return vec
+
+
+def combine(vectors: Sequence, weights: Optional[Sequence[float]] = None, dim: int = DEFAULT_DIM):
+    """複数ベクトルの加重平均（正規化済み）"""
+    if not vectors:
+        return np.zeros(dim, dtype=np.float32)
+    stacked = np.vstack(vectors).astype(np.float32)
+    w = np.asarray(weights if weights is not None else [1.0] * len(vectors), dtype=np.float32)
+    vec = (stacked * w[:, None]).sum(axis=0)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+def to_bytes(vec) -> bytes:
+    return np.asarray(vec, dtype=np.float32).tobytes()
+
+
+def from_bytes(data, dim: Optional[int] = None):
+    if data is None:
+        return None
+    vec = np.frombuffer(bytes(data), dtype=np.float32)
+    if dim is not None and vec.shape[0] != dim:
+        return None
+    return vec
+
+
+def experience_text(exp) -> str:
+    parts = [exp.position, exp.industry, exp.business, exp.tasks, exp.achievements]
+    parts.extend(str(t) for t in (exp.technologies_used or []))
+    parts.extend(str(t) for t in (exp.skill_tags or []))
+    return '\n'.join(p for p in parts if p)
+
+
+def resume_text(resume) -> str:
+    parts = [resume.desired_job, resume.skills, resume.self_pr]
+    parts.extend(str(i) for i in (resume.desired_industries or []))
+    return '\n'.join(p for p in parts if p)
+
+
+def job_text(job) -> str:
+    # skills_required を重視するため2回含める
+    parts = [job.title, job.skills_required, job.skills_required, job.requirements, job.description]
+    return '\n'.join(p for p in parts if p)
+
+
+def resume_vector(resume, experience_vectors: Sequence, dim: int):
+    """履歴書本文とその職歴ベクトルを合成した履歴書ベクトル"""
+    vectors = [vectorize(resume_text(resume), dim)] + list(experience_vectors)
+    weights = [2.0] + [1.0] * len(experience_vectors)
+    return combine(vectors, weights, dim)
+
+
+# ============================================================
+# 近傍探索インデックス
+# ============================================================
+
+class BruteForceIndex:
+    """全件内積による top-k（ベクトルは正規化済みのため内積 = コサイン類似度）"""
+    kind = 'brute_force'
+
+    def __init__(self, ids: List[str], matrix):
+        self.ids = ids
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def _top_k(scores, k: int):
+        if scores.shape[0] == 0:
+            return np.array([], dtype=np.int64)
+        k = min(k, scores.shape[0])
+        idx = np.argpartition(-scores, k - 1)[:k]
+        return idx[np.argsort(-scores[idx])]
+
+    def search(self, query, k: int, exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+        if not len(self):
+            return []
+        exclude = set(exclude)
+        scores = self.matrix @ query
+        order = self._top_k(scores, k + len(exclude))
+        results = [(self.ids[i], float(scores[i])) for i in order if self.ids[i] not in exclude]
+        return results[:k]
+
+
+class IVFIndex(BruteForceIndex):
+    """IVF（k-means で分割した転置リスト）。クエリに近い nprobe 個のクラスタのみ走査"""
+    kind = 'ivf'
+
+    def __init__(self, ids: List[str], matrix, n_lists: int, n_probe: int, iterations: int = 10, seed: int = 0,
+                 centroids=None):
+        super().__init__(ids, matrix)
+        n = matrix.shape[0]
+        if centroids is not None:
+            # 既存のクラスタ中心を使い、割り当てだけをやり直す（k-means を省略）
+            centroids = centroids.copy()
+            iterations = 0
+        else:
+            centroids = matrix[np.random.default_rng(seed).choice(n, max(1, min(n_lists, n)), replace=False)].copy()
+        self.n_lists = centroids.shape[0]
+        self.n_probe = max(1, min(n_probe, self.n_lists))
+        assign = np.argmax(matrix @ centroids.T, axis=1)
+        for _ in range(iterations):
+            for c in range(self.n_lists):
+                members = matrix[assign == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    norm = np.linalg.norm(centroid)
+                    centroids[c] = centroid / norm if norm > 0 else centroid
+            assign = np.argmax(matrix @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [np.flatnonzero(assign == c) for c in range(self.n_lists)]
+
+    def search(self, query, k: int, exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+        if not len(self):
+            return []
+        exclude = set(exclude)
+        probe = self._top_k(self.centroids @ query, self.n_probe)
+        candidates = np.concatenate([self.lists[c] for c in probe]) if len(probe) else np.array([], dtype=np.int64)
+        if candidates.shape[0] == 0:
+            return []
+        scores = self.matrix[candidates] @ query
+        order = self._top_k(scores, k + len(exclude))
+        results = [(self.ids[candidates[i]], float(scores[i])) for i in order if self.ids[candidates[i]] not in exclude]
+        return results[:k]
+
+
+def build_index(ids: List[str], matrix, force_exact: bool = False, centroids=None):
+    """件数と設定に応じて brute force / IVF を選ぶ（centroids を渡すと IVF の k-means を省略）"""
+    min_rows = int(getattr(settings, 'MATCHING_IVF_MIN_ROWS', 5000))
+    if force_exact or not getattr(settings, 'MATCHING_USE_IVF', True) or len(ids) < min_rows:
+        return BruteForceIndex(ids, matrix)
+    n_lists = int(getattr(settings, 'MATCHING_IVF_LISTS', 0)) or max(1, int(len(ids) ** 0.5))
+    n_probe = int(getattr(settings, 'MATCHING_IVF_PROBES', 8))
+    return IVFIndex(ids, matrix, n_lists=n_lists, n_probe=n_probe, centroids=centroids)
+
+
+@dataclass
+class _CachedIndex:
+    approx: object
+    exact: object
+    generation: int
+    built_at: float
+    dim: int
+
+
+# プロセス内キャッシュ: {(対象, モデルID): _CachedIndex}
+_index_cache: Dict[Tuple[str, int], _CachedIndex] = {}
+_index_lock = threading.Lock()
+# バックグラウンドで作り直し中のキー
+_rebuilding: set = set()
+
+
+def index_generation(target: str) -> int:
+    """target のインデックスの世代（ベクトルが変わるたびに増える）"""
+    try:
+        return int(cache.get(GENERATION_KEY.format(target=target)) or 0)
+    except Exception:
+        return 0
+
+
+def bump_index_generation(target: str) -> None:
+    key = GENERATION_KEY.format(target=target)
+    try:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+    except Exception as e:
+        logger.warning(f"Matching index generation bump failed for {target}: {e}")
+
+
+def _load_matrix(rows, dim: int):
+    ids, vectors = [], []
+    for object_id, data in rows:
+        vec = from_bytes(data, dim)
+        if vec is not None:
+            ids.append(str(object_id))
+            vectors.append(vec)
+    matrix = np.vstack(vectors) if vectors else np.zeros((0, dim), dtype=np.float32)
+    return ids, matrix
+
+
+def _build_cached_index(target: str, model, generation: int, previous: Optional[_CachedIndex] = None) -> _CachedIndex:
+    from .models import SeekerProfile, JobPosting
+
+    dim = get_dim(model)
+    if target == 'seekers':
+        rows = SeekerProfile.objects.exclude(skill_vector_f32=None).values_list('id', 'skill_vector_f32')
+    else:
+        rows = JobPosting.objects.filter(is_active=True).exclude(skills_vector_f32=None).values_list('id', 'skills_vector_f32')
+    ids, matrix = _load_matrix(rows.iterator(chunk_size=2000), dim)
+    centroids = getattr(previous.approx, 'centroids', None) if previous is not None and previous.dim == dim else None
+    approx = build_index(ids, matrix, centroids=centroids)
+    exact_index = approx if approx.kind == BruteForceIndex.kind else BruteForceIndex(ids, matrix)
+    return _CachedIndex(approx, exact_index, generation, time.monotonic(), dim)
+
+
+def _store_index(key: Tuple[str, int], built: _CachedIndex) -> None:
+    """_index_lock の中で呼ぶ。同じ対象の古いモデルのインデックスは破棄"""
+    for old_key in [k for k in _index_cache if k[0] == key[0]]:
+        _index_cache.pop(old_key, None)
+    _index_cache[key] = built
+
+
+def _rebuild_in_background(key: Tuple[str, int], model, generation: int, previous: _CachedIndex) -> None:
+    """インデックスを別スレッドで作り直して差し替える（呼び出し側は _rebuilding に key を登録済み）"""
+    def run():
+        try:
+            built = _build_cached_index(key[0], model, generation, previous)
+            with _index_lock:
+                _store_index(key, built)
+        except Exception as e:
+            logger.error(f"Matching index rebuild failed for {key[0]}: {e}")
+        finally:
+            with _index_lock:
+                _rebuilding.discard(key)
+            connection.close()
+
+    threading.Thread(target=run, name=f'matching-index-{key[0]}', daemon=True).start()
+
+
+def get_index(target: str, model, exact: bool = False):
+    """target='seekers'（SeekerProfile.id）/ 'jobs'（JobPosting.id）のインデックスを返す
+
+    世代が変わっていてもリクエスト内では作り直さず、手元のインデックスを返して作り直しを
+    バックグラウンドで始める。モデルが切り替わった直後も次元が同じなら前のインデックスで応答する。
+    インデックスがまだない（プロセスで初回、または次元が変わった）場合のみ構築を待つ。
+    """
+    key = (target, model.pk)
+    generation = index_generation(target)
+    refresh_seconds = float(getattr(settings, 'MATCHING_INDEX_REFRESH_SECONDS', 30))
+    dim = get_dim(model)
+    with _index_lock:
+        cached = _index_cache.get(key)
+        if cached is not None:
+            stale = cached.generation != generation and time.monotonic() - cached.built_at >= refresh_seconds
+        else:
+            # 別モデルのインデックス（同じ次元）があれば作り直しの間はそれを使う
+            cached = next((c for k, c in _index_cache.items() if k[0] == target and c.dim == dim), None)
+            stale = cached is not None
+        if stale and key not in _rebuilding:
+            _rebuilding.add(key)
+            _rebuild_in_background(key, model, generation, cached)
+        if cached is None:
+            cached = _build_cached_index(target, model, generation)
+            _store_index(key, cached)
+    return cached.exact if exact else cached.approx
+
+
+def get_active_model():
+    from .models import MLModel
+    return MLModel.objects.filter(model_type='matching', is_active=True).order_by('-created_at').first()
+
+
+# ============================================================
+# 特徴量パイプライン（管理コマンドから呼び出す）
+# ============================================================
+
+def build_all_vectors(dim: int = DEFAULT_DIM, batch_size: int = 500, log=None) -> dict:
+    """職歴 → 履歴書 → 求職者 → 求人の順にベクトルを計算して保存し、履歴書の match_score を更新"""
+    from django.db.models import Prefetch
+    from .models import SeekerProfile, Resume, Experience, JobPosting
+
+    log = log or (lambda msg: logger.info(msg))
+    stats = {'experiences': 0, 'resumes': 0, 'seekers': 0, 'jobs': 0}
+    # 全件を計算し直すため再計算待ちを取り消す（計算中に保存された行はまた印が付く）
+    JobPosting.objects.filter(matching_stale=True).update(matching_stale=False)
+    SeekerProfile.objects.filter(matching_stale=True).update(matching_stale=False)
+
+    # 求人
+    jobs_batch = []
+    for job in JobPosting.objects.only('id', 'title', 'skills_required', 'requirements', 'description').iterator(chunk_size=batch_size):
+        job.skills_vector_f32 = to_bytes(vectorize(job_text(job), dim))
+        jobs_batch.append(job)
+        if len(jobs_batch) >= batch_size:
+            JobPosting.objects.bulk_update(jobs_batch, ['skills_vector_f32'])
+            stats['jobs'] += len(jobs_batch)
+            jobs_batch = []
+    if jobs_batch:
+        JobPosting.objects.bulk_update(jobs_batch, ['skills_vector_f32'])
+        stats['jobs'] += len(jobs_batch)
+    log(f"jobs: {stats['jobs']}")
+
+    job_rows = JobPosting.objects.filter(is_active=True).values_list('id', 'skills_vector_f32')
+    _, job_matrix = _load_matrix(job_rows, dim)
+
+    # 求職者（履歴書・職歴をまとめて処理）
+    profiles = (
+        SeekerProfile.objects.select_related('user')
+        .prefetch_related(Prefetch('user__resumes', queryset=Resume.objects.prefetch_related('experiences')))
+        .order_by('pk')
+    )
+    exp_batch, resume_batch, profile_batch = [], [], []
+
+    def flush():
+        if exp_batch:
+            Experience.objects.bulk_update(exp_batch, ['embedding_f32'], batch_size=batch_size)
+        if resume_batch:
+            Resume.objects.bulk_update(resume_batch, ['resume_vector_f32', 'match_score'], batch_size=batch_size)
+        if profile_batch:
+            SeekerProfile.objects.bulk_update(profile_batch, ['skill_vector_f32'], batch_size=batch_size)
+        stats['experiences'] += len(exp_batch)
+        stats['resumes'] += len(resume_batch)
+        stats['seekers'] += len(profile_batch)
+        exp_batch.clear()
+        resume_batch.clear()
+        profile_batch.clear()
+
+    for profile in profiles.iterator(chunk_size=batch_size):
+        exps, resumes = _profile_vectors(profile, dim, job_matrix)
+        exp_batch.extend(exps)
+        resume_batch.extend(resumes)
+        profile_batch.append(profile)
+        if len(profile_batch) >= batch_size:
+            flush()
+    flush()
+    log(f"seekers: {stats['seekers']}, resumes: {stats['resumes']}, experiences: {stats['experiences']}")
+    return stats
+
+
+def _profile_vectors(profile, dim: int, job_matrix=None) -> Tuple[list, list]:
+    """求職者の職歴・履歴書・求職者ベクトルを計算してインスタンスに設定し、(職歴, 履歴書) を返す
+
+    profile.user.resumes と各履歴書の experiences は取得済み（prefetch）であること。
+    job_matrix を渡すと履歴書の match_score も更新する。
+    """
+    experiences, resumes = [], []
+    resume_vectors, resume_weights = [], []
+    for resume in profile.user.resumes.all():
+        exp_vectors = []
+        for exp in resume.experiences.all():
+            vec = vectorize(experience_text(exp), dim)
+            exp.embedding_f32 = to_bytes(vec)
+            experiences.append(exp)
+            exp_vectors.append(vec)
+        vec = resume_vector(resume, exp_vectors, dim)
+        resume.resume_vector_f32 = to_bytes(vec)
+        if job_matrix is not None and job_matrix.shape[0]:
+            best = float((job_matrix @ vec).max())
+            resume.match_score = round(max(0.0, min(1.0, best)) * 100, 2)
+        resumes.append(resume)
+        resume_vectors.append(vec)
+        resume_weights.append(2.0 if resume.is_active else 1.0)
+    if resume_vectors:
+        profile.skill_vector_f32 = to_bytes(combine(resume_vectors, resume_weights, dim))
+    else:
+        profile.skill_vector_f32 = None
+    return experiences, resumes
+
+
+# ============================================================
+# 変更の反映（シグナルで印を付け、ワーカーがまとめて計算する）
+# ============================================================
+
+def mark_job_stale(job_id, update_fields=None) -> None:
+    """求人のベクトルを再計算待ちにする（本文・公開状態以外の更新では何もしない）
+
+    QuerySet.update のため post_save（再計算待ちの再帰）は発生しない。
+    """
+    from .models import JobPosting
+
+    if update_fields is not None and not JOB_TEXT_FIELDS.intersection(update_fields):
+        return
+    JobPosting.objects.filter(pk=job_id, matching_stale=False).update(matching_stale=True)
+
+
+def mark_seeker_stale(user_id) -> None:
+    """求職者（履歴書・職歴を含む）のベクトルを再計算待ちにする"""
+    from .models import SeekerProfile
+
+    if user_id:
+        SeekerProfile.objects.filter(user_id=user_id, matching_stale=False).update(matching_stale=True)
+
+
+def schedule_index_bump(target: str) -> None:
+    """削除時: コミット後にインデックスの世代だけを進める（作り直しは各プロセスのバックグラウンド）"""
+    def run():
+        bump_index_generation(target)
+    transaction.on_commit(run)
+
+
+def _claim_stale(queryset, batch_size: int) -> list:
+    """再計算待ちの主キーを取り出してフラグを下ろす（計算中に保存された行は次回また処理される）"""
+    ids = list(queryset.filter(matching_stale=True).values_list('pk', flat=True)[:batch_size])
+    if ids:
+        queryset.filter(pk__in=ids).update(matching_stale=False)
+    return ids
+
+
+def refresh_stale_vectors(batch_size: int = 500, log=None) -> dict:
+    """matching_stale の求人・求職者のベクトルを有効なモデルの次元で計算し直す
+
+    build_matching_vectors --stale（ワーカー）から呼び出す。match_score は全件の再計算時のみ更新する。
+    ベクトルを更新した対象ごとにインデックスの世代を1回だけ進める。
+    """
+    from django.db.models import Prefetch
+    from .models import SeekerProfile, Resume, Experience, JobPosting
+
+    log = log or (lambda msg: logger.info(msg))
+    stats = {'experiences': 0, 'resumes': 0, 'seekers': 0, 'jobs': 0}
+    model = get_active_model() if NUMPY_AVAILABLE else None
+    if model is None:
+        return stats
+    dim = get_dim(model)
+
+    while True:
+        ids = _claim_stale(JobPosting.objects.all(), batch_size)
+        if not ids:
+            break
+        jobs = list(JobPosting.objects.filter(pk__in=ids).only('id', 'title', 'skills_required', 'requirements', 'description'))
+        for job in jobs:
+            job.skills_vector_f32 = to_bytes(vectorize(job_text(job), dim))
+        JobPosting.objects.bulk_update(jobs, ['skills_vector_f32'])
+        stats['jobs'] += len(jobs)
+
+    profiles = (
+        SeekerProfile.objects.select_related('user')
+        .prefetch_related(Prefetch('user__resumes', queryset=Resume.objects.prefetch_related('experiences')))
+    )
+    while True:
+        ids = _claim_stale(SeekerProfile.objects.all(), batch_size)
+        if not ids:
+            break
+        exp_batch, resume_batch, profile_batch = [], [], []
+        for profile in profiles.filter(pk__in=ids):
+            exps, resumes = _profile_vectors(profile, dim)
+            exp_batch.extend(exps)
+            resume_batch.extend(resumes)
+            profile_batch.append(profile)
+        with transaction.atomic():
+            if exp_batch:
+                Experience.objects.bulk_update(exp_batch, ['embedding_f32'], batch_size=batch_size)
+            if resume_batch:
+                Resume.objects.bulk_update(resume_batch, ['resume_vector_f32'], batch_size=batch_size)
+            SeekerProfile.objects.bulk_update(profile_batch, ['skill_vector_f32'], batch_size=batch_size)
+        stats['experiences'] += len(exp_batch)
+        stats['resumes'] += len(resume_batch)
+        stats['seekers'] += len(profile_batch)
+
+    if stats['jobs']:
+        bump_index_generation('jobs')
+    if stats['seekers']:
+        bump_index_generation('seekers')
+    if stats['jobs'] or stats['seekers']:
+        log(f"refreshed jobs: {stats['jobs']}, seekers: {stats['seekers']}, resumes: {stats['resumes']}, "
+            f"experiences: {stats['experiences']}")
+    return stats
+
+
+def activate_new_model(dim: int, stats: dict):
+    """今回の特徴量に対応する MLModel を登録し、有効なマッチングモデルを切り替える"""
+    from django.db import transaction
+    from django.utils import timezone
+    from .models import MLModel
+
+    now = timezone.now()
+    with transaction.atomic():
+        MLModel.objects.filter(model_type='matching', is_active=True).update(is_active=False)
+        model = MLModel.objects.create(
+            name=MODEL_NAME,
+            model_type='matching',
+            # 同じ秒に複数回実行しても重複しないようマイクロ秒まで含める
+            version=now.strftime('%Y%m%d%H%M%S%f'),
+            model_path='db:float32',
+            training_data_size=stats.get('seekers', 0) + stats.get('jobs', 0),
+            training_date=now,
+            parameters={'dim': dim, 'hash': 'crc32-signed', 'tokenizer': 'cjk-bigram', **stats},
+            is_active=True,
+        )
+    return model
+
+
+# ============================================================
+# 推論（API から呼び出す）
+# ============================================================
+
+def match_seekers_for_job(job, model, k: int = 10, exact: bool = False):
+    """求人に合う求職者 top-k: [(SeekerProfile.id, score)]"""
+    dim = get_dim(model)
+    query = from_bytes(job.skills_vector_f32, dim)
+    if query is None:
+        query = vectorize(job_text(job), dim)
+    index = get_index('seekers', model, exact=exact)
+    return index.search(query, k), index.kind
+
+
+def match_jobs_for_seeker(profile, model, k: int = 10, exact: bool = False):
+    """求職者に合う求人 top-k: [(JobPosting.id, score)]"""
+    dim = get_dim(model)
+    query = from_bytes(profile.skill_vector_f32, dim)
+    if query is None:
+        from .models import Resume
+        resumes = Resume.objects.filter(user_id=profile.user_id)
+        query = combine([resume_vector(r, [], dim) for r in resumes], dim=dim) if resumes else None
+    if query is None or not np.any(query):
+        return [], 'none'
+    index = get_index('jobs', model, exact=exact)
+    return index.search(query, k), index.kind
+
+
+# ============================================================
+# 推論結果の記録
+# ============================================================
+
+def record_predictions(model, rows: List[Tuple[object, float, dict]]) -> int:
+    """マッチ結果を MLPrediction として記録する: rows = [(user_id, score, input_features)]
+
+    1リクエストの結果を1回の bulk_create で書き込む。記録に失敗しても応答は返す。
+    """
+    from .models import MLPrediction
+
+    if not rows:
+        return 0
+    predictions = [
+        MLPrediction(
+            model=model, user_id=user_id, prediction_type=PREDICTION_TYPE,
+            prediction_value=round(score, 6), confidence=round(max(0.0, min(1.0, score)), 6),
+            input_features=features,
+        )
+        for user_id, score, features in rows
+    ]
+    try:
+        with transaction.atomic():
+            MLPrediction.objects.bulk_create(predictions)
+    except Exception as e:
+        logger.error(f"Recording {len(predictions)} matching predictions failed: {e}")
+        return 0
+    return len(predictions)
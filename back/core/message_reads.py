@@ -0,0 +1,131 @@
+"""
+アドバイス系メッセージの一括既読化と既読位置（MessageReadMarker）
+
+- read_through(): カーソル（メッセージ ID か日時）以前に受け取った管理者からのメッセージを
+  1回の UPDATE（... WHERE created_at <= X）で既読にし、件名ごとの既読位置を進める。
+  対応する通知も同じ範囲で既読にし、コミット後に新しい未読件数を WebSocket へ送る
+- unread_counts(): 件名ごとの未読件数。既読位置より新しいメッセージだけを数える（1クエリ）
+
+既読位置は前にしか進めない（古いカーソルでの既読化は位置を戻さない）。
+個別に既読にされたメッセージ（is_read）も数えないため、位置より新しい範囲でも is_read で絞る。
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Sequence
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from . import notification_buffer, staff_roster
+from .user_notifications import ADVICE_KINDS, DELTA_EVENT_TYPE, jsonable, mark_read, unread_summary
+
+
+class CursorError(ValueError):
+    """カーソルのメッセージが見つからない（自分のメッセージでない）"""
+
+
+def _received(user_id, subjects: Sequence[str]):
+    """user_id が管理者から受け取ったメッセージ（管理者が呼んだ場合も一般ユーザーからのメッセージは含めない）"""
+    from .models import Message
+
+    return Message.objects.filter(
+        receiver_id=user_id, is_staff_message=True, subject__in=subjects, sender_id__in=staff_roster.staff_ids(),
+    )
+
+
+def resolve_cursor(user_id, cursor=None, until: Optional[datetime] = None):
+    """(既読化する上限の日時, カーソルのメッセージ ID or None)。どちらも未指定なら現在時刻まで"""
+    from .models import Message
+
+    if cursor not in (None, ''):
+        try:
+            row = Message.objects.filter(Q(receiver_id=user_id) | Q(sender_id=user_id), id=int(cursor)).values_list(
+                'id', 'created_at').first()
+        except (TypeError, ValueError):
+            row = None
+        if row is None:
+            raise CursorError(cursor)
+        return row[1], row[0]
+    now = timezone.now()
+    return (min(until, now) if until is not None else now), None
+
+
+def _advance_markers(user_id, subjects: Iterable[str], through: datetime) -> None:
+    from .models import MessageReadMarker
+
+    for subject in subjects:
+        markers = MessageReadMarker.objects.filter(user_id=user_id, subject=subject)
+        if markers.filter(read_through__lt=through).update(read_through=through, updated_at=timezone.now()):
+            continue
+        if markers.exists():
+            continue
+        try:
+            with transaction.atomic():
+                MessageReadMarker.objects.create(user_id=user_id, subject=subject, read_through=through)
+        except IntegrityError:
+            markers.filter(read_through__lt=through).update(read_through=through, updated_at=timezone.now())
+
+
+def _notification_bound(user_id, subjects: Sequence[str], through: datetime, message_id=None) -> Optional[int]:
+    """through までのメッセージに対応する通知の最大 ID（通知はメッセージの作成直後に作られる）"""
+    from .models import Notification
+
+    notifications = Notification.objects.filter(user_id=user_id, kind__in=subjects)
+    if message_id is not None:
+        bound = notifications.filter(source_type='message', source_id=str(message_id)).values_list('id', flat=True).first()
+        if bound is not None:
+            return bound
+    return notifications.filter(created_at__lte=through).aggregate(bound=Max('id'))['bound']
+
+
+def read_through(user_id, subjects: Optional[Sequence[str]] = None, cursor=None,
+                 until: Optional[datetime] = None, push: bool = True) -> dict:
+    """cursor（メッセージ ID）または until（日時）以前のメッセージを一括で既読にする
+
+    返却: {'read': 既読にしたメッセージ数, 'read_through': 日時, 'unread': unread_counts()}
+    """
+    subjects = list(subjects or ADVICE_KINDS)
+    through, message_id = resolve_cursor(user_id, cursor, until)
+    now = timezone.now()
+    with transaction.atomic():
+        updated = _received(user_id, subjects).filter(is_read=False, created_at__lte=through).update(
+            is_read=True, read_at=now,
+        )
+        _advance_markers(user_id, subjects, through)
+        bound = _notification_bound(user_id, subjects, through, message_id)
+        if bound is not None:
+            mark_read(user_id, kinds=subjects, up_to=bound, push=False)
+    unread = unread_counts(user_id, subjects)
+    if push:
+        notification_buffer.publish(user_id, jsonable({
+            'type': DELTA_EVENT_TYPE,
+            'read': {'kinds': subjects, 'through': through, 'messages': updated},
+            'unread': unread_summary(user_id),
+            'messages_unread': unread,
+        }))
+    return {'read': updated, 'read_through': through, 'unread': unread}
+
+
+def unread_counts(user_id, subjects: Optional[Sequence[str]] = None) -> Dict[str, int]:
+    """{subject: 未読件数, ..., 'total_unread'}（既読位置より新しい範囲だけを数える）"""
+    from .models import MessageReadMarker
+
+    subjects = list(subjects or ADVICE_KINDS)
+    markers = dict(MessageReadMarker.objects.filter(user_id=user_id, subject__in=subjects).values_list(
+        'subject', 'read_through'))
+
+    def after_marker(subject):
+        cond = Q(subject=subject)
+        if markers.get(subject) is not None:
+            cond &= Q(created_at__gt=markers[subject])
+        return cond
+
+    ranges = Q()
+    for subject in subjects:
+        ranges |= after_marker(subject)
+    counts = _received(user_id, subjects).filter(ranges, is_read=False).aggregate(**{
+        f'unread_{i}': Count('id', filter=after_marker(subject)) for i, subject in enumerate(subjects)
+    })
+    data: Dict[str, int] = {subject: counts[f'unread_{i}'] or 0 for i, subject in enumerate(subjects)}
+    data['total_unread'] = sum(data.values())
+    return data
@@ -0,0 +1,163 @@
+"""
+会話メッセージの差分同期（advice_messages / company_messages の GET）
+
+?since= / ?before= / ?limit= / ?wait= のいずれかを指定すると同期モードになる（未指定なら従来の全件配列）。
+    ?since=<message id>   そのメッセージより新しいもの（古い順、最大 limit 件）
+    ?before=<message id>  そのメッセージより古いもの（履歴の遡り。古い順で返す）
+    （どちらもなし）       最新の limit 件
+    ?wait=<秒>            since 指定時、新着がなければ最大その秒数待ってから返す
+                          （既定 0。MESSAGES_LONG_POLL_MAX 秒で打ち切る。同期ワーカーを塞がないよう短く保つ）
+応答: {'results': [...], 'has_more', 'next_since', 'next_before'}
+
+並び順は (created_at, id) のキーセット。会話の絞り込みは
+(subject, sender, receiver, created_at) の複合インデックス（core_msgs_conv_idx）で行う。
+
+リアルタイムの新着は WebSocket で受け取る: メッセージ作成時（コミット後）に参加者へ
+message.created イベント（core.notification_buffer）を送るので、クライアントはそれを受けて ?since= で取得する。
+
+wait 中は DB を繰り返し検索しない。メッセージ作成時に参加者ごとのスタンプ（キャッシュ）を更新し、
+スタンプが変わったときだけ検索する（プロセス内キャッシュで他ワーカーの更新が見えない場合に備え、打ち切り時にも1回検索する）。
+"""
+import time
+import uuid
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from rest_framework import status
+from rest_framework.response import Response
+
+SYNC_PARAMS = ('since', 'before', 'limit', 'wait')
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+POLL_INTERVAL = 0.25  # スタンプを確認する間隔（秒）
+STAMP_KEY_PREFIX = 'msg_stamp'
+CREATED_EVENT_TYPE = 'message.created'
+
+
+def is_sync_request(request) -> bool:
+    return any(name in request.query_params for name in SYNC_PARAMS)
+
+
+# ============================================================
+# 新着スタンプ
+# ============================================================
+
+def _stamp_key(user_id) -> str:
+    return f'{STAMP_KEY_PREFIX}:{user_id}'
+
+
+def message_stamp(user_id) -> Optional[str]:
+    return cache.get(_stamp_key(user_id))
+
+
+def publish_created(message) -> None:
+    """コミット後に送信者・受信者の WebSocket へ新着を知らせる（シグナルから呼ぶ）"""
+    from . import notification_buffer
+
+    event = {
+        'type': CREATED_EVENT_TYPE,
+        'message_id': message.pk,
+        'subject': message.subject,
+        'sender': str(message.sender_id),
+        'receiver': str(message.receiver_id),
+    }
+    for user_id in {message.sender_id, message.receiver_id}:
+        if user_id:
+            notification_buffer.publish(user_id, event)
+
+
+def bump_message_stamp(*user_ids) -> None:
+    """コミット後に参加者の新着スタンプを更新する（シグナルから呼ぶ）"""
+    user_ids = [uid for uid in user_ids if uid]
+    if not user_ids:
+        return
+
+    def bump():
+        try:
+            cache.set_many({_stamp_key(uid): uuid.uuid4().hex for uid in user_ids}, timeout=3600)
+        except Exception:
+            pass
+
+    transaction.on_commit(bump)
+
+
+# ============================================================
+# キーセット
+# ============================================================
+
+def _position(message_id):
+    """カーソルのメッセージの (created_at, id)。見つからなければ (None, id)"""
+    from .models import Message
+
+    created_at = Message.objects.filter(id=message_id).values_list('created_at', flat=True).first()
+    return created_at, message_id
+
+
+def _newer(queryset, position, limit: int):
+    created_at, message_id = position
+    if created_at is None:
+        # カーソルのメッセージが削除されていれば id だけで続ける
+        queryset = queryset.filter(id__gt=message_id)
+    else:
+        queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=message_id))
+    return list(queryset.order_by('created_at', 'id')[:limit + 1])
+
+
+def _older(queryset, position, limit: int):
+    if position is not None:
+        created_at, message_id = position
+        if created_at is None:
+            queryset = queryset.filter(id__lt=message_id)
+        else:
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=message_id))
+    return list(queryset.order_by('-created_at', '-id')[:limit + 1])
+
+
+def _int_param(request, name: str) -> Optional[int]:
+    value = request.query_params.get(name)
+    if value in (None, ''):
+        return None
+    return int(value)
+
+
+def sync_response(request, queryset, serialize: Callable, watch_user_id) -> Response:
+    """同期モードの応答（queryset は会話で絞り込み済み。watch_user_id は新着スタンプを見る参加者）"""
+    try:
+        since = _int_param(request, 'since')
+        before = _int_param(request, 'before')
+        limit = max(1, min(_int_param(request, 'limit') or DEFAULT_LIMIT, MAX_LIMIT))
+        wait = max(0.0, min(float(request.query_params.get('wait') or 0), getattr(settings, 'MESSAGES_LONG_POLL_MAX', 2.0)))
+    except ValueError:
+        return Response({'error': 'invalid_cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if since is not None:
+        position = _position(since)
+        deadline = time.monotonic() + wait
+        stamp = message_stamp(watch_user_id)
+        rows = _newer(queryset, position, limit)
+        checked = True
+        while not rows and time.monotonic() < deadline:
+            time.sleep(min(POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+            current = message_stamp(watch_user_id)
+            checked = current != stamp
+            if checked:
+                stamp = current
+                rows = _newer(queryset, position, limit)
+        if not rows and not checked:
+            rows = _newer(queryset, position, limit)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        rows = _older(queryset, _position(before) if before is not None else None, limit)
+        has_more = len(rows) > limit
+        rows = list(reversed(rows[:limit]))
+
+    return Response({
+        'results': serialize(rows),
+        'has_more': has_more,
+        'next_since': rows[-1].id if rows else since,
+        'next_before': rows[0].id if rows else before,
+    }, status=status.HTTP_200_OK)
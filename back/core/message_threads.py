@@ -0,0 +1,191 @@
+"""
+添削スレッドの概要テーブル（MessageThread）
+
+advice_threads はスレッドごとの件数・最新メッセージ・未解決フラグをこの表から1回のクエリで返す
+（メッセージ全件の読み込みとシリアライズをしない）。
+
+- record_message(): 注釈付きメッセージの作成時（シグナル）。件数を F 式で増やし、最新メッセージを更新する
+- remove_message(): メッセージ削除時（シグナル）。該当スレッドを Message から集計し直す
+- set_resolved(): 注釈の解決・再開時（シグナル）。unresolved を注釈の状態に合わせる
+- rebuild_threads(): Message から作り直す（rebuild_message_threads コマンド）
+- rebuild_for_staff_change(): is_staff が変わったユーザーと、その相手のスレッドを作り直す（シグナル）
+
+対象は一般ユーザーと管理者（is_staff）の間の、注釈（annotation）付きメッセージのみ。
+管理者の判定は users を JOIN せず、名簿キャッシュ（core.staff_roster）と Message.is_staff_message で行う。
+unresolved はスレッドの注釈（最初のメッセージの注釈）が未解決かどうか。
+"""
+from typing import Iterable, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import staff_roster
+
+THREAD_ANNOTATION = 'annotation'
+THREAD_COMMENT = 'comment'
+
+
+def participants(message) -> Optional[Tuple[object, object]]:
+    """(一般ユーザーID, 管理者ID)。一般ユーザーと管理者の間のメッセージでなければ None"""
+    staff_ids = staff_roster.staff_ids()
+    sender_staff, receiver_staff = str(message.sender_id) in staff_ids, str(message.receiver_id) in staff_ids
+    if sender_staff and not receiver_staff:
+        return message.receiver_id, message.sender_id
+    if receiver_staff and not sender_staff:
+        return message.sender_id, message.receiver_id
+    return None
+
+
+def thread_keys(message) -> List[Tuple[str, str]]:
+    """メッセージが属するスレッドの (kind, thread_key)"""
+    return [
+        (THREAD_ANNOTATION, str(message.annotation_id)),
+        (THREAD_COMMENT, str(message.parent_id or message.id)),
+    ]
+
+
+def _thread_messages(user_id, subject: str, kind: str, key: str):
+    from .models import Message
+
+    staff_ids = staff_roster.staff_ids()
+    qs = Message.objects.filter(subject=subject, annotation__isnull=False, is_staff_message=True).filter(
+        Q(sender_id=user_id, receiver_id__in=staff_ids) | Q(sender_id__in=staff_ids, receiver_id=user_id)
+    )
+    if kind == THREAD_ANNOTATION:
+        return qs.filter(annotation_id=key)
+    return qs.filter(Q(id=key) | Q(parent_id=key))
+
+
+def rebuild_thread(user_id, subject: str, kind: str, key: str) -> None:
+    """1スレッドを Message から集計し直す（メッセージがなければ行を削除）"""
+    from .models import MessageThread
+
+    rows = list(
+        _thread_messages(user_id, subject, kind, key)
+        .order_by('created_at', 'id')
+        .values('id', 'sender_id', 'receiver_id', 'annotation_id', 'annotation__is_resolved', 'created_at')
+    )
+    threads = MessageThread.objects.filter(user_id=user_id, subject=subject, kind=kind, thread_key=key)
+    if not rows:
+        threads.delete()
+        return
+    first, last = rows[0], rows[-1]
+    MessageThread.objects.update_or_create(
+        user_id=user_id, subject=subject, kind=kind, thread_key=key,
+        defaults={
+            'staff_id': first['receiver_id'] if str(first['sender_id']) == str(user_id) else first['sender_id'],
+            'annotation_id': first['annotation_id'],
+            'root_id': first['id'],
+            'messages_count': len(rows),
+            'last_message_id': last['id'],
+            'last_message_at': last['created_at'],
+            'unresolved': not first['annotation__is_resolved'],
+        },
+    )
+
+
+def record_message(message) -> None:
+    """作成された注釈付きメッセージをスレッド概要に反映する"""
+    from .models import MessageThread
+
+    if not message.annotation_id:
+        return
+    pair = participants(message)
+    if pair is None:
+        return
+    user_id = pair[0]
+    now = timezone.now()
+    for kind, key in thread_keys(message):
+        threads = MessageThread.objects.filter(user_id=user_id, subject=message.subject, kind=kind, thread_key=key)
+        if threads.update(messages_count=F('messages_count') + 1, last_message_id=message.id,
+                          last_message_at=message.created_at, updated_at=now):
+            continue
+        # スレッドの最初のメッセージ（または概要が欠けていた）場合は実数から作成する
+        try:
+            with transaction.atomic():
+                rebuild_thread(user_id, message.subject, kind, key)
+        except IntegrityError:
+            threads.update(messages_count=F('messages_count') + 1, last_message_id=message.id,
+                           last_message_at=message.created_at, updated_at=now)
+
+
+def remove_message(message) -> None:
+    """削除されたメッセージのスレッドを集計し直す"""
+    from .models import MessageThread
+
+    if not message.annotation_id:
+        return
+    # 削除時は送受信者がすでに削除されていることがある（ユーザー削除のカスケード）ため、名簿で判定する
+    roster = staff_roster.staff_ids()
+    user_ids = [uid for uid in (message.sender_id, message.receiver_id) if str(uid) not in roster]
+    if len(user_ids) != 1:
+        return
+    for kind, key in thread_keys(message):
+        if MessageThread.objects.filter(user_id=user_ids[0], subject=message.subject, kind=kind, thread_key=key).exists():
+            rebuild_thread(user_ids[0], message.subject, kind, key)
+
+
+def set_resolved(annotation) -> None:
+    from .models import MessageThread
+
+    MessageThread.objects.filter(annotation_id=annotation.pk).exclude(unresolved=not annotation.is_resolved).update(
+        unresolved=not annotation.is_resolved, updated_at=timezone.now(),
+    )
+
+
+def rebuild_threads(user_ids: Optional[Iterable] = None) -> int:
+    """スレッド概要を Message から作り直し、作成した行数を返す（user_ids=None なら全ユーザー）"""
+    from .models import Message, MessageThread
+
+    staff_ids = staff_roster.staff_ids()
+    messages = Message.objects.filter(annotation__isnull=False, is_staff_message=True).exclude(
+        sender_id__in=staff_ids, receiver_id__in=staff_ids,
+    )
+    threads = MessageThread.objects.all()
+    wanted = None
+    if user_ids is not None:
+        user_ids = [uid for uid in user_ids if uid]
+        wanted = {str(uid) for uid in user_ids}
+        messages = messages.filter(Q(sender_id__in=user_ids) | Q(receiver_id__in=user_ids))
+        threads = threads.filter(user_id__in=user_ids)
+
+    summaries = {}
+    rows = messages.order_by('created_at', 'id').values(
+        'id', 'sender_id', 'receiver_id', 'subject', 'annotation_id',
+        'annotation__is_resolved', 'parent_id', 'created_at',
+    )
+    for m in rows.iterator(chunk_size=2000):
+        user_id, staff_id = (m['receiver_id'], m['sender_id']) if str(m['sender_id']) in staff_ids else (m['sender_id'], m['receiver_id'])
+        if wanted is not None and str(user_id) not in wanted:
+            continue
+        for kind, key in ((THREAD_ANNOTATION, str(m['annotation_id'])), (THREAD_COMMENT, str(m['parent_id'] or m['id']))):
+            thread = summaries.get((user_id, m['subject'], kind, key))
+            if thread is None:
+                thread = summaries[(user_id, m['subject'], kind, key)] = MessageThread(
+                    user_id=user_id, subject=m['subject'], kind=kind, thread_key=key, staff_id=staff_id,
+                    annotation_id=m['annotation_id'], root_id=m['id'], messages_count=0,
+                    unresolved=not m['annotation__is_resolved'],
+                )
+            thread.messages_count += 1
+            thread.last_message_id = m['id']
+            thread.last_message_at = m['created_at']
+    with transaction.atomic():
+        threads.delete()
+        MessageThread.objects.bulk_create(list(summaries.values()), batch_size=1000)
+    return len(summaries)
+
+
+def rebuild_for_staff_change(user_id) -> int:
+    """is_staff が変わったユーザーと、注釈付きメッセージをやり取りした相手のスレッド概要を作り直す
+
+    スレッドの持ち主（一般ユーザー側）と対象メッセージ（is_staff_message）が入れ替わるため。
+    Message.is_staff_message を付け直した後（staff_roster.sync_staff_messages の後）に呼ぶ。
+    """
+    from .models import Message
+
+    pairs = Message.objects.filter(
+        Q(sender_id=user_id) | Q(receiver_id=user_id), annotation__isnull=False,
+    ).values_list('sender_id', 'receiver_id').distinct()
+    user_ids = {user_id} | {uid for pair in pairs for uid in pair}
+    return rebuild_threads(list(user_ids))
@@ -0,0 +1,162 @@
+# Generated manually to add SeekerSearchDocument (denormalized seeker search table)
+
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# 以下はこのマイグレーション時点の core.search_index の凍結コピー（後の変更の影響を受けないようにする）
+PREFECTURES = (
+    '北海道', '青森県', '岩手県', '宮城県', '秋田県', '山形県', '福島県',
+    '茨城県', '栃木県', '群馬県', '埼玉県', '千葉県', '東京都', '神奈川県',
+    '新潟県', '富山県', '石川県', '福井県', '山梨県', '長野県', '岐阜県',
+    '静岡県', '愛知県', '三重県', '滋賀県', '京都府', '大阪府', '兵庫県',
+    '奈良県', '和歌山県', '鳥取県', '島根県', '岡山県', '広島県', '山口県',
+    '徳島県', '香川県', '愛媛県', '高知県', '福岡県', '佐賀県', '長崎県',
+    '熊本県', '大分県', '宮崎県', '鹿児島県', '沖縄県',
+)
+PREFECTURE_ALIASES = {p[:-1]: p for p in PREFECTURES if p != '北海道'}
+PREFECTURE_ALIASES['北海'] = '北海道'
+WORD_SPLIT_RE = re.compile(r'[\s、。，．,.・/／|｜;:：;「」『』()（）\[\]【】]+')
+NUMBER_RE = re.compile(r'\d+')
+BATCH_SIZE = 500
+
+
+def normalize_text(value):
+    if value is None:
+        return ''
+    text = unicodedata.normalize('NFKC', str(value)).lower()
+    return ' '.join(text.split())
+
+
+def normalize_prefecture(value):
+    text = normalize_text(value).replace(' ', '')
+    if text in PREFECTURES:
+        return text
+    return PREFECTURE_ALIASES.get(text, text)
+
+
+def parse_salary(value):
+    if value is None:
+        return None
+    match = NUMBER_RE.search(unicodedata.normalize('NFKC', str(value)).replace(',', ''))
+    if not match:
+        return None
+    number = int(match.group())
+    return number if number <= 2 ** 31 - 1 else None
+
+
+def tokenize_keywords(*texts):
+    tokens = []
+    for text in texts:
+        for token in WORD_SPLIT_RE.split(normalize_text(text)):
+            if token and token not in tokens:
+                tokens.append(token)
+    return ' '.join(tokens)
+
+
+def join_tokens(values, normalizer=normalize_text):
+    tokens = []
+    for value in values or []:
+        token = normalizer(value).replace('|', ' ')
+        if token and token not in tokens:
+            tokens.append(token)
+    return '|' + '|'.join(tokens) + '|' if tokens else ''
+
+
+def as_list(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if isinstance(value, str) and value:
+        return [s for s in re.split(r'[,、]', value) if s.strip()]
+    return []
+
+
+def build_document_fields(profile, resumes, experience_industries):
+    desired_locations, desired_industries, desired_jobs, keyword_sources = [], [], [], []
+    for resume in resumes:
+        desired_locations.extend(as_list(resume['desired_locations']))
+        desired_industries.extend(as_list(resume['desired_industries']))
+        if resume['desired_job']:
+            desired_jobs.append(resume['desired_job'])
+        keyword_sources.extend([resume['skills'], resume['self_pr']])
+    return {
+        'user_id': profile.user_id,
+        'prefecture': normalize_prefecture(profile.prefecture),
+        'desired_locations': join_tokens(desired_locations, normalize_prefecture),
+        'desired_industries': join_tokens(desired_industries),
+        'experience_industries': join_tokens(experience_industries),
+        'desired_jobs': join_tokens(desired_jobs),
+        'experience_years': profile.experience_years or 0,
+        'desired_salary': parse_salary(profile.desired_salary),
+        'keywords': tokenize_keywords(*keyword_sources),
+        'created_at': profile.user.created_at,
+    }
+
+
+def backfill_documents(apps, schema_editor):
+    SeekerProfile = apps.get_model('core', 'SeekerProfile')
+    Resume = apps.get_model('core', 'Resume')
+    Experience = apps.get_model('core', 'Experience')
+    SeekerSearchDocument = apps.get_model('core', 'SeekerSearchDocument')
+
+    profiles = list(SeekerProfile.objects.select_related('user').order_by('pk'))
+    for i in range(0, len(profiles), BATCH_SIZE):
+        chunk = profiles[i:i + BATCH_SIZE]
+        user_ids = [profile.user_id for profile in chunk]
+        # 求職者ごとに2回ではなく、バッチごとに履歴書・職歴を1回ずつ読む
+        resumes = defaultdict(list)
+        for row in Resume.objects.filter(user_id__in=user_ids).order_by('pk').values(
+                'user_id', 'desired_job', 'desired_locations', 'desired_industries', 'skills', 'self_pr'):
+            resumes[row['user_id']].append(row)
+        industries = defaultdict(list)
+        for user_id, industry in (
+                Experience.objects.filter(resume__user_id__in=user_ids).exclude(industry='')
+                .order_by('pk').values_list('resume__user_id', 'industry')):
+            industries[user_id].append(industry)
+        SeekerSearchDocument.objects.bulk_create([
+            SeekerSearchDocument(
+                seeker_profile=profile,
+                **build_document_fields(profile, resumes[profile.user_id], industries[profile.user_id]),
+            )
+            for profile in chunk
+        ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_interview_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeekerSearchDocument',
+            fields=[
+                ('seeker_profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='core.seekerprofile')),
+                ('prefecture', models.CharField(blank=True, max_length=20)),
+                ('desired_locations', models.TextField(blank=True)),
+                ('desired_industries', models.TextField(blank=True)),
+                ('experience_industries', models.TextField(blank=True)),
+                ('desired_jobs', models.TextField(blank=True)),
+                ('experience_years', models.IntegerField(default=0)),
+                ('desired_salary', models.IntegerField(blank=True, null=True)),
+                ('keywords', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='seeker_search_document', to='core.user')),
+            ],
+            options={
+                'db_table': 'seeker_search_documents',
+                'indexes': [
+                    models.Index(fields=['prefecture', 'experience_years'], name='core_ssd_pref_exp_idx'),
+                    models.Index(fields=['experience_years'], name='core_ssd_exp_idx'),
+                    models.Index(fields=['desired_salary'], name='core_ssd_salary_idx'),
+                    models.Index(fields=['-created_at'], name='core_ssd_created_idx'),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+    ]
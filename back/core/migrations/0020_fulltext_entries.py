@@ -0,0 +1,75 @@
+# Generated manually to add FullTextEntry and the vendor specific full-text indexes
+
+from django.db import migrations, models
+
+
+def install_structures(apps, schema_editor):
+    from core import fulltext
+    fulltext.install_search_structures(schema_editor.connection)
+
+
+def uninstall_structures(apps, schema_editor):
+    from core import fulltext
+    fulltext.uninstall_search_structures(schema_editor.connection)
+
+
+def backfill_entries(apps, schema_editor):
+    from core import fulltext
+
+    SeekerProfile = apps.get_model('core', 'SeekerProfile')
+    Resume = apps.get_model('core', 'Resume')
+    Message = apps.get_model('core', 'Message')
+    FullTextEntry = apps.get_model('core', 'FullTextEntry')
+
+    def flush(doc_type, items):
+        entries = [
+            FullTextEntry(doc_type=doc_type, object_id=str(object_id), body=text, tokens=fulltext.tokenize_document(text))
+            for object_id, text in items if (text or '').strip()
+        ]
+        FullTextEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+    batch = []
+    for profile in SeekerProfile.objects.only('id', 'user_id').iterator(chunk_size=500):
+        resumes = Resume.objects.filter(user_id=profile.user_id).only('skills', 'self_pr')
+        batch.append((profile.id, fulltext.seeker_document_text(resumes)))
+        if len(batch) >= 500:
+            flush(fulltext.DOC_SEEKER, batch)
+            batch = []
+    flush(fulltext.DOC_SEEKER, batch)
+
+    batch = []
+    for message_id, content in Message.objects.values_list('id', 'content').iterator(chunk_size=2000):
+        batch.append((message_id, content))
+        if len(batch) >= 2000:
+            flush(fulltext.DOC_MESSAGE, batch)
+            batch = []
+    flush(fulltext.DOC_MESSAGE, batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_seeker_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FullTextEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('doc_type', models.CharField(max_length=20)),
+                ('object_id', models.CharField(max_length=64)),
+                ('body', models.TextField()),
+                ('tokens', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'fulltext_entries',
+                'constraints': [
+                    models.UniqueConstraint(fields=('doc_type', 'object_id'), name='uniq_fulltext_doc'),
+                ],
+            },
+        ),
+        migrations.RunPython(install_structures, uninstall_structures),
+        migrations.RunPython(backfill_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated manually to add (created_at, id) style indexes for keyset pagination
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_fulltext_entries'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-created_at', '-id'], name='core_users_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', '-created_at', '-id'], name='core_users_role_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resume',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='core_resumes_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jobposting',
+            index=models.Index(fields=['company', '-created_at', '-id'], name='core_jobs_company_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jobposting',
+            index=models.Index(fields=['is_active', '-created_at', '-id'], name='core_jobs_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['company', '-applied_at', '-id'], name='core_apps_company_applied_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scout',
+            index=models.Index(fields=['seeker', '-scouted_at', '-id'], name='core_scouts_seeker_scouted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['receiver', '-created_at', '-id'], name='core_msgs_receiver_created_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='seekersearchdocument',
+            name='core_ssd_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='seekersearchdocument',
+            index=models.Index(fields=['-created_at', '-seeker_profile'], name='core_ssd_created_pk_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated manually to add float32 binary vector columns for the matching engine
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seekerprofile',
+            name='skill_vector_f32',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='resume',
+            name='resume_vector_f32',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='experience',
+            name='embedding_f32',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='jobposting',
+            name='skills_vector_f32',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated manually to add AnalyticsDailyRollup (materialized daily admin analytics)
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_matching_vectors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsDailyRollup',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('registrations', models.IntegerField(default=0)),
+                ('seeker_registrations', models.IntegerField(default=0)),
+                ('company_registrations', models.IntegerField(default=0)),
+                ('logins', models.IntegerField(default=0)),
+                ('payments', models.IntegerField(default=0)),
+                ('snapshot', models.JSONField(blank=True, default=dict)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'analytics_daily_rollups',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['last_login'], name='core_users_last_login_idx'),
+        ),
+    ]
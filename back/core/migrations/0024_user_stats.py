@@ -0,0 +1,35 @@
+# Generated manually to add UserStats (denormalized per-user counters)
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_analytics_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='core.user')),
+                ('resumes_count', models.IntegerField(default=0)),
+                ('active_resumes_count', models.IntegerField(default=0)),
+                ('experiences_count', models.IntegerField(default=0)),
+                ('applications_count', models.IntegerField(default=0)),
+                ('scouts_received_count', models.IntegerField(default=0)),
+                ('applications_received_count', models.IntegerField(default=0)),
+                ('pending_applications_count', models.IntegerField(default=0)),
+                ('scouts_sent_count', models.IntegerField(default=0)),
+                ('active_scouts_count', models.IntegerField(default=0)),
+                ('messages_sent_count', models.IntegerField(default=0)),
+                ('messages_received_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'user_stats',
+            },
+        ),
+    ]
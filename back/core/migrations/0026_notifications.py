@@ -0,0 +1,94 @@
+# Generated manually to add Notification / NotificationCounter (persistent notifications and unread counters)
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+ADVICE_KINDS = ('resume_advice', 'advice', 'interview')
+
+
+def backfill_advice_notifications(apps, schema_editor):
+    """未読のアドバイス系メッセージを通知として取り込み、未読カウンタを作成する"""
+    Message = apps.get_model('core', 'Message')
+    Notification = apps.get_model('core', 'Notification')
+    NotificationCounter = apps.get_model('core', 'NotificationCounter')
+
+    unread = (
+        Message.objects.filter(subject__in=ADVICE_KINDS, is_read=False, sender__is_staff=True)
+        .order_by('created_at')
+        .values('id', 'receiver_id', 'subject', 'content', 'annotation_id', 'parent_id', 'created_at')
+    )
+    batch = []
+    counters = {}
+    for m in unread.iterator(chunk_size=1000):
+        batch.append(Notification(
+            user_id=m['receiver_id'], kind=m['subject'], body=(m['content'] or '')[:300],
+            data={
+                'message_id': str(m['id']),
+                'annotation_id': str(m['annotation_id']) if m['annotation_id'] else None,
+                'parent_id': str(m['parent_id']) if m['parent_id'] else None,
+            },
+            source_type='message', source_id=str(m['id']), created_at=m['created_at'],
+        ))
+        key = (m['receiver_id'], m['subject'])
+        count, _ = counters.get(key, (0, None))
+        counters[key] = (count + 1, m['created_at'])
+        if len(batch) >= 1000:
+            Notification.objects.bulk_create(batch)
+            batch = []
+    Notification.objects.bulk_create(batch)
+    NotificationCounter.objects.bulk_create([
+        NotificationCounter(user_id=user_id, kind=kind, unread_count=count, latest_at=latest_at)
+        for (user_id, kind), (count, latest_at) in counters.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_email_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=50)),
+                ('title', models.CharField(blank=True, max_length=200)),
+                ('body', models.CharField(blank=True, max_length=300)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('source_type', models.CharField(blank=True, max_length=30)),
+                ('source_id', models.CharField(blank=True, max_length=64)),
+                ('is_read', models.BooleanField(default=False)),
+                ('read_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='core.user')),
+            ],
+            options={
+                'db_table': 'notifications',
+                'ordering': ['-id'],
+                'indexes': [
+                    models.Index(fields=['user', 'is_read', 'created_at'], name='core_notif_user_read_idx'),
+                    models.Index(fields=['user', 'id'], name='core_notif_user_cursor_idx'),
+                    models.Index(fields=['source_type', 'source_id'], name='core_notif_source_idx'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50)),
+                ('unread_count', models.IntegerField(default=0)),
+                ('latest_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_counters', to='core.user')),
+            ],
+            options={
+                'db_table': 'notification_counters',
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind'), name='uniq_notification_counter')],
+            },
+        ),
+        migrations.RunPython(backfill_advice_notifications, migrations.RunPython.noop),
+    ]
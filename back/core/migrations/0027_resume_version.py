@@ -0,0 +1,18 @@
+# Generated manually to add Resume.version (optimistic concurrency for the resume delta API)
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_notifications'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resume',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
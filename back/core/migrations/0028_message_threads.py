@@ -0,0 +1,71 @@
+# Generated manually to add MessageThread (per-thread summaries for advice_threads)
+
+from django.db import migrations, models
+from django.db.models import Q
+import django.db.models.deletion
+
+
+def backfill_message_threads(apps, schema_editor):
+    """一般ユーザー↔管理者の注釈付きメッセージからスレッド概要を作成する"""
+    Message = apps.get_model('core', 'Message')
+    MessageThread = apps.get_model('core', 'MessageThread')
+
+    rows = (
+        Message.objects.filter(annotation__isnull=False)
+        .filter(Q(sender__is_staff=True, receiver__is_staff=False) | Q(sender__is_staff=False, receiver__is_staff=True))
+        .order_by('created_at', 'id')
+        .values('id', 'sender_id', 'receiver_id', 'sender__is_staff', 'subject', 'annotation_id',
+                'annotation__is_resolved', 'parent_id', 'created_at')
+    )
+    threads = {}
+    for m in rows.iterator(chunk_size=2000):
+        if m['sender__is_staff']:
+            user_id, staff_id = m['receiver_id'], m['sender_id']
+        else:
+            user_id, staff_id = m['sender_id'], m['receiver_id']
+        for kind, key in (('annotation', str(m['annotation_id'])), ('comment', str(m['parent_id'] or m['id']))):
+            thread = threads.get((user_id, m['subject'], kind, key))
+            if thread is None:
+                thread = threads[(user_id, m['subject'], kind, key)] = MessageThread(
+                    user_id=user_id, subject=m['subject'], kind=kind, thread_key=key, staff_id=staff_id,
+                    annotation_id=m['annotation_id'], root_id=m['id'], messages_count=0,
+                    unresolved=not m['annotation__is_resolved'],
+                )
+            thread.messages_count += 1
+            thread.last_message_id = m['id']
+            thread.last_message_at = m['created_at']
+    MessageThread.objects.bulk_create(list(threads.values()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_resume_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageThread',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('annotation', '注釈ごと'), ('comment', '親メッセージごと')], max_length=20)),
+                ('thread_key', models.CharField(max_length=64)),
+                ('subject', models.CharField(blank=True, max_length=200)),
+                ('root_id', models.BigIntegerField()),
+                ('messages_count', models.IntegerField(default=0)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('unresolved', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('annotation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='threads', to='core.annotation')),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.message')),
+                ('staff', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.user')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_threads', to='core.user')),
+            ],
+            options={
+                'db_table': 'message_threads',
+                'constraints': [models.UniqueConstraint(fields=('user', 'subject', 'kind', 'thread_key'), name='uniq_message_thread')],
+                'indexes': [models.Index(fields=['user', 'subject', 'kind', 'last_message_at'], name='core_msgthread_list_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_message_threads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated manually to add the (subject, sender, receiver, created_at) index for incremental message sync
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_message_threads'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['subject', 'sender', 'receiver', 'created_at'], name='core_msgs_conv_idx'),
+        ),
+    ]
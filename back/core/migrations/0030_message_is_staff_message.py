@@ -0,0 +1,32 @@
+# Generated manually to add the denormalized Message.is_staff_message flag
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def backfill_staff_messages(apps, schema_editor):
+    Message = apps.get_model('core', 'Message')
+    User = apps.get_model('core', 'User')
+    staff_ids = list(User.objects.filter(is_staff=True).values_list('id', flat=True))
+    if staff_ids:
+        Message.objects.filter(Q(sender_id__in=staff_ids) | Q(receiver_id__in=staff_ids)).update(is_staff_message=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_message_conversation_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='is_staff_message',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill_staff_messages, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['receiver', 'is_staff_message', 'subject', 'is_read'], name='core_msgs_staff_recv_idx'),
+        ),
+    ]
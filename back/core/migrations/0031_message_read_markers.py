@@ -0,0 +1,37 @@
+# Generated manually to add per-subject message read watermarks (MessageReadMarker)
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_message_is_staff_message'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageReadMarker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=200)),
+                ('read_through', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_read_markers', to='core.user')),
+            ],
+            options={
+                'db_table': 'message_read_markers',
+                'constraints': [models.UniqueConstraint(fields=('user', 'subject'), name='uniq_message_read_marker')],
+            },
+        ),
+        # 既読化・未読件数は created_at の範囲で引く（is_read の代わりに created_at を末尾に置く）
+        migrations.RemoveIndex(
+            model_name='message',
+            name='core_msgs_staff_recv_idx',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['receiver', 'is_staff_message', 'subject', 'created_at'], name='core_msgs_staff_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated manually to add the StripeEvent idempotency / processing queue table
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def import_processed_events(apps, schema_editor):
+    """ActivityLog に記録済みのイベントを processed として登録する（Stripe の再送で二重に反映しない）"""
+    ActivityLog = apps.get_model('core', 'ActivityLog')
+    StripeEvent = apps.get_model('core', 'StripeEvent')
+    rows, seen = [], set()
+    logs = ActivityLog.objects.filter(details__has_key='stripe_event_id').values_list('details', 'created_at')
+    for details, created_at in logs.iterator(chunk_size=2000):
+        event_id = str((details or {}).get('stripe_event_id') or '')
+        if not event_id or event_id in seen:
+            continue
+        seen.add(event_id)
+        rows.append(StripeEvent(
+            event_id=event_id, event_type='checkout.session.completed', status='processed',
+            result='imported', processed_at=created_at,
+        ))
+    StripeEvent.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_message_read_markers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True)),
+                ('event_type', models.CharField(blank=True, max_length=100)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', '処理待ち'), ('processing', '処理中'), ('processed', '処理済み'), ('dead', '処理不可')], default='pending', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('result', models.CharField(blank=True, max_length=50)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'stripe_events',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='core_stripe_status_next_idx')],
+            },
+        ),
+        migrations.RunPython(import_processed_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated manually to add the (user, updated_at, id) index used by resume list keyset pagination
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_stripe_events'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='resume',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='core_resumes_user_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated manually to add SeekerSearchTag (indexed exact-match lookups for multi-value seeker search filters)
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# このマイグレーション時点の core.search_index.TAG_FIELDS
+TAG_FIELDS = {
+    'desired_locations': 'desired_location',
+    'desired_industries': 'desired_industry',
+    'experience_industries': 'experience_industry',
+    'desired_jobs': 'desired_job',
+}
+BATCH_SIZE = 1000
+
+
+def backfill_tags(apps, schema_editor):
+    SeekerSearchDocument = apps.get_model('core', 'SeekerSearchDocument')
+    SeekerSearchTag = apps.get_model('core', 'SeekerSearchTag')
+
+    batch = []
+    rows = SeekerSearchDocument.objects.order_by('pk').values_list('pk', *TAG_FIELDS)
+    for pk, *columns in rows.iterator(chunk_size=BATCH_SIZE):
+        for joined, field in zip(columns, TAG_FIELDS.values()):
+            for value in {token[:255] for token in (joined or '').split('|') if token}:
+                batch.append(SeekerSearchTag(document_id=pk, field=field, value=value))
+        if len(batch) >= BATCH_SIZE:
+            SeekerSearchTag.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        SeekerSearchTag.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_resume_updated_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeekerSearchTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=255)),
+                ('document', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='tags', to='core.seekersearchdocument')),
+            ],
+            options={
+                'db_table': 'seeker_search_tags',
+                'constraints': [
+                    models.UniqueConstraint(fields=('document', 'field', 'value'), name='uniq_seeker_search_tag'),
+                ],
+                'indexes': [
+                    models.Index(fields=['field', 'value', 'document'], name='core_sst_lookup_idx'),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated manually to store the full-text tsvector in a generated column (PostgreSQL only)
+
+from django.db import migrations
+
+FORWARD_SQL = [
+    "ALTER TABLE fulltext_entries ADD COLUMN IF NOT EXISTS tsv tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', tokens)) STORED",
+    "DROP INDEX IF EXISTS fulltext_entries_tsv_gin",
+    "CREATE INDEX IF NOT EXISTS fulltext_entries_tsv_col_gin ON fulltext_entries USING GIN (tsv)",
+]
+
+REVERSE_SQL = [
+    "DROP INDEX IF EXISTS fulltext_entries_tsv_col_gin",
+    "ALTER TABLE fulltext_entries DROP COLUMN IF EXISTS tsv",
+    "CREATE INDEX IF NOT EXISTS fulltext_entries_tsv_gin ON fulltext_entries USING GIN (to_tsvector('simple', tokens))",
+]
+
+
+def _run(schema_editor, statements):
+    # SQLite（FTS5）/ その他の DB では何もしない
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def add_tsvector_column(apps, schema_editor):
+    _run(schema_editor, FORWARD_SQL)
+
+
+def remove_tsvector_column(apps, schema_editor):
+    _run(schema_editor, REVERSE_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_seeker_search_tags'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_tsvector_column, remove_tsvector_column),
+    ]
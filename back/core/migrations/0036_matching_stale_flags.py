@@ -0,0 +1,31 @@
+# Generated manually to mark seekers and jobs whose matching vectors need recomputing (processed by build_matching_vectors --stale)
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_fulltext_stored_tsvector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seekerprofile',
+            name='matching_stale',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='jobposting',
+            name='matching_stale',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='seekerprofile',
+            index=models.Index(condition=models.Q(('matching_stale', True)), fields=['matching_stale'], name='core_seekers_match_stale_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jobposting',
+            index=models.Index(condition=models.Q(('matching_stale', True)), fields=['matching_stale'], name='core_jobs_match_stale_idx'),
+        ),
+    ]
@@ -63,6 +63,11 @@ class User(AbstractUser):
             models.Index(fields=['email', 'role']),
             models.Index(fields=['created_at']),
             models.Index(fields=['plan_tier']),
+            # キーセットページネーション用
+            models.Index(fields=['-created_at', '-id'], name='core_users_created_id_idx'),
+            models.Index(fields=['role', '-created_at', '-id'], name='core_users_role_created_idx'),
+            # 管理者分析（ログイン状況の集計）用
+            models.Index(fields=['last_login'], name='core_users_last_login_idx'),
         ]
     
     def __str__(self):
@@ -103,6 +108,8 @@ class SeekerProfile(models.Model):
     # 機械学習用フィールド
     skill_vector = models.JSONField(default=list, blank=True)  # スキルの特徴ベクトル
     profile_embeddings = models.JSONField(default=dict, blank=True)  # プロフィールの埋め込み表現
+    skill_vector_f32 = models.BinaryField(null=True, blank=True, editable=False)  # マッチング用ベクトル（float32 バイナリ）
+    matching_stale = models.BooleanField(default=False, editable=False)  # ベクトルの再計算待ち（build_matching_vectors --stale）
     
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -112,6 +119,7 @@ class SeekerProfile(models.Model):
             models.Index(fields=['prefecture']),
             models.Index(fields=['experience_years']),
             models.Index(fields=['graduation_year']),
+            models.Index(fields=['matching_stale'], condition=models.Q(matching_stale=True), name='core_seekers_match_stale_idx'),
         ]
     
     def __str__(self):
@@ -277,11 +285,14 @@ class Resume(models.Model):
     
     # 機械学習用フィールド
     resume_vector = models.JSONField(default=list, blank=True)  # 履歴書全体の特徴ベクトル
+    resume_vector_f32 = models.BinaryField(null=True, blank=True, editable=False)  # マッチング用ベクトル（float32 バイナリ）
     match_score = models.FloatField(default=0.0, validators=[MinValueValidator(0.0), MaxValueValidator(100.0)])  # マッチングスコア
     
     # ステータス
     is_active = models.BooleanField(default=True)
     submitted_at = models.DateTimeField(default=timezone.now)
+    # 楽観的排他制御の版数（ETag / If-Match。更新のたびに1増やす）
+    version = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -292,6 +303,8 @@ class Resume(models.Model):
             models.Index(fields=['-submitted_at']),
             models.Index(fields=['is_active']),
             models.Index(fields=['-match_score']),
+            models.Index(fields=['user', '-created_at', '-id'], name='core_resumes_user_created_idx'),
+            models.Index(fields=['user', '-updated_at', '-id'], name='core_resumes_user_updated_idx'),
         ]
     
     def __str__(self):
@@ -364,6 +377,7 @@ class Experience(models.Model):
     # 機械学習用フィールド
     experience_embeddings = models.JSONField(default=dict, blank=True)  # 職歴の埋め込み表現
     skill_tags = models.JSONField(default=list, blank=True)  # 抽出されたスキルタグ
+    embedding_f32 = models.BinaryField(null=True, blank=True, editable=False)  # マッチング用ベクトル（float32 バイナリ）
     
     order = models.IntegerField(default=0)
     
@@ -446,6 +460,10 @@ class JobPosting(models.Model):
     skills_required = models.TextField(blank=True)
     benefits = models.TextField(blank=True)
     
+    # 機械学習用フィールド
+    skills_vector_f32 = models.BinaryField(null=True, blank=True, editable=False)  # マッチング用ベクトル（float32 バイナリ）
+    matching_stale = models.BooleanField(default=False, editable=False)  # ベクトルの再計算待ち（build_matching_vectors --stale）
+    
     # ステータス
     deadline = models.DateField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
@@ -455,6 +473,11 @@ class JobPosting(models.Model):
     class Meta:
         db_table = 'job_postings'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['company', '-created_at', '-id'], name='core_jobs_company_created_idx'),
+            models.Index(fields=['is_active', '-created_at', '-id'], name='core_jobs_active_created_idx'),
+            models.Index(fields=['matching_stale'], condition=models.Q(matching_stale=True), name='core_jobs_match_stale_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.company.company_name if hasattr(self.company, 'company_profile') else self.company.email}"
@@ -500,6 +523,7 @@ class Application(models.Model):
             models.Index(fields=['company', 'status']),
             models.Index(fields=['applicant', '-applied_at']),
             models.Index(fields=['-match_score']),
+            models.Index(fields=['company', '-applied_at', '-id'], name='core_apps_company_applied_idx'),
         ]
     
     def __str__(self):
@@ -536,6 +560,7 @@ class Scout(models.Model):
             models.Index(fields=['status', '-scouted_at']),
             models.Index(fields=['seeker', 'status']),
             models.Index(fields=['company', '-scouted_at']),
+            models.Index(fields=['seeker', '-scouted_at', '-id'], name='core_scouts_seeker_scouted_idx'),
         ]
     
     def __str__(self):
@@ -560,6 +585,8 @@ class Message(models.Model):
     annotation = models.ForeignKey('Annotation', on_delete=models.SET_NULL, null=True, blank=True, related_name='messages')
     # スレッド返信（任意）
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    # 送信者・受信者のどちらかが管理者（is_staff）か（users を JOIN せずに絞り込むための非正規化。core.staff_roster）
+    is_staff_message = models.BooleanField(default=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -568,6 +595,11 @@ class Message(models.Model):
         indexes = [
             models.Index(fields=['receiver', 'is_read', '-created_at']),
             models.Index(fields=['sender', '-created_at']),
+            models.Index(fields=['receiver', '-created_at', '-id'], name='core_msgs_receiver_created_idx'),
+            # 会話の差分同期（core.message_sync）
+            models.Index(fields=['subject', 'sender', 'receiver', 'created_at'], name='core_msgs_conv_idx'),
+            # 管理者とのやり取り（アドバイス系の未読件数・既読化。既読位置からの範囲検索。core.message_reads）
+            models.Index(fields=['receiver', 'is_staff_message', 'subject', 'created_at'], name='core_msgs_staff_unread_idx'),
         ]
     
     def __str__(self):
@@ -1037,3 +1069,363 @@ class PromptTemplate(models.Model):
 
     def __str__(self):
         return f"{self.name} ({self.get_target_display()})"
+
+
+# ============================================================
+# 検索インデックス（非正規化テーブル）
+# ============================================================
+
+class SeekerSearchDocument(models.Model):
+    """求職者検索用の非正規化ドキュメント（SeekerProfile / Resume / Experience から再構築）"""
+    seeker_profile = models.OneToOneField(
+        SeekerProfile, on_delete=models.CASCADE, primary_key=True, related_name='search_document'
+    )
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='seeker_search_document')
+
+    # 正規化済みの検索条件（複数値は "|値1|値2|" 形式）
+    prefecture = models.CharField(max_length=20, blank=True)
+    desired_locations = models.TextField(blank=True)
+    desired_industries = models.TextField(blank=True)
+    experience_industries = models.TextField(blank=True)
+    desired_jobs = models.TextField(blank=True)
+    experience_years = models.IntegerField(default=0)
+    desired_salary = models.IntegerField(null=True, blank=True)  # desired_salary を整数化したもの
+
+    # skills / self_pr の正規化トークン（空白区切り）
+    keywords = models.TextField(blank=True)
+
+    created_at = models.DateTimeField()  # ユーザー登録日時のコピー（並び順用）
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'seeker_search_documents'
+        indexes = [
+            models.Index(fields=['prefecture', 'experience_years'], name='core_ssd_pref_exp_idx'),
+            models.Index(fields=['experience_years'], name='core_ssd_exp_idx'),
+            models.Index(fields=['desired_salary'], name='core_ssd_salary_idx'),
+            models.Index(fields=['-created_at', '-seeker_profile'], name='core_ssd_created_pk_idx'),
+        ]
+
+    def __str__(self):
+        return f"SearchDocument({self.user_id})"
+
+
+class SeekerSearchTag(models.Model):
+    """検索ドキュメントの複数値カラム（"|値1|値2|"）を1値1行に展開したもの
+
+    希望勤務地・業界・職種の絞り込みを LIKE '%|値|%' ではなく (field, value) の完全一致の索引で行う。
+    core.search_index がドキュメントと同時に書き換える。
+    """
+    FIELD_DESIRED_LOCATION = 'desired_location'
+    FIELD_DESIRED_INDUSTRY = 'desired_industry'
+    FIELD_EXPERIENCE_INDUSTRY = 'experience_industry'
+    FIELD_DESIRED_JOB = 'desired_job'
+
+    # ドキュメント側の参照は一意制約 (document, field, value) の索引で足りる
+    document = models.ForeignKey(SeekerSearchDocument, on_delete=models.CASCADE, related_name='tags', db_index=False)
+    field = models.CharField(max_length=20)
+    value = models.CharField(max_length=255)
+
+    class Meta:
+        db_table = 'seeker_search_tags'
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'field', 'value'], name='uniq_seeker_search_tag'),
+        ]
+        indexes = [
+            models.Index(fields=['field', 'value', 'document'], name='core_sst_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.field}={self.value}"
+
+
+class FullTextEntry(models.Model):
+    """全文検索の文書（core.fulltext が管理。SQLite では FTS5 仮想テーブルがトリガーで追従）"""
+    id = models.BigAutoField(primary_key=True)  # FTS5 の content_rowid として使用
+    doc_type = models.CharField(max_length=20)
+    object_id = models.CharField(max_length=64)
+    body = models.TextField()  # 元テキスト（スニペット生成用）
+    tokens = models.TextField()  # N-gram トークン列（空白区切り）
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'fulltext_entries'
+        constraints = [
+            models.UniqueConstraint(fields=['doc_type', 'object_id'], name='uniq_fulltext_doc'),
+        ]
+
+    def __str__(self):
+        return f"{self.doc_type}:{self.object_id}"
+
+
+# ============================================================
+# 集計（ロールアップ）
+# ============================================================
+
+class AnalyticsDailyRollup(models.Model):
+    """管理者分析の日次ロールアップ（core.analytics / rollup_analytics コマンドが作成）
+
+    - 日次のイベント件数（登録・ログイン・支払い）は日ごとに合計できる
+    - snapshot はその日の終了時点の状態（総数・プラン分布・ログイン状況・年齢分布）
+    """
+    date = models.DateField(primary_key=True)
+
+    registrations = models.IntegerField(default=0)
+    seeker_registrations = models.IntegerField(default=0)
+    company_registrations = models.IntegerField(default=0)
+    logins = models.IntegerField(default=0)  # 最終ログイン日がこの日のユーザー数
+    payments = models.IntegerField(default=0)
+
+    snapshot = models.JSONField(default=dict, blank=True)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'analytics_daily_rollups'
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"AnalyticsDailyRollup({self.date})"
+
+
+class UserStats(models.Model):
+    """ユーザーごとの件数カウンタ（ダッシュボード用の非正規化テーブル）
+
+    core.signals が Resume / Experience / Application / Scout / Message の作成・削除・
+    ステータス変更に合わせて F 式で増減する。ずれは reconcile_user_stats コマンドで修正。
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+
+    # 求職者
+    resumes_count = models.IntegerField(default=0)
+    active_resumes_count = models.IntegerField(default=0)
+    experiences_count = models.IntegerField(default=0)
+    applications_count = models.IntegerField(default=0)
+    scouts_received_count = models.IntegerField(default=0)
+
+    # 企業
+    applications_received_count = models.IntegerField(default=0)
+    pending_applications_count = models.IntegerField(default=0)
+    scouts_sent_count = models.IntegerField(default=0)
+    active_scouts_count = models.IntegerField(default=0)
+
+    # 共通
+    messages_sent_count = models.IntegerField(default=0)
+    messages_received_count = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'user_stats'
+
+    def __str__(self):
+        return f"UserStats({self.user_id})"
+
+
+# ============================================================
+# メール送信キュー（アウトボックス）
+# ============================================================
+
+class EmailOutbox(models.Model):
+    """送信待ちメール（core.email_outbox.enqueue が作成し、send_outbox_emails コマンドが送信）
+
+    API の処理中は行を追加するだけにし、SMTP の遅延・障害をリクエストに持ち込まない。
+    失敗時は指数バックオフで再試行し、上限回数を超えたら dead（手動で再送可能）。
+    """
+    STATUS_CHOICES = [
+        ('pending', '送信待ち'),
+        ('sending', '送信中'),
+        ('sent', '送信済み'),
+        ('dead', '送信不可'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    category = models.CharField(max_length=50, blank=True)  # scout_notification / resume_pdf など
+    from_email = models.CharField(max_length=254, blank=True)  # 空なら DEFAULT_FROM_EMAIL
+    to = models.JSONField(default=list)  # 宛先メールアドレスのリスト
+    subject = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    # [{'filename', 'mimetype', 'content_b64'} | {'filename', 'mimetype', 'pdf_job'}]
+    attachments = models.JSONField(default=list, blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)  # sending にした時刻（ワーカー異常終了の検出用）
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'email_outbox'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='core_outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"EmailOutbox({', '.join(self.to)}: {self.subject} [{self.status}])"
+
+
+class StripeEvent(models.Model):
+    """受信した Stripe Webhook イベント（core.stripe_events）
+
+    stripe_webhook は署名を検証してこの表に1行追加するだけで応答する（event_id の一意制約で重複を弾く）。
+    クレジット・プラン・求人チケットへの反映は process_stripe_events コマンドが行い、
+    反映と processed への更新を同じトランザクションで行う（再送・同時実行でも一度だけ反映される）。
+    """
+    STATUS_CHOICES = [
+        ('pending', '処理待ち'),
+        ('processing', '処理中'),
+        ('processed', '処理済み'),
+        ('dead', '処理不可'),
+    ]
+
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField(default=dict)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)  # processing にした時刻（ワーカー異常終了の検出用）
+    result = models.CharField(max_length=50, blank=True)  # credits_added / plan_updated / ignored / user_not_found など
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'stripe_events'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='core_stripe_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"StripeEvent({self.event_id}: {self.event_type} [{self.status}])"
+
+
+# ============================================================
+# 通知（永続化・未読カウンタ）
+# ============================================================
+
+class Notification(models.Model):
+    """ユーザー向け通知（core.user_notifications.notify が作成）
+
+    id は単調増加で、WebSocket の差分同期（カーソルより新しい通知）に使う。
+    未読件数は NotificationCounter に非正規化して保持する。
+    """
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=50)  # resume_advice / advice / interview / scout_notification など
+    title = models.CharField(max_length=200, blank=True)
+    body = models.CharField(max_length=300, blank=True)
+    data = models.JSONField(default=dict, blank=True)
+    # 通知の元になったオブジェクト（message / scout / application と その id）
+    source_type = models.CharField(max_length=30, blank=True)
+    source_id = models.CharField(max_length=64, blank=True)
+
+    is_read = models.BooleanField(default=False)
+    read_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'notifications'
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['user', 'is_read', 'created_at'], name='core_notif_user_read_idx'),
+            models.Index(fields=['user', 'id'], name='core_notif_user_cursor_idx'),
+            models.Index(fields=['source_type', 'source_id'], name='core_notif_source_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notification({self.user_id}: {self.kind} #{self.id})"
+
+
+class NotificationCounter(models.Model):
+    """ユーザー × 種別ごとの未読件数（通知の作成・既読化と同じトランザクションで F 式により増減）
+
+    ずれは rebuild_notification_counters で Notification から作り直す。
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_counters')
+    kind = models.CharField(max_length=50)
+    unread_count = models.IntegerField(default=0)
+    latest_at = models.DateTimeField(null=True, blank=True)  # この種別の最新通知の作成日時
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'notification_counters'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind'], name='uniq_notification_counter'),
+        ]
+
+    def __str__(self):
+        return f"NotificationCounter({self.user_id}: {self.kind}={self.unread_count})"
+
+
+# ============================================================
+# 添削スレッドの概要（advice_threads 用）
+# ============================================================
+
+class MessageThread(models.Model):
+    """注釈付き添削メッセージのスレッド概要（core.message_threads が Message の作成・削除と注釈の解決で更新する）
+
+    1通のメッセージは2つの行に集計される:
+      - kind='annotation': 注釈ごと（thread_key = 注釈ID）
+      - kind='comment': 親メッセージごと（thread_key = 親メッセージID、親がなければ自身のID）
+    user はやり取りの一般ユーザー側（相手は管理者）。
+    ずれは rebuild_message_threads で Message から作り直す。
+    """
+    KIND_CHOICES = [
+        ('annotation', '注釈ごと'),
+        ('comment', '親メッセージごと'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    thread_key = models.CharField(max_length=64)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='message_threads')
+    staff = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')  # 最初のメッセージの管理者側
+    subject = models.CharField(max_length=200, blank=True)
+    annotation = models.ForeignKey('Annotation', on_delete=models.CASCADE, related_name='threads')
+    root_id = models.BigIntegerField()  # スレッド最初のメッセージID
+    messages_count = models.IntegerField(default=0)
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    unresolved = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'message_threads'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'subject', 'kind', 'thread_key'], name='uniq_message_thread'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'subject', 'kind', 'last_message_at'], name='core_msgthread_list_idx'),
+        ]
+
+    def __str__(self):
+        return f"MessageThread({self.user_id}: {self.subject}/{self.kind} {self.thread_key})"
+
+
+class MessageReadMarker(models.Model):
+    """ユーザー × 件名ごとの既読位置（core.message_reads）
+
+    read_through 以前に受け取った管理者からのメッセージは一括既読化済み。
+    未読件数はこれより新しいメッセージだけを数える（core_msgs_staff_unread_idx の範囲検索）。
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='message_read_markers')
+    subject = models.CharField(max_length=200)
+    read_through = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'message_read_markers'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'subject'], name='uniq_message_read_marker'),
+        ]
+
+    def __str__(self):
+        return f"MessageReadMarker({self.user_id}: {self.subject} <= {self.read_through})"
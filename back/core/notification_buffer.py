@@ -0,0 +1,212 @@
+"""
+WebSocket 通知のバッファリング（トランザクション確定後にユーザー単位でまとめて送信）
+
+- publish(user_id, event): 通知を登録する。transaction.on_commit 経由でバッファに入るため、
+  atomic ブロック内で登録した通知はコミット後に、ロールバックされた通知は送られない
+- batch() スコープ（NotificationBufferMiddleware がリクエスト単位で張る）の終了時にまとめて送信する
+    - 同じユーザー宛ての複数イベントは1回の group_send（type: notification.batch）にまとめる
+    - 全ユーザー分の group_send は1回の async_to_sync 内で並行に行う
+    - スコープ外（管理コマンド・シェル等）ではコミットごとにすぐ送信する
+- チャンネルレイヤーは CHANNEL_LAYERS に従う（CHANNEL_REDIS_URL 設定時は Redis で、他プロセスの接続にも届く）
+- stats(): バッファ内の件数・送信回数・送信レイテンシ（プロセス単位）
+
+設定:
+    NOTIFICATION_BUFFER_MAX（スコープ内でもこの件数を超えたら途中で送信）,
+    NOTIFICATION_BATCH_MAX（1回の group_send にまとめるイベント数の上限）
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import partial
+from typing import Dict, List, Tuple
+
+from asgiref.local import Local
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from .profiling import percentile
+
+logger = logging.getLogger(__name__)
+
+BATCH_EVENT_TYPE = 'notification.batch'
+# 送信レイテンシを保持する件数
+LATENCY_SAMPLES = 1000
+
+_local = Local()
+
+
+def group_name(user_id) -> str:
+    return f'notifications_{user_id}'
+
+
+# ============================================================
+# 計測
+# ============================================================
+
+class _Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self.queued = 0
+            self.depth = 0
+            self.max_depth = 0
+            self.flushes = 0
+            self.group_sends = 0
+            self.failures = 0
+            self.latencies: deque = deque(maxlen=LATENCY_SAMPLES)
+
+    def staged(self) -> None:
+        with self._lock:
+            self.queued += 1
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+
+    def flushed(self, events: int, sends: int, failures: int, latency_ms: float) -> None:
+        with self._lock:
+            self.depth = max(0, self.depth - events)
+            self.flushes += 1
+            self.group_sends += sends
+            self.failures += failures
+            self.latencies.append(latency_ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            return {
+                'since': self.started_at,
+                'events': self.queued,
+                'queue_depth': self.depth,
+                'max_queue_depth': self.max_depth,
+                'flushes': self.flushes,
+                'group_sends': self.group_sends,
+                'failures': self.failures,
+                # 1回の group_send あたりのイベント数（まとめの効果）
+                'events_per_send': round(self.queued / self.group_sends, 2) if self.group_sends else None,
+                'send_latency_ms': {
+                    f'p{p}': (round(v, 2) if v is not None else None)
+                    for p, v in ((p, percentile(latencies, p)) for p in (50, 95, 99))
+                },
+            }
+
+
+metrics = _Metrics()
+
+
+def stats() -> dict:
+    return metrics.snapshot()
+
+
+# ============================================================
+# バッファ
+# ============================================================
+
+class _Buffer:
+    def __init__(self):
+        self.scopes = 0
+        self.size = 0
+        self.events: Dict[str, List[dict]] = {}
+
+
+def _buffer() -> _Buffer:
+    buf = getattr(_local, 'buffer', None)
+    if buf is None:
+        buf = _local.buffer = _Buffer()
+    return buf
+
+
+def publish(user_id, event: dict) -> None:
+    """user_id 宛ての通知イベント（'type' を含む dict）を登録する"""
+    transaction.on_commit(partial(_stage, str(user_id), event))
+
+
+def _stage(user_id: str, event: dict) -> None:
+    buf = _buffer()
+    buf.events.setdefault(user_id, []).append(event)
+    buf.size += 1
+    metrics.staged()
+    if buf.scopes == 0 or buf.size >= getattr(settings, 'NOTIFICATION_BUFFER_MAX', 1000):
+        flush()
+
+
+@contextmanager
+def batch():
+    """スコープ内でコミットされた通知を、スコープの終了時にまとめて送信する（入れ子可）"""
+    buf = _buffer()
+    buf.scopes += 1
+    try:
+        yield
+    finally:
+        buf.scopes -= 1
+        if buf.scopes == 0:
+            flush()
+
+
+def _messages(events: Dict[str, List[dict]]) -> List[Tuple[str, dict]]:
+    size = max(1, getattr(settings, 'NOTIFICATION_BATCH_MAX', 50))
+    messages = []
+    for user_id, items in events.items():
+        for i in range(0, len(items), size):
+            chunk = items[i:i + size]
+            # 1件だけなら従来どおりのイベントをそのまま送る
+            message = chunk[0] if len(chunk) == 1 else {'type': BATCH_EVENT_TYPE, 'events': chunk}
+            messages.append((group_name(user_id), message))
+    return messages
+
+
+async def _send_all(channel_layer, messages: List[Tuple[str, dict]]) -> int:
+    results = await asyncio.gather(
+        *(channel_layer.group_send(group, message) for group, message in messages),
+        return_exceptions=True,
+    )
+    failures = [r for r in results if isinstance(r, BaseException)]
+    if failures:
+        logger.error(f'Failed to send {len(failures)}/{len(messages)} WebSocket notifications: {failures[0]}')
+    return len(failures)
+
+
+def flush() -> int:
+    """このスレッド（コンテキスト）のバッファを送信し、送信したイベント数を返す"""
+    buf = _buffer()
+    events, count = buf.events, buf.size
+    buf.events, buf.size = {}, 0
+    if not count:
+        return 0
+
+    messages = _messages(events)
+    start = time.perf_counter()
+    failures = len(messages)
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        logger.warning(f'No channel layer configured; dropped {count} WebSocket notifications')
+    else:
+        try:
+            failures = async_to_sync(_send_all)(channel_layer, messages)
+        except Exception as e:
+            logger.error(f'Failed to send WebSocket notifications: {e}')
+    metrics.flushed(count, len(messages), failures, (time.perf_counter() - start) * 1000.0)
+    logger.info(f'WebSocket notifications sent: {count} events to {len(events)} users in {len(messages)} group sends')
+    return count
+
+
+# ============================================================
+# ミドルウェア
+# ============================================================
+
+class NotificationBufferMiddleware:
+    """リクエスト中にコミットされた WebSocket 通知をレスポンス生成後にまとめて送信する"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with batch():
+            return self.get_response(request)
@@ -3,14 +3,15 @@
 WebSocketとメール通知を統合管理
 """
 
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from django.core.mail import send_mail
 from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 import logging
 
+from .email_outbox import enqueue as enqueue_email
+from .notification_buffer import publish as publish_notification
+from .user_notifications import is_advice_message, notify
+
 logger = logging.getLogger(__name__)
 
 
@@ -36,7 +37,10 @@ class NotificationService:
                     'message': scout.scout_message[:100],  # 最初の100文字
                     'scouted_at': scout.scouted_at.isoformat(),
                 }
-            }
+            },
+            title=f'{scout.company.company_name}からスカウトが届きました',
+            body=scout.scout_message[:100],
+            source=('scout', scout.id),
         )
         
         # メール通知
@@ -50,7 +54,8 @@ class NotificationService:
                     'company_name': scout.company.company_name,
                     'scout_message': scout.scout_message,
                     'scout_url': f'{settings.FRONTEND_URL}/scouts/{scout.id}'
-                }
+                },
+                category='scout_notification',
             )
     
     @staticmethod
@@ -72,7 +77,10 @@ class NotificationService:
                     'applied_at': application.applied_at.isoformat(),
                     'status': application.status,
                 }
-            }
+            },
+            title='新しい応募が届きました',
+            body=application.applicant.full_name or application.applicant.username,
+            source=('application', application.id),
         )
         
         # メール通知
@@ -85,7 +93,8 @@ class NotificationService:
                     'company_name': application.company.company_name,
                     'applicant_name': application.applicant.full_name or application.applicant.username,
                     'application_url': f'{settings.FRONTEND_URL}/company/seekers-applied/{application.id}'
-                }
+                },
+                category='application_notification',
             )
     
     @staticmethod
@@ -116,7 +125,10 @@ class NotificationService:
                     'status': application.status,
                     'message': status_messages.get(application.status, '応募ステータスが更新されました'),
                 }
-            }
+            },
+            title=status_messages.get(application.status, '応募ステータスが更新されました'),
+            body=application.company.company_name,
+            source=('application', application.id),
         )
         
         # メール通知
@@ -131,7 +143,8 @@ class NotificationService:
                     'status': application.get_status_display(),
                     'message': status_messages.get(application.status),
                     'application_url': f'{settings.FRONTEND_URL}/applications/{application.id}'
-                }
+                },
+                category='application_status_update',
             )
     
     @staticmethod
@@ -154,7 +167,11 @@ class NotificationService:
                     'content': message.content[:100],  # 最初の100文字
                     'created_at': message.created_at.isoformat(),
                 }
-            }
+            },
+            title=f'新しいメッセージ: {message.subject or "メッセージが届きました"}',
+            body=message.content[:100],
+            # 管理者からのアドバイス系メッセージは保存時のシグナルで通知が作成済み
+            source=None if is_advice_message(message) else ('message', message.id),
         )
         
         # メール通知
@@ -169,61 +186,67 @@ class NotificationService:
                     'subject': message.subject,
                     'content': message.content,
                     'message_url': f'{settings.FRONTEND_URL}/messages/{message.id}'
-                }
+                },
+                category='message_notification',
             )
     
     @staticmethod
-    def _send_websocket_notification(user_id, notification_type, data):
+    def _send_websocket_notification(user_id, notification_type, data, title='', body='', source=None):
         """
-        WebSocket経由で通知を送信
+        通知を保存し、WebSocket通知をバッファに登録
+        
+        トランザクション確定後、リクエスト終了時にユーザー単位でまとめて送信される（core.notification_buffer）
         
         Args:
             user_id: 通知を受け取るユーザーのID
             notification_type: 通知タイプ
             data: 通知データ
+            title, body: 保存する通知の見出しと本文
+            source: 通知の元オブジェクト (source_type, source_id)。None なら通知を保存しない
         """
-        channel_layer = get_channel_layer()
-        if channel_layer:
+        if source is not None:
             try:
-                async_to_sync(channel_layer.group_send)(
-                    f'notifications_{user_id}',
-                    {
-                        'type': notification_type,
-                        **data
-                    }
-                )
-                logger.info(f'WebSocket notification sent to user {user_id}: {notification_type}')
+                notify(user_id, notification_type, title=title, body=body, data=data,
+                       source_type=source[0], source_id=source[1])
             except Exception as e:
-                logger.error(f'Failed to send WebSocket notification: {e}')
+                logger.error(f'Failed to save notification: {e}')
+        try:
+            publish_notification(user_id, {
+                'type': notification_type,
+                **data
+            })
+        except Exception as e:
+            logger.error(f'Failed to queue WebSocket notification: {e}')
     
     @staticmethod
-    def _send_email_notification(recipient, subject, template, context):
+    def _send_email_notification(recipient, subject, template, context, category=''):
         """
-        メール通知を送信
+        メール通知を送信キュー（EmailOutbox）に登録
+        
+        実際の送信は send_outbox_emails コマンドが行う（SMTP の遅延をリクエストに含めない）
         
         Args:
             recipient: 受信者のメールアドレス
             subject: メールの件名
             template: メールテンプレートのパス
             context: テンプレートコンテキスト
+            category: 送信キュー上の分類（scout_notification など）
         """
         try:
             # HTMLメールの内容を生成
             html_message = render_to_string(template, context)
             plain_message = strip_tags(html_message)
             
-            # メール送信
-            send_mail(
+            enqueue_email(
+                to=recipient,
                 subject=subject,
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'noreply@trumeee.com',
-                recipient_list=[recipient],
-                html_message=html_message,
-                fail_silently=False,
+                body=plain_message,
+                html_body=html_message,
+                category=category,
             )
-            logger.info(f'Email notification sent to {recipient}: {subject}')
+            logger.info(f'Email notification queued for {recipient}: {subject}')
         except Exception as e:
-            logger.error(f'Failed to send email notification: {e}')
+            logger.error(f'Failed to queue email notification: {e}')
 
 
 # 簡易的な通知送信関数（既存コードとの互換性のため）
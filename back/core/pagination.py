@@ -0,0 +1,232 @@
+"""
+キーセット（カーソル）ページネーション
+
+OFFSET/COUNT を使わず、インデックス済みの (created_at, id) などの並び順で
+「前ページ最後の行より後」を WHERE 条件で取得する。深いページでも一定コスト。
+
+- カーソルは不透明な文字列（base64url(JSON)）。クライアントは next_cursor をそのまま渡す
+- ?cursor= を指定したリクエストのみキーセットモード。未指定なら従来の page/page_size 応答
+- ?include_total=1 で概算件数（PostgreSQL は実行計画の推定行数、その他は上限付き COUNT）
+"""
+import base64
+import binascii
+import json
+from typing import Callable, List, Optional, Sequence
+
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+DEFAULT_ORDERING = ('-created_at', '-id')
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# 概算件数を上限付き COUNT で求める場合の上限
+COUNT_CAP = 10000
+
+CURSOR_PARAM = 'cursor'
+LIMIT_PARAMS = ('limit', 'page_size')
+
+
+def encode_cursor(payload: dict) -> str:
+    raw = json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValidationError({'cursor': 'invalid_cursor'})
+    if not isinstance(payload, dict):
+        raise ValidationError({'cursor': 'invalid_cursor'})
+    return payload
+
+
+def is_cursor_request(request) -> bool:
+    """?cursor= が指定されていればキーセットモード（空文字は先頭ページ）"""
+    return CURSOR_PARAM in request.query_params
+
+
+def parse_limit(request, default: int = DEFAULT_LIMIT, max_limit: int = MAX_LIMIT) -> int:
+    for name in LIMIT_PARAMS:
+        value = request.query_params.get(name)
+        if value:
+            try:
+                return max(1, min(int(value), max_limit))
+            except ValueError:
+                break
+    return default
+
+
+def approximate_count(queryset, cap: int = COUNT_CAP) -> dict:
+    """概算件数。PostgreSQL は EXPLAIN の推定行数、それ以外は上限付き COUNT"""
+    queryset = queryset.order_by()
+    if connection.vendor == 'postgresql':
+        try:
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return {'value': int(plan[0]['Plan']['Plan Rows']), 'is_estimate': True}
+        except Exception:
+            pass
+    count = queryset[:cap + 1].count()
+    return {'value': min(count, cap), 'is_estimate': count > cap}
+
+
+class KeysetPaginator:
+    """並び順キー（既定: -created_at, -id）によるキーセットページネーション"""
+
+    def __init__(self, ordering: Sequence[str] = DEFAULT_ORDERING, default_limit: int = DEFAULT_LIMIT,
+                 max_limit: int = MAX_LIMIT):
+        self.ordering = tuple(ordering)
+        self.default_limit = default_limit
+        self.max_limit = max_limit
+        self.fields = [o.lstrip('-') for o in self.ordering]
+        self.descending = [o.startswith('-') for o in self.ordering]
+
+    # --- カーソル ---------------------------------------------------------
+    def _position(self, obj) -> list:
+        return [getattr(obj, f) for f in self.fields]
+
+    def _cursor_for(self, obj, reverse: bool) -> str:
+        payload = {'p': self._position(obj)}
+        if reverse:
+            payload['r'] = 1
+        return encode_cursor(payload)
+
+    def _parse_position(self, queryset, payload) -> list:
+        values = payload.get('p')
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise ValidationError({'cursor': 'invalid_cursor'})
+        opts = queryset.model._meta
+        parsed = []
+        for name, value in zip(self.fields, values):
+            if name in queryset.query.annotations:
+                # 注釈（例: 全文検索の search_score）は出力フィールドで変換する
+                field = queryset.query.annotations[name].output_field
+            else:
+                field = opts.pk if name == 'pk' else opts.get_field(name)
+            try:
+                parsed.append(field.to_python(value))
+            except Exception:
+                raise ValidationError({'cursor': 'invalid_cursor'})
+        return parsed
+
+    def _after(self, position, reverse: bool) -> Q:
+        """position より「後」（reverse=True なら「前」）の行を表す条件"""
+        condition = Q()
+        for i, name in enumerate(self.fields):
+            desc = self.descending[i] != reverse
+            lookup = f"{name}__{'lt' if desc else 'gt'}"
+            clause = Q(**{lookup: position[i]})
+            for j in range(i):
+                clause &= Q(**{self.fields[j]: position[j]})
+            condition |= clause
+        return condition
+
+    # --- ページング -------------------------------------------------------
+    def paginate_queryset(self, queryset, request) -> List:
+        self.request = request
+        self.limit = parse_limit(request, self.default_limit, self.max_limit)
+        self.base_queryset = queryset
+        raw = request.query_params.get(CURSOR_PARAM) or ''
+        payload = decode_cursor(raw) if raw else {}
+        reverse = bool(payload.get('r'))
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(o[1:] if o.startswith('-') else f'-{o}' for o in ordering)
+        queryset = queryset.order_by(*ordering)
+        if payload:
+            queryset = queryset.filter(self._after(self._parse_position(queryset, payload), reverse))
+
+        rows = list(queryset[:self.limit + 1])
+        has_extra = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if reverse:
+            rows.reverse()
+
+        self.page = rows
+        if reverse:
+            self.has_next = True
+            self.has_previous = has_extra
+        else:
+            self.has_next = has_extra
+            self.has_previous = bool(payload)
+        return rows
+
+    def get_next_cursor(self) -> Optional[str]:
+        if not self.has_next or not self.page:
+            return None
+        return self._cursor_for(self.page[-1], reverse=False)
+
+    def get_previous_cursor(self) -> Optional[str]:
+        if not self.has_previous or not self.page:
+            return None
+        return self._cursor_for(self.page[0], reverse=True)
+
+    def get_paginated_data(self, data) -> dict:
+        body = {
+            'results': data,
+            'next_cursor': self.get_next_cursor(),
+            'previous_cursor': self.get_previous_cursor(),
+            'has_more': self.has_next,
+            'limit': self.limit,
+        }
+        if self.request.query_params.get('include_total') in ('1', 'true'):
+            body['approximate_count'] = approximate_count(self.base_queryset)
+        return body
+
+    def get_paginated_response(self, data) -> Response:
+        return Response(self.get_paginated_data(data))
+
+
+def keyset_paginated_response(request, queryset, serialize: Callable[[List], object],
+                              ordering: Sequence[str] = DEFAULT_ORDERING, **kwargs) -> Optional[Response]:
+    """?cursor= 指定時のみキーセットページングした Response を返す（未指定時は None）
+
+    使い方:
+        paged = keyset_paginated_response(request, qs, lambda rows: Serializer(rows, many=True).data)
+        if paged is not None:
+            return paged
+    """
+    if not is_cursor_request(request):
+        return None
+    paginator = KeysetPaginator(ordering=ordering, **kwargs)
+    rows = paginator.paginate_queryset(queryset, request)
+    return paginator.get_paginated_response(serialize(rows))
+
+
+class CursorOrPageNumberPagination(PageNumberPagination):
+    """ViewSet 用: ?cursor= 指定時はキーセット、それ以外は従来の PageNumberPagination
+
+    ビューの keyset_ordering（未指定時はモデルに created_at があれば -created_at, -id）で並べる。
+    """
+    def _keyset_ordering(self, queryset, view):
+        ordering = getattr(view, 'keyset_ordering', None)
+        if ordering:
+            return ordering
+        field_names = {f.name for f in queryset.model._meta.get_fields()}
+        if 'created_at' in field_names:
+            return DEFAULT_ORDERING
+        return None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self._keyset = None
+        if is_cursor_request(request):
+            ordering = self._keyset_ordering(queryset, view)
+            if ordering:
+                self._keyset = KeysetPaginator(ordering=ordering, default_limit=self.page_size or DEFAULT_LIMIT)
+                return self._keyset.paginate_queryset(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self._keyset is not None:
+            return self._keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
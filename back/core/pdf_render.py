@@ -0,0 +1,262 @@
+"""
+履歴書 PDF のレンダリングサービス（内容アドレスのディスクキャッシュ + プロセスプール）
+
+- resumeData を正規化した JSON の SHA-256 を鍵（= ジョブID）とし、
+  PDF_CACHE_DIR/<鍵の先頭2文字>/<鍵>.pdf に保存する。同じ内容なら再レンダリングしない
+- キャッシュにない場合は ProcessPoolExecutor（spawn）でレンダリングし、Web ワーカーをブロックしない。
+  呼び出し側は完了を待たずにジョブIDを返し、クライアントは pdf-jobs/<ジョブID>/ をポーリングする
+- ジョブの状態はディスク上のファイルで表す（全ワーカー共通）
+    <鍵>.pdf: 完了 / <鍵>.pending: レンダリング中 / <鍵>.err: 失敗（内容はエラーメッセージ）
+- PDF_RENDER_WORKERS=0 ならリクエスト内で同期レンダリング（開発・テスト用）
+- ジョブの状態は PDF_CACHE_DIR のファイルなので、Web を複数台・ワーカーを別サービスで動かす場合は
+  PDF_CACHE_DIR を共有ボリュームにする（共有しない場合、メール送信ワーカーは render_now で自分で作り直す）
+- 古いファイルは prune_pdf_cache コマンドで削除する
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# レイアウト（api_v2/resume_pdf.py）を変えたら上げる。鍵に含まれるため旧キャッシュは使われなくなる
+RENDERER_VERSION = 1
+
+STATUS_READY = 'ready'
+STATUS_PENDING = 'pending'
+STATUS_FAILED = 'failed'
+STATUS_UNKNOWN = 'unknown'
+
+_KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+# このプロセスで実行中のジョブ（同じ内容の同時リクエストで Future を共有する）
+_inflight: Dict[str, Future] = {}
+
+
+def cache_dir() -> str:
+    return getattr(settings, 'PDF_CACHE_DIR', '') or os.path.join(settings.BASE_DIR, 'pdf_cache')
+
+
+def is_valid_key(key: str) -> bool:
+    return bool(_KEY_RE.match(key or ''))
+
+
+def canonical_payload(resume_data) -> str:
+    """キー順・空白を正規化した JSON"""
+    return json.dumps(resume_data or {}, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+def content_key(resume_data) -> str:
+    raw = f'{RENDERER_VERSION}:{canonical_payload(resume_data)}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _path(key: str, suffix: str) -> str:
+    return os.path.join(cache_dir(), key[:2], f'{key}.{suffix}')
+
+
+def pdf_path(key: str) -> str:
+    return _path(key, 'pdf')
+
+
+# ============================================================
+# レンダリング（ワーカープロセス側）
+# ============================================================
+
+def _render_to_file(payload: str, path: str) -> int:
+    """payload（正規化 JSON）をレンダリングし path に原子的に書き込む。PDF のバイト数を返す"""
+    from api_v2.resume_pdf import render_resume_pdf
+
+    pdf = render_resume_pdf(json.loads(payload))
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp, path)
+    return len(pdf)
+
+
+# ============================================================
+# ジョブ管理（Web プロセス側）
+# ============================================================
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=max(1, getattr(settings, 'PDF_RENDER_WORKERS', 2)),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def _reset_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _pending_is_fresh(marker: str) -> bool:
+    try:
+        age = time.time() - os.path.getmtime(marker)
+    except OSError:
+        return False
+    return age < getattr(settings, 'PDF_RENDER_TIMEOUT', 120)
+
+
+def _claim(key: str) -> bool:
+    """レンダリング中マーカーを作成する（他プロセスがレンダリング中なら False）"""
+    marker = _path(key, 'pending')
+    os.makedirs(os.path.dirname(marker), exist_ok=True)
+    if os.path.exists(marker) and not _pending_is_fresh(marker):
+        # タイムアウトしたジョブ（ワーカー異常終了など）は引き継ぐ
+        _remove(marker)
+    try:
+        os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return False
+    _remove(_path(key, 'err'))
+    return True
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _finish(key: str, error: Optional[BaseException]) -> None:
+    if error is not None:
+        logger.error(f"Resume PDF render failed ({key[:12]}): {error}")
+        try:
+            with open(_path(key, 'err'), 'w', encoding='utf-8') as f:
+                f.write(str(error)[:1000] or error.__class__.__name__)
+        except OSError:
+            pass
+    _remove(_path(key, 'pending'))
+
+
+def _on_done(key: str, future: Future) -> None:
+    _inflight.pop(key, None)
+    error = future.exception() if not future.cancelled() else RuntimeError('cancelled')
+    if isinstance(error, BrokenProcessPool):
+        _reset_executor()
+    _finish(key, error)
+
+
+def _render_here(key: str, payload: str) -> None:
+    """このプロセスでレンダリングする（_claim 済みで呼ぶ）"""
+    try:
+        _render_to_file(payload, pdf_path(key))
+    except Exception as e:
+        _finish(key, e)
+    else:
+        _finish(key, None)
+
+
+def submit(resume_data) -> str:
+    """キャッシュになければレンダリングを開始し、ジョブID（内容の鍵）を返す"""
+    key = content_key(resume_data)
+    if os.path.exists(pdf_path(key)) or key in _inflight or not _claim(key):
+        return key
+
+    payload = canonical_payload(resume_data)
+    if getattr(settings, 'PDF_RENDER_WORKERS', 2) <= 0:
+        _render_here(key, payload)
+        return key
+
+    try:
+        future = _get_executor().submit(_render_to_file, payload, pdf_path(key))
+    except (BrokenProcessPool, RuntimeError):
+        _reset_executor()
+        future = _get_executor().submit(_render_to_file, payload, pdf_path(key))
+    _inflight[key] = future
+    future.add_done_callback(lambda f: _on_done(key, f))
+    return key
+
+
+def job_status(key: str) -> dict:
+    """ジョブの状態（ready / pending / failed / unknown）"""
+    status = {'job_id': key, 'status': STATUS_UNKNOWN}
+    path = pdf_path(key)
+    if os.path.exists(path):
+        status.update(status=STATUS_READY, size=os.path.getsize(path))
+    elif key in _inflight or _pending_is_fresh(_path(key, 'pending')):
+        status['status'] = STATUS_PENDING
+    elif os.path.exists(_path(key, 'err')):
+        try:
+            with open(_path(key, 'err'), encoding='utf-8') as f:
+                error = f.read()
+        except OSError:
+            error = ''
+        status.update(status=STATUS_FAILED, error=error)
+    return status
+
+
+def render(resume_data) -> dict:
+    """レンダリングを開始し、完了を待たずに状態を返す（キャッシュ済みなら ready）"""
+    cached = os.path.exists(pdf_path(content_key(resume_data)))
+    status = job_status(submit(resume_data))
+    status['cached'] = cached
+    return status
+
+
+def render_now(resume_data) -> dict:
+    """このプロセスで（プールを使わずに）レンダリングして状態を返す（メール送信ワーカー用）
+
+    キャッシュ済みならそのまま、他のプロセスがレンダリング中（.pending が新しい）なら pending を返す。
+    以前の失敗（.err）はやり直す。
+    """
+    key = content_key(resume_data)
+    if not os.path.exists(pdf_path(key)) and _claim(key):
+        _render_here(key, canonical_payload(resume_data))
+    return job_status(key)
+
+
+def open_pdf(key: str):
+    """キャッシュ済み PDF をバイナリで開く（更新日時を現在にし、prune の対象から外す）"""
+    path = pdf_path(key)
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return open(path, 'rb')
+
+
+def read_pdf(key: str) -> bytes:
+    with open_pdf(key) as f:
+        return f.read()
+
+
+def prune(max_age_days: float, dry_run: bool = False) -> int:
+    """最終参照（open_pdf で更新日時を更新）から max_age_days 日を過ぎたファイルを削除し、件数を返す"""
+    root = cache_dir()
+    if not os.path.isdir(root):
+        return 0
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    if not dry_run:
+                        os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
@@ -0,0 +1,267 @@
+"""
+リクエスト計測（レイテンシ・SQL クエリ数・重複クエリ・応答サイズ）
+
+- PerfMiddleware: サンプリングしたリクエストについて、URL 名ごとに
+  レイテンシ / クエリ数 / SQL 合計時間 / 重複クエリ数（N+1 の兆候）/ 応答サイズを記録する
+- 記録は URL 名ごとのリングバッファ（直近 PERF_BUFFER_SIZE 件）に保持し、
+  レポート時に p50/p95/p99 を求める（プロセス単位。各ワーカーがそれぞれ保持する）
+- PERF_PROFILE_RATE > 0 なら、さらにその割合のリクエストを cProfile で計測し
+  PERF_PROFILE_DIR に .prof を書き出す（`python -m pstats <file>` で確認）
+- 管理者向け API: GET/DELETE /api/v2/admin/perf/
+- 計測したリクエストの応答には Server-Timing を付ける（DEBUG 時か管理者のリクエストのみ）
+
+設定:
+    PERF_ENABLED, PERF_SAMPLE_RATE（0〜1）, PERF_BUFFER_SIZE, PERF_PATH_PREFIXES,
+    PERF_PROFILE_RATE（0〜1）, PERF_PROFILE_DIR, PERF_PROFILE_KEEP
+"""
+import cProfile
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# 重複クエリとして記録するシグネチャの上限（URL 名ごと）
+MAX_DUPLICATE_SIGNATURES = 10
+# シグネチャの SQL を切り詰める長さ
+SIGNATURE_MAX_LENGTH = 300
+
+_IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def query_signature(sql: str) -> str:
+    """パラメータ化された SQL をシグネチャにする（IN (%s, %s, ...) の個数差は同一視）"""
+    sql = _WHITESPACE_RE.sub(' ', _IN_LIST_RE.sub('IN (...)', sql or '')).strip()
+    return sql[:SIGNATURE_MAX_LENGTH]
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """最近傍順位法によるパーセンタイル（sorted_values は昇順）"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(-(-pct * len(sorted_values) // 100)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+# ============================================================
+# 計測データ
+# ============================================================
+
+class _QueryCollector:
+    """connection.execute_wrapper 用: クエリ数・SQL 時間・シグネチャを集める"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.signatures: Counter = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.signatures[query_signature(sql)] += 1
+
+
+class EndpointStats:
+    """URL 名ごとのリングバッファと累計"""
+
+    def __init__(self, size: int):
+        # (latency_ms, queries, sql_ms, duplicates, response_bytes)
+        self.samples: deque = deque(maxlen=size)
+        self.total = 0
+        self.errors = 0
+        self.duplicate_signatures: Dict[str, int] = {}
+
+    def add(self, sample: tuple, status_code: int, duplicates: Dict[str, int]) -> None:
+        self.samples.append(sample)
+        self.total += 1
+        if status_code >= 500:
+            self.errors += 1
+        for sig, repeat in duplicates.items():
+            if sig in self.duplicate_signatures:
+                self.duplicate_signatures[sig] = max(self.duplicate_signatures[sig], repeat)
+            elif len(self.duplicate_signatures) < MAX_DUPLICATE_SIGNATURES:
+                self.duplicate_signatures[sig] = repeat
+
+    def summary(self) -> dict:
+        columns = list(zip(*self.samples)) if self.samples else [(), (), (), (), ()]
+        latency, queries, sql_ms, duplicates, sizes = (sorted(c) for c in columns)
+
+        def pcts(values, digits=1):
+            return {f'p{p}': (round(v, digits) if v is not None else None)
+                    for p, v in ((p, percentile(values, p)) for p in (50, 95, 99))}
+
+        n = len(self.samples)
+        return {
+            'requests': self.total,
+            'sampled': n,
+            'errors': self.errors,
+            'latency_ms': pcts(latency),
+            'queries': {**pcts(queries, 0), 'max': max(queries) if n else None},
+            'sql_ms': pcts(sql_ms),
+            'duplicate_queries': {**pcts(duplicates, 0), 'max': max(duplicates) if n else None},
+            'response_bytes': pcts(sizes, 0),
+            'duplicate_signatures': [
+                {'sql': sig, 'max_repeat': repeat}
+                for sig, repeat in sorted(self.duplicate_signatures.items(), key=lambda kv: -kv[1])
+            ],
+        }
+
+
+class PerfRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, EndpointStats] = {}
+        self.started_at = time.time()
+
+    def record(self, endpoint: str, sample: tuple, status_code: int, duplicates: Dict[str, int]) -> None:
+        size = getattr(settings, 'PERF_BUFFER_SIZE', 1000)
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats(size)
+            stats.add(sample, status_code, duplicates)
+
+    def report(self) -> Dict[str, dict]:
+        with self._lock:
+            return {name: stats.summary() for name, stats in self._endpoints.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+            self.started_at = time.time()
+
+
+recorder = PerfRecorder()
+
+
+# ============================================================
+# cProfile ダンプ
+# ============================================================
+
+def profile_dir() -> str:
+    return getattr(settings, 'PERF_PROFILE_DIR', '') or os.path.join(tempfile.gettempdir(), 'trumee-profiles')
+
+
+def _dump_profile(profiler: cProfile.Profile, endpoint: str) -> Optional[str]:
+    directory = profile_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        safe = re.sub(r'[^A-Za-z0-9_.-]+', '_', endpoint)
+        path = os.path.join(directory, f'{time.strftime("%Y%m%d-%H%M%S")}-{time.time_ns() % 10**9:09d}-{os.getpid()}-{safe}.prof')
+        profiler.dump_stats(path)
+        _prune_profiles(directory, getattr(settings, 'PERF_PROFILE_KEEP', 50))
+        return path
+    except Exception as e:
+        logger.warning(f"Failed to write profile for {endpoint}: {e}")
+        return None
+
+
+def _prune_profiles(directory: str, keep: int) -> None:
+    files = sorted((f for f in os.listdir(directory) if f.endswith('.prof')), reverse=True)
+    for name in files[keep:]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+
+def list_profiles(limit: int = 20) -> List[dict]:
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    files = sorted((f for f in os.listdir(directory) if f.endswith('.prof')), reverse=True)[:limit]
+    return [{'file': name, 'bytes': os.path.getsize(os.path.join(directory, name))} for name in files]
+
+
+# ============================================================
+# ミドルウェア
+# ============================================================
+
+def endpoint_name(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    if match.view_name:
+        return match.view_name
+    return match.route or 'unresolved'
+
+
+def _may_see_timing(request) -> bool:
+    """Server-Timing（SQL 時間・クエリ数）を返してよいか（DEBUG 時か管理者のみ）
+
+    DRF の認証結果は元の HttpRequest.user にも反映されるため、応答後に判定する。
+    """
+    if settings.DEBUG:
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and getattr(user, 'is_staff', False))
+
+
+class PerfMiddleware:
+    """サンプリングしたリクエストのレイテンシ・SQL を URL 名ごとに記録する"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _should_sample(self, request) -> bool:
+        if not getattr(settings, 'PERF_ENABLED', True):
+            return False
+        prefixes = getattr(settings, 'PERF_PATH_PREFIXES', ('/api/',))
+        if prefixes and not request.path.startswith(tuple(prefixes)):
+            return False
+        return random.random() < getattr(settings, 'PERF_SAMPLE_RATE', 1.0)
+
+    def __call__(self, request):
+        if not self._should_sample(request):
+            return self.get_response(request)
+
+        collector = _QueryCollector()
+        profiler = None
+        if random.random() < getattr(settings, 'PERF_PROFILE_RATE', 0.0):
+            profiler = cProfile.Profile()
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(collector))
+            if profiler is not None:
+                profiler.enable()
+                stack.callback(profiler.disable)
+            response = self.get_response(request)
+        latency_ms = (time.perf_counter() - start) * 1000.0
+        sql_ms = collector.duration * 1000.0
+
+        endpoint = endpoint_name(request)
+        try:
+            if getattr(response, 'streaming', False):
+                size = int(response.get('Content-Length') or 0)
+            else:
+                size = len(response.content)
+            duplicates = {sig: n for sig, n in collector.signatures.items() if n > 1}
+            recorder.record(
+                endpoint,
+                (latency_ms, collector.count, sql_ms, sum(n - 1 for n in duplicates.values()), size),
+                response.status_code, duplicates,
+            )
+            if profiler is not None:
+                _dump_profile(profiler, endpoint)
+            if _may_see_timing(request):
+                response['Server-Timing'] = f'app;dur={latency_ms:.1f}, db;dur={sql_ms:.1f};desc="{collector.count} queries"'
+        except Exception as e:
+            logger.warning(f"Failed to record request metrics for {endpoint}: {e}")
+        return response
@@ -0,0 +1,176 @@
+"""
+シリアライザーのクエリプラン（N+1 クエリの一括解消）
+
+シリアライザーが必要とする select_related / prefetch_related / annotate を
+クラス単位で求め、一覧・詳細のクエリセットに自動で適用する。
+
+- 推論: フィールド定義から自動で求める
+    - source='company.company_profile.company_name' → select_related('company__company_profile')
+    - ネストしたシリアライザー（単数）→ select_related（ネスト側の関連も前置きして連結）
+    - many=True のネスト → Prefetch（子クエリセットにも子シリアライザーのプランを適用）
+    - PrimaryKeyRelatedField(many=True) → prefetch_related
+- 宣言: 推論できないもの（Subquery のアノテーション等）は query_plan = QueryPlan(...) で補う
+- 適用: ViewSet は QueryPlanMixin、関数ビューは optimize_queryset(qs, Serializer)
+"""
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple, Type
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueryPlan:
+    """シリアライザーが宣言するクエリプラン（推論結果に追加される）
+
+    - select_related / prefetch_related: モデル基準の lookup（'company__company_profile' 等）
+    - annotations: {名前: 式}。トップレベル、または many=True のネストとして使われるときに適用
+    """
+    select_related: Sequence[str] = ()
+    prefetch_related: Sequence[str] = ()
+    annotations: Dict[str, object] = field(default_factory=dict)
+
+
+@dataclass
+class _ResolvedPlan:
+    select_related: Tuple[str, ...]
+    # (lookup, 子シリアライザークラス or None, 子モデル or None)
+    prefetches: Tuple[Tuple[str, Optional[type], Optional[type]], ...]
+    annotations: Dict[str, object]
+
+
+_plans: Dict[type, _ResolvedPlan] = {}
+_plans_lock = threading.Lock()
+
+
+def _relation_path(model, source: str) -> Tuple[List[str], Optional[object]]:
+    """source（'a.b.c'）のうちモデルの関連をたどれる部分と、最後にたどった関連フィールドを返す
+
+    単数の関連（FK / O2O / 逆 O2O）は続けてたどり、複数の関連（逆 FK / M2M）に当たったらそこで止める。
+    """
+    path: List[str] = []
+    last = None
+    current = model
+    for attr in source.split('.'):
+        if current is None:
+            break
+        try:
+            f = current._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not f.is_relation:
+            break
+        path.append(attr)
+        last = f
+        if f.one_to_many or f.many_to_many:
+            break
+        current = f.related_model
+    return path, last
+
+
+def _resolve(serializer_class: type) -> _ResolvedPlan:
+    select: List[str] = []
+    prefetches: List[Tuple[str, Optional[type], Optional[type]]] = []
+
+    declared = getattr(serializer_class, 'query_plan', None) or QueryPlan()
+    select.extend(declared.select_related)
+    prefetches.extend((lookup, None, None) for lookup in declared.prefetch_related)
+
+    model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+    if model is None:
+        return _ResolvedPlan(tuple(select), tuple(prefetches), dict(declared.annotations))
+
+    for name, f in serializer_class().fields.items():
+        if f.write_only or f.source == '*':
+            continue
+        path, relation = _relation_path(model, f.source)
+        if not path:
+            continue
+        lookup = '__'.join(path)
+        multiple = relation.one_to_many or relation.many_to_many
+
+        if isinstance(f, serializers.ListSerializer):
+            if multiple:
+                child = type(f.child) if isinstance(f.child, serializers.ModelSerializer) else None
+                prefetches.append((lookup, child, relation.related_model))
+        elif isinstance(f, serializers.ManyRelatedField):
+            if multiple:
+                prefetches.append((lookup, None, None))
+        elif isinstance(f, serializers.BaseSerializer):
+            if multiple:
+                continue
+            select.append(lookup)
+            nested = get_plan(type(f))
+            select.extend(f'{lookup}__{s}' for s in nested.select_related)
+            prefetches.extend((f'{lookup}__{p}', c, m) for p, c, m in nested.prefetches)
+        elif isinstance(f, serializers.RelatedField) and len(path) == 1:
+            # PrimaryKeyRelatedField などは外部キーの値だけで表現できる
+            continue
+        elif multiple:
+            prefetches.append((lookup, None, None))
+        else:
+            select.append(lookup)
+
+    # 重複と、より長い lookup に含まれる短い lookup を除く
+    unique = sorted(set(select))
+    select = [s for s in unique if not any(o.startswith(f'{s}__') for o in unique)]
+    seen = set()
+    prefetches = [p for p in prefetches if not (p[0] in seen or seen.add(p[0]))]
+    return _ResolvedPlan(tuple(select), tuple(prefetches), dict(declared.annotations))
+
+
+def get_plan(serializer_class: type) -> _ResolvedPlan:
+    """serializer_class のクエリプラン（クラスごとに1回だけ求めてキャッシュ）"""
+    plan = _plans.get(serializer_class)
+    if plan is None:
+        # ネストしたシリアライザーの解決で再帰するため、ロックの外で求めて先勝ちで登録する
+        plan = _resolve(serializer_class)
+        with _plans_lock:
+            plan = _plans.setdefault(serializer_class, plan)
+    return plan
+
+
+def optimize_queryset(queryset, serializer_class: Optional[Type[serializers.BaseSerializer]]):
+    """queryset に serializer_class のクエリプランを適用する（スライス前に呼ぶこと）"""
+    if serializer_class is None:
+        return queryset
+    try:
+        plan = get_plan(serializer_class)
+    except Exception as e:
+        logger.warning(f"Query plan resolution failed for {serializer_class.__name__}: {e}")
+        return queryset
+
+    if plan.select_related:
+        queryset = queryset.select_related(*plan.select_related)
+    lookups = []
+    for lookup, child, child_model in plan.prefetches:
+        if child is not None and child_model is not None:
+            lookups.append(Prefetch(lookup, queryset=optimize_queryset(child_model._default_manager.all(), child)))
+        else:
+            lookups.append(lookup)
+    if lookups:
+        queryset = queryset.prefetch_related(*lookups)
+    if plan.annotations:
+        existing = set(queryset.query.annotations)
+        missing = {k: v for k, v in plan.annotations.items() if k not in existing}
+        if missing:
+            queryset = queryset.annotate(**missing)
+    return queryset
+
+
+class QueryPlanMixin:
+    """ViewSet 用: 参照系（GET/HEAD/OPTIONS）で get_serializer_class() のクエリプランを適用する
+
+    list / retrieve / detail アクションの get_object() はいずれも filter_queryset() を経由する。
+    """
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method in SAFE_METHODS:
+            queryset = optimize_queryset(queryset, self.get_serializer_class())
+        return queryset
@@ -0,0 +1,261 @@
+"""
+スライディングウィンドウ方式のレート制限（全ワーカー共通）
+
+- アルゴリズム: sliding log（ウィンドウ内のリクエスト時刻を保持し、件数が上限未満なら許可）
+- Redis: Lua スクリプトで「期限切れ削除 → 件数確認 → 追加」を1回の往復・原子的に実行
+  （時刻は Redis サーバーの TIME を使うため、ワーカー間の時計ずれの影響を受けない）
+- Redis 未設定・障害時: プロセス内（ロック付き）の実装にフォールバック
+- DRF のスロットルクラス（RateLimitThrottle とそのサブクラス）として各ビューに適用する
+
+設定:
+    RATELIMIT_BACKEND = 'auto' | 'redis' | 'memory'
+    REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] = {'login': '10/10m', ...}
+    REST_FRAMEWORK['NUM_PROXIES']: X-Forwarded-For の信頼するプロキシ段数（クライアントIPの判定）。
+        既定は 0（REMOTE_ADDR を使い、クライアントが送る X-Forwarded-For は信頼しない）
+"""
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'rl'
+
+# KEYS[1]: キー / ARGV: ウィンドウ(ms), 上限, メンバー接尾辞
+# 返り値: {許可(1/0), ウィンドウ内件数, 再試行までの待ち時間(ms)}
+_SLIDING_LOG_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+if count < limit then
+    redis.call('ZADD', KEYS[1], now, now .. '-' .. ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return {1, count + 1, 0}
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return {0, count, tonumber(oldest[2]) + window - now}
+"""
+
+_RATE_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*([smhd])[a-z]*\s*$')
+_UNIT_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """'10/min', '5/10m', '100/h' などを (上限, ウィンドウ秒) に変換する"""
+    match = _RATE_RE.match(rate or '')
+    if not match:
+        raise ImproperlyConfigured(f"Invalid rate limit: {rate!r}")
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * _UNIT_SECONDS[unit]
+
+
+# ============================================================
+# バックエンド
+# ============================================================
+
+class MemoryBackend:
+    """プロセス内のスライディングログ（Redis がない場合のフォールバック）"""
+    name = 'memory'
+    # 保持するキー数の上限（超えたら期限切れのキーを掃除する）
+    max_keys = 10000
+
+    def __init__(self):
+        self._logs: Dict[str, deque] = {}
+        # キーごとのウィンドウ秒（掃除の判定はそのキーのウィンドウで行う）
+        self._windows: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window: int) -> Tuple[bool, int, float]:
+        now = time.monotonic()
+        with self._lock:
+            log = self._logs.get(key)
+            if log is None:
+                if len(self._logs) >= self.max_keys:
+                    self._prune(now)
+                log = self._logs[key] = deque()
+            self._windows[key] = window
+            while log and log[0] <= now - window:
+                log.popleft()
+            if len(log) < limit:
+                log.append(now)
+                return True, len(log), 0.0
+            return False, len(log), log[0] + window - now
+
+    def _prune(self, now: float) -> None:
+        expired = [k for k, log in self._logs.items() if not log or log[-1] <= now - self._windows.get(k, 0)]
+        for key in expired:
+            del self._logs[key]
+            self._windows.pop(key, None)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._logs.clear()
+            self._windows.clear()
+
+
+class RedisBackend:
+    """Redis 上のスライディングログ（Lua スクリプトで原子的に判定）"""
+    name = 'redis'
+
+    def __init__(self, alias: str = 'default'):
+        from django_redis import get_redis_connection
+        self._client = get_redis_connection(alias)
+        self._script = self._client.register_script(_SLIDING_LOG_LUA)
+
+    def hit(self, key: str, limit: int, window: int) -> Tuple[bool, int, float]:
+        allowed, count, wait_ms = self._script(keys=[key], args=[window * 1000, limit, uuid.uuid4().hex[:12]])
+        return bool(allowed), int(count), max(0.0, int(wait_ms) / 1000.0)
+
+
+_backend = None
+_fallback = MemoryBackend()
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _select_backend()
+    return _backend
+
+
+def _select_backend():
+    choice = getattr(settings, 'RATELIMIT_BACKEND', 'auto')
+    cache_backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if choice == 'redis' or (choice == 'auto' and cache_backend.startswith('django_redis')):
+        try:
+            return RedisBackend()
+        except Exception as e:
+            logger.warning(f"Redis rate limit backend unavailable, using in-process fallback: {e}")
+    return _fallback
+
+
+def hit(key: str, limit: int, window: int) -> Tuple[bool, int, float]:
+    """key のリクエストを1件記録し (許可, ウィンドウ内件数, 待ち秒数) を返す"""
+    full_key = f'{KEY_PREFIX}:{key}'
+    backend = get_backend()
+    try:
+        return backend.hit(full_key, limit, window)
+    except Exception as e:
+        if backend is _fallback:
+            raise
+        logger.warning(f"Redis rate limit failed, using in-process fallback: {e}")
+        return _fallback.hit(full_key, limit, window)
+
+
+# ============================================================
+# DRF スロットル
+# ============================================================
+
+class RateLimited(Throttled):
+    """429 応答。本文は {response_key: message}（各エンドポイントの従来の形）、待ち秒数は Retry-After ヘッダー"""
+
+    def __init__(self, wait: Optional[float], message: str, response_key: str = 'detail'):
+        APIException.__init__(self, {response_key: message})
+        self.wait = math.ceil(wait) if wait is not None else None
+
+
+class RateLimitThrottle(BaseThrottle):
+    """スライディングウィンドウのスロットル
+
+    - scope: エンドポイント識別子（DEFAULT_THROTTLE_RATES のキー）
+    - rate: 既定のレート（設定の DEFAULT_THROTTLE_RATES[scope] が優先）
+    - key_parts: キーの構成要素。'ip'（X-Forwarded-For 考慮）/ 'user'（未ログイン時は IP）/
+      'field:<name>'（リクエストボディの値。例: ログイン時の email）
+    - message: 制限時のエラーメッセージ（未指定なら DRF 既定）
+    - response_key: 429 の本文でメッセージを入れるキー（'detail' / 'error'）
+    """
+    scope: Optional[str] = None
+    rate: Optional[str] = None
+    key_parts: Tuple[str, ...] = ('ip',)
+    message: Optional[str] = None
+    response_key: str = 'detail'
+
+    def get_rate(self) -> str:
+        rates = api_settings.DEFAULT_THROTTLE_RATES or {}
+        rate = rates.get(self.scope) or self.rate
+        if not rate:
+            raise ImproperlyConfigured(f"No rate limit configured for scope {self.scope!r}")
+        return rate
+
+    def get_key_part(self, request, part: str) -> str:
+        if part == 'ip':
+            return self.get_ident(request) or 'unknown'
+        if part == 'user':
+            if request.user and request.user.is_authenticated:
+                return f'u{request.user.pk}'
+            return self.get_ident(request) or 'unknown'
+        if part.startswith('field:'):
+            try:
+                value = request.data.get(part[6:])
+            except Exception:
+                value = None
+            return str(value or '').strip().lower() or 'unknown'
+        raise ImproperlyConfigured(f"Unknown rate limit key part: {part!r}")
+
+    def get_cache_key(self, request, view) -> str:
+        raw = ':'.join(self.get_key_part(request, p) for p in self.key_parts)
+        # 入力値（メールアドレス等）をそのままキーにしないようハッシュ化
+        return f'{self.scope}:{hashlib.sha1(raw.encode("utf-8")).hexdigest()}'
+
+    def allow_request(self, request, view) -> bool:
+        limit, window = parse_rate(self.get_rate())
+        allowed, _, wait = hit(self.get_cache_key(request, view), limit, window)
+        if allowed:
+            return True
+        self._wait = wait
+        if self.message:
+            raise RateLimited(wait, self.message, self.response_key)
+        return False
+
+    def wait(self) -> Optional[float]:
+        return getattr(self, '_wait', None)
+
+
+class LoginRateThrottle(RateLimitThrottle):
+    """ログイン試行: IP + メールアドレスごと"""
+    scope = 'login'
+    rate = '10/10m'
+    key_parts = ('ip', 'field:email')
+    message = '試行回数が多すぎます。しばらくしてからお試しください。'
+
+
+class InterviewPersonalizeThrottle(RateLimitThrottle):
+    """面接質問パーソナライズ（外部 AI 呼び出しを含む）: ユーザーごと"""
+    scope = 'interview_personalize'
+    rate = '10/m'
+    key_parts = ('user',)
+    message = 'Too many requests'
+
+
+class ResumePdfDownloadThrottle(RateLimitThrottle):
+    """履歴書 PDF ダウンロード: IP ごと"""
+    scope = 'resume_pdf_download'
+    rate = '10/m'
+    message = 'リクエストが多すぎます。しばらくしてからお試しください。'
+    response_key = 'error'
+
+
+class ResumePdfSendThrottle(RateLimitThrottle):
+    """履歴書 PDF メール送信: IP ごと"""
+    scope = 'resume_pdf_send'
+    rate = '5/10m'
+    message = 'メール送信の試行回数が多すぎます。しばらくしてからお試しください。'
+    response_key = 'error'
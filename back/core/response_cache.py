@@ -0,0 +1,140 @@
+"""
+API レスポンスキャッシュ（共有キャッシュ + 世代番号による無効化）
+
+- @cached_response で GET の 200 応答（response.data）を settings.CACHES['default'] に保存する
+- キャッシュキーは「名前空間 + スコープ + 世代番号 + パス/クエリ（+ユーザー）」。
+  invalidate(namespace, scope) で世代番号を更新すると、旧キーは参照されなくなり TTL で消える
+- 無効化はモデルシグナル（core/signals.py）からコミット後に行う
+- 名前空間ごとのヒット/ミス数をキャッシュ上で集計（全ワーカー共通）。
+  RESPONSE_CACHE_STATS_RATE の割合のリクエストだけを 1/割合 の重みで incr 1回で数える（概数）
+"""
+import functools
+import hashlib
+import logging
+import random
+import time
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'rc'
+DEFAULT_TIMEOUT = 300
+
+# 統計を集計する名前空間（admin 向け統計 API で列挙する）
+_namespaces = set()
+
+
+def _version_key(namespace: str, scope) -> str:
+    return f'{KEY_PREFIX}:v:{namespace}:{scope if scope is not None else "*"}'
+
+
+def _stats_key(namespace: str, kind: str) -> str:
+    return f'{KEY_PREFIX}:stats:{namespace}:{kind}'
+
+
+def _get_version(namespace: str, scope) -> int:
+    key = _version_key(namespace, scope)
+    version = cache.get(key)
+    if version is None:
+        # 世代番号が失われても古いキーと衝突しないよう時刻を使う
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key) or version
+    return version
+
+
+def invalidate(namespace: str, scope=None) -> None:
+    """名前空間（scope 指定時はそのスコープのみ）のキャッシュを無効化する"""
+    try:
+        cache.set(_version_key(namespace, scope), time.time_ns(), timeout=None)
+    except Exception as e:
+        logger.warning(f"Response cache invalidation failed for {namespace}:{scope}: {e}")
+
+
+def schedule_invalidate(namespace: str, scope=None) -> None:
+    """コミット後に無効化する（トランザクション外なら即時）"""
+    transaction.on_commit(lambda: invalidate(namespace, scope))
+
+
+def _count(namespace: str, kind: str) -> None:
+    rate = getattr(settings, 'RESPONSE_CACHE_STATS_RATE', 0.1)
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return
+    key = _stats_key(namespace, kind)
+    weight = max(1, round(1 / min(rate, 1)))
+    try:
+        cache.incr(key, weight)
+    except ValueError:
+        # 初回のみ（キーがない）
+        if not cache.add(key, weight, timeout=None):
+            cache.incr(key, weight)
+    except Exception:
+        pass
+
+
+def get_stats() -> dict:
+    """名前空間ごとのヒット/ミス数"""
+    keys = [_stats_key(ns, kind) for ns in sorted(_namespaces) for kind in ('hit', 'miss')]
+    values = cache.get_many(keys) if keys else {}
+    stats = {}
+    for ns in sorted(_namespaces):
+        hits = int(values.get(_stats_key(ns, 'hit')) or 0)
+        misses = int(values.get(_stats_key(ns, 'miss')) or 0)
+        total = hits + misses
+        stats[ns] = {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / total, 4) if total else None}
+    return stats
+
+
+def reset_stats() -> None:
+    cache.delete_many([_stats_key(ns, kind) for ns in _namespaces for kind in ('hit', 'miss')])
+
+
+def cached_response(namespace: str, timeout: int = DEFAULT_TIMEOUT, vary_on_user: bool = False,
+                    scope: Optional[Callable] = None):
+    """関数ビュー用のレスポンスキャッシュデコレーター（@api_view の内側に付ける）
+
+    - vary_on_user: リクエストユーザーごとにキーを分ける（本人/他人で応答が変わるビュー）
+    - scope(request, **kwargs): 無効化の単位（例: 対象ユーザーID）。None なら名前空間全体
+    """
+    _namespaces.add(namespace)
+
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view_func(request, *args, **kwargs)
+            try:
+                scope_value = scope(request, **kwargs) if scope else None
+                parts = [request.path, request.GET.urlencode()]
+                if vary_on_user:
+                    user = request.user
+                    parts.append(str(user.pk) if user.is_authenticated else 'anon')
+                digest = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+                key = f'{KEY_PREFIX}:{namespace}:{scope_value}:{_get_version(namespace, scope_value)}:{digest}'
+                cached = cache.get(key)
+            except Exception as e:
+                logger.warning(f"Response cache lookup failed for {namespace}: {e}")
+                return view_func(request, *args, **kwargs)
+
+            if cached is not None:
+                _count(namespace, 'hit')
+                response = Response(cached['data'], status=cached['status'])
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _count(namespace, 'miss')
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200 and isinstance(response, Response):
+                try:
+                    cache.set(key, {'data': response.data, 'status': response.status_code}, timeout)
+                except Exception as e:
+                    logger.warning(f"Response cache store failed for {namespace}: {e}")
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
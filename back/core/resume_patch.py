@@ -0,0 +1,349 @@
+"""
+履歴書の差分更新（自動保存用）と楽観的排他制御
+
+- Resume.version を版数とし、ETag は resume_etag()（"<id>.<version>"）。
+  Resume の保存・子テーブルの変更では必ず版数が上がる（QuerySet.update では呼び出し側が version も上げる）
+- PATCH /resumes/<id>/delta/ は If-Match があれば版数を確認し、変わっていれば 412 で拒否する（別タブでの上書き防止）。
+  If-Match がなければ確認せずに適用する（後勝ち）
+- 本文は次のいずれか:
+    JSON Patch（application/json-patch+json、または JSON 配列）
+        [{"op": "replace", "path": "/extra_data/skills/0", "value": "..."},
+         {"op": "add", "path": "/experiences/-", "value": {...}}]
+    JSON Merge Patch（application/merge-patch+json、または JSON オブジェクト）
+        {"title": "...", "extra_data": {"memo": null}}  # null はキーの削除、配列は丸ごと置き換え
+- パスの先頭は ResumeUpdateSerializer の書き込み可能フィールド。
+  触れたフィールドだけを読み込んで適用し、値が変わったものだけを書き込む
+  （子テーブルは serializers.write_resume_children による差分書き込み）
+- 版数の更新は UPDATE ... WHERE version = <If-Match の版数> で行い、
+  同時に保存した2つ目のリクエストは 0 件更新となって 412 になる
+"""
+import copy
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.parsers import JSONParser
+
+CHILD_FIELDS = ('experiences', 'educations', 'certifications')
+
+# 子テーブルを一括で書き込み中の履歴書（版数は呼び出し側が管理する）
+_bulk_writing: ContextVar[frozenset] = ContextVar('resume_bulk_writing', default=frozenset())
+
+
+class JSONPatchParser(JSONParser):
+    media_type = 'application/json-patch+json'
+
+
+class MergePatchParser(JSONParser):
+    media_type = 'application/merge-patch+json'
+
+
+PATCH_PARSERS = [JSONPatchParser, MergePatchParser, JSONParser]
+
+
+class PatchError(Exception):
+    def __init__(self, detail: str, status_code: int = status.HTTP_400_BAD_REQUEST, extra: Optional[dict] = None):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+        self.extra = extra or {}
+
+    def as_data(self) -> dict:
+        return {'detail': self.detail, **self.extra}
+
+
+# ============================================================
+# ETag / If-Match
+# ============================================================
+
+def version_etag(pk, version) -> str:
+    return f'"{pk}.{version}"'
+
+
+def resume_etag(resume) -> str:
+    return version_etag(resume.pk, resume.version)
+
+
+def _if_match_tags(request) -> Optional[List[str]]:
+    header = request.META.get('HTTP_IF_MATCH')
+    if header is None:
+        return None
+    tags = []
+    for tag in header.split(','):
+        tag = tag.strip()
+        # 弱い ETag も同じ版数として扱う
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag:
+            tags.append(tag)
+    return tags
+
+
+def check_if_match(request, resume, required: bool = False) -> None:
+    """If-Match が現在の ETag と一致しなければ PatchError（412 / 必須で未指定なら 428）"""
+    tags = _if_match_tags(request)
+    if tags is None:
+        if required:
+            raise PatchError('If-Match header is required', status.HTTP_428_PRECONDITION_REQUIRED,
+                             {'etag': resume_etag(resume), 'version': resume.version})
+        return
+    if '*' not in tags and resume_etag(resume) not in tags:
+        raise PatchError('Resume has been modified by another request', status.HTTP_412_PRECONDITION_FAILED,
+                         {'etag': resume_etag(resume), 'version': resume.version})
+
+
+def bump_version(resume, conditional: bool = True) -> None:
+    """resume.version が DB の値と一致する場合のみ版数を上げる（一致しなければ 412）
+
+    トランザクション内で呼ぶ。行ロックはコミットまで保持され、同時保存は直列化される。
+    conditional=False（If-Match なしの保存）は版数を確認せずに上げ、resume.version を DB の値に合わせる。
+    直後の resume.save() では版数を上げない（version_saved）。
+    """
+    from .models import Resume
+
+    if not conditional:
+        _increment(resume)
+    elif not Resume.objects.filter(pk=resume.pk, version=resume.version).update(version=F('version') + 1):
+        current = Resume.objects.filter(pk=resume.pk).values_list('version', flat=True).first()
+        raise PatchError('Resume has been modified by another request', status.HTTP_412_PRECONDITION_FAILED,
+                         {'etag': version_etag(resume.pk, current), 'version': current})
+    else:
+        resume.version += 1
+    resume._version_bumped = True
+
+
+def _increment(resume) -> None:
+    from .models import Resume
+
+    Resume.objects.filter(pk=resume.pk).update(version=F('version') + 1)
+    resume.version = Resume.objects.filter(pk=resume.pk).values_list('version', flat=True).first()
+
+
+def version_saved(resume) -> None:
+    """Resume の保存後（シグナル）。bump_version を通らない保存（管理画面・extra_data のみの更新など）でも
+    版数を上げ、詳細の ETag が必ず変わるようにする"""
+    if resume.__dict__.pop('_version_bumped', False):
+        return
+    _increment(resume)
+
+
+def touch_resume(resume_id) -> None:
+    """子テーブル（職歴・学歴・資格）の個別の変更で版数と updated_at を進める（シグナルから呼ぶ）"""
+    from .models import Resume
+
+    if not resume_id or resume_id in _bulk_writing.get():
+        return
+    Resume.objects.filter(pk=resume_id).update(version=F('version') + 1, updated_at=timezone.now())
+
+
+@contextmanager
+def bulk_child_write(resume_id):
+    """この中での子テーブルの変更では touch_resume しない（一括書き込みの呼び出し側が版数を上げる）"""
+    token = _bulk_writing.set(_bulk_writing.get() | {resume_id})
+    try:
+        yield
+    finally:
+        _bulk_writing.reset(token)
+
+
+# ============================================================
+# JSON Pointer / JSON Patch（RFC 6901 / 6902）/ Merge Patch（RFC 7386）
+# ============================================================
+
+def _pointer(path) -> List[str]:
+    if not isinstance(path, str) or (path and not path.startswith('/')):
+        raise PatchError(f'Invalid JSON pointer: {path!r}')
+    return [t.replace('~1', '/').replace('~0', '~') for t in path.split('/')[1:]]
+
+
+def _index(container: list, token: str, allow_end: bool = False) -> int:
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (token != '0' and token.startswith('0')):
+        raise PatchError(f'Invalid array index: {token!r}')
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f'Array index out of range: {token}', status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return index
+
+
+def _parent(doc, tokens: List[str]):
+    """tokens の親コンテナと最後のトークン"""
+    target = doc
+    for token in tokens[:-1]:
+        if isinstance(target, dict) and token in target:
+            target = target[token]
+        elif isinstance(target, list):
+            target = target[_index(target, token)]
+        else:
+            raise PatchError(f'Path not found: /{"/".join(tokens)}', status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return target, tokens[-1]
+
+
+def _get(doc, tokens: List[str]):
+    if not tokens:
+        return doc
+    parent, key = _parent(doc, tokens)
+    if isinstance(parent, dict) and key in parent:
+        return parent[key]
+    if isinstance(parent, list):
+        return parent[_index(parent, key)]
+    raise PatchError(f'Path not found: /{"/".join(tokens)}', status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+def _add(doc, tokens: List[str], value):
+    parent, key = _parent(doc, tokens)
+    if isinstance(parent, dict):
+        parent[key] = value
+    elif isinstance(parent, list):
+        parent.insert(_index(parent, key, allow_end=True), value)
+    else:
+        raise PatchError(f'Cannot add to /{"/".join(tokens)}', status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+def _remove(doc, tokens: List[str]):
+    parent, key = _parent(doc, tokens)
+    if isinstance(parent, dict) and key in parent:
+        return parent.pop(key)
+    if isinstance(parent, list):
+        return parent.pop(_index(parent, key))
+    raise PatchError(f'Path not found: /{"/".join(tokens)}', status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+def apply_json_patch(doc: dict, operations: list) -> dict:
+    """JSON Patch を doc（ルートのキーは読み込み済み）に適用する。test の不一致は 409"""
+    doc = copy.deepcopy(doc)
+    for operation in operations:
+        if not isinstance(operation, dict) or 'op' not in operation or 'path' not in operation:
+            raise PatchError('Each operation needs "op" and "path"')
+        op, tokens = operation['op'], _pointer(operation['path'])
+        if not tokens:
+            raise PatchError('Replacing the whole resume is not supported; use PUT')
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise PatchError(f'"{op}" needs "value"')
+        if op == 'add':
+            _add(doc, tokens, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(doc, tokens)
+        elif op == 'replace':
+            _remove(doc, tokens)
+            _add(doc, tokens, copy.deepcopy(operation['value']))
+        elif op in ('move', 'copy'):
+            source = _pointer(operation.get('from'))
+            if op == 'move' and tokens[:len(source)] == source and tokens != source:
+                raise PatchError('Cannot move a value into itself')
+            value = _remove(doc, source) if op == 'move' else copy.deepcopy(_get(doc, source))
+            _add(doc, tokens, value)
+        elif op == 'test':
+            if _get(doc, tokens) != operation['value']:
+                raise PatchError(f'Test failed at {operation["path"]}', status.HTTP_409_CONFLICT)
+        else:
+            raise PatchError(f'Unsupported op: {op!r}')
+    return doc
+
+
+def apply_merge_patch(target, patch):
+    """JSON Merge Patch（null はキーの削除、オブジェクト以外は置き換え）"""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
+
+
+def _root_keys(patch) -> List[str]:
+    if isinstance(patch, dict):
+        return list(patch)
+    keys = []
+    for operation in patch:
+        for path in (operation.get('path'), operation.get('from')) if isinstance(operation, dict) else ():
+            if isinstance(path, str) and path.startswith('/'):
+                keys.append(_pointer(path)[0])
+    return list(dict.fromkeys(keys))
+
+
+# ============================================================
+# 適用
+# ============================================================
+
+def _writable_fields(serializer) -> dict:
+    return {name: field for name, field in serializer.fields.items() if not field.read_only}
+
+
+def apply_patch(resume, patch, conditional: bool = True) -> Tuple[dict, dict]:
+    """パッチを resume に適用して保存する（トランザクション内で呼ぶ。If-Match の確認は呼び出し側）
+
+    conditional=False（If-Match なし）なら resume.version を確認せずに版数を上げる。
+
+    戻り値は (変更したフィールド → 書き込み件数などの要約, 適用後の触れたフィールドの表現)。
+    値が変わらなければ何も書き込まず、版数も上げない。
+    """
+    from .models import Certification, Education, Experience
+    from .serializers import ResumeUpdateSerializer, write_resume_children
+
+    if not isinstance(patch, (dict, list)):
+        raise PatchError('Patch must be a JSON Patch array or a merge patch object')
+    serializer = ResumeUpdateSerializer(resume)
+    writable = _writable_fields(serializer)
+    keys = _root_keys(patch)
+    unknown = [k for k in keys if k not in writable]
+    if unknown:
+        raise PatchError(f'Unknown or read-only fields: {", ".join(unknown)}')
+
+    # 触れたフィールドだけ現在の表現を読み込む（子テーブルは該当テーブルのみ SELECT）
+    before = {k: writable[k].to_representation(writable[k].get_attribute(resume)) for k in keys}
+    if isinstance(patch, list):
+        after = apply_json_patch(before, patch)
+    else:
+        after = apply_merge_patch(before, patch)
+    # ルートの remove / null は既定値へのリセットではないため拒否する
+    missing = [k for k in keys if k not in after]
+    if missing:
+        raise PatchError(f'Field cannot be removed: {", ".join(missing)}')
+    changed = [k for k in keys if after[k] != before[k]]
+    if not changed:
+        return {}, after
+
+    scalar = {k: after[k] for k in changed if k not in CHILD_FIELDS}
+    children = {k: after[k] for k in changed if k in CHILD_FIELDS}
+    validator = ResumeUpdateSerializer(resume, data=scalar, partial=True)
+    validator.is_valid(raise_exception=True)
+    validated_children = {}
+    for key, items in children.items():
+        if not isinstance(items, list):
+            raise PatchError(f'{key} must be a list')
+        child = writable[key].child.__class__(data=items, many=True)
+        if not child.is_valid():
+            raise serializers.ValidationError({key: child.errors})
+        ids = [item.get('id') if isinstance(item, dict) else None for item in items]
+        validated_children[key] = (child.validated_data, ids)
+
+    bump_version(resume, conditional=conditional)
+    summary = {}
+    update_fields = []
+    for attr, value in validator.validated_data.items():
+        setattr(resume, attr, value)
+        update_fields.append(attr)
+        summary[attr] = 'updated'
+    models = {'experiences': Experience, 'educations': Education, 'certifications': Certification}
+    for key, (items, ids) in validated_children.items():
+        # 子要素の表現に含まれないフィールド（学歴の卒業年など）は保持する
+        summary[key] = write_resume_children(resume, models[key], items, ids, reset_omitted=False)
+    # 子テーブルのみの変更でも post_save（検索ドキュメント・プロフィールキャッシュの更新）を通す
+    resume.save(update_fields=update_fields + ['updated_at'])
+    return summary, after
+
+
+def apply_patch_request(request, resume) -> Tuple[dict, dict]:
+    """If-Match があれば確認してから 1 トランザクションでパッチを適用する"""
+    check_if_match(request, resume)
+    with transaction.atomic():
+        return apply_patch(resume, request.data, conditional='HTTP_IF_MATCH' in request.META)
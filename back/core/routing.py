@@ -2,5 +2,7 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
+    # 認証ユーザーの通知（user_id 付きの URL は互換用。認証ユーザーと一致しなければ拒否）
+    re_path(r'ws/notifications/$', consumers.NotificationConsumer.as_asgi()),
     re_path(r'ws/notifications/(?P<user_id>[^/]+)/$', consumers.NotificationConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -0,0 +1,284 @@
+"""
+求職者検索インデックス（SeekerSearchDocument）の構築・正規化ユーティリティ
+
+SeekerProfile / Resume / Experience に分散している検索条件を
+1求職者1行の非正規化ドキュメントにまとめ、search_seekers_v2 が
+JOIN / DISTINCT なしで絞り込めるようにする。
+複数値の条件（希望勤務地・業界・職種）は SeekerSearchTag に1値1行で展開し、
+tagged() の完全一致（索引付きの IN サブクエリ）で絞り込む。
+"""
+import logging
+import re
+import unicodedata
+from typing import Iterable, List, Optional
+
+from django.db import transaction
+
+from . import fulltext
+
+logger = logging.getLogger(__name__)
+
+# 複数値カラムの区切り文字（"|東京都|大阪府|" の形式で保存する。検索は SeekerSearchTag で行う）
+TOKEN_SEPARATOR = '|'
+# SeekerSearchTag.value の最大長
+MAX_TAG_LENGTH = 255
+
+# 複数値カラム → SeekerSearchTag.field
+TAG_FIELDS = {
+    'desired_locations': 'desired_location',
+    'desired_industries': 'desired_industry',
+    'experience_industries': 'experience_industry',
+    'desired_jobs': 'desired_job',
+}
+
+# 32bit INTEGER に収まらない値は検索対象外とする
+MAX_SALARY_VALUE = 2 ** 31 - 1
+
+PREFECTURES = (
+    '北海道', '青森県', '岩手県', '宮城県', '秋田県', '山形県', '福島県',
+    '茨城県', '栃木県', '群馬県', '埼玉県', '千葉県', '東京都', '神奈川県',
+    '新潟県', '富山県', '石川県', '福井県', '山梨県', '長野県', '岐阜県',
+    '静岡県', '愛知県', '三重県', '滋賀県', '京都府', '大阪府', '兵庫県',
+    '奈良県', '和歌山県', '鳥取県', '島根県', '岡山県', '広島県', '山口県',
+    '徳島県', '香川県', '愛媛県', '高知県', '福岡県', '佐賀県', '長崎県',
+    '熊本県', '大分県', '宮崎県', '鹿児島県', '沖縄県',
+)
+# "東京" → "東京都" のような接尾辞なし表記の対応表
+_PREFECTURE_ALIASES = {p[:-1]: p for p in PREFECTURES if p != '北海道'}
+_PREFECTURE_ALIASES['北海'] = '北海道'
+
+_WORD_SPLIT_RE = re.compile(r'[\s、。，．,.・/／|｜;:：;「」『』()（）\[\]【】]+')
+_NUMBER_RE = re.compile(r'\d+')
+
+
+def normalize_text(value) -> str:
+    """全角/半角・大文字小文字の揺れを吸収した比較用文字列を返す"""
+    if value is None:
+        return ''
+    text = unicodedata.normalize('NFKC', str(value)).lower()
+    return ' '.join(text.split())
+
+
+def normalize_prefecture(value) -> str:
+    """都道府県名を正式表記に揃える（都道府県以外は normalize_text と同じ）"""
+    text = normalize_text(value).replace(' ', '')
+    if text in PREFECTURES:
+        return text
+    return _PREFECTURE_ALIASES.get(text, text)
+
+
+def parse_salary(value) -> Optional[int]:
+    """"500", "500万円", "5,000,000" などから先頭の整数値を取り出す"""
+    if value is None:
+        return None
+    text = unicodedata.normalize('NFKC', str(value)).replace(',', '')
+    match = _NUMBER_RE.search(text)
+    if not match:
+        return None
+    number = int(match.group())
+    return number if number <= MAX_SALARY_VALUE else None
+
+
+def tokenize_keywords(*texts: str) -> str:
+    """skills / self_pr を正規化・分割し、重複を除いたトークン列（空白区切り）にする"""
+    seen = set()
+    tokens: List[str] = []
+    for text in texts:
+        for token in _WORD_SPLIT_RE.split(normalize_text(text)):
+            if token and token not in seen:
+                seen.add(token)
+                tokens.append(token)
+    return ' '.join(tokens)
+
+
+def tag_value(value, normalizer=normalize_text) -> str:
+    """複数値の1要素の正規化（保存・検索の両方で使う）"""
+    return normalizer(value).replace(TOKEN_SEPARATOR, ' ')[:MAX_TAG_LENGTH]
+
+
+def join_tokens(values: Iterable, normalizer=normalize_text) -> str:
+    """複数値を "|a|b|" 形式に連結する（空値・重複は除外）"""
+    tokens: List[str] = []
+    for value in values or []:
+        token = tag_value(value, normalizer)
+        if token and token not in tokens:
+            tokens.append(token)
+    if not tokens:
+        return ''
+    return TOKEN_SEPARATOR + TOKEN_SEPARATOR.join(tokens) + TOKEN_SEPARATOR
+
+
+def split_tokens(joined: str) -> List[str]:
+    """join_tokens の逆（"|a|b|" → ['a', 'b']）"""
+    return [token for token in (joined or '').split(TOKEN_SEPARATOR) if token]
+
+
+def tagged(field: str, values: Iterable, normalizer=normalize_text):
+    """field のいずれかの値を持つドキュメントの条件（SeekerSearchTag の完全一致。値が空なら常に偽）"""
+    from django.db.models import Q
+    from .models import SeekerSearchTag
+
+    values = sorted({tag_value(v, normalizer) for v in values if v} - {''})
+    if not values:
+        return Q(pk__in=[])
+    return Q(pk__in=SeekerSearchTag.objects.filter(field=field, value__in=values).values('document_id'))
+
+
+def document_tags(document) -> list:
+    """ドキュメントの複数値カラムから SeekerSearchTag の行を作る（未保存）"""
+    from .models import SeekerSearchTag
+
+    return [
+        SeekerSearchTag(document_id=document.pk, field=field, value=value)
+        for column, field in TAG_FIELDS.items()
+        for value in split_tokens(getattr(document, column))
+    ]
+
+
+def write_tags(documents) -> None:
+    """documents のタグを書き直す（トランザクション内で呼ぶ）"""
+    from .models import SeekerSearchTag
+
+    documents = list(documents)
+    if not documents:
+        return
+    SeekerSearchTag.objects.filter(document_id__in=[d.pk for d in documents]).delete()
+    SeekerSearchTag.objects.bulk_create(
+        [tag for document in documents for tag in document_tags(document)], batch_size=1000,
+    )
+
+
+def _as_list(value) -> list:
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if isinstance(value, str) and value:
+        return [s for s in re.split(r'[,、]', value) if s.strip()]
+    return []
+
+
+def build_document_fields(profile, resumes, experience_industries) -> dict:
+    """SeekerSearchDocument の各カラム値を組み立てる"""
+    desired_locations: list = []
+    desired_industries: list = []
+    desired_jobs: list = []
+    keyword_sources: list = []
+    for resume in resumes:
+        desired_locations.extend(_as_list(resume.desired_locations))
+        desired_industries.extend(_as_list(resume.desired_industries))
+        if resume.desired_job:
+            desired_jobs.append(resume.desired_job)
+        keyword_sources.extend([resume.skills, resume.self_pr])
+
+    return {
+        'user_id': profile.user_id,
+        'prefecture': normalize_prefecture(profile.prefecture),
+        'desired_locations': join_tokens(desired_locations, normalize_prefecture),
+        'desired_industries': join_tokens(desired_industries),
+        'experience_industries': join_tokens(experience_industries),
+        'desired_jobs': join_tokens(desired_jobs),
+        'experience_years': profile.experience_years or 0,
+        'desired_salary': parse_salary(profile.desired_salary),
+        'keywords': tokenize_keywords(*keyword_sources),
+        'created_at': profile.user.created_at,
+    }
+
+
+def rebuild_seeker_search_document(user_id):
+    """指定ユーザーの検索ドキュメントを再構築する（プロフィールがなければ削除）"""
+    from .models import SeekerProfile, Resume, Experience, SeekerSearchDocument
+
+    profile = SeekerProfile.objects.select_related('user').filter(user_id=user_id).first()
+    if profile is None:
+        SeekerSearchDocument.objects.filter(user_id=user_id).delete()
+        return None
+
+    resumes = list(
+        Resume.objects.filter(user_id=user_id).only(
+            'id', 'desired_job', 'desired_locations', 'desired_industries', 'skills', 'self_pr'
+        )
+    )
+    experience_industries = (
+        Experience.objects.filter(resume__user_id=user_id)
+        .exclude(industry='')
+        .values_list('industry', flat=True)
+    )
+    fields = build_document_fields(profile, resumes, experience_industries)
+    with transaction.atomic():
+        document, _ = SeekerSearchDocument.objects.update_or_create(
+            seeker_profile=profile, defaults=fields
+        )
+        write_tags([document])
+    fulltext.index_document(fulltext.DOC_SEEKER, profile.pk, fulltext.seeker_document_text(resumes))
+    return document
+
+
+def schedule_seeker_search_refresh(user_id):
+    """コミット後に検索ドキュメントを再構築する（ロールバック時は何もしない）"""
+    if not user_id:
+        return
+
+    def _refresh():
+        try:
+            rebuild_seeker_search_document(user_id)
+        except Exception as e:
+            logger.error(f"Seeker search document refresh failed for {user_id}: {e}")
+
+    transaction.on_commit(_refresh)
+
+
+def rebuild_all_seeker_search_documents(batch_size: int = 500) -> int:
+    """全求職者の検索ドキュメントを一括再構築する（管理コマンド用）"""
+    from django.db.models import Prefetch
+    from .models import SeekerProfile, Resume, SeekerSearchDocument
+
+    update_fields = [
+        'user', 'prefecture', 'desired_locations', 'desired_industries',
+        'experience_industries', 'desired_jobs', 'experience_years',
+        'desired_salary', 'keywords', 'created_at', 'updated_at',
+    ]
+    queryset = (
+        SeekerProfile.objects.select_related('user')
+        .prefetch_related(
+            Prefetch('user__resumes', queryset=Resume.objects.prefetch_related('experiences'))
+        )
+        .order_by('pk')
+    )
+
+    total = 0
+    batch: List = []
+    texts: List = []
+    for profile in queryset.iterator(chunk_size=batch_size):
+        resumes = list(profile.user.resumes.all())
+        industries = [
+            exp.industry for resume in resumes for exp in resume.experiences.all() if exp.industry
+        ]
+        batch.append(SeekerSearchDocument(seeker_profile=profile, **build_document_fields(profile, resumes, industries)))
+        texts.append((profile.pk, fulltext.seeker_document_text(resumes)))
+        if len(batch) >= batch_size:
+            total += _flush_documents(batch, update_fields)
+            fulltext.index_documents(fulltext.DOC_SEEKER, texts)
+            batch, texts = [], []
+    if batch:
+        total += _flush_documents(batch, update_fields)
+        fulltext.index_documents(fulltext.DOC_SEEKER, texts)
+
+    # プロフィールが削除済みのドキュメントは CASCADE で消えるため追加処理は不要
+    return total
+
+
+def _flush_documents(documents, update_fields) -> int:
+    from django.utils import timezone
+    from .models import SeekerSearchDocument
+
+    now = timezone.now()
+    for document in documents:
+        document.updated_at = now
+    with transaction.atomic():
+        SeekerSearchDocument.objects.bulk_create(
+            documents,
+            update_conflicts=True,
+            unique_fields=['seeker_profile'],
+            update_fields=update_fields,
+        )
+        write_tags(documents)
+    return len(documents)
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
 from .models import (
     User, SeekerProfile, CompanyProfile, Resume, Experience, Education, Certification,
     Application, Scout, Message, Payment, JobPosting,
@@ -8,6 +10,7 @@ from .models import (
     JobCapPlan, JobTicketLedger, TicketConsumption,
     InterviewSlot,
 )
+from .query_plans import QueryPlan
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -17,6 +20,17 @@ class UserSerializer(serializers.ModelSerializer):
     scout_credits_remaining = serializers.SerializerMethodField()
     first_resume_created_at = serializers.SerializerMethodField()
     last_resume_created_at = serializers.SerializerMethodField()
+
+    # 一覧でユーザーごとに履歴書を引かないよう、最初/最新の作成日時をサブクエリで付与する
+    query_plan = QueryPlan(annotations={
+        'first_resume_created_at': Subquery(
+            Resume.objects.filter(user=OuterRef('pk')).order_by('created_at').values('created_at')[:1]
+        ),
+        'last_resume_created_at': Subquery(
+            Resume.objects.filter(user=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+        ),
+    })
+
     class Meta:
         model = User
         fields = [
@@ -41,23 +55,19 @@ class UserSerializer(serializers.ModelSerializer):
             return 0
 
     def get_first_resume_created_at(self, obj):
-        # アノテーション済みならそれを返す
-        val = getattr(obj, 'first_resume_created_at', None)
-        if val:
-            return val
+        # アノテーション済み（query_plan 適用時）ならそれを返す（履歴書なしの None も含む）
+        if hasattr(obj, 'first_resume_created_at'):
+            return obj.first_resume_created_at
         try:
-            from .models import Resume
             first = Resume.objects.filter(user=obj).order_by('created_at').values_list('created_at', flat=True).first()
             return first
         except Exception:
             return None
 
     def get_last_resume_created_at(self, obj):
-        val = getattr(obj, 'last_resume_created_at', None)
-        if val:
-            return val
+        if hasattr(obj, 'last_resume_created_at'):
+            return obj.last_resume_created_at
         try:
-            from .models import Resume
             last = Resume.objects.filter(user=obj).order_by('-created_at').values_list('created_at', flat=True).first()
             return last
         except Exception:
@@ -239,9 +249,96 @@ class ResumeSerializer(serializers.ModelSerializer):
             'submitted_at', 'is_active', 'desired_job', 'desired_industries', 
             'desired_locations', 'skills', 'self_pr', 'experiences',
             'certifications', 'match_score', 'is_complete', 'extra_data',
-            'resume_vector', 'created_at', 'updated_at'
+            'resume_vector', 'version', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['user', 'is_complete', 'created_at', 'updated_at']
+        read_only_fields = ['user', 'is_complete', 'version', 'created_at', 'updated_at']
+
+
+def _initial_child_ids(serializer, field_name):
+    """入力の子要素ごとの id（id は read_only のため validated_data には含まれない）"""
+    initial = getattr(serializer, 'initial_data', None)
+    items = initial.get(field_name) if hasattr(initial, 'get') else None
+    if not isinstance(items, list):
+        return []
+    return [item.get('id') if isinstance(item, dict) else None for item in items]
+
+
+def write_resume_children(resume, model, items, ids=None, reset_omitted=True):
+    """履歴書の子テーブル（職歴・学歴・資格）を items（入力順）に合わせて差分で書き込む
+
+    - id が一致する既存行、なければ同じ order の既存行を対応させる
+    - 対応する行は値が変わったものだけ bulk_update、対応しない入力は bulk_create、
+      残った既存行は1回の DELETE ... IN で削除する（値が同じ行には書き込まない）
+    - reset_omitted=True なら入力にないフィールドは既定値に戻す（作り直しと同じ結果）
+    bulk_create / bulk_update はシグナルを送らないため、職歴の件数カウンタはここで増やす。
+    戻り値は {'created', 'updated', 'deleted'} の件数。
+    """
+    from . import user_stats
+    from .resume_patch import bulk_child_write
+
+    ids = list(ids or [])
+    fields = [
+        f for f in model._meta.concrete_fields
+        if f.editable and not f.primary_key and f.name != 'resume'
+    ]
+    existing = list(model.objects.filter(resume=resume))
+    by_id = {str(obj.pk): obj for obj in existing}
+    matched = [None] * len(items)
+    claimed = set()
+    for i in range(len(items)):
+        obj = by_id.get(str(ids[i])) if i < len(ids) and ids[i] else None
+        if obj is not None and obj.pk not in claimed:
+            matched[i] = obj
+            claimed.add(obj.pk)
+    by_order = {}
+    for obj in existing:
+        if obj.pk not in claimed:
+            by_order.setdefault(obj.order, obj)
+    for i in range(len(items)):
+        if matched[i] is None:
+            obj = by_order.pop(i, None)
+            if obj is not None and obj.pk not in claimed:
+                matched[i] = obj
+                claimed.add(obj.pk)
+
+    to_create, to_update, update_fields = [], [], set()
+    for i, (data, obj) in enumerate(zip(items, matched)):
+        data = dict(data, order=i)
+        if obj is None:
+            to_create.append(model(resume=resume, **data))
+            continue
+        changed = []
+        for f in fields:
+            if f.name in data:
+                value = data[f.name]
+            elif reset_omitted:
+                value = f.get_default()
+            else:
+                continue
+            if getattr(obj, f.name) != value:
+                setattr(obj, f.name, value)
+                changed.append(f.name)
+        if not changed:
+            continue
+        # 内容が変わった職歴のマッチング用ベクトルは古いので、次回のバッチで計算し直させる
+        if model is Experience and set(changed) != {'order'} and obj.embedding_f32 is not None:
+            obj.embedding_f32 = None
+            changed.append('embedding_f32')
+        to_update.append(obj)
+        update_fields.update(changed)
+
+    stale = [obj.pk for obj in existing if obj.pk not in claimed]
+    with transaction.atomic(), bulk_child_write(resume.pk):
+        if stale:
+            # 削除はシグナル（件数カウンタ・検索ドキュメント）を通す
+            model.objects.filter(pk__in=stale).delete()
+        if to_update:
+            model.objects.bulk_update(to_update, sorted(update_fields))
+        if to_create:
+            model.objects.bulk_create(to_create)
+            if model is Experience:
+                user_stats.adjust(resume.user_id, experiences_count=len(to_create))
+    return {'created': len(to_create), 'updated': len(to_update), 'deleted': len(stale)}
 
 
 class ResumeCreateSerializer(serializers.ModelSerializer):
@@ -267,23 +364,17 @@ class ResumeCreateSerializer(serializers.ModelSerializer):
         # educations_data = validated_data.pop('educations', [])
         certifications_data = validated_data.pop('certifications', [])
         
-        # extra_data はここでそのまま保存（JSONField）
-        resume = Resume.objects.create(**validated_data)
-        
-        # 職歴作成
-        for i, exp_data in enumerate(experiences_data):
-            exp_data['order'] = i
-            Experience.objects.create(resume=resume, **exp_data)
-        
-        # 学歴作成は一時的に無効化
-        # for i, edu_data in enumerate(educations_data):
-        #     edu_data['order'] = i
-        #     Education.objects.create(resume=resume, **edu_data)
-        
-        # 資格作成
-        for i, cert_data in enumerate(certifications_data):
-            cert_data['order'] = i
-            Certification.objects.create(resume=resume, **cert_data)
+        # 子テーブルまで1トランザクションで作成する
+        # （Resume の post_save による検索ドキュメント再構築はコミット後なので職歴も反映される）
+        with transaction.atomic():
+            # extra_data はここでそのまま保存（JSONField）
+            resume = Resume.objects.create(**validated_data)
+            
+            # 職歴・資格作成（各テーブル1回の INSERT）
+            write_resume_children(resume, Experience, experiences_data)
+            # 学歴作成は一時的に無効化
+            # write_resume_children(resume, Education, educations_data)
+            write_resume_children(resume, Certification, certifications_data)
         
         return resume
 
@@ -308,31 +399,28 @@ class ResumeUpdateSerializer(serializers.ModelSerializer):
         educations_data = validated_data.pop('educations', None)
         certifications_data = validated_data.pop('certifications', None)
         
-        # 基本情報更新（extra_data も含む）
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        
-        # 職歴更新
-        if experiences_data is not None:
-            instance.experiences.all().delete()
-            for i, exp_data in enumerate(experiences_data):
-                exp_data['order'] = i
-                Experience.objects.create(resume=instance, **exp_data)
-        
-        # 学歴更新
-        if educations_data is not None:
-            instance.educations.all().delete()
-            for i, edu_data in enumerate(educations_data):
-                edu_data['order'] = i
-                Education.objects.create(resume=instance, **edu_data)
-        
-        # 資格更新
-        if certifications_data is not None:
-            instance.certifications.all().delete()
-            for i, cert_data in enumerate(certifications_data):
-                cert_data['order'] = i
-                Certification.objects.create(resume=instance, **cert_data)
+        # 基本情報と子テーブルを1トランザクションで更新する
+        # （子テーブルは差分のみ書き込む。Resume の post_save による検索ドキュメント再構築はコミット後）
+        with transaction.atomic():
+            # 基本情報更新（extra_data も含む）
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
+            
+            # 職歴更新
+            if experiences_data is not None:
+                write_resume_children(instance, Experience, experiences_data,
+                                      _initial_child_ids(self, 'experiences'), reset_omitted=not self.partial)
+            
+            # 学歴更新
+            if educations_data is not None:
+                write_resume_children(instance, Education, educations_data,
+                                      _initial_child_ids(self, 'educations'), reset_omitted=not self.partial)
+            
+            # 資格更新
+            if certifications_data is not None:
+                write_resume_children(instance, Certification, certifications_data,
+                                      _initial_child_ids(self, 'certifications'), reset_omitted=not self.partial)
         
         return instance
 
@@ -0,0 +1,398 @@
+"""
+モデルシグナルハンドラ
+
+非正規化テーブル（検索インデックス・件数カウンタ等）やレスポンスキャッシュを
+元データの保存・削除に追従させる。
+"""
+from django.db.models.signals import post_init, post_save, post_delete, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import (
+    auth_cache, fulltext, matching, message_sync, message_threads, response_cache, staff_roster, user_notifications, user_stats,
+)
+from .models import (
+    User, SeekerProfile, CompanyProfile, Resume, Experience, Education, Certification,
+    Message, JobPosting, InterviewQuestion, CompanyMonthlyPage, UserPrivacySettings, UserProfileExtension,
+    Application, Scout, Annotation,
+)
+from .resume_patch import touch_resume, version_saved
+from .search_index import schedule_seeker_search_refresh
+
+
+# ============================================================
+# 求職者検索ドキュメント
+# ============================================================
+
+@receiver(post_save, sender=SeekerProfile, dispatch_uid='seeker_search_profile_saved')
+def refresh_search_document_for_profile(sender, instance, **kwargs):
+    schedule_seeker_search_refresh(instance.user_id)
+
+
+@receiver(post_delete, sender=SeekerProfile, dispatch_uid='seeker_search_profile_deleted')
+def remove_search_document_for_profile(sender, instance, **kwargs):
+    # 検索ドキュメント本体は CASCADE で削除される。全文検索の文書のみ明示的に削除
+    fulltext.schedule_remove_document(fulltext.DOC_SEEKER, instance.pk)
+
+
+@receiver(post_save, sender=Resume, dispatch_uid='seeker_search_resume_saved')
+@receiver(post_delete, sender=Resume, dispatch_uid='seeker_search_resume_deleted')
+def refresh_search_document_for_resume(sender, instance, **kwargs):
+    schedule_seeker_search_refresh(instance.user_id)
+
+
+def _experience_user_id(instance):
+    if Experience.resume.is_cached(instance):
+        return instance.resume.user_id
+    return Resume.objects.filter(pk=instance.resume_id).values_list('user_id', flat=True).first()
+
+
+@receiver(post_save, sender=Experience, dispatch_uid='seeker_search_experience_saved')
+@receiver(post_delete, sender=Experience, dispatch_uid='seeker_search_experience_deleted')
+def refresh_search_document_for_experience(sender, instance, **kwargs):
+    schedule_seeker_search_refresh(_experience_user_id(instance))
+
+
+# ============================================================
+# マッチングのベクトル（core.matching）
+# ============================================================
+# 保存された求人 / 求職者はベクトルを再計算待ちにするだけ（計算は build_matching_vectors --stale のワーカー）。
+# 削除時はインデックスの世代を進め、各プロセスがバックグラウンドで作り直す
+
+@receiver(post_save, sender=JobPosting, dispatch_uid='matching_job_saved')
+def refresh_matching_job(sender, instance, update_fields=None, **kwargs):
+    matching.mark_job_stale(instance.pk, update_fields)
+
+
+@receiver(post_delete, sender=JobPosting, dispatch_uid='matching_job_deleted')
+def drop_matching_job(sender, instance, **kwargs):
+    matching.schedule_index_bump('jobs')
+
+
+@receiver(post_save, sender=SeekerProfile, dispatch_uid='matching_profile_saved')
+@receiver(post_save, sender=Resume, dispatch_uid='matching_resume_saved')
+@receiver(post_delete, sender=Resume, dispatch_uid='matching_resume_deleted')
+def refresh_matching_seeker(sender, instance, **kwargs):
+    matching.mark_seeker_stale(instance.user_id)
+
+
+@receiver(post_save, sender=Experience, dispatch_uid='matching_experience_saved')
+@receiver(post_delete, sender=Experience, dispatch_uid='matching_experience_deleted')
+def refresh_matching_seeker_for_experience(sender, instance, **kwargs):
+    matching.mark_seeker_stale(_experience_user_id(instance))
+
+
+@receiver(post_delete, sender=SeekerProfile, dispatch_uid='matching_profile_deleted')
+def drop_matching_seeker(sender, instance, **kwargs):
+    matching.schedule_index_bump('seekers')
+
+
+# ============================================================
+# 全文検索（メッセージ本文）
+# ============================================================
+
+@receiver(post_save, sender=Message, dispatch_uid='fulltext_message_saved')
+def index_message_content(sender, instance, created, update_fields=None, **kwargs):
+    # 既読化など本文以外の更新では再索引しない
+    if not created and update_fields is not None and 'content' not in update_fields:
+        return
+    fulltext.schedule_index_document(fulltext.DOC_MESSAGE, instance.pk, instance.content)
+
+
+@receiver(post_delete, sender=Message, dispatch_uid='fulltext_message_deleted')
+def remove_message_content(sender, instance, **kwargs):
+    fulltext.schedule_remove_document(fulltext.DOC_MESSAGE, instance.pk)
+
+
+# ============================================================
+# レスポンスキャッシュの無効化
+# ============================================================
+
+@receiver(post_save, sender=JobPosting, dispatch_uid='cache_jobs_saved')
+@receiver(post_delete, sender=JobPosting, dispatch_uid='cache_jobs_deleted')
+@receiver(post_save, sender=CompanyProfile, dispatch_uid='cache_jobs_company_saved')
+def invalidate_public_jobs(sender, instance, **kwargs):
+    # 求人一覧は企業名（CompanyProfile）も含む
+    response_cache.schedule_invalidate('jobs_public')
+
+
+@receiver(post_save, sender=InterviewQuestion, dispatch_uid='cache_interview_saved')
+@receiver(post_delete, sender=InterviewQuestion, dispatch_uid='cache_interview_deleted')
+def invalidate_interview_questions(sender, instance, **kwargs):
+    response_cache.schedule_invalidate('interview_questions')
+
+
+@receiver(post_save, sender=CompanyMonthlyPage, dispatch_uid='cache_monthly_saved')
+@receiver(post_delete, sender=CompanyMonthlyPage, dispatch_uid='cache_monthly_deleted')
+def invalidate_company_monthly(sender, instance, **kwargs):
+    response_cache.schedule_invalidate('company_monthly', instance.company_id)
+
+
+@receiver(post_save, sender=User, dispatch_uid='cache_user_profile_user_saved')
+@receiver(post_delete, sender=User, dispatch_uid='cache_user_profile_user_deleted')
+def invalidate_user_profile_for_user(sender, instance, **kwargs):
+    response_cache.schedule_invalidate('user_profile', instance.pk)
+
+
+@receiver(post_save, sender=SeekerProfile, dispatch_uid='cache_user_profile_seeker_saved')
+@receiver(post_delete, sender=SeekerProfile, dispatch_uid='cache_user_profile_seeker_deleted')
+@receiver(post_save, sender=Resume, dispatch_uid='cache_user_profile_resume_saved')
+@receiver(post_delete, sender=Resume, dispatch_uid='cache_user_profile_resume_deleted')
+@receiver(post_save, sender=UserPrivacySettings, dispatch_uid='cache_user_profile_privacy_saved')
+@receiver(post_delete, sender=UserPrivacySettings, dispatch_uid='cache_user_profile_privacy_deleted')
+@receiver(post_save, sender=UserProfileExtension, dispatch_uid='cache_user_profile_extension_saved')
+@receiver(post_delete, sender=UserProfileExtension, dispatch_uid='cache_user_profile_extension_deleted')
+def invalidate_user_profile(sender, instance, **kwargs):
+    response_cache.schedule_invalidate('user_profile', instance.user_id)
+
+
+# ============================================================
+# ユーザー別件数カウンタ（UserStats）
+# ============================================================
+# post_init で読み込み時の値を控え、保存時に変化分だけ増減する
+
+_STATS_TRACKED_FIELDS = {
+    Resume: ('is_active',),
+    Application: ('status',),
+    Scout: ('status',),
+}
+
+
+def _remember_stats_state(sender, instance, **kwargs):
+    # 遅延読み込み（only/defer）のフィールドは控えない（変化量不明として扱う）
+    instance._stats_state = {f: instance.__dict__[f] for f in _STATS_TRACKED_FIELDS[sender] if f in instance.__dict__}
+
+
+for _model in _STATS_TRACKED_FIELDS:
+    post_init.connect(_remember_stats_state, sender=_model, dispatch_uid=f'user_stats_init_{_model.__name__}')
+
+
+def _flag(value) -> int:
+    return 1 if value else 0
+
+
+def _change(instance, field, weight) -> int:
+    """field の変更によるカウンタの増減（読み込み時の値が不明なら 0）"""
+    state = getattr(instance, '_stats_state', {})
+    if field not in state:
+        return 0
+    return weight(getattr(instance, field)) - weight(state[field])
+
+
+@receiver(post_save, sender=Resume, dispatch_uid='user_stats_resume_saved')
+def count_resume_saved(sender, instance, created, **kwargs):
+    if created:
+        user_stats.adjust(instance.user_id, resumes_count=1, active_resumes_count=_flag(instance.is_active))
+    else:
+        user_stats.adjust(instance.user_id, active_resumes_count=_change(instance, 'is_active', _flag))
+    _remember_stats_state(sender, instance)
+
+
+@receiver(post_delete, sender=Resume, dispatch_uid='user_stats_resume_deleted')
+def count_resume_deleted(sender, instance, **kwargs):
+    user_stats.adjust(instance.user_id, resumes_count=-1, active_resumes_count=-_flag(instance.is_active))
+
+
+@receiver(post_save, sender=Experience, dispatch_uid='user_stats_experience_saved')
+def count_experience_saved(sender, instance, created, **kwargs):
+    if created:
+        user_stats.adjust(_experience_user_id(instance), experiences_count=1)
+
+
+@receiver(post_delete, sender=Experience, dispatch_uid='user_stats_experience_deleted')
+def count_experience_deleted(sender, instance, **kwargs):
+    user_stats.adjust(_experience_user_id(instance), experiences_count=-1)
+
+
+def _pending(status) -> int:
+    return _flag(status == user_stats.PENDING_APPLICATION_STATUS)
+
+
+@receiver(post_save, sender=Application, dispatch_uid='user_stats_application_saved')
+def count_application_saved(sender, instance, created, **kwargs):
+    if created:
+        user_stats.adjust(instance.applicant_id, applications_count=1)
+        user_stats.adjust(instance.company_id, applications_received_count=1,
+                          pending_applications_count=_pending(instance.status))
+    else:
+        user_stats.adjust(instance.company_id, pending_applications_count=_change(instance, 'status', _pending))
+    _remember_stats_state(sender, instance)
+
+
+@receiver(post_delete, sender=Application, dispatch_uid='user_stats_application_deleted')
+def count_application_deleted(sender, instance, **kwargs):
+    user_stats.adjust(instance.applicant_id, applications_count=-1)
+    user_stats.adjust(instance.company_id, applications_received_count=-1,
+                      pending_applications_count=-_pending(instance.status))
+
+
+def _active_scout(status) -> int:
+    return _flag(status == user_stats.ACTIVE_SCOUT_STATUS)
+
+
+@receiver(post_save, sender=Scout, dispatch_uid='user_stats_scout_saved')
+def count_scout_saved(sender, instance, created, **kwargs):
+    if created:
+        user_stats.adjust(instance.company_id, scouts_sent_count=1, active_scouts_count=_active_scout(instance.status))
+        user_stats.adjust(instance.seeker_id, scouts_received_count=1)
+    else:
+        user_stats.adjust(instance.company_id, active_scouts_count=_change(instance, 'status', _active_scout))
+    _remember_stats_state(sender, instance)
+
+
+@receiver(post_delete, sender=Scout, dispatch_uid='user_stats_scout_deleted')
+def count_scout_deleted(sender, instance, **kwargs):
+    user_stats.adjust(instance.company_id, scouts_sent_count=-1, active_scouts_count=-_active_scout(instance.status))
+    user_stats.adjust(instance.seeker_id, scouts_received_count=-1)
+
+
+@receiver(post_save, sender=Message, dispatch_uid='user_stats_message_saved')
+def count_message_saved(sender, instance, created, **kwargs):
+    if created:
+        user_stats.adjust(instance.sender_id, messages_sent_count=1)
+        user_stats.adjust(instance.receiver_id, messages_received_count=1)
+
+
+@receiver(post_delete, sender=Message, dispatch_uid='user_stats_message_deleted')
+def count_message_deleted(sender, instance, **kwargs):
+    user_stats.adjust(instance.sender_id, messages_sent_count=-1)
+    user_stats.adjust(instance.receiver_id, messages_received_count=-1)
+
+
+# ============================================================
+# 通知（Notification）
+# ============================================================
+
+@receiver(post_save, sender=Message, dispatch_uid='notifications_message_saved')
+def notify_message_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        # 管理者からのアドバイス系メッセージ（それ以外は NotificationService が通知を作成する）
+        if user_notifications.is_advice_message(instance):
+            user_notifications.notify(
+                instance.receiver_id, instance.subject, body=instance.content,
+                data={
+                    'message_id': str(instance.pk),
+                    'annotation_id': str(instance.annotation_id) if instance.annotation_id else None,
+                    'parent_id': str(instance.parent_id) if instance.parent_id else None,
+                },
+                source_type='message', source_id=instance.pk,
+            )
+    elif instance.is_read and (update_fields is None or 'is_read' in update_fields):
+        user_notifications.mark_read(instance.receiver_id, source=('message', instance.pk))
+
+
+@receiver(post_delete, sender=Message, dispatch_uid='notifications_message_deleted')
+def remove_message_notification(sender, instance, **kwargs):
+    # 通知を作るのはアドバイス系の件名のみ（送信者が後から管理者でなくなっていても消す）
+    if instance.subject in user_notifications.ADVICE_KINDS:
+        user_notifications.remove_for_source(instance.receiver_id, 'message', instance.pk)
+
+
+# ============================================================
+# 添削スレッドの概要（MessageThread）
+# ============================================================
+
+@receiver(post_save, sender=Message, dispatch_uid='message_threads_message_saved')
+def record_message_thread(sender, instance, created, **kwargs):
+    if created:
+        message_threads.record_message(instance)
+
+
+@receiver(post_save, sender=Message, dispatch_uid='message_sync_message_saved')
+def bump_message_sync_stamp(sender, instance, created, **kwargs):
+    # WebSocket と ?wait= 中のクライアントに新着を知らせる（core.message_sync）
+    if created:
+        message_sync.bump_message_stamp(instance.sender_id, instance.receiver_id)
+        message_sync.publish_created(instance)
+
+
+@receiver(post_delete, sender=Message, dispatch_uid='message_threads_message_deleted')
+def remove_message_thread(sender, instance, **kwargs):
+    message_threads.remove_message(instance)
+
+
+@receiver(post_save, sender=Annotation, dispatch_uid='message_threads_annotation_saved')
+def resolve_message_threads(sender, instance, created, **kwargs):
+    if not created:
+        message_threads.set_resolved(instance)
+
+
+# ============================================================
+# 管理者の名簿（core.staff_roster）
+# ============================================================
+
+@receiver(pre_save, sender=Message, dispatch_uid='staff_roster_message_flag')
+def flag_staff_message(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance.is_staff_message = (
+            staff_roster.is_staff_id(instance.sender_id) or staff_roster.is_staff_id(instance.receiver_id)
+        )
+
+
+def _remember_staff_state(sender, instance, **kwargs):
+    instance._staff_state = instance.__dict__.get('is_staff')
+
+
+post_init.connect(_remember_staff_state, sender=User, dispatch_uid='staff_roster_user_init')
+
+
+@receiver(post_save, sender=User, dispatch_uid='staff_roster_user_saved')
+def refresh_staff_roster(sender, instance, created, **kwargs):
+    before = getattr(instance, '_staff_state', None)
+    if created:
+        changed = bool(instance.is_staff)
+    else:
+        # 読み込み時の値が不明（only/defer）な場合も変化ありとして扱う
+        changed = before is None or bool(before) != bool(instance.is_staff)
+    if changed:
+        staff_roster.invalidate()
+        if not created:
+            staff_roster.sync_staff_messages(instance.pk, bool(instance.is_staff))
+            message_threads.rebuild_for_staff_change(instance.pk)
+    _remember_staff_state(sender, instance)
+
+
+@receiver(post_delete, sender=User, dispatch_uid='staff_roster_user_deleted')
+def drop_staff_from_roster(sender, instance, **kwargs):
+    if instance.is_staff:
+        staff_roster.invalidate()
+
+
+# ============================================================
+# 認証キャッシュ（core.auth_cache）
+# ============================================================
+# パスワード変更・無効化・プラン変更などユーザーの変更はすべてスタンプの更新で反映する
+
+@receiver(post_save, sender=User, dispatch_uid='auth_cache_user_saved')
+@receiver(post_delete, sender=User, dispatch_uid='auth_cache_user_deleted')
+def invalidate_auth_cache_for_user(sender, instance, **kwargs):
+    auth_cache.bump_user_stamp(instance.pk)
+
+
+@receiver(post_delete, sender=Token, dispatch_uid='auth_cache_token_deleted')
+def invalidate_auth_cache_for_token(sender, instance, **kwargs):
+    # ログアウト（Token 削除）は即時に失効させる
+    auth_cache.discard_token(instance.key)
+    auth_cache.bump_user_stamp(instance.user_id)
+
+
+# ============================================================
+# 履歴書の版数（ETag）
+# ============================================================
+# 履歴書の保存と、子テーブルの個別の変更で版数を進める（詳細の ETag が必ず変わるように）
+# （bump_version 済みの保存と、一括書き込み（write_resume_children）中は呼び出し側が版数を上げる）
+
+@receiver(post_save, sender=Resume, dispatch_uid='resume_version_resume_saved')
+def bump_resume_version(sender, instance, created, **kwargs):
+    if not created:
+        version_saved(instance)
+
+
+@receiver(post_save, sender=Experience, dispatch_uid='resume_version_experience_saved')
+@receiver(post_delete, sender=Experience, dispatch_uid='resume_version_experience_deleted')
+@receiver(post_save, sender=Education, dispatch_uid='resume_version_education_saved')
+@receiver(post_delete, sender=Education, dispatch_uid='resume_version_education_deleted')
+@receiver(post_save, sender=Certification, dispatch_uid='resume_version_certification_saved')
+@receiver(post_delete, sender=Certification, dispatch_uid='resume_version_certification_deleted')
+def touch_resume_for_child(sender, instance, **kwargs):
+    touch_resume(instance.resume_id)
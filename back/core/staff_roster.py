@@ -0,0 +1,115 @@
+"""
+管理者（is_staff）の名簿キャッシュ
+
+アドバイス系メッセージの処理で毎回 users を JOIN / 検索しないよう、管理者の ID 集合と
+一般ユーザーの既定の相手（最初に登録された管理者）を Django キャッシュ（REDIS_URL 設定時は全ワーカー共有）に置く。
+
+- staff_ids(): 管理者 ID（文字列）の frozenset。メッセージの絞り込みは sender_id__in=staff_ids() で行う
+- default_counterpart_id() / default_counterpart(): 一般ユーザーの既定の相手
+- invalidate(): User の is_staff の変更・管理者の作成/削除時（シグナル）。コミット後に破棄する
+- sync_staff_messages(): is_staff が変わったユーザーのメッセージの Message.is_staff_message を付け直す
+- rebuild_staff_flags(): is_staff_message を全件付け直す（rebuild_staff_flags コマンド）
+
+QuerySet.update で is_staff を変えた場合はシグナルが発火しないため、ROSTER_TTL 秒で自然に更新される。
+"""
+from typing import FrozenSet, Iterable, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+ROSTER_KEY = 'staff_roster'
+ROSTER_TTL = 300
+
+
+def _load() -> dict:
+    from .models import User
+
+    ids = [str(uid) for uid in User.objects.filter(is_staff=True).order_by('date_joined', 'id').values_list('id', flat=True)]
+    return {'ids': ids, 'default': ids[0] if ids else None}
+
+
+def roster() -> dict:
+    """{'ids': [管理者ID...], 'default': 既定の相手のID or None}"""
+    try:
+        value = cache.get(ROSTER_KEY)
+    except Exception:
+        value = None
+    if value is None:
+        value = _load()
+        try:
+            cache.set(ROSTER_KEY, value, timeout=ROSTER_TTL)
+        except Exception:
+            pass
+    return value
+
+
+def staff_ids() -> FrozenSet[str]:
+    return frozenset(roster()['ids'])
+
+
+def is_staff_id(user_id) -> bool:
+    return user_id is not None and str(user_id) in staff_ids()
+
+
+def default_counterpart_id() -> Optional[str]:
+    return roster()['default']
+
+
+def default_counterpart():
+    """一般ユーザーの既定の相手（最初の管理者）。存在しない場合は None"""
+    from .models import User
+
+    default_id = default_counterpart_id()
+    if default_id is None:
+        return None
+    user = User.objects.filter(id=default_id, is_staff=True).first()
+    if user is None:
+        # 名簿が古い（管理者が外れた・削除された）場合は作り直す
+        invalidate(on_commit=False)
+        default_id = default_counterpart_id()
+        user = User.objects.filter(id=default_id).first() if default_id else None
+    return user
+
+
+def invalidate(on_commit: bool = True) -> None:
+    def clear():
+        try:
+            cache.delete(ROSTER_KEY)
+        except Exception:
+            pass
+
+    clear()
+    if on_commit:
+        # コミット前に古い名簿を読み直したリクエストの分も破棄する
+        transaction.on_commit(clear)
+
+
+def sync_staff_messages(user_id, is_staff: bool) -> int:
+    """user_id の is_staff の変更を、そのユーザーが送受信したメッセージの is_staff_message に反映する"""
+    from .models import Message
+
+    mine = Q(sender_id=user_id) | Q(receiver_id=user_id)
+    if is_staff:
+        return Message.objects.filter(mine, is_staff_message=False).update(is_staff_message=True)
+    others = [uid for uid in _load()['ids'] if uid != str(user_id)]
+    return Message.objects.filter(mine, is_staff_message=True).exclude(
+        Q(sender_id__in=others) | Q(receiver_id__in=others)
+    ).update(is_staff_message=False)
+
+
+def rebuild_staff_flags(user_ids: Optional[Iterable] = None) -> int:
+    """Message.is_staff_message を現在の管理者から付け直し、変更した行数を返す（user_ids=None なら全メッセージ）"""
+    from .models import Message
+
+    invalidate(on_commit=False)
+    ids = staff_ids()
+    messages = Message.objects.all()
+    if user_ids is not None:
+        user_ids = [uid for uid in user_ids if uid]
+        messages = messages.filter(Q(sender_id__in=user_ids) | Q(receiver_id__in=user_ids))
+    involved = Q(sender_id__in=ids) | Q(receiver_id__in=ids)
+    with transaction.atomic():
+        flagged = messages.filter(involved, is_staff_message=False).update(is_staff_message=True)
+        cleared = messages.filter(is_staff_message=True).exclude(involved).update(is_staff_message=False)
+    return flagged + cleared
@@ -0,0 +1,265 @@
+"""
+Stripe Webhook イベントの受付と非同期処理（StripeEvent）
+
+- record(): stripe_webhook から呼ばれ、イベントを1行 INSERT するだけ（event_id の一意制約で重複を判定）。
+  応答時間はイベントの内容によらず一定
+- drain(): process_stripe_events コマンドから呼ばれ、処理待ちの行をバッチで取り出して反映する
+    - 反映（F 式による加算）と processed への更新は同じトランザクションで行う。途中で失敗すれば
+      ロールバックされ、attempts を増やして STRIPE_EVENTS_RETRY_BASE * 2^(attempts-1) 秒後に再試行。
+      STRIPE_EVENTS_MAX_ATTEMPTS 回失敗したら dead
+    - processing のままワーカーが落ちた行は STRIPE_EVENTS_LOCK_TIMEOUT 秒後に pending へ戻す
+  ワーカーは Procfile の stripe_worker、Docker / railway では start_workers.sh が起動する
+- process_inline(): STRIPE_EVENTS_PROCESS_INLINE=true のとき、Webhook のコミット後にその1件をその場で反映する
+  （ワーカーを動かせない環境向けの代替。失敗した分はワーカーがあれば通常どおり再試行する）
+
+対応イベント（checkout.session.completed の metadata.plan_type）:
+    credits100            スカウトクレジット +100
+    standard / premium    プラン更新（30日）
+    job_tickets           求人チケット +tickets_add（metadata.job_id の所有者のみ）
+"""
+import datetime
+import logging
+import random
+from typing import Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import auth_cache, response_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50
+CREDITS_PACK_SIZE = 100
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+# ============================================================
+# 受付（Webhook 側）
+# ============================================================
+
+def record(event_id: str, event_type: str, payload: dict) -> Tuple[object, bool]:
+    """イベントを登録して (StripeEvent, 新規か) を返す（同じ event_id は2回目以降 False）"""
+    from .models import StripeEvent
+
+    try:
+        with transaction.atomic():
+            return StripeEvent.objects.create(event_id=event_id, event_type=event_type or '', payload=payload or {}), True
+    except IntegrityError:
+        return StripeEvent.objects.get(event_id=event_id), False
+
+
+def retry_delay(attempts: int) -> float:
+    """attempts 回目の失敗後の待ち秒数（指数バックオフ + 最大 10% のジッタ）"""
+    base = _setting('STRIPE_EVENTS_RETRY_BASE', 30)
+    delay = min(base * (2 ** max(0, attempts - 1)), _setting('STRIPE_EVENTS_RETRY_MAX', 3600))
+    return delay * (1 + random.random() * 0.1)
+
+
+# ============================================================
+# 反映
+# ============================================================
+
+def _log(user_id, details: dict) -> None:
+    from .models import ActivityLog
+
+    ActivityLog.objects.create(user_id=user_id, action='message', details=details)
+
+
+def _user_changed(user_id) -> None:
+    # QuerySet.update はシグナルを発火しないため、User の保存時と同じキャッシュを明示的に破棄する
+    auth_cache.bump_user_stamp(user_id)
+    response_cache.schedule_invalidate('user_profile', user_id)
+
+
+def _add_credits(event_id: str, user_id, plan_type: str) -> str:
+    from .models import User
+
+    updated = User.objects.filter(id=user_id).update(
+        scout_credits_total=F('scout_credits_total') + CREDITS_PACK_SIZE, updated_at=timezone.now(),
+    )
+    if not updated:
+        return 'user_not_found'
+    _log(user_id, {'stripe_event_id': event_id, 'plan_type': plan_type, 'delta': CREDITS_PACK_SIZE})
+    _user_changed(user_id)
+    return 'credits_added'
+
+
+def _update_plan(event_id: str, user_id, plan_type: str) -> str:
+    from .models import User
+
+    now = timezone.now()
+    updated = User.objects.filter(id=user_id).update(
+        plan_tier=plan_type, is_premium=True, premium_expiry=now + datetime.timedelta(days=30), updated_at=now,
+    )
+    if not updated:
+        return 'user_not_found'
+    _log(user_id, {'stripe_event_id': event_id, 'plan_type': plan_type})
+    _user_changed(user_id)
+    return 'plan_updated'
+
+
+def _add_job_tickets(event_id: str, user_id, plan_type: str, metadata: dict) -> str:
+    from .models import JobPosting, JobTicketLedger
+
+    job_id = metadata.get('job_id')
+    try:
+        tickets_add = int(metadata.get('tickets_add'))
+    except (TypeError, ValueError):
+        tickets_add = 0
+    if not job_id or tickets_add <= 0 or not user_id:
+        return 'ignored'
+    # 所有者チェック（ベストエフォート）
+    job = JobPosting.objects.filter(id=job_id, company_id=user_id).first()
+    if job is None:
+        return 'job_not_found'
+    ledger, _ = JobTicketLedger.objects.get_or_create(job_posting=job)
+    JobTicketLedger.objects.filter(pk=ledger.pk).update(
+        tickets_total=F('tickets_total') + tickets_add, updated_at=timezone.now(),
+    )
+    _log(user_id, {'stripe_event_id': event_id, 'plan_type': plan_type, 'job_id': str(job.id), 'delta': tickets_add})
+    return 'tickets_added'
+
+
+def apply_event(event) -> str:
+    """イベントを反映して結果（StripeEvent.result）を返す。呼び出し側のトランザクション内で実行する"""
+    if event.event_type != 'checkout.session.completed':
+        return 'ignored'
+    data_object = ((event.payload or {}).get('data') or {}).get('object')
+    if not isinstance(data_object, dict):
+        return 'ignored'
+    metadata = data_object.get('metadata') or {}
+    plan_type = str(metadata.get('plan_type') or '')
+    user_id = metadata.get('user_id')
+
+    if plan_type == 'credits100' and user_id:
+        return _add_credits(event.event_id, user_id, plan_type)
+    if plan_type in ('standard', 'premium') and user_id:
+        return _update_plan(event.event_id, user_id, plan_type)
+    if plan_type == 'job_tickets':
+        return _add_job_tickets(event.event_id, user_id, plan_type, metadata)
+    return 'ignored'
+
+
+# ============================================================
+# 処理（ワーカー側）
+# ============================================================
+
+def release_stale_locks(now=None) -> int:
+    """processing のまま一定時間経った行を pending に戻す"""
+    from .models import StripeEvent
+
+    now = now or timezone.now()
+    cutoff = now - datetime.timedelta(seconds=_setting('STRIPE_EVENTS_LOCK_TIMEOUT', 300))
+    return StripeEvent.objects.filter(status='processing', locked_at__lt=cutoff).update(
+        status='pending', locked_at=None, next_attempt_at=now,
+    )
+
+
+def claim_batch(batch_size: int = DEFAULT_BATCH_SIZE, now=None) -> list:
+    """処理時刻に達した行を processing にして返す（複数ワーカーでも同じ行を取らない）"""
+    from .models import StripeEvent
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        # SQLite など行ロックがない DB 向けに status も条件に含める
+        StripeEvent.objects.filter(id__in=ids, status='pending').update(status='processing', locked_at=now)
+    return list(StripeEvent.objects.filter(id__in=ids, status='processing', locked_at=now).order_by('next_attempt_at', 'id'))
+
+
+def process(event) -> str:
+    """1件を反映して processed にする（反映と状態更新は同じトランザクション）。失敗時は再試行に回す"""
+    from .models import StripeEvent
+
+    try:
+        with transaction.atomic():
+            # 自分が取った行のままか（ロック切れで他のワーカーに渡っていないか）を確認してから反映する
+            claimed = StripeEvent.objects.select_for_update().filter(
+                pk=event.pk, status='processing', locked_at=event.locked_at,
+            ).exists()
+            if not claimed:
+                return 'skipped'
+            result = apply_event(event)
+            StripeEvent.objects.filter(pk=event.pk).update(
+                status='processed', result=result, attempts=event.attempts + 1,
+                processed_at=timezone.now(), locked_at=None, last_error='',
+            )
+        return 'processed'
+    except Exception as e:
+        attempts = event.attempts + 1
+        status = 'dead' if attempts >= _setting('STRIPE_EVENTS_MAX_ATTEMPTS', 10) else 'pending'
+        StripeEvent.objects.filter(pk=event.pk, status='processing', locked_at=event.locked_at).update(
+            status=status, attempts=attempts, locked_at=None,
+            next_attempt_at=timezone.now() + datetime.timedelta(seconds=retry_delay(attempts)),
+            last_error=f'{e.__class__.__name__}: {e}'[:2000],
+        )
+        if status == 'dead':
+            logger.error(f"Stripe event {event.event_id} moved to dead letter after {attempts} attempts: {e}")
+        else:
+            logger.warning(f"Stripe event {event.event_id} failed (attempt {attempts}), will retry: {e}")
+        return 'dead' if status == 'dead' else 'retry'
+
+
+def claim(event_pk, now=None):
+    """指定の1件を processing にして返す（他のワーカーが取っていれば None）"""
+    from .models import StripeEvent
+
+    now = now or timezone.now()
+    if not StripeEvent.objects.filter(pk=event_pk, status='pending').update(status='processing', locked_at=now):
+        return None
+    return StripeEvent.objects.filter(pk=event_pk, status='processing', locked_at=now).first()
+
+
+def process_inline(event_pk) -> None:
+    """Webhook のコミット後に1件を反映する（STRIPE_EVENTS_PROCESS_INLINE）"""
+    def run():
+        event = claim(event_pk)
+        if event is not None:
+            process(event)
+
+    transaction.on_commit(run)
+
+
+def drain(batch_size: int = DEFAULT_BATCH_SIZE, max_batches: Optional[int] = None) -> dict:
+    """処理可能な行がなくなる（または max_batches に達する）まで処理する"""
+    totals = {'processed': 0, 'retry': 0, 'dead': 0, 'skipped': 0, 'released': release_stale_locks()}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        events = claim_batch(batch_size)
+        if not events:
+            break
+        for event in events:
+            totals[process(event)] += 1
+        batches += 1
+    return totals
+
+
+def requeue_dead(ids: Optional[Iterable] = None) -> int:
+    """dead の行を処理対象に戻す（ids 指定時はその行のみ）"""
+    from .models import StripeEvent
+
+    qs = StripeEvent.objects.filter(status='dead')
+    if ids is not None:
+        qs = qs.filter(id__in=list(ids))
+    return qs.update(status='pending', attempts=0, next_attempt_at=timezone.now(), last_error='')
+
+
+def purge_processed(older_than_days: float) -> int:
+    """処理済みの行のうち古いものの payload を消す（event_id は重複判定のため残す）"""
+    from .models import StripeEvent
+
+    cutoff = timezone.now() - datetime.timedelta(days=older_than_days)
+    return StripeEvent.objects.filter(status='processed', processed_at__lt=cutoff).update(payload={})
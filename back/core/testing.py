@@ -0,0 +1,75 @@
+"""
+テスト用ヘルパー
+
+- assert_constant_queries(): ページサイズを変えても発行クエリ数が変わらない（N+1 がない）ことを確認する
+- QueryCountAssertionsMixin: TestCase 用に assertListQueryCount() を追加する
+
+例:
+    class ScoutListTests(QueryCountAssertionsMixin, TestCase):
+        def test_scout_list(self):
+            ...  # 20件以上のスカウトを作成
+            self.assertListQueryCount(self.client, '/api/v2/scouts/', sizes=(1, 5, 20))
+"""
+from typing import Callable, Dict, Optional, Sequence
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+DEFAULT_SIZES = (1, 5, 20)
+
+
+def cursor_page_params(size: int) -> Dict[str, object]:
+    """キーセットモード（?cursor=&limit=）で size 件取得するクエリパラメータ"""
+    return {'cursor': '', 'limit': size}
+
+
+def _row_count(data) -> Optional[int]:
+    if isinstance(data, list):
+        return len(data)
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        return len(data['results'])
+    return None
+
+
+def assert_constant_queries(client, url: str, sizes: Sequence[int] = DEFAULT_SIZES, expected: Optional[int] = None,
+                            params_for: Callable[[int], Dict[str, object]] = cursor_page_params,
+                            check_rows: bool = True, using: str = DEFAULT_DB_ALIAS) -> int:
+    """一覧 API を各ページサイズで GET し、発行クエリ数が同じであることを確認する
+
+    - expected: 指定時はクエリ数がその値であることも確認する
+    - check_rows: 応答件数がページサイズと一致することを確認する（データ不足で
+      「件数が少ないからクエリ数が同じ」になるのを防ぐ）
+    一致しない場合は各回の SQL を含めて AssertionError を送出する。戻り値はクエリ数。
+    """
+    runs = []
+    for size in sizes:
+        with CaptureQueriesContext(connections[using]) as ctx:
+            response = client.get(url, params_for(size))
+        if response.status_code != 200:
+            raise AssertionError(f"GET {url} (size={size}) returned {response.status_code}")
+        if check_rows:
+            rows = _row_count(getattr(response, 'data', None))
+            if rows is not None and rows != size:
+                raise AssertionError(
+                    f"GET {url} (size={size}) returned {rows} rows; create at least {max(sizes)} rows first"
+                )
+        runs.append((size, ctx.captured_queries))
+
+    counts = {size: len(queries) for size, queries in runs}
+    first = runs[0][1]
+    if len(set(counts.values())) > 1 or (expected is not None and len(first) != expected):
+        lines = [f"Query count for GET {url} varies with page size: {counts}"
+                 + (f" (expected {expected})" if expected is not None else '')]
+        for size, queries in runs:
+            lines.append(f"--- size={size}: {len(queries)} queries")
+            lines.extend(f"  {i}. {q['sql']}" for i, q in enumerate(queries, 1))
+        raise AssertionError('\n'.join(lines))
+    return len(first)
+
+
+class QueryCountAssertionsMixin:
+    """TestCase 用: self.assertListQueryCount(client, url, ...)"""
+
+    def assertListQueryCount(self, client, url: str, sizes: Sequence[int] = DEFAULT_SIZES,
+                             expected: Optional[int] = None, **kwargs) -> int:
+        return assert_constant_queries(client, url, sizes=sizes, expected=expected, **kwargs)
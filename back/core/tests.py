@@ -1,3 +1,305 @@
-from django.test import TestCase
+"""
+core のテスト
 
-# Create your tests here.
+- 一覧 API の発行クエリ数（core.testing の assert_constant_queries を使用）。
+  ページサイズ（または件数）を変えてもクエリ数が変わらないこと = 行ごとの N+1 がないことを確認する
+- 履歴書の差分更新の楽観的排他制御（If-Match）
+- Stripe イベントの受付・反映（重複・二重処理・再試行）
+- マッチングのベクトル: 保存時は再計算待ちの印だけを付け、ワーカーがまとめて計算する
+"""
+import datetime
+import unittest
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import (
+    Annotation, Certification, CompanyProfile, Experience, JobPosting, MLPrediction, Message, Resume, Scout,
+    SeekerProfile, StripeEvent, User,
+)
+from . import matching, stripe_events
+from .testing import QueryCountAssertionsMixin
+
+PAGE_SIZES = (1, 5, 20)
+
+
+def make_user(email, role='user', **extra):
+    return User.objects.create_user(username=email, email=email, password='pw12345!x', role=role, **extra)
+
+
+def make_seeker(email, **profile):
+    user = make_user(email)
+    SeekerProfile.objects.create(user=user, first_name='太郎', last_name='山田', **profile)
+    return user
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+class ListQueryCountTests(QueryCountAssertionsMixin, TestCase):
+    """ページサイズによらず一覧のクエリ数が一定であること"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = make_user('company@example.com', role='company', company_name='ACME')
+        CompanyProfile.objects.create(user=cls.company, company_name='ACME', industry='IT')
+        cls.seeker = make_seeker('seeker@example.com', prefecture='東京都')
+        # 検索ドキュメントはコミット後に更新されるため、コールバックをその場で実行する
+        with cls.captureOnCommitCallbacks(execute=True):
+            for i in range(max(PAGE_SIZES)):
+                make_seeker(f'searchable{i}@example.com', prefecture='東京都')
+        for i in range(max(PAGE_SIZES)):
+            other = make_seeker(f'seeker{i}@example.com', prefecture='東京都')
+            Scout.objects.create(company=cls.company, seeker=other, scout_message='ご連絡です')
+            resume = Resume.objects.create(user=cls.seeker, skills='Python', self_pr='自己PR')
+            Experience.objects.create(
+                resume=resume, company='株式会社A', period_from=datetime.date(2020, 1, 1),
+                employment_type='fulltime', tasks='開発',
+            )
+            Certification.objects.create(resume=resume, name='基本情報技術者')
+            Message.objects.create(sender=cls.company, receiver=cls.seeker, content=f'メッセージ{i}')
+
+    def test_scouts(self):
+        self.assertListQueryCount(client_for(self.company), '/api/v2/scouts/', sizes=PAGE_SIZES)
+
+    def test_resumes_with_experiences_and_certifications(self):
+        self.assertListQueryCount(client_for(self.seeker), '/api/v2/resumes/', sizes=PAGE_SIZES)
+
+    def test_seeker_messages(self):
+        self.assertListQueryCount(client_for(self.seeker), '/api/v2/seeker/messages/', sizes=PAGE_SIZES)
+
+    def test_seeker_search(self):
+        self.assertListQueryCount(client_for(self.company), '/api/v2/search/seekers/', sizes=PAGE_SIZES)
+
+    def test_seeker_search_page_number_mode(self):
+        self.assertListQueryCount(
+            client_for(self.company), '/api/v2/search/seekers/', sizes=PAGE_SIZES,
+            params_for=lambda size: {'prefecture': '東京都', 'page_size': size},
+        )
+
+
+class SeekerKeywordSearchQueryCountTests(QueryCountAssertionsMixin, TestCase):
+    """キーワード（全文検索）指定時も件数によらずクエリ数が一定であること"""
+
+    def setUp(self):
+        self.company = make_user('company@example.com', role='company', company_name='ACME')
+        # 全文検索の索引はコミット後に更新されるため、コールバックをその場で実行する
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(max(PAGE_SIZES)):
+                seeker = make_seeker(f'seeker{i}@example.com')
+                Resume.objects.create(user=seeker, skills='Python, Django', self_pr='マネジメント経験あり')
+
+    def test_keyword_search(self):
+        self.assertListQueryCount(
+            client_for(self.company), '/api/v2/search/seekers/', sizes=PAGE_SIZES,
+            params_for=lambda size: {'keyword': 'マネジメント', 'page_size': size},
+        )
+
+    def test_keyword_search_cursor_pages_by_relevance(self):
+        client = client_for(self.company)
+        seen, scores, cursor = [], [], ''
+        while True:
+            response = client.get('/api/v2/search/seekers/', {'keyword': 'マネジメント', 'limit': 7, 'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            seen += [item['id'] for item in response.data['results']]
+            scores += [item['search_score'] for item in response.data['results']]
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), max(PAGE_SIZES))
+        self.assertEqual(len(set(seen)), len(seen))
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+
+class AdviceThreadsQueryCountTests(QueryCountAssertionsMixin, TestCase):
+    """アドバイスのスレッド一覧はスレッド数によらずクエリ数が一定であること"""
+
+    def setUp(self):
+        self.staff = make_user('staff@example.com', is_staff=True)
+        self.seeker = make_seeker('seeker@example.com')
+        self.resume = Resume.objects.create(user=self.seeker, skills='Python', self_pr='自己PR')
+
+    def add_threads(self, count):
+        # 本文の全文検索の索引はコミット後に更新されるため、コールバックをその場で実行する
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                index = Annotation.objects.filter(resume=self.resume).count()
+                annotation = Annotation.objects.create(
+                    resume=self.resume, subject='resume_advice', anchor_id=f'section-{index}', created_by=self.staff,
+                )
+                Message.objects.create(
+                    sender=self.staff, receiver=self.seeker, subject='resume_advice', content='具体的に書きましょう',
+                    annotation=annotation,
+                )
+                Message.objects.create(
+                    sender=self.seeker, receiver=self.staff, subject='resume_advice', content='修正しました',
+                    annotation=annotation,
+                )
+
+    def assertThreadQueriesConstant(self, client, params):
+        self.add_threads(1)
+        # 初回のみのクエリ（管理者名簿・全文検索テーブルの有無の確認など）を計測から除く
+        client.get('/api/v2/advice/threads/', params)
+        single = self.assertListQueryCount(
+            client, '/api/v2/advice/threads/', sizes=(1,), params_for=lambda size: params, check_rows=False,
+        )
+        self.add_threads(max(PAGE_SIZES) - 1)
+        self.assertListQueryCount(
+            client, '/api/v2/advice/threads/', sizes=(max(PAGE_SIZES),), expected=single,
+            params_for=lambda size: params,
+        )
+
+    def test_seeker_threads(self):
+        self.assertThreadQueriesConstant(client_for(self.seeker), {})
+
+    def test_staff_threads(self):
+        self.assertThreadQueriesConstant(client_for(self.staff), {'user_id': str(self.seeker.pk)})
+
+    def test_threads_text_search(self):
+        self.assertThreadQueriesConstant(client_for(self.seeker), {'q': '具体的'})
+
+
+class ResumeDeltaIfMatchTests(TestCase):
+    """差分更新（delta）の楽観的排他制御: If-Match があるときだけ版数を確認する"""
+
+    def setUp(self):
+        self.seeker = make_seeker('seeker@example.com')
+        self.resume = Resume.objects.create(user=self.seeker, skills='Python', self_pr='自己PR')
+        self.client = client_for(self.seeker)
+        self.url = f'/api/v2/resumes/{self.resume.pk}/delta/'
+
+    def patch(self, value, **headers):
+        return self.client.patch(self.url, {'self_pr': value}, format='json', **headers)
+
+    def test_stale_if_match_is_rejected(self):
+        etag = self.client.get(f'/api/v2/resumes/{self.resume.pk}/')['ETag']
+        self.assertEqual(self.patch('タブ1', HTTP_IF_MATCH=etag).status_code, 200)
+
+        response = self.patch('タブ2', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.resume.refresh_from_db()
+        self.assertEqual(self.resume.self_pr, 'タブ1')
+
+    def test_current_if_match_returns_new_etag(self):
+        etag = self.client.get(f'/api/v2/resumes/{self.resume.pk}/')['ETag']
+        response = self.patch('更新', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_without_if_match_applies_and_bumps_version(self):
+        version = self.resume.version
+        response = self.patch('上書き')
+        self.assertEqual(response.status_code, 200)
+        self.resume.refresh_from_db()
+        self.assertEqual(self.resume.self_pr, '上書き')
+        self.assertEqual(self.resume.version, version + 1)
+
+
+class StripeEventProcessingTests(TestCase):
+    """Stripe イベントは一度だけ反映され、失敗は再試行を経て dead になること"""
+
+    def setUp(self):
+        self.user = make_user('company@example.com', role='company', company_name='ACME')
+
+    def record_credits(self, event_id='evt_1'):
+        payload = {'data': {'object': {'metadata': {'plan_type': 'credits100', 'user_id': str(self.user.pk)}}}}
+        return stripe_events.record(event_id, 'checkout.session.completed', payload)
+
+    def credits(self):
+        self.user.refresh_from_db()
+        return self.user.scout_credits_total
+
+    def test_duplicate_record_is_not_created(self):
+        first, created = self.record_credits()
+        self.assertTrue(created)
+        again, created = self.record_credits()
+        self.assertFalse(created)
+        self.assertEqual(again.pk, first.pk)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+    def test_claimed_row_is_applied_once(self):
+        event, _ = self.record_credits()
+        before = self.credits()
+        claimed = stripe_events.claim(event.pk)
+        self.assertIsNotNone(claimed)
+        self.assertIsNone(stripe_events.claim(event.pk))
+
+        self.assertEqual(stripe_events.process(claimed), 'processed')
+        self.assertEqual(stripe_events.process(claimed), 'skipped')
+        self.assertEqual(self.credits(), before + stripe_events.CREDITS_PACK_SIZE)
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.result, event.attempts), ('processed', 'credits_added', 1))
+
+    @override_settings(STRIPE_EVENTS_MAX_ATTEMPTS=2)
+    def test_failures_retry_then_move_to_dead(self):
+        event, _ = self.record_credits()
+        before = self.credits()
+        with mock.patch.object(stripe_events, 'apply_event', side_effect=RuntimeError('boom')):
+            self.assertEqual(stripe_events.process(stripe_events.claim(event.pk)), 'retry')
+            event.refresh_from_db()
+            self.assertEqual((event.status, event.attempts), ('pending', 1))
+            self.assertGreater(event.next_attempt_at, timezone.now())
+            self.assertIn('boom', event.last_error)
+
+            # バックオフ待ちの行はバッチで取り出されない
+            self.assertEqual(stripe_events.claim_batch(), [])
+            StripeEvent.objects.filter(pk=event.pk).update(next_attempt_at=timezone.now() - datetime.timedelta(seconds=1))
+            self.assertEqual(stripe_events.drain(), {'processed': 0, 'retry': 0, 'dead': 1, 'skipped': 0, 'released': 0})
+
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ('dead', 2))
+        self.assertEqual(self.credits(), before)
+
+        self.assertEqual(stripe_events.requeue_dead([event.pk]), 1)
+        self.assertEqual(stripe_events.drain()['processed'], 1)
+        self.assertEqual(self.credits(), before + stripe_events.CREDITS_PACK_SIZE)
+
+
+@unittest.skipUnless(matching.NUMPY_AVAILABLE, 'numpy is required for the matching engine')
+class MatchingStaleVectorTests(TestCase):
+    """保存ではベクトルを計算せず matching_stale を立て、refresh_stale_vectors がまとめて計算すること"""
+
+    def setUp(self):
+        self.model = matching.activate_new_model(matching.get_dim(), {})
+        self.company = make_user('company@example.com', role='company', company_name='ACME')
+        self.seeker = make_seeker('seeker@example.com')
+        self.job = JobPosting.objects.create(
+            company=self.company, title='バックエンド', description='d', requirements='r', location='東京',
+            skills_required='Python Django',
+        )
+
+    def test_saves_mark_rows_stale_until_refreshed(self):
+        Resume.objects.create(user=self.seeker, skills='Python Django', self_pr='自己PR')
+        self.assertTrue(JobPosting.objects.get(pk=self.job.pk).matching_stale)
+        self.assertTrue(SeekerProfile.objects.get(user=self.seeker).matching_stale)
+        self.assertIsNone(JobPosting.objects.get(pk=self.job.pk).skills_vector_f32)
+
+        stats = matching.refresh_stale_vectors()
+        self.assertEqual((stats['jobs'], stats['seekers'], stats['resumes']), (1, 1, 1))
+        job = JobPosting.objects.get(pk=self.job.pk)
+        profile = SeekerProfile.objects.get(user=self.seeker)
+        self.assertFalse(job.matching_stale or profile.matching_stale)
+        self.assertIsNotNone(job.skills_vector_f32)
+        self.assertIsNotNone(profile.skill_vector_f32)
+        self.assertEqual(matching.refresh_stale_vectors()['jobs'], 0)
+
+    def test_saves_outside_matching_fields_are_ignored(self):
+        JobPosting.objects.filter(pk=self.job.pk).update(matching_stale=False)
+        self.job.location = '大阪'
+        self.job.save(update_fields=['location'])
+        self.assertFalse(JobPosting.objects.get(pk=self.job.pk).matching_stale)
+
+    def test_predictions_are_written_with_one_insert(self):
+        rows = [(self.seeker.id, 0.5, {'rank': rank}) for rank in range(5)]
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(matching.record_predictions(self.model, rows), 5)
+        inserts = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(MLPrediction.objects.filter(model=self.model).count(), 5)
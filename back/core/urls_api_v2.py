@@ -35,6 +35,7 @@ urlpatterns = [
     
     # 検索・マッチング
     path('search/seekers/', views_api_v2.search_seekers_v2, name='search-seekers-v2'),
+    path('match/', views_api_v2.match_v2, name='match-v2'),
     
     # ダッシュボード・統計
     path('dashboard/stats/', views_api_v2.dashboard_stats_v2, name='dashboard-stats-v2'),
@@ -49,6 +50,8 @@ urlpatterns = [
     path('admin/companies/credits/topup/', views_api_v2.admin_companies_credits_topup, name='admin-companies-credits-topup'),
     # 管理者分析
     path('admin/analytics/summary/', views_api_v2.admin_analytics_summary, name='admin-analytics-summary'),
+    path('admin/cache/stats/', views_api_v2.admin_cache_stats, name='admin-cache-stats'),
+    path('admin/perf/', views_api_v2.admin_perf_report, name='admin-perf-report'),
     
     # プロフィール
     path('profile/me/', views_api_v2.user_profile_v2, name='user-profile-v2'),
@@ -104,6 +107,8 @@ urlpatterns = [
     # Resume PDF endpoints
     path('resumes/download-pdf/', views_api_v2.download_resume_pdf, name='download-resume-pdf'),
     path('resumes/send-pdf/', views_api_v2.send_resume_pdf, name='send-resume-pdf'),
+    path('resumes/pdf-jobs/<str:job_id>/', views_api_v2.resume_pdf_job_status, name='resume-pdf-job-status'),
+    path('resumes/pdf-jobs/<str:job_id>/download/', views_api_v2.resume_pdf_job_download, name='resume-pdf-job-download'),
 
     # Payments (Stripe)
     path('payments/checkout/', views_api.create_stripe_checkout_session, name='stripe-checkout-v2'),
@@ -114,6 +119,8 @@ urlpatterns = [
     path('advice/threads/', views_api_v2.advice_threads, name='advice-threads'),
     path('advice/notifications/', views_api_v2.advice_notifications, name='advice-notifications'),
     path('advice/mark_read/', views_api_v2.advice_mark_read, name='advice-mark-read'),
+    path('notifications/', views_api_v2.notifications_sync, name='notifications-sync'),
+    path('notifications/mark-read/', views_api_v2.notifications_mark_read, name='notifications-mark-read'),
     # 注釈API
     path('advice/annotations/', views_api_v2.advice_annotations, name='advice-annotations'),
     path('advice/annotations/<uuid:annotation_id>/', views_api_v2.advice_annotation_detail, name='advice-annotation-detail'),
@@ -0,0 +1,234 @@
+"""
+ユーザー向け通知（Notification）と未読カウンタ（NotificationCounter）
+
+- notify(): 通知を1件作成し、同じトランザクションで未読カウンタを F 式で増やす。
+  コミット後に WebSocket へ差分（notification.delta）を送る
+- mark_read(): 未読の通知を既読にし、種別ごとに実際に更新された件数だけカウンタを減らす
+  （アドバイス系メッセージの範囲既読化は core.message_reads.read_through から呼ぶ）
+- remove_for_source(): 元データ（メッセージ等）の削除時に通知を削除し、未読だった分カウンタを減らす
+- unread_summary(): 種別ごとの未読件数と最新の未読通知の日時（カウンタの参照1回）
+- changes_since(): カーソル（Notification.id）より新しい通知。WebSocket の sync とポーリング API で使う
+- rebuild_counters(): Notification から集計し直す（rebuild_notification_counters コマンド）
+
+差分イベント（WebSocket の notifications_delta フレームになる）:
+    作成: {'cursor', 'notifications': [...], 'unread_delta': {kind: +n}}
+    既読: {'read': {'ids' | 'kinds' | 'source' | 'up_to'}, 'unread': unread_summary()}
+    削除: {'removed': {'source'}, 'unread': unread_summary()}
+    メッセージの範囲既読化: {'read': {'kinds', 'through', 'messages'}, 'unread', 'messages_unread'}
+"""
+import json
+import logging
+from typing import Dict, Iterable, Optional, Sequence
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import notification_buffer, staff_roster
+
+logger = logging.getLogger(__name__)
+
+# 管理者（is_staff）から届くアドバイス系メッセージの件名（= 通知の種別）
+ADVICE_KINDS = ('resume_advice', 'advice', 'interview')
+
+DELTA_EVENT_TYPE = 'notification.delta'
+SYNC_LIMIT = 200
+
+
+def is_advice_message(message) -> bool:
+    return message.subject in ADVICE_KINDS and staff_roster.is_staff_id(message.sender_id)
+
+
+def jsonable(value):
+    """API の応答と同じ表現（日時は ISO 8601）の JSON 互換な値にする（チャンネルレイヤー送信用）"""
+    return json.loads(json.dumps(value, cls=JSONEncoder))
+
+
+def serialize(notification) -> dict:
+    return {
+        'id': notification.id,
+        'kind': notification.kind,
+        'title': notification.title,
+        'body': notification.body,
+        'data': notification.data,
+        'source_type': notification.source_type,
+        'source_id': notification.source_id,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at,
+    }
+
+
+# ============================================================
+# 未読カウンタ
+# ============================================================
+
+def _increment(user_id, kind: str, created_at) -> None:
+    from .models import Notification, NotificationCounter
+
+    counters = NotificationCounter.objects.filter(user_id=user_id, kind=kind)
+    if counters.update(unread_count=F('unread_count') + 1, latest_at=created_at, updated_at=timezone.now()):
+        return
+    # 初回は実数から作成する（カウンタだけ消えていた場合もここで回復する）
+    unread = Notification.objects.filter(user_id=user_id, kind=kind, is_read=False).count()
+    try:
+        with transaction.atomic():
+            NotificationCounter.objects.create(user_id=user_id, kind=kind, unread_count=unread, latest_at=created_at)
+    except IntegrityError:
+        counters.update(unread_count=F('unread_count') + 1, latest_at=created_at, updated_at=timezone.now())
+
+
+def _refresh_latest(user_id, kinds: Iterable[str]) -> None:
+    """カウンタの latest_at を最新の未読通知の日時に合わせる（既読化・削除で未読が減った種別）"""
+    from .models import Notification, NotificationCounter
+
+    newest_unread = Notification.objects.filter(
+        user_id=OuterRef('user_id'), kind=OuterRef('kind'), is_read=False,
+    ).order_by('-created_at').values('created_at')[:1]
+    NotificationCounter.objects.filter(user_id=user_id, kind__in=list(kinds)).update(latest_at=Subquery(newest_unread))
+
+
+def unread_summary(user_id, kinds: Optional[Sequence[str]] = None) -> dict:
+    """{kind: {'unread', 'latest_at'}, ..., 'total_unread'}（kinds 指定時は未作成の種別も 0 で返す）"""
+    from .models import NotificationCounter
+
+    rows = NotificationCounter.objects.filter(user_id=user_id)
+    if kinds is not None:
+        rows = rows.filter(kind__in=kinds)
+    data: Dict[str, object] = {kind: {'unread': 0, 'latest_at': None} for kind in (kinds or ())}
+    total = 0
+    for kind, unread, latest_at in rows.values_list('kind', 'unread_count', 'latest_at'):
+        unread = max(0, unread)
+        data[kind] = {'unread': unread, 'latest_at': latest_at if unread else None}
+        total += unread
+    data['total_unread'] = total
+    return data
+
+
+def rebuild_counters(user_ids: Optional[Iterable] = None) -> int:
+    """未読カウンタを Notification から作り直し、作成した行数を返す（user_ids=None なら全ユーザー）"""
+    from .models import Notification, NotificationCounter
+
+    notifications = Notification.objects.all()
+    counters = NotificationCounter.objects.all()
+    if user_ids is not None:
+        user_ids = [uid for uid in user_ids if uid]
+        notifications = notifications.filter(user_id__in=user_ids)
+        counters = counters.filter(user_id__in=user_ids)
+    rows = [
+        NotificationCounter(user_id=row['user_id'], kind=row['kind'],
+                            unread_count=row['unread'], latest_at=row['latest_at'])
+        for row in notifications.values('user_id', 'kind').annotate(
+            unread=Count('id', filter=Q(is_read=False)), latest_at=Max('created_at', filter=Q(is_read=False)),
+        ).order_by()
+    ]
+    with transaction.atomic():
+        counters.delete()
+        NotificationCounter.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+# ============================================================
+# 作成・既読化
+# ============================================================
+
+def notify(user_id, kind: str, title: str = '', body: str = '', data: Optional[dict] = None,
+           source_type: str = '', source_id='', push: bool = True):
+    """通知を作成して返す（push=True ならコミット後に WebSocket へ差分を送る）"""
+    from .models import Notification
+
+    with transaction.atomic():
+        notification = Notification.objects.create(
+            user_id=user_id, kind=kind, title=title[:200], body=body[:300], data=data or {},
+            source_type=source_type, source_id=str(source_id or ''),
+        )
+        _increment(user_id, kind, notification.created_at)
+    if push:
+        notification_buffer.publish(user_id, jsonable({
+            'type': DELTA_EVENT_TYPE,
+            'cursor': notification.id,
+            'notifications': [serialize(notification)],
+            'unread_delta': {kind: 1},
+        }))
+    return notification
+
+
+def mark_read(user_id, ids: Optional[Iterable] = None, kinds: Optional[Iterable[str]] = None,
+              source: Optional[tuple] = None, up_to: Optional[int] = None, push: bool = True) -> Dict[str, int]:
+    """未読の通知を既読にし、種別ごとの既読化件数を返す
+
+    ids / kinds / source（(source_type, source_id)）/ up_to（この ID 以前）で対象を絞る。いずれも未指定なら全件。
+    """
+    from .models import Notification, NotificationCounter
+
+    qs = Notification.objects.filter(user_id=user_id, is_read=False)
+    scope: Dict[str, object] = {}
+    if ids is not None:
+        ids = [int(i) for i in ids]
+        qs = qs.filter(id__in=ids)
+        scope['ids'] = ids
+    if kinds is not None:
+        kinds = list(kinds)
+        qs = qs.filter(kind__in=kinds)
+        scope['kinds'] = kinds
+    if source is not None:
+        qs = qs.filter(source_type=source[0], source_id=str(source[1]))
+        scope['source'] = {'type': source[0], 'id': str(source[1])}
+    if up_to is not None:
+        qs = qs.filter(id__lte=int(up_to))
+        scope['up_to'] = int(up_to)
+
+    changed: Dict[str, int] = {}
+    now = timezone.now()
+    with transaction.atomic():
+        for kind in set(qs.values_list('kind', flat=True)):
+            # update の件数は実際に未読→既読にした行数（同時実行でも二重に減らさない）
+            updated = qs.filter(kind=kind).update(is_read=True, read_at=now)
+            if updated:
+                NotificationCounter.objects.filter(user_id=user_id, kind=kind).update(
+                    unread_count=F('unread_count') - updated, updated_at=now,
+                )
+                changed[kind] = updated
+        if changed:
+            _refresh_latest(user_id, changed)
+    if changed and push:
+        notification_buffer.publish(user_id, jsonable({
+            'type': DELTA_EVENT_TYPE,
+            'read': scope or {'all': True},
+            'unread': unread_summary(user_id),
+        }))
+    return changed
+
+
+def remove_for_source(user_id, source_type: str, source_id, push: bool = True) -> int:
+    """source の通知を削除し、削除した件数を返す（未読だった分はカウンタから減らす）"""
+    from .models import Notification
+
+    source_id = str(source_id)
+    with transaction.atomic():
+        # 先に既読化してカウンタを正確に減らしてから削除する（同時の既読化と二重に減らさない）
+        changed = mark_read(user_id, source=(source_type, source_id), push=False)
+        deleted, _ = Notification.objects.filter(user_id=user_id, source_type=source_type, source_id=source_id).delete()
+    if deleted and push:
+        notification_buffer.publish(user_id, jsonable({
+            'type': DELTA_EVENT_TYPE,
+            'removed': {'source': {'type': source_type, 'id': source_id}},
+            'unread': unread_summary(user_id),
+        }))
+    return deleted
+
+
+def changes_since(user_id, cursor: int = 0, limit: int = SYNC_LIMIT) -> dict:
+    """cursor より新しい通知（古い順）と、次回のカーソル・未読サマリ"""
+    from .models import Notification
+
+    limit = max(1, min(limit, SYNC_LIMIT))
+    rows = list(Notification.objects.filter(user_id=user_id, id__gt=cursor).order_by('id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'notifications': [serialize(n) for n in rows],
+        'cursor': rows[-1].id if rows else cursor,
+        'has_more': has_more,
+        'unread': unread_summary(user_id),
+    }
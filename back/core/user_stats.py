@@ -0,0 +1,107 @@
+"""
+ユーザー別件数カウンタ（UserStats）の集計・更新
+
+- adjust(): シグナルから呼ばれ、同じトランザクション内で F 式により増減する
+  （行がまだなければ増分の代わりに実数から作成する。減算のみの場合は作らず、初回参照時に get_user_stats が作成する）
+- rebuild_user_stats(): 元テーブルを GROUP BY で集計し一括 upsert（整合性の回復用）
+- get_user_stats(): ダッシュボード用。主キー1回の参照
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from django.db.models import Count, F, Q
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = (
+    'resumes_count', 'active_resumes_count', 'experiences_count', 'applications_count',
+    'scouts_received_count', 'applications_received_count', 'pending_applications_count',
+    'scouts_sent_count', 'active_scouts_count', 'messages_sent_count', 'messages_received_count',
+)
+
+# 「進行中」とみなすステータス
+PENDING_APPLICATION_STATUS = 'pending'
+ACTIVE_SCOUT_STATUS = 'sent'
+
+
+def adjust(user_id, **deltas) -> None:
+    """user_id のカウンタを増減する（例: adjust(uid, resumes_count=1)）"""
+    from django.utils import timezone
+    from .models import UserStats
+
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not user_id or not deltas:
+        return
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}, updated_at=timezone.now()
+    )
+    if not updated and any(delta > 0 for delta in deltas.values()):
+        # 行の作成と並行した増分を失わないよう、シグナル元の行を含めた実数で作る
+        # （減算のみ = 削除時は作らない。ユーザー削除の連鎖の途中で行を作り直さないため）
+        rebuild_user_stats([user_id])
+
+
+def compute_counts(user_ids: Optional[Iterable] = None) -> Dict[object, dict]:
+    """元テーブルから件数を集計する（user_ids=None なら全ユーザー）"""
+    from .models import Resume, Experience, Application, Scout, Message
+
+    counts: Dict[object, dict] = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+    ids = list(user_ids) if user_ids is not None else None
+
+    def grouped(queryset, user_field, **aggregates):
+        if ids is not None:
+            queryset = queryset.filter(**{f'{user_field}__in': ids})
+        for row in queryset.values(user_field).annotate(**aggregates).order_by():
+            counts[row[user_field]].update({k: row[k] for k in aggregates})
+
+    grouped(Resume.objects, 'user_id', resumes_count=Count('id'),
+            active_resumes_count=Count('id', filter=Q(is_active=True)))
+    grouped(Experience.objects, 'resume__user_id', experiences_count=Count('id'))
+    grouped(Application.objects, 'applicant_id', applications_count=Count('id'))
+    grouped(Application.objects, 'company_id', applications_received_count=Count('id'),
+            pending_applications_count=Count('id', filter=Q(status=PENDING_APPLICATION_STATUS)))
+    grouped(Scout.objects, 'company_id', scouts_sent_count=Count('id'),
+            active_scouts_count=Count('id', filter=Q(status=ACTIVE_SCOUT_STATUS)))
+    grouped(Scout.objects, 'seeker_id', scouts_received_count=Count('id'))
+    grouped(Message.objects, 'sender_id', messages_sent_count=Count('id'))
+    grouped(Message.objects, 'receiver_id', messages_received_count=Count('id'))
+    return counts
+
+
+def rebuild_user_stats(user_ids: Optional[Iterable] = None, batch_size: int = 1000) -> int:
+    """カウンタを実数で作り直す（user_ids=None なら全ユーザー）"""
+    from django.utils import timezone
+    from .models import User, UserStats
+
+    if user_ids is not None:
+        user_ids = [uid for uid in user_ids if uid]
+        if not user_ids:
+            return 0
+        targets: List = list(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    else:
+        targets = list(User.objects.values_list('id', flat=True))
+
+    total = 0
+    for i in range(0, len(targets), batch_size):
+        chunk = targets[i:i + batch_size]
+        counts = compute_counts(chunk)
+        now = timezone.now()
+        rows = [UserStats(user_id=uid, updated_at=now, **counts[uid]) for uid in chunk]
+        UserStats.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['user'],
+            update_fields=list(COUNTER_FIELDS) + ['updated_at'],
+        )
+        total += len(rows)
+    return total
+
+
+def get_user_stats(user):
+    """user の UserStats を返す（未作成なら実数から作成）"""
+    from .models import UserStats
+
+    stats = UserStats.objects.filter(user_id=user.pk).first()
+    if stats is None:
+        rebuild_user_stats([user.pk])
+        stats = UserStats.objects.get(user_id=user.pk)
+    return stats
@@ -6,11 +6,14 @@ from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import login
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
+from django.db.models import F, Q
+from django.utils import timezone
 from datetime import datetime
 from django.http import JsonResponse
-from django.core.cache import cache
 
+from .ratelimit import LoginRateThrottle
+from .user_stats import rebuild_user_stats
+from .query_plans import optimize_queryset
 from .models import (
     User, SeekerProfile, Resume, Experience,
     Application, Scout, Message, Payment
@@ -78,27 +81,9 @@ class RegisterView(APIView):
 class LoginView(APIView):
     """ログインAPI"""
     permission_classes = [AllowAny]
+    throttle_classes = [LoginRateThrottle]  # IP+email ごとに 10回 / 10分
     
     def post(self, request):
-        # Rate limit login attempts (per IP+email): 10 tries / 10 minutes
-        def _rate_limit(key: str, limit: int, window_seconds: int) -> bool:
-            ip = request.META.get('REMOTE_ADDR') or 'unknown'
-            cache_key = f"rl:{ip}:{key}"
-            added = cache.add(cache_key, 1, timeout=window_seconds)
-            if added:
-                return True
-            try:
-                current = cache.incr(cache_key)
-            except ValueError:
-                cache.set(cache_key, 1, timeout=window_seconds)
-                return True
-            return current <= limit
-
-        email_for_key = request.data.get('email') or 'unknown'
-        key = f"login:{email_for_key}"
-        if not _rate_limit(key, limit=10, window_seconds=600):
-            return Response({'detail': '試行回数が多すぎます。しばらくしてからお試しください。'}, status=429)
-
         serializer = LoginSerializer(data=request.data)
         
         if serializer.is_valid():
@@ -195,9 +180,14 @@ class ResumeViewSet(viewsets.ModelViewSet):
     def activate(self, request, pk=None):
         """履歴書をアクティブにする"""
         resume = self.get_object()
-        Resume.objects.filter(user=request.user).update(is_active=False)
+        # update() は保存処理を通らないため、ETag が変わるよう版数と updated_at も進める
+        Resume.objects.filter(user=request.user, is_active=True).exclude(pk=resume.pk).update(
+            is_active=False, version=F('version') + 1, updated_at=timezone.now(),
+        )
         resume.is_active = True
         resume.save()
+        # update() はシグナルを発火しないためカウンタを作り直す
+        rebuild_user_stats([request.user.pk])
         return Response({'message': 'Resume activated'})
 
 
@@ -384,7 +374,7 @@ def search_seekers(request):
             seeker_profile__prefecture__icontains=location
         )
     
-    serializer = UserSerializer(seekers[:50], many=True)
+    serializer = UserSerializer(optimize_queryset(seekers, UserSerializer)[:50], many=True)
     return Response(serializer.data)
 
 
@@ -437,7 +427,7 @@ def search_companies(request):
     # ページネーション
     paginator = PageNumberPagination()
     paginator.page_size = 20
-    page = paginator.paginate_queryset(queryset, request)
+    page = paginator.paginate_queryset(optimize_queryset(queryset, UserSerializer), request)
     
     serializer = UserSerializer(page, many=True)
     return paginator.get_paginated_response(serializer.data)
@@ -587,7 +577,7 @@ def get_admin_seekers(request):
     from rest_framework.pagination import PageNumberPagination
     paginator = PageNumberPagination()
     paginator.page_size = 50
-    page = paginator.paginate_queryset(queryset, request)
+    page = paginator.paginate_queryset(optimize_queryset(queryset, UserSerializer), request)
     
     serializer = UserSerializer(page, many=True)
     return paginator.get_paginated_response(serializer.data)
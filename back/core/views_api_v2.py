@@ -9,18 +9,15 @@
 """
 
 from rest_framework import status, viewsets, permissions
-from rest_framework.exceptions import PermissionDenied
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.exceptions import PermissionDenied, ValidationError as DRFValidationError
+from rest_framework.decorators import api_view, permission_classes, throttle_classes, action, renderer_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.authtoken.models import Token
 from django.shortcuts import get_object_or_404
 from django.db import transaction
-from django.db.models import OuterRef, Subquery
 from django.db import connection
-from django.db.models.functions import Cast
-from django.db.models import IntegerField
 from django.contrib.auth import authenticate
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
@@ -31,10 +28,20 @@ import uuid
 import jwt
 import datetime
 import os
-from django.core.cache import cache
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError as DjangoValidationError
 
+from .response_cache import cached_response
+from .exports import EXPORT_RENDERERS, export_format, streaming_export
+from .resume_patch import (
+    PATCH_PARSERS, PatchError, apply_patch_request, bump_version, check_if_match, resume_etag, version_etag,
+)
+from . import staff_roster
+from .conditional import ConditionalGetMixin, conditional_get
+from .message_sync import is_sync_request, sync_response
+from .pagination import keyset_paginated_response
+from .query_plans import QueryPlanMixin, optimize_queryset
+from .ratelimit import LoginRateThrottle, InterviewPersonalizeThrottle
 from .models import (
     User, SeekerProfile, CompanyProfile, Resume, Experience, 
     Education, Certification, Application, Scout, Message, JobPosting,
@@ -112,6 +119,9 @@ JWT_SECRET = os.getenv("JWT_SECRET_KEY", "default-secret-key-change-in-productio
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXP_DELTA_SECONDS = int(os.getenv("JWT_EXP_DELTA_SECONDS", str(3600*24*30)))
 
+# 履歴書一覧の並び順（通常の一覧とカーソルモードで共通。索引: core_resumes_user_updated_idx）
+RESUME_LIST_ORDERING = ('-updated_at', '-id')
+
 def generate_jwt_token(user):
     """JWT トークンを生成"""
     payload = {
@@ -132,23 +142,6 @@ def verify_jwt_token(token):
     except jwt.InvalidTokenError:
         return None
 
-def _rate_limit(request, key: str, limit: int, window_seconds: int) -> bool:
-    """Simple IP+key-based rate limiter using Django cache.
-    Returns True if within limit, False if over.
-    """
-    ip = request.META.get('REMOTE_ADDR') or 'unknown'
-    cache_key = f"rl:{ip}:{key}"
-    added = cache.add(cache_key, 1, timeout=window_seconds)
-    if added:
-        return True
-    try:
-        current = cache.incr(cache_key)
-    except ValueError:
-        cache.set(cache_key, 1, timeout=window_seconds)
-        return True
-    return current <= limit
-
-
 # ============================================================================
 # テスト用エンドポイント
 # ============================================================================
@@ -171,6 +164,8 @@ def health_check_v2(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+# 質問マスタはユーザーによらず同じ応答のため vary_on_user なしで共有する
+@cached_response('interview_questions', timeout=600)
 def interview_categories_v2(request):
     """質問カテゴリ一覧（typeでフィルタ可能）"""
     qtype = request.GET.get('type')
@@ -188,6 +183,8 @@ def interview_categories_v2(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+# 質問マスタはユーザーによらず同じ応答のため vary_on_user なしで共有する
+@cached_response('interview_questions', timeout=600)
 def interview_questions_v2(request):
     """質問一覧取得。クエリ: type, category, difficulty, tags, limit"""
     qtype = request.GET.get('type')
@@ -216,13 +213,11 @@ def interview_questions_v2(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([InterviewPersonalizeThrottle])
 def interview_personalize_v2(request):
     """履歴書に基づき質問をパーソナライズして返す（+Geminiで追加生成）"""
-    # レート制限（IPベース、1分10回）
     import logging
     logger = logging.getLogger(__name__)
-    if not _rate_limit(request, 'interview_personalize', 10, 60):
-        return Response({'detail': 'Too many requests'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
     body = request.data or {}
     qtype = str(body.get('type') or 'interview')
     limit = int(body.get('limit') or 5)
@@ -399,33 +394,73 @@ def template_render_v2(request):
     rendered = render_prompt_with_resume(t, r)
     return Response({'text': rendered, 'template': PromptTemplateSerializer(t).data}, status=status.HTTP_200_OK)
 
+# ============================================================================
+# 履歴書 PDF レンダリングジョブ
+# ============================================================================
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def resume_pdf_job_status(request, job_id):
+    """PDF レンダリングジョブの状態
+
+    GET /api/v2/resumes/pdf-jobs/<job_id>/
+    job_id は download-pdf が 202 で返す内容ハッシュ。status: ready / pending / failed
+    """
+    from . import pdf_render
+    if not pdf_render.is_valid_key(job_id):
+        return Response({'detail': 'ジョブが見つかりません'}, status=status.HTTP_404_NOT_FOUND)
+    job = pdf_render.job_status(job_id)
+    if job['status'] == pdf_render.STATUS_UNKNOWN:
+        return Response({'detail': 'ジョブが見つかりません'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(job, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def resume_pdf_job_download(request, job_id):
+    """レンダリング済み PDF のダウンロード（未完了なら 202 と状態）
+
+    GET /api/v2/resumes/pdf-jobs/<job_id>/download/
+    """
+    from . import pdf_render
+    if not pdf_render.is_valid_key(job_id):
+        return Response({'detail': 'ジョブが見つかりません'}, status=status.HTTP_404_NOT_FOUND)
+    job = pdf_render.job_status(job_id)
+    if job['status'] == pdf_render.STATUS_READY:
+        from django.http import FileResponse
+        response = FileResponse(pdf_render.open_pdf(job_id), content_type='application/pdf', as_attachment=True,
+                                filename=f'resume_{timezone.localdate().strftime("%Y%m%d")}.pdf')
+        response['ETag'] = f'"{job_id}"'
+        return response
+    if job['status'] == pdf_render.STATUS_PENDING:
+        return Response(job, status=status.HTTP_202_ACCEPTED)
+    if job['status'] == pdf_render.STATUS_FAILED:
+        return Response({'error': f'PDF生成中にエラーが発生しました: {job.get("error", "")}', **job},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response({'detail': 'ジョブが見つかりません'}, status=status.HTTP_404_NOT_FOUND)
+
+
 # ============================================================================
 # 管理者用エンドポイント
 # ============================================================================
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(EXPORT_RENDERERS)
 def admin_seekers_v2(request):
     """管理者用 求職者一覧 (API v2)
 
     互換エンドポイント。実体は admin_users_v2 と同等のロジックで
     role='user' に固定フィルタをかけたもの。
+    ?format=ndjson|csv（または ?stream=1）で全件をストリーミングでエクスポート。
     """
     # 権限チェック
     if not request.user.is_staff:
         return Response({'detail': '管理者権限が必要です'}, status=status.HTTP_403_FORBIDDEN)
 
     queryset = User.objects.filter(role='user').order_by('-created_at')
-    # annotate earliest resume creation
-    try:
-        first_resume_subq = Resume.objects.filter(user=OuterRef('pk')).order_by('created_at').values('created_at')[:1]
-        last_resume_subq = Resume.objects.filter(user=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
-        queryset = queryset.annotate(
-            first_resume_created_at=Subquery(first_resume_subq),
-            last_resume_created_at=Subquery(last_resume_subq),
-        )
-    except Exception:
-        pass
+    # 最初/最新の履歴書作成日時（UserSerializer のクエリプラン）
+    queryset = optimize_queryset(queryset, UserSerializer)
 
     # フィルタ（v1互換）
     status_filter = request.query_params.get('status', '')
@@ -442,6 +477,16 @@ def admin_seekers_v2(request):
     if date_to:
         queryset = queryset.filter(created_at__lte=date_to)
 
+    # 全件エクスポート: ?format=ndjson|csv / ?stream=1
+    fmt = export_format(request)
+    if fmt:
+        return streaming_export(request, queryset, UserSerializer, 'seekers', fmt)
+
+    # カーソル（キーセット）モード: ?cursor= 指定時
+    paged = keyset_paginated_response(request, queryset, lambda rows: UserSerializer(rows, many=True).data)
+    if paged is not None:
+        return paged
+
     # ページネーション
     from rest_framework.pagination import PageNumberPagination
     paginator = PageNumberPagination()
@@ -454,11 +499,13 @@ def admin_seekers_v2(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(EXPORT_RENDERERS)
 def admin_users_v2(request):
     """管理者用 ユーザー一覧 (API v2)
 
     クエリ: role=(user|company) で絞り込み可能。未指定は全件。
     status=(active|premium) フィルタ対応。日付範囲も同様。
+    ?format=ndjson|csv（または ?stream=1）で全件をストリーミングでエクスポート。
     """
     if not request.user.is_staff:
         return Response({'detail': '管理者権限が必要です'}, status=status.HTTP_403_FORBIDDEN)
@@ -482,16 +529,18 @@ def admin_users_v2(request):
     if date_to:
         queryset = queryset.filter(created_at__lte=date_to)
 
-    # annotate earliest and latest resume creation
-    try:
-        first_resume_subq = Resume.objects.filter(user=OuterRef('pk')).order_by('created_at').values('created_at')[:1]
-        last_resume_subq = Resume.objects.filter(user=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
-        queryset = queryset.annotate(
-            first_resume_created_at=Subquery(first_resume_subq),
-            last_resume_created_at=Subquery(last_resume_subq),
-        )
-    except Exception:
-        pass
+    # 最初/最新の履歴書作成日時（UserSerializer のクエリプラン）
+    queryset = optimize_queryset(queryset, UserSerializer)
+
+    # 全件エクスポート: ?format=ndjson|csv / ?stream=1
+    fmt = export_format(request)
+    if fmt:
+        return streaming_export(request, queryset, UserSerializer, f'users-{role}' if role in {'user', 'company'} else 'users', fmt)
+
+    # カーソル（キーセット）モード: ?cursor= 指定時
+    paged = keyset_paginated_response(request, queryset, lambda rows: UserSerializer(rows, many=True).data)
+    if paged is not None:
+        return paged
 
     from rest_framework.pagination import PageNumberPagination
     paginator = PageNumberPagination()
@@ -589,28 +638,20 @@ def admin_user_overview(request, user_id):
     # ユーザー取得
     target = get_object_or_404(User, id=user_id)
 
-    # 件数サマリ
-    resumes_count = Resume.objects.filter(user=target).count()
-    experiences_count = Experience.objects.filter(resume__user=target).count()
+    # 件数サマリ（UserStats カウンタ）
+    from .user_stats import get_user_stats
+    counters = get_user_stats(target)
+    resumes_count = counters.resumes_count
+    experiences_count = counters.experiences_count
 
     # 応募とスカウト（求職者/企業で分岐）
-    applications_as_applicant = Application.objects.filter(applicant=target).count()
-    applications_as_company = Application.objects.filter(company=target).count()
-    scouts_sent = Scout.objects.filter(company=target).count()
-    scouts_received = Scout.objects.filter(seeker=target).count()
+    applications_as_applicant = counters.applications_count
+    applications_as_company = counters.applications_received_count
+    scouts_sent = counters.scouts_sent_count
+    scouts_received = counters.scouts_received_count
 
     # メッセージ（送受信）
-    from django.db.models import Q
-    messages_total = 0
-    try:
-        messages_total = target.sent_messages.count() + target.received_messages.count()
-    except Exception:
-        # 念のためのフォールバック
-        messages_total = (
-            __import__('core.models', fromlist=['Message']).Message.objects.filter(
-                Q(sender=target) | Q(receiver=target)
-            ).count()
-        )
+    messages_total = counters.messages_sent_count + counters.messages_received_count
 
     # 最終アクティビティ（存在すれば）
     latest_activity = None
@@ -656,7 +697,9 @@ def admin_user_overview(request, user_id):
         ann_time = None
         ann_user = None
     try:
-        msg = Message.objects.filter(subject='resume_advice', receiver=target, sender__is_staff=True).order_by('-created_at').first()
+        msg = Message.objects.filter(
+            subject='resume_advice', receiver=target, sender_id__in=staff_roster.staff_ids(),
+        ).order_by('-created_at').first()
         msg_time = getattr(msg, 'created_at', None)
         msg_user = getattr(msg, 'sender', None)
     except Exception:
@@ -763,13 +806,21 @@ def admin_user_overview(request, user_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(EXPORT_RENDERERS)
 def admin_user_resumes(request, user_id):
-    """管理者用: 指定ユーザーの履歴書一覧を取得"""
+    """管理者用: 指定ユーザーの履歴書一覧を取得（?format=ndjson|csv / ?stream=1 でストリーミング）"""
     if not request.user.is_staff:
         return Response({'detail': '管理者権限が必要です'}, status=status.HTTP_403_FORBIDDEN)
 
     target = get_object_or_404(User, id=user_id)
-    resumes_qs = Resume.objects.filter(user=target).order_by('-updated_at')
+    resumes_qs = optimize_queryset(Resume.objects.filter(user=target).order_by(*RESUME_LIST_ORDERING), ResumeSerializer)
+    fmt = export_format(request)
+    if fmt:
+        return streaming_export(request, resumes_qs, ResumeSerializer, f'resumes-{target.id}', fmt)
+    paged = keyset_paginated_response(request, resumes_qs, lambda rows: ResumeSerializer(rows, many=True).data,
+                                      ordering=RESUME_LIST_ORDERING)
+    if paged is not None:
+        return paged
     data = ResumeSerializer(resumes_qs, many=True).data
     return Response(data, status=status.HTTP_200_OK)
 
@@ -901,14 +952,9 @@ def register_company_v2(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginRateThrottle])
 def login_v2(request):
     """ユーザーログイン API v2"""
-    # Rate limit login attempts per IP+email: 10 tries / 10 minutes
-    email_for_key = (request.data or {}).get('email') if hasattr(request, 'data') else None
-    email_for_key = email_for_key or 'unknown'
-    if not _rate_limit(request, f"login:{email_for_key}", limit=10, window_seconds=600):
-        return Response({'detail': '試行回数が多すぎます。しばらくしてからお試しください。'}, status=429)
-
     serializer = LoginSerializer(data=request.data)
     
     if serializer.is_valid():
@@ -1047,96 +1093,86 @@ def admin_analytics_summary(request):
 
     GET /api/v2/admin/analytics/summary/
     返却: totals/plan_distribution/login_recency/registrations_trend/age_buckets/payments_recent
+    日次ロールアップ（rollup_analytics コマンド）+ 今日分の差分から算出する。
+    login_recency / age_buckets は rollup_date 終了時点の値。
     """
     if not request.user.is_staff:
         return Response({'detail': '管理者権限が必要です'}, status=status.HTTP_403_FORBIDDEN)
 
-    from django.db.models import Count, Q
-    from django.db.models.functions import TruncDate
-    from .models import User, SeekerProfile, Payment
-
-    now = timezone.now()
-    today = now.date()
-    d7 = now - datetime.timedelta(days=7)
-    d30 = now - datetime.timedelta(days=30)
-    d90 = now - datetime.timedelta(days=90)
-
-    # Totals
-    totals = {
-        'users': User.objects.count(),
-        'seekers': User.objects.filter(role='user').count(),
-        'companies': User.objects.filter(role='company').count(),
-        'active': User.objects.filter(is_active=True).count(),
-        'premium': User.objects.filter(is_premium=True).count(),
-    }
+    from .analytics import analytics_summary
 
-    # Plan distribution
-    plan_distribution = {
-        'none': User.objects.filter(plan_tier='').count(),
-        'starter': User.objects.filter(plan_tier='starter').count(),
-        'standard': User.objects.filter(plan_tier='standard').count(),
-        'premium': User.objects.filter(plan_tier='premium').count(),
-    }
+    return Response(analytics_summary(), status=status.HTTP_200_OK)
 
-    # Login recency
-    login_recency = {
-        'within_7d': User.objects.filter(last_login__gte=d7).count(),
-        'within_30d': User.objects.filter(last_login__gte=d30).count(),
-        'within_90d': User.objects.filter(last_login__gte=d90).count(),
-        'none': User.objects.filter(last_login__isnull=True).count(),
-        'older_90d': User.objects.filter(last_login__lt=d90, last_login__isnull=False).count(),
-    }
 
-    # Registrations trend (last 30 days, daily)
-    since = today - datetime.timedelta(days=29)
-    trend_qs = (
-        User.objects.filter(created_at__date__gte=since)
-        .annotate(d=TruncDate('created_at'))
-        .values('d')
-        .annotate(count=Count('id'))
-        .order_by('d')
-    )
-    trend_map = {row['d']: row['count'] for row in trend_qs}
-    registrations_trend = []
-    for i in range(30):
-        day = since + datetime.timedelta(days=i)
-        registrations_trend.append({'date': day.isoformat(), 'count': int(trend_map.get(day, 0))})
-
-    # Age buckets (seekers only)
-    total_seekers = User.objects.filter(role='user').count()
-    birthdays = list(SeekerProfile.objects.filter(birthday__isnull=False).values_list('birthday', flat=True))
-    def _age(bday):
-        try:
-            return today.year - bday.year - ((today.month, today.day) < (bday.month, bday.day))
-        except Exception:
-            return None
-    ages = [a for a in (_age(b) for b in birthdays) if a is not None]
-    age_buckets = {
-        'under20': sum(1 for a in ages if a < 20),
-        '20s': sum(1 for a in ages if 20 <= a <= 29),
-        '30s': sum(1 for a in ages if 30 <= a <= 39),
-        '40s': sum(1 for a in ages if 40 <= a <= 49),
-        '50_plus': sum(1 for a in ages if a >= 50),
-        'unknown': max(0, total_seekers - len(ages)),
-    }
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def admin_cache_stats(request):
+    """管理者向け: レスポンスキャッシュのヒット/ミス数
 
-    # Payments recent
-    payments_recent = {
-        'last_30d': Payment.objects.filter(created_at__gte=d30).count(),
-        'last_90d': Payment.objects.filter(created_at__gte=d90).count(),
-    }
+    GET /api/v2/admin/cache/stats/
+    DELETE /api/v2/admin/cache/stats/ - 集計をリセット
+    """
+    if not request.user.is_staff:
+        return Response({'detail': '管理者権限が必要です'}, status=status.HTTP_403_FORBIDDEN)
 
-    data = {
-        'totals': totals,
-        'plan_distribution': plan_distribution,
-        'login_recency': login_recency,
-        'registrations_trend': registrations_trend,
-        'age_buckets': age_buckets,
-        'payments_recent': payments_recent,
-        'generated_at': now,
+    from . import response_cache
+    if request.method == 'DELETE':
+        response_cache.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response({
+        'backend': settings.CACHES['default']['BACKEND'],
+        'namespaces': response_cache.get_stats(),
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def admin_perf_report(request):
+    """管理者向け: エンドポイントごとのレイテンシ・SQL クエリ数（このプロセスの計測値）
+
+    GET /api/v2/admin/perf/?sort=latency|queries|sql|duplicates|requests&limit=50
+    DELETE /api/v2/admin/perf/ - 計測値をリセット
+
+    notifications: WebSocket 通知バッファのキュー深さ・group_send 回数・送信レイテンシ
+    auth_cache: 認証キャッシュのエントリ数・ヒット率
+    """
+    if not request.user.is_staff:
+        return Response({'detail': '管理者権限が必要です'}, status=status.HTTP_403_FORBIDDEN)
+
+    from . import auth_cache, notification_buffer, profiling
+    if request.method == 'DELETE':
+        profiling.recorder.reset()
+        notification_buffer.metrics.reset()
+        auth_cache.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    sort_keys = {
+        'latency': lambda e: e['latency_ms']['p95'] or 0,
+        'queries': lambda e: e['queries']['p95'] or 0,
+        'sql': lambda e: e['sql_ms']['p95'] or 0,
+        'duplicates': lambda e: e['duplicate_queries']['max'] or 0,
+        'requests': lambda e: e['requests'],
     }
+    sort = request.query_params.get('sort', 'latency')
+    if sort not in sort_keys:
+        return Response({'detail': f"sort は {', '.join(sort_keys)} のいずれかです"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = max(1, min(int(request.query_params.get('limit') or 50), 500))
+    except ValueError:
+        return Response({'detail': 'limit は整数で指定してください'}, status=status.HTTP_400_BAD_REQUEST)
 
-    return Response(data, status=status.HTTP_200_OK)
+    endpoints = [{'endpoint': name, **summary} for name, summary in profiling.recorder.report().items()]
+    endpoints.sort(key=sort_keys[sort], reverse=True)
+    return Response({
+        'pid': os.getpid(),
+        'since': datetime.datetime.fromtimestamp(profiling.recorder.started_at, tz=datetime.timezone.utc),
+        'sample_rate': getattr(settings, 'PERF_SAMPLE_RATE', 1.0),
+        'profile_rate': getattr(settings, 'PERF_PROFILE_RATE', 0.0),
+        'endpoints': endpoints[:limit],
+        'profiles': profiling.list_profiles() if getattr(settings, 'PERF_PROFILE_RATE', 0.0) > 0 else [],
+        'notifications': notification_buffer.stats(),
+        'auth_cache': auth_cache.stats(),
+    }, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
@@ -1159,7 +1195,11 @@ def admin_companies_credits_topup(request):
 
     from django.db.models import F
     try:
-        updated = User.objects.filter(role='company').update(scout_credits_total=F('scout_credits_total') + delta)
+        companies = User.objects.filter(role='company')
+        updated = companies.update(scout_credits_total=F('scout_credits_total') + delta)
+        # update() はシグナルを発火しないため、キャッシュ済みの認証ユーザーを明示的に無効化
+        from .auth_cache import bump_user_stamp
+        bump_user_stamp(*companies.values_list('id', flat=True))
         return Response({'updated': updated, 'delta': delta}, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({'detail': 'update_failed', 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1168,7 +1208,7 @@ def admin_companies_credits_topup(request):
 # プロフィール関連エンドポイント
 # ============================================================================
 
-class SeekerProfileViewSet(viewsets.ModelViewSet):
+class SeekerProfileViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """求職者プロフィール ViewSet"""
     serializer_class = SeekerProfileSerializer
     permission_classes = [IsAuthenticated]
@@ -1196,7 +1236,7 @@ class SeekerProfileViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
 
 
-class CompanyProfileViewSet(viewsets.ModelViewSet):
+class CompanyProfileViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """企業プロフィール ViewSet"""
     serializer_class = CompanyProfileSerializer
     permission_classes = [IsAuthenticated]
@@ -1228,13 +1268,28 @@ class CompanyProfileViewSet(viewsets.ModelViewSet):
 # 履歴書関連エンドポイント
 # ============================================================================
 
-class ResumeViewSet(viewsets.ModelViewSet):
+class ResumeViewSet(ConditionalGetMixin, QueryPlanMixin, viewsets.ModelViewSet):
     """履歴書 ViewSet"""
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
         return Resume.objects.filter(user=self.request.user)
     
+    def get_validators(self):
+        """詳細は版数の ETag（If-Match と共通）、一覧は max(updated_at) と件数"""
+        from django.db.models import Count, Max
+        queryset = self.get_queryset()
+        if self.action == 'retrieve':
+            try:
+                row = queryset.filter(pk=self.kwargs.get('pk')).values_list('pk', 'version', 'updated_at').first()
+            except (ValueError, DjangoValidationError):
+                return None
+            if row is None:
+                return None
+            return version_etag(row[0], row[1]), row[2]
+        agg = queryset.aggregate(latest=Max('updated_at'), count=Count('id'))
+        return ('resumes', agg['latest'], agg['count']), agg['latest']
+    
     def get_serializer_class(self):
         if self.action == 'create':
             return ResumeCreateSerializer
@@ -1245,6 +1300,40 @@ class ResumeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
     
+    def update(self, request, *args, **kwargs):
+        """全体更新（If-Match があるときだけ版数を確認し、一致しなければ 412。ないときは後勝ち）"""
+        partial = kwargs.pop('partial', False)
+        resume = self.get_object()
+        serializer = self.get_serializer(resume, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        try:
+            check_if_match(request, resume)
+            with transaction.atomic():
+                bump_version(resume, conditional='HTTP_IF_MATCH' in request.META)
+                serializer.save()
+        except PatchError as e:
+            return Response(e.as_data(), status=e.status_code)
+        response = Response(serializer.data)
+        response['ETag'] = resume_etag(resume)
+        return response
+    
+    @action(detail=True, methods=['patch'], url_path='delta', parser_classes=PATCH_PARSERS)
+    def delta(self, request, pk=None):
+        """自動保存用の差分更新（JSON Patch / Merge Patch。If-Match があれば版数を確認し、一致しなければ 412）"""
+        resume = self.get_object()
+        try:
+            changed, _ = apply_patch_request(request, resume)
+        except PatchError as e:
+            return Response(e.as_data(), status=e.status_code)
+        response = Response({
+            'id': str(resume.pk),
+            'version': resume.version,
+            'updated_at': resume.updated_at,
+            'changed': changed,
+        })
+        response['ETag'] = resume_etag(resume)
+        return response
+    
     @action(detail=True, methods=['post'])
     def add_experience(self, request, pk=None):
         """職歴追加"""
@@ -1301,7 +1390,7 @@ class ResumeViewSet(viewsets.ModelViewSet):
         return Response(completeness, status=status.HTTP_200_OK)
 
 
-class ExperienceViewSet(viewsets.ModelViewSet):
+class ExperienceViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """職歴 ViewSet"""
     serializer_class = ExperienceSerializer
     permission_classes = [IsAuthenticated]
@@ -1310,7 +1399,7 @@ class ExperienceViewSet(viewsets.ModelViewSet):
         return Experience.objects.filter(resume__user=self.request.user)
 
 
-class EducationViewSet(viewsets.ModelViewSet):
+class EducationViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """学歴 ViewSet"""
     serializer_class = EducationSerializer
     permission_classes = [IsAuthenticated]
@@ -1319,7 +1408,7 @@ class EducationViewSet(viewsets.ModelViewSet):
         return Education.objects.filter(resume__user=self.request.user)
 
 
-class CertificationViewSet(viewsets.ModelViewSet):
+class CertificationViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """資格 ViewSet"""
     serializer_class = CertificationSerializer
     permission_classes = [IsAuthenticated]
@@ -1328,7 +1417,7 @@ class CertificationViewSet(viewsets.ModelViewSet):
         return Certification.objects.filter(resume__user=self.request.user)
 
 
-class ResumeFileViewSet(viewsets.ModelViewSet):
+class ResumeFileViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """履歴書ファイル ViewSet（アップロード/一覧/削除）"""
     serializer_class = ResumeFileSerializer
     permission_classes = [IsAuthenticated]
@@ -1410,57 +1499,36 @@ def search_seekers_v2(request):
         min_salary = request.GET.get('min_salary')
         max_salary = request.GET.get('max_salary')
         
-        # 検索クエリ構築
-        queryset = SeekerProfile.objects.select_related('user')
-        
-        if keyword:
-            # スキルや自己PRにキーワードが含まれる履歴書を持つ求職者
-            from django.db.models import Q
-            queryset = queryset.filter(
-                Q(user__resumes__skills__icontains=keyword) |
-                Q(user__resumes__self_pr__icontains=keyword)
-            )
+        # 検索クエリ構築（非正規化済みの検索ドキュメント1テーブルのみを参照）
+        from django.db.models import Q
+        from .models import SeekerSearchDocument, SeekerSearchTag
+        from .search_index import normalize_text, normalize_prefecture, tagged
+
+        queryset = SeekerSearchDocument.objects.all()
         
-        # 居住地 or 希望勤務地
+        # 居住地 or 希望勤務地（複数値は SeekerSearchTag の完全一致）
         if prefecture or prefectures or desired_locations:
-            from django.db.models import Q
             pref_q = Q()
-            if prefecture:
-                pref_q |= Q(prefecture=prefecture)
-            if prefectures:
-                pref_q |= Q(prefecture__in=prefectures)
+            pref_values = [normalize_prefecture(p) for p in [prefecture, *prefectures] if p]
+            if pref_values:
+                pref_q |= Q(prefecture__in=pref_values)
             if desired_locations:
-                # DBによりJSON contains可否が異なるため分岐
-                if connection.vendor == 'postgresql':
-                    for loc in desired_locations:
-                        pref_q |= Q(user__resumes__desired_locations__contains=[loc])
-                else:
-                    for loc in desired_locations:
-                        pref_q |= Q(user__resumes__desired_locations__icontains=loc)
+                pref_q |= tagged(SeekerSearchTag.FIELD_DESIRED_LOCATION, desired_locations, normalize_prefecture)
             queryset = queryset.filter(pref_q)
         
         # 経験業界 or 希望業界
         if industry or industries or desired_industries:
-            from django.db.models import Q
             ind_q = Q()
-            if industry:
-                ind_q |= Q(user__resumes__experiences__industry=industry)
-            if industries:
-                ind_q |= Q(user__resumes__experiences__industry__in=industries)
+            experience = [ind for ind in [industry, *industries] if ind]
+            if experience:
+                ind_q |= tagged(SeekerSearchTag.FIELD_EXPERIENCE_INDUSTRY, experience)
             if desired_industries:
-                if connection.vendor == 'postgresql':
-                    for ind in desired_industries:
-                        ind_q |= Q(user__resumes__desired_industries__contains=[ind])
-                else:
-                    for ind in desired_industries:
-                        ind_q |= Q(user__resumes__desired_industries__icontains=ind)
+                ind_q |= tagged(SeekerSearchTag.FIELD_DESIRED_INDUSTRY, desired_industries)
             queryset = queryset.filter(ind_q)
 
-        # 職種（希望職種）
+        # 職種（希望職種。正規化した値の完全一致）
         if desired_job:
-            queryset = queryset.filter(
-                user__resumes__desired_job__icontains=desired_job
-            )
+            queryset = queryset.filter(tagged(SeekerSearchTag.FIELD_DESIRED_JOB, [desired_job]))
         
         # 経験年数フィルター
         if experience_years_min:
@@ -1485,27 +1553,22 @@ def search_seekers_v2(request):
             except ValueError:
                 pass
         
-        # 年収（希望年収）
-        if min_salary or max_salary:
-            # 数値にキャストして比較（不正値は除外）
-            queryset = queryset.annotate(
-                desired_salary_int=Cast('desired_salary', IntegerField())
-            )
-            if min_salary:
-                try:
-                    queryset = queryset.filter(desired_salary_int__gte=int(min_salary))
-                except ValueError:
-                    pass
-            if max_salary:
-                try:
-                    queryset = queryset.filter(desired_salary_int__lte=int(max_salary))
-                except ValueError:
-                    pass
+        # 年収（希望年収）: 整数化済みカラムで比較（不正値は NULL のため自然に除外）
+        if min_salary:
+            try:
+                queryset = queryset.filter(desired_salary__gte=int(min_salary))
+            except ValueError:
+                pass
+        if max_salary:
+            try:
+                queryset = queryset.filter(desired_salary__lte=int(max_salary))
+            except ValueError:
+                pass
 
-        # 重複排除
-        queryset = queryset.distinct()
-        
-        # ページネーション
+        # 1求職者1行のため DISTINCT は不要。ページングを安定させるため並び順を固定
+        queryset = queryset.order_by('-created_at', '-pk')
+
+        # ページネーション（従来の page / page_size）
         try:
             page_size = int(request.GET.get('page_size', 20))
             page = int(request.GET.get('page', 1))
@@ -1515,24 +1578,67 @@ def search_seekers_v2(request):
         
         start = (page - 1) * page_size
         end = start + page_size
-        
-        # カウントを先に取得
-        total_count = queryset.count()
-        
-        # 結果を取得
-        results = queryset[start:end]
-        
-        # レスポンス生成
-        serializer = SeekerProfileSerializer(results, many=True)
+
+        from .pagination import KeysetPaginator, is_cursor_request
+
+        data = None
+        if keyword:
+            # スキルや自己PRにキーワードが含まれる履歴書を持つ求職者（全文検索・関連度順）。
+            # 他の条件との絞り込み・採点・並べ替え・ページングはすべて DB 側で行い、
+            # 取得したページの行だけを読み込んでスニペットを作る
+            from . import fulltext
+
+            def serialize_entries(entries):
+                profiles = SeekerProfile.objects.in_bulk([uuid.UUID(e.object_id) for e in entries])
+                pairs = [(e, profiles[uuid.UUID(e.object_id)]) for e in entries if uuid.UUID(e.object_id) in profiles]
+                data = SeekerProfileSerializer([profile for _, profile in pairs], many=True).data
+                for item, (entry, _) in zip(data, pairs):
+                    item['search_score'] = entry.search_score
+                    item['highlight'] = fulltext.highlight(entry.body, keyword)
+                return data
+
+            ranked = fulltext.ranked_entries(fulltext.DOC_SEEKER, keyword, within=queryset).only('object_id', 'body')
+            try:
+                with transaction.atomic():
+                    # カーソル（キーセット）モード: (関連度, object_id) の位置をカーソルに格納する
+                    if is_cursor_request(request):
+                        paginator = KeysetPaginator(ordering=fulltext.RANK_ORDERING)
+                        entries = paginator.paginate_queryset(ranked, request)
+                        return paginator.get_paginated_response(serialize_entries(entries))
+                    total_count = ranked.count()
+                    data = serialize_entries(list(ranked[start:end]))
+            except DRFValidationError:
+                raise
+            except Exception as e:
+                # 全文検索が使えない場合は従来の部分一致（検索ドキュメントのキーワード列）で絞り込む
+                logger.warning(f"Full-text seeker search failed, falling back to keywords filter: {e}")
+                queryset = queryset.filter(keywords__contains=normalize_text(keyword))
+
+        if data is None:
+            # カーソル（キーセット）モード: ?cursor= 指定時
+            if is_cursor_request(request):
+                paginator = KeysetPaginator(ordering=('-created_at', '-pk'))
+                docs = paginator.paginate_queryset(queryset.select_related('seeker_profile'), request)
+                return paginator.get_paginated_response(
+                    SeekerProfileSerializer([d.seeker_profile for d in docs], many=True).data)
+
+            # カウントを先に取得
+            total_count = queryset.count()
+
+            # 結果を取得
+            results = [doc.seeker_profile for doc in queryset.select_related('seeker_profile')[start:end]]
+            data = SeekerProfileSerializer(results, many=True).data
         
         return Response({
-            'results': serializer.data,
+            'results': data,
             'count': total_count,
             'page': page,
             'page_size': page_size,
             'total_pages': (total_count + page_size - 1) // page_size if page_size > 0 else 0
         }, status=status.HTTP_200_OK)
         
+    except DRFValidationError:
+        raise
     except Exception as e:
         logger.error(f"Search error: {str(e)}")
         return Response({
@@ -1541,11 +1647,111 @@ def search_seekers_v2(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def match_v2(request):
+    """マッチング API v2（事前計算ベクトルによる top-k）
+
+    - ?job_id=<求人ID>: 求人に合う求職者（求人の掲載企業またはスタッフのみ）
+    - ?seeker_id=<ユーザーID>: 求職者に合う求人（本人またはスタッフのみ。求職者は省略可）
+    - ?k=10（最大100）、?exact=1 で IVF を使わず全件走査
+    結果は有効な MLModel(model_type='matching') に紐づけて MLPrediction に記録する
+    （1回の bulk_create。matching.record_predictions）。
+    """
+    from . import matching
+
+    if not matching.NUMPY_AVAILABLE:
+        return Response({'detail': 'Matching engine is not available'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    model = matching.get_active_model()
+    if model is None:
+        return Response({'detail': 'No active matching model. Run build_matching_vectors first.'},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    try:
+        k = max(1, min(int(request.GET.get('k', 10)), 100))
+    except ValueError:
+        return Response({'detail': 'k must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    exact = request.GET.get('exact') in ('1', 'true')
+    job_id = request.GET.get('job_id')
+    seeker_id = request.GET.get('seeker_id')
+
+    try:
+        if job_id:
+            job = JobPosting.objects.filter(id=job_id).first()
+            if job is None:
+                return Response({'detail': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+            if job.company_id != request.user.id and not request.user.is_staff:
+                return Response({'detail': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+
+            matches, index_kind = matching.match_seekers_for_job(job, model, k=k, exact=exact)
+            profiles = SeekerProfile.objects.select_related('user').in_bulk([pid for pid, _ in matches])
+            results, predictions = [], []
+            for rank, (pid, score) in enumerate(matches, start=1):
+                profile = profiles.get(uuid.UUID(pid))
+                if profile is None or score <= 0:
+                    continue
+                results.append({
+                    'rank': rank,
+                    'score': round(score, 4),
+                    'seeker_profile_id': str(profile.id),
+                    'user_id': str(profile.user_id),
+                    'full_name': profile.full_name,
+                    'prefecture': profile.prefecture,
+                    'experience_years': profile.experience_years,
+                })
+                predictions.append((profile.user_id, score, {
+                    'job_id': str(job.id), 'seeker_profile_id': str(profile.id), 'rank': rank,
+                }))
+            target = {'type': 'job', 'id': str(job.id)}
+        else:
+            if seeker_id:
+                if str(seeker_id) != str(request.user.id) and not request.user.is_staff:
+                    return Response({'detail': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+                profile = SeekerProfile.objects.filter(user_id=seeker_id).first()
+            elif request.user.role == 'user':
+                profile = SeekerProfile.objects.filter(user_id=request.user.id).first()
+            else:
+                return Response({'detail': 'job_id or seeker_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+            if profile is None:
+                return Response({'detail': 'Seeker profile not found'}, status=status.HTTP_404_NOT_FOUND)
+
+            matches, index_kind = matching.match_jobs_for_seeker(profile, model, k=k, exact=exact)
+            jobs = JobPosting.objects.select_related('company').in_bulk([jid for jid, _ in matches])
+            results, predictions = [], []
+            for rank, (jid, score) in enumerate(matches, start=1):
+                job = jobs.get(uuid.UUID(jid))
+                if job is None or not job.is_active or score <= 0:
+                    continue
+                results.append({
+                    'rank': rank,
+                    'score': round(score, 4),
+                    'job_id': str(job.id),
+                    'title': job.title,
+                    'location': job.location,
+                    'company_name': job.company.company_name,
+                })
+                predictions.append((profile.user_id, score, {
+                    'job_id': str(job.id), 'seeker_profile_id': str(profile.id), 'rank': rank,
+                }))
+            target = {'type': 'seeker', 'id': str(profile.user_id)}
+
+        matching.record_predictions(model, predictions)
+        return Response({
+            'target': target,
+            'results': results,
+            'k': k,
+            'index': index_kind,
+            'model': {'id': model.id, 'version': model.version},
+        }, status=status.HTTP_200_OK)
+    except (ValueError, DjangoValidationError):
+        return Response({'detail': 'Invalid id'}, status=status.HTTP_400_BAD_REQUEST)
+
+
 # ============================================================================
 # スカウト・応募関連エンドポイント
 # ============================================================================
 
-class JobPostingViewSet(viewsets.ModelViewSet):
+class JobPostingViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """求人投稿 ViewSet"""
     serializer_class = JobPostingSerializer
     permission_classes = [IsAuthenticated]
@@ -1567,10 +1773,12 @@ class JobPostingViewSet(viewsets.ModelViewSet):
         serializer.save(company=self.request.user)
 
 
-class ApplicationViewSet(viewsets.ModelViewSet):
+class ApplicationViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """応募 ViewSet"""
     serializer_class = ApplicationSerializer
     permission_classes = [IsAuthenticated]
+    # ?cursor= 指定時のキーセット並び順
+    keyset_ordering = ('-applied_at', '-id')
     
     def get_queryset(self):
         if self.request.user.role == 'user':
@@ -1587,10 +1795,12 @@ class ApplicationViewSet(viewsets.ModelViewSet):
             raise PermissionDenied('求職者のみ応募できます')
 
 
-class ScoutViewSet(viewsets.ModelViewSet):
+class ScoutViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """スカウト ViewSet"""
     serializer_class = ScoutSerializer
     permission_classes = [IsAuthenticated]
+    # ?cursor= 指定時のキーセット並び順
+    keyset_ordering = ('-scouted_at', '-id')
     
     def get_queryset(self):
         if self.request.user.role == 'company':
@@ -1783,23 +1993,27 @@ def dashboard_stats_v2(request):
     """ダッシュボード統計 API v2"""
     user = request.user
     
+    from .user_stats import get_user_stats
+    
     if user.role == 'user':
         # 求職者向け統計
+        counters = get_user_stats(user)
         stats = {
-            'resumes_count': user.resumes.count(),
-            'active_resumes_count': user.resumes.filter(is_active=True).count(),
-            'applications_count': user.applications.count(),
-            'scouts_received_count': user.received_scouts.count(),
+            'resumes_count': counters.resumes_count,
+            'active_resumes_count': counters.active_resumes_count,
+            'applications_count': counters.applications_count,
+            'scouts_received_count': counters.scouts_received_count,
             'recent_activities': []
         }
         
     elif user.role == 'company':
         # 企業向け統計
+        counters = get_user_stats(user)
         stats = {
-            'applications_received_count': user.received_applications.count(),
-            'scouts_sent_count': user.sent_scouts.count(),
-            'pending_applications_count': user.received_applications.filter(status='pending').count(),
-            'active_scouts_count': user.sent_scouts.filter(status='sent').count(),
+            'applications_received_count': counters.applications_received_count,
+            'scouts_sent_count': counters.scouts_sent_count,
+            'pending_applications_count': counters.pending_applications_count,
+            'active_scouts_count': counters.active_scouts_count,
             'recent_activities': [],
             'scout_credits_total': getattr(user, 'scout_credits_total', 0),
             'scout_credits_used': getattr(user, 'scout_credits_used', 0),
@@ -2284,8 +2498,8 @@ def advice_messages(request):
             except (User.DoesNotExist, ValueError):
                 return None
         else:
-            # 一般ユーザー→最初の管理者（存在しない場合は None）
-            return User.objects.filter(is_staff=True).order_by('date_joined').first()
+            # 一般ユーザー→最初の管理者（存在しない場合は None。管理者の名簿キャッシュから引く）
+            return staff_roster.default_counterpart()
 
     if request.method == 'GET':
         user_id = request.GET.get('user_id')
@@ -2298,9 +2512,10 @@ def advice_messages(request):
                 return Response({'error': 'counterpart_not_found'}, status=status.HTTP_404_NOT_FOUND)
             # 管理者は「自分宛てのもの」に限定せず、対象ユーザー×全管理者のやり取りを一覧できるようにする。
             # これにより、最初の管理者以外が閲覧してもメッセージが見える。
+            staff_ids = staff_roster.staff_ids()
             qs = Message.objects.filter(subject=SUBJECT).filter(
-                Q(sender=counterpart, receiver__is_staff=True) |
-                Q(sender__is_staff=True, receiver=counterpart)
+                Q(sender=counterpart, receiver_id__in=staff_ids) |
+                Q(sender_id__in=staff_ids, receiver=counterpart)
             ).order_by('created_at')
             # 片方でも不正なUUIDが来た場合に500を避ける
             if parent_id:
@@ -2321,14 +2536,14 @@ def advice_messages(request):
                     qs = qs.filter(annotation_id=annotation_id)
                 except Exception:
                     return Response({'error': 'invalid_annotation_id'}, status=status.HTTP_400_BAD_REQUEST)
+            if is_sync_request(request):
+                return sync_response(request, qs, lambda rows: MessageSerializer(rows, many=True).data, counterpart.id)
             return Response(MessageSerializer(qs, many=True).data)
 
         # 一般ユーザー: どの管理者とのやり取りでも一覧できるよう、相手を限定しない
         qs = Message.objects.filter(
             Q(sender=request.user) | Q(receiver=request.user)
-        ).filter(
-            Q(sender__is_staff=True) | Q(receiver__is_staff=True)
-        ).filter(subject=SUBJECT).order_by('created_at')
+        ).filter(is_staff_message=True, subject=SUBJECT).order_by('created_at')
         if parent_id:
             pid = str(parent_id)
             try:
@@ -2347,6 +2562,8 @@ def advice_messages(request):
             except Exception:
                 return Response({'error': 'invalid_annotation_id'}, status=status.HTTP_400_BAD_REQUEST)
         
+        if is_sync_request(request):
+            return sync_response(request, qs, lambda rows: MessageSerializer(rows, many=True).data, request.user.id)
         return Response(MessageSerializer(qs, many=True).data)
 
     # POST
@@ -2473,7 +2690,6 @@ def advice_threads(request):
       - comment: 親メッセージ（parent=null）ごと
     返却例 (mode=comment): [{ thread_id: <parent_or_self_id>, annotation: {...}, latest_message: {...}, messages_count: n, unresolved: bool }]
     """
-    from .models import Annotation
     from django.db.models import Q
     SUBJECT = request.GET.get('subject') or 'resume_advice'
     user_id = request.GET.get('user_id')
@@ -2483,36 +2699,25 @@ def advice_threads(request):
     # Optional free-text query. Client-sideでもフィルタしているが、API側でも軽く対応しておく
     q = (request.GET.get('q') or '').strip()
 
-    # 対向ユーザーの決定（advice_messages と同等）
-    def resolve_counterpart(for_user, specified_user_id=None):
-        if for_user.is_staff:
-            if not specified_user_id:
-                return None
-            try:
-                return User.objects.get(id=specified_user_id)
-            except (User.DoesNotExist, ValueError):
-                return None
-        else:
-            return User.objects.filter(is_staff=True).order_by('date_joined').first()
-
-    counterpart = resolve_counterpart(request.user, user_id)
-    if request.user.is_staff and counterpart is None:
-        return Response({'error': 'counterpart_not_found'}, status=status.HTTP_404_NOT_FOUND)
-
-    # 対象メッセージ抽出
+    # 管理者は対象ユーザーを必須にする（一般ユーザーのスレッドは自分のものだけなので相手の解決は不要）
+    counterpart = None
     if request.user.is_staff:
-        qs = Message.objects.filter(subject=SUBJECT).filter(
-            Q(sender=counterpart, receiver__is_staff=True) |
-            Q(sender__is_staff=True, receiver=counterpart)
-        )
-    else:
-        qs = Message.objects.filter(
-            Q(sender=request.user) | Q(receiver=request.user)
-        ).filter(
-            Q(sender__is_staff=True) | Q(receiver__is_staff=True)
-        ).filter(subject=SUBJECT)
-
-    qs = qs.filter(annotation__isnull=False).select_related('annotation').order_by('created_at')
+        try:
+            counterpart = User.objects.get(id=user_id) if user_id else None
+        except (User.DoesNotExist, ValueError, DjangoValidationError):
+            counterpart = None
+        if counterpart is None:
+            return Response({'error': 'counterpart_not_found'}, status=status.HTTP_404_NOT_FOUND)
+
+    # スレッド概要（MessageThread）から1回のクエリで返す。
+    # スレッドの持ち主は一般ユーザー側（管理者は対象ユーザー×全管理者のやり取りを見る）
+    from .message_threads import THREAD_ANNOTATION, THREAD_COMMENT
+    from .models import MessageThread
+    owner = counterpart if request.user.is_staff else request.user
+    kind = THREAD_COMMENT if mode == 'comment' else THREAD_ANNOTATION
+    qs = MessageThread.objects.filter(user=owner, subject=SUBJECT, kind=kind).select_related(
+        'annotation__created_by', 'annotation__resolved_by', 'last_message__sender', 'last_message__receiver',
+    )
     # Optional: filter by resume
     if resume_id:
         try:
@@ -2521,11 +2726,28 @@ def advice_threads(request):
         except Exception:
             pass
     if q:
+        # アンカーIDの部分一致 + 本文の全文検索（一致したメッセージを含むスレッド）。
+        # 全文検索の一致はスレッドの持ち主のメッセージに限定したサブクエリで絞り込む（件数上限なし）
+        from . import fulltext
+        candidates = Message.objects.filter(
+            Q(sender=owner) | Q(receiver=owner), subject=SUBJECT, annotation__isnull=False,
+        )
+
+        def thread_keys(matched):
+            if kind == THREAD_ANNOTATION:
+                return {str(aid) for aid in matched.values_list('annotation_id', flat=True)}
+            return {str(pid or mid) for mid, pid in matched.values_list('id', 'parent_id')}
+
         try:
-            # アンカーIDと本文の簡易検索（前方一致ではなく部分一致）
-            qs = qs.filter(Q(annotation__anchor_id__icontains=q) | Q(content__icontains=q))
-        except Exception:
-            pass
+            with transaction.atomic():
+                keys = thread_keys(candidates.filter(
+                    id__in=fulltext.matching_keys(fulltext.DOC_MESSAGE, q, Message._meta.pk)))
+        except Exception as e:
+            # 全文検索が使えない場合は本文の部分一致で絞り込む
+            import logging
+            logging.getLogger(__name__).warning(f"Full-text message search failed, falling back to icontains: {e}")
+            keys = thread_keys(candidates.filter(content__icontains=q))
+        qs = qs.filter(Q(annotation__anchor_id__icontains=q) | Q(thread_key__in=keys))
     if annotation_id:
         try:
             uuid.UUID(str(annotation_id))
@@ -2533,58 +2755,24 @@ def advice_threads(request):
         except Exception:
             return Response({'error': 'invalid_annotation_id'}, status=status.HTTP_400_BAD_REQUEST)
 
-    if mode == 'comment':
-        threads = {}
-        for m in qs:
-            tid = str(m.parent_id or m.id)
-            t = threads.get(tid) or {
-                'thread_id': tid,
-                'annotation': AnnotationSerializer(m.annotation).data,
-                'latest_message': None,
-                'messages_count': 0,
-                'unresolved': not bool(m.annotation.is_resolved),
-            }
-            t['messages_count'] += 1
-            t['latest_message'] = MessageSerializer(m).data
-            t['unresolved'] = t['unresolved'] or (not bool(m.annotation.is_resolved))
-            threads[tid] = t
-        result = list(threads.values())
-        result.sort(key=lambda x: x['latest_message']['created_at'])
-        return Response(result, status=status.HTTP_200_OK)
-    else:
-        threads = {}
-        for m in qs:
-            aid = str(m.annotation_id)
-            t = threads.get(aid) or {'annotation': AnnotationSerializer(m.annotation).data, 'latest_message': None, 'messages_count': 0, 'unresolved': not bool(m.annotation.is_resolved)}
-            t['messages_count'] += 1
-            t['latest_message'] = MessageSerializer(m).data
-            t['unresolved'] = t['unresolved'] or (not bool(m.annotation.is_resolved))
-            threads[aid] = t
-        result = list(threads.values())
-        result.sort(key=lambda x: x['latest_message']['created_at'])
-        return Response(result, status=status.HTTP_200_OK)
+    result = []
+    for t in qs.order_by('last_message_at', 'id'):
+        row = {
+            'annotation': AnnotationSerializer(t.annotation).data,
+            'latest_message': MessageSerializer(t.last_message).data if t.last_message else None,
+            'messages_count': t.messages_count,
+            'unresolved': t.unresolved,
+        }
+        if kind == THREAD_COMMENT:
+            row = {'thread_id': t.thread_key, **row}
+        result.append(row)
+    return Response(result, status=status.HTTP_200_OK)
 
 
 def _advice_notifications_summary(user):
-    subjects = ['resume_advice', 'advice', 'interview']
-    data = {}
-    total = 0
-    for sub in subjects:
-        qs = Message.objects.filter(
-            receiver=user,
-            subject=sub,
-            is_read=False,
-            sender__is_staff=True,
-        ).order_by('-created_at')
-        count = qs.count()
-        latest = qs.first().created_at if count > 0 else None
-        data[sub] = {
-            'unread': count,
-            'latest_at': latest,
-        }
-        total += count
-    data['total_unread'] = total
-    return data
+    # 未読件数は NotificationCounter（通知の作成・既読化で増減）から読む
+    from .user_notifications import ADVICE_KINDS, unread_summary
+    return unread_summary(user.id, ADVICE_KINDS)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -2596,23 +2784,72 @@ def advice_notifications(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def advice_mark_read(request):
-    """アドバイス系メッセージを既読化。body: { subject?: 'resume_advice'|'advice'|'interview' }
-    未指定の場合は全件。
-    返却: advice_notifications と同じサマリ
-    """
-    allowed = {'resume_advice', 'advice', 'interview'}
-    subject = (request.data or {}).get('subject')
-    qs = Message.objects.filter(
-        receiver=request.user,
-        is_read=False,
-        sender__is_staff=True,
-    )
-    if subject in allowed:
-        qs = qs.filter(subject=subject)
-    # 既読更新
-    qs.update(is_read=True, read_at=timezone.now())
+    """アドバイス系メッセージを既読化。body: { subject?: 'resume_advice'|'advice'|'interview', cursor?, until? }
+    未指定の場合は全件。cursor（メッセージ ID）/ until（ISO 8601 日時）を指定するとそれ以前のメッセージのみ。
+    1回の UPDATE で既読化し、件名ごとの既読位置を進める（core.message_reads）。
+    返却: advice_notifications と同じサマリ + read_through: { messages, through }
+    """
+    from django.utils.dateparse import parse_datetime
+    from .message_reads import CursorError, read_through
+    from .user_notifications import ADVICE_KINDS
+
+    data = request.data or {}
+    subject = data.get('subject')
+    until = None
+    if data.get('until'):
+        try:
+            until = parse_datetime(str(data.get('until')))
+        except ValueError:
+            until = None
+        if until is None:
+            return Response({'error': 'invalid_until'}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(until):
+            until = timezone.make_aware(until)
+    try:
+        result = read_through(
+            request.user.id, [subject] if subject in ADVICE_KINDS else ADVICE_KINDS,
+            cursor=data.get('cursor'), until=until,
+        )
+    except CursorError:
+        return Response({'error': 'invalid_cursor'}, status=status.HTTP_400_BAD_REQUEST)
     # 最新のサマリを返す（内部ヘルパーを直接使用）
-    return Response(_advice_notifications_summary(request.user), status=status.HTTP_200_OK)
+    summary = _advice_notifications_summary(request.user)
+    summary['read_through'] = {'messages': result['read'], 'through': result['read_through']}
+    return Response(summary, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def notifications_sync(request):
+    """カーソルより新しい通知と未読サマリ（WebSocket 非対応クライアント・再接続時の取りこぼし用）
+
+    GET /api/v2/notifications/?since=<cursor>&limit=100
+    返却: { notifications: [...], cursor, has_more, unread: {kind: {unread, latest_at}, total_unread} }
+    """
+    from .user_notifications import SYNC_LIMIT, changes_since
+    try:
+        since = int(request.query_params.get('since') or 0)
+        limit = int(request.query_params.get('limit') or SYNC_LIMIT)
+    except ValueError:
+        return Response({'detail': 'since / limit は整数で指定してください'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(changes_since(request.user.id, since, limit), status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def notifications_mark_read(request):
+    """通知を既読化。body: { ids?: number[], kinds?: string[] }（未指定なら全件）
+    返却: { read: {kind: 件数}, unread: 未読サマリ }
+    """
+    from .user_notifications import mark_read, unread_summary
+    body = request.data or {}
+    ids, kinds = body.get('ids'), body.get('kinds')
+    if ids is not None and not (isinstance(ids, list) and all(str(i).isdigit() for i in ids)):
+        return Response({'ids': ['invalid']}, status=status.HTTP_400_BAD_REQUEST)
+    if kinds is not None and not (isinstance(kinds, list) and all(isinstance(k, str) for k in kinds)):
+        return Response({'kinds': ['invalid']}, status=status.HTTP_400_BAD_REQUEST)
+    changed = mark_read(request.user.id, ids=ids, kinds=kinds)
+    return Response({'read': changed, 'unread': unread_summary(request.user.id)}, status=status.HTTP_200_OK)
 
 
 @api_view(['GET', 'POST'])
@@ -2683,7 +2920,7 @@ def advice_annotations(request):
                 anchors = [a for a in anchors if str(a) not in {target, alias}]
                 extra['recently_changed_anchors'] = anchors
                 resume.extra_data = extra
-                resume.save(update_fields=['extra_data'])
+                resume.save(update_fields=['extra_data', 'updated_at'])
     except Exception:
         pass
     return Response(AnnotationSerializer(ann).data, status=status.HTTP_201_CREATED)
@@ -2723,7 +2960,7 @@ def advice_annotation_detail(request, annotation_id):
                     anchors = [a for a in anchors if str(a) not in {target, alias}]
                     extra['recently_changed_anchors'] = anchors
                     ann.resume.extra_data = extra
-                    ann.resume.save(update_fields=['extra_data'])
+                    ann.resume.save(update_fields=['extra_data', 'updated_at'])
             except Exception:
                 pass
             ann.delete()
@@ -2772,6 +3009,8 @@ def company_messages(request):
         qs = Message.objects.filter(subject=SUBJECT).filter(
             Q(sender=request.user, receiver=seeker) | Q(sender=seeker, receiver=request.user)
         ).order_by('created_at')
+        if is_sync_request(request):
+            return sync_response(request, qs, lambda rows: MessageSerializer(rows, many=True).data, seeker.id)
         return Response(MessageSerializer(qs, many=True).data)
 
     # POST: { user_id, content, scout_id?, application_id?, subject? }
@@ -2810,8 +3049,23 @@ def company_messages(request):
 # ユーザープロフィール公開API（新規追加）
 # ====================================================================
 
+def _user_profile_validators(request, user_id):
+    """ユーザー・公開設定・拡張情報・求職者プロフィールの updated_at と履歴書の max(updated_at)/件数"""
+    from django.db.models import Count, Max
+    rows = User.objects.filter(id=user_id).values(
+        'updated_at', 'privacy_settings__updated_at', 'profile_extension__updated_at', 'seeker_profile__updated_at',
+    ).annotate(resumes_latest=Max('resumes__updated_at'), resumes_count=Count('resumes'))[:1]
+    row = next(iter(rows), None)
+    if row is None:
+        return None
+    stamps = [v for k, v in row.items() if k != 'resumes_count' and v is not None]
+    return (user_id, *row.values()), max(stamps) if stamps else None
+
+
 @api_view(['GET', 'PATCH'])
 @permission_classes([AllowAny])
+@conditional_get(_user_profile_validators)
+@cached_response('user_profile', vary_on_user=True, scope=lambda request, user_id: user_id)
 def user_public_profile(request, user_id):
     """
     公開ユーザープロフィール取得・更新
@@ -3036,15 +3290,22 @@ def user_public_resumes(request, user_id):
             return Response([], status=status.HTTP_200_OK)
 
     if is_owner:
-        resumes_qs = Resume.objects.filter(user=user).order_by('-updated_at')
+        resumes_qs = Resume.objects.filter(user=user).order_by(*RESUME_LIST_ORDERING)
     else:
-        resumes_qs = Resume.objects.filter(user=user, is_active=True).order_by('-updated_at')
+        resumes_qs = Resume.objects.filter(user=user, is_active=True).order_by(*RESUME_LIST_ORDERING)
+    resumes_qs = optimize_queryset(resumes_qs, ResumeSerializer)
 
-    data = ResumeSerializer(resumes_qs, many=True).data
-    if not is_owner:
-        for r in data:
-            r.pop('user_email', None)
-    return Response(data, status=status.HTTP_200_OK)
+    def serialize(rows):
+        data = ResumeSerializer(rows, many=True).data
+        if not is_owner:
+            for r in data:
+                r.pop('user_email', None)
+        return data
+
+    paged = keyset_paginated_response(request, resumes_qs, serialize, ordering=RESUME_LIST_ORDERING)
+    if paged is not None:
+        return paged
+    return Response(serialize(resumes_qs), status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
@@ -3146,8 +3407,14 @@ def company_view_user_resumes(request, user_id):
     return Response(sanitized, status=status.HTTP_200_OK)
 
 
+def _seeker_profile_validators(request):
+    row = SeekerProfile.objects.filter(user_id=request.user.pk).values_list('id', 'updated_at').first()
+    return (row, row[1]) if row is not None else None
+
+
 @api_view(['GET', 'PUT'])
 @permission_classes([IsAuthenticated])
+@conditional_get(_seeker_profile_validators)
 def seeker_profile_detail(request):
     """
     求職者プロフィール取得・更新
@@ -3191,7 +3458,11 @@ def seeker_resumes_list(request):
     if request.user.role != 'user':
         return Response({'error': 'This endpoint is for seekers only'}, status=status.HTTP_403_FORBIDDEN)
     
-    resumes = Resume.objects.filter(user=request.user).order_by('-updated_at')
+    resumes = optimize_queryset(Resume.objects.filter(user=request.user).order_by(*RESUME_LIST_ORDERING), ResumeSerializer)
+    paged = keyset_paginated_response(request, resumes, lambda rows: ResumeSerializer(rows, many=True).data,
+                                      ordering=RESUME_LIST_ORDERING)
+    if paged is not None:
+        return paged
     serializer = ResumeSerializer(resumes, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -3206,7 +3477,11 @@ def seeker_scouts_list(request):
     if request.user.role != 'user':
         return Response({'error': 'This endpoint is for seekers only'}, status=status.HTTP_403_FORBIDDEN)
     
-    scouts = Scout.objects.filter(seeker=request.user).order_by('-scouted_at')
+    scouts = optimize_queryset(Scout.objects.filter(seeker=request.user).order_by('-scouted_at'), ScoutSerializer)
+    paged = keyset_paginated_response(request, scouts, lambda rows: ScoutSerializer(rows, many=True).data,
+                                      ordering=('-scouted_at', '-id'))
+    if paged is not None:
+        return paged
     serializer = ScoutSerializer(scouts, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -3221,7 +3496,12 @@ def seeker_applications_list(request):
     if request.user.role != 'user':
         return Response({'error': 'This endpoint is for seekers only'}, status=status.HTTP_403_FORBIDDEN)
     
-    applications = Application.objects.filter(applicant=request.user).order_by('-applied_at')
+    applications = optimize_queryset(Application.objects.filter(applicant=request.user).order_by('-applied_at'),
+                                     ApplicationSerializer)
+    paged = keyset_paginated_response(request, applications, lambda rows: ApplicationSerializer(rows, many=True).data,
+                                      ordering=('-applied_at', '-id'))
+    if paged is not None:
+        return paged
     serializer = ApplicationSerializer(applications, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -3259,7 +3539,10 @@ def seeker_messages_list(request):
     if request.user.role != 'user':
         return Response({'error': 'This endpoint is for seekers only'}, status=status.HTTP_403_FORBIDDEN)
     
-    messages = Message.objects.filter(receiver=request.user).order_by('-created_at')
+    messages = optimize_queryset(Message.objects.filter(receiver=request.user).order_by('-created_at'), MessageSerializer)
+    paged = keyset_paginated_response(request, messages, lambda rows: MessageSerializer(rows, many=True).data)
+    if paged is not None:
+        return paged
     serializer = MessageSerializer(messages, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -3278,11 +3561,13 @@ def company_dashboard(request):
     if request.user.role != 'company':
         return Response({'error': 'This endpoint is for companies only'}, status=status.HTTP_403_FORBIDDEN)
     
+    from .user_stats import get_user_stats
+    counters = get_user_stats(request.user)
     stats = {
-        'applications_received': Application.objects.filter(company=request.user).count(),
-        'scouts_sent': Scout.objects.filter(company=request.user).count(),
-        'pending_applications': Application.objects.filter(company=request.user, status='pending').count(),
-        'active_scouts': Scout.objects.filter(company=request.user, status='sent').count(),
+        'applications_received': counters.applications_received_count,
+        'scouts_sent': counters.scouts_sent_count,
+        'pending_applications': counters.pending_applications_count,
+        'active_scouts': counters.active_scouts_count,
         'recent_applications': ApplicationSerializer(
             Application.objects.filter(company=request.user).order_by('-applied_at')[:5],
             many=True
@@ -3403,7 +3688,10 @@ def company_jobs_list(request):
     if request.user.role != 'company':
         return Response({'error': 'This endpoint is for companies only'}, status=status.HTTP_403_FORBIDDEN)
 
-    jobs = JobPosting.objects.filter(company=request.user).order_by('-created_at')
+    jobs = optimize_queryset(JobPosting.objects.filter(company=request.user).order_by('-created_at'), JobPostingSerializer)
+    paged = keyset_paginated_response(request, jobs, lambda rows: JobPostingSerializer(rows, many=True).data)
+    if paged is not None:
+        return paged
     serializer = JobPostingSerializer(jobs, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -3412,20 +3700,46 @@ def company_jobs_list(request):
 # 公開求人一覧/詳細（未ログインでも閲覧可）
 # ============================================================================
 
+def _jobs_public_list_validators(request):
+    """公開求人の max(updated_at)・件数と、表示する企業名のプロフィール max(updated_at)"""
+    from django.db.models import Count, Max
+    agg = JobPosting.objects.filter(is_active=True).aggregate(
+        latest=Max('updated_at'), count=Count('id'), company_latest=Max('company__company_profile__updated_at'),
+    )
+    stamps = [v for v in (agg['latest'], agg['company_latest']) if v is not None]
+    return ('jobs', agg['latest'], agg['count'], agg['company_latest']), max(stamps) if stamps else None
+
+
+def _jobs_public_detail_validators(request, job_id):
+    row = JobPosting.objects.filter(id=job_id, is_active=True).values_list(
+        'updated_at', 'company__company_profile__updated_at',
+    ).first()
+    if row is None:
+        return None
+    return (job_id, *row), max(v for v in row if v is not None)
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@conditional_get(_jobs_public_list_validators)
+@cached_response('jobs_public', timeout=120)
 def jobs_public_list(request):
     """
     公開求人一覧
     GET /api/v2/jobs/
     """
-    qs = JobPosting.objects.filter(is_active=True).order_by('-created_at')
+    qs = optimize_queryset(JobPosting.objects.filter(is_active=True).order_by('-created_at'), JobPostingSerializer)
+    paged = keyset_paginated_response(request, qs, lambda rows: JobPostingSerializer(rows, many=True).data)
+    if paged is not None:
+        return paged
     data = JobPostingSerializer(qs, many=True).data
     return Response(data, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@conditional_get(_jobs_public_detail_validators)
+@cached_response('jobs_public', timeout=120)
 def jobs_public_detail(request, job_id):
     """
     公開求人詳細
@@ -3449,7 +3763,11 @@ def company_scouts_list(request):
     if request.user.role != 'company':
         return Response({'error': 'This endpoint is for companies only'}, status=status.HTTP_403_FORBIDDEN)
     
-    scouts = Scout.objects.filter(company=request.user).order_by('-scouted_at')
+    scouts = optimize_queryset(Scout.objects.filter(company=request.user).order_by('-scouted_at'), ScoutSerializer)
+    paged = keyset_paginated_response(request, scouts, lambda rows: ScoutSerializer(rows, many=True).data,
+                                      ordering=('-scouted_at', '-id'))
+    if paged is not None:
+        return paged
     serializer = ScoutSerializer(scouts, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -3464,7 +3782,12 @@ def company_applications_list(request):
     if request.user.role != 'company':
         return Response({'error': 'This endpoint is for companies only'}, status=status.HTTP_403_FORBIDDEN)
     
-    applications = Application.objects.filter(company=request.user).order_by('-applied_at')
+    applications = optimize_queryset(Application.objects.filter(company=request.user).order_by('-applied_at'),
+                                     ApplicationSerializer)
+    paged = keyset_paginated_response(request, applications, lambda rows: ApplicationSerializer(rows, many=True).data,
+                                      ordering=('-applied_at', '-id'))
+    if paged is not None:
+        return paged
     serializer = ApplicationSerializer(applications, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -3494,6 +3817,7 @@ def company_monthly_current(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response('company_monthly', vary_on_user=True, scope=lambda request: request.user.pk)
 def company_monthly_list(request):
     """
     自社の月次ページ一覧
@@ -3502,12 +3826,25 @@ def company_monthly_list(request):
     if request.user.role != 'company':
         return Response({'error': 'This endpoint is for companies only'}, status=status.HTTP_403_FORBIDDEN)
     pages = CompanyMonthlyPage.objects.filter(company=request.user).order_by('-year', '-month')
+    # (company, year, month) は一意のため年月だけでキーになる
+    paged = keyset_paginated_response(request, pages, lambda rows: CompanyMonthlyPageSerializer(rows, many=True).data,
+                                      ordering=('-year', '-month'))
+    if paged is not None:
+        return paged
     serializer = CompanyMonthlyPageSerializer(pages, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+def _company_monthly_validators(request, year: int, month: int):
+    row = CompanyMonthlyPage.objects.filter(
+        company_id=request.user.pk, year=year, month=month,
+    ).values_list('id', 'updated_at').first()
+    return (row, row[1]) if row is not None else None
+
+
 @api_view(['GET', 'PUT'])
 @permission_classes([IsAuthenticated])
+@conditional_get(_company_monthly_validators)
 def company_monthly_detail(request, year: int, month: int):
     """
     指定年月の月次ページ取得・更新
@@ -3616,15 +3953,23 @@ def stripe_webhook(request):
     """
     Stripe Webhookエンドポイント。
 
+    署名を検証してイベントを StripeEvent に1行登録するだけで応答する（core.stripe_events）。
+    クレジット・プラン・求人チケットへの反映は別プロセスの
+    `python manage.py process_stripe_events --loop` が行う（Procfile の stripe_worker / start_workers.sh）。
+    STRIPE_EVENTS_PROCESS_INLINE=true ならコミット後にその場でも反映する。
+
     対応イベント:
       - checkout.session.completed: metadata.plan_type == 'credits100' の場合、スカウトクレジット +100。
+        standard / premium はプラン更新、job_tickets は求人チケットの追加。
 
     備考:
       - STRIPE_SECRET_KEY / STRIPE_WEBHOOK_SECRET が設定されている前提（Webhook Secret未設定時は検証をスキップし、ベストエフォートで処理）。
-      - 冪等性: ActivityLog に stripe_event_id を記録し、重複処理を抑止（best-effort）。
+      - 冪等性: event_id の一意制約で重複を弾く（同時に届いた再送も1件だけ登録される）。
     """
+    import hashlib
     import json
     from django.conf import settings as dj_settings
+    from .stripe_events import process_inline, record
     try:
         import stripe
     except Exception:
@@ -3639,114 +3984,27 @@ def stripe_webhook(request):
     # イベント検証
     try:
         if webhook_secret:
-            event = stripe.Webhook.construct_event(
+            stripe.Webhook.construct_event(
                 payload=payload, sig_header=sig_header, secret=webhook_secret
             )
-        else:
-            event = json.loads(payload.decode('utf-8'))
+        event = json.loads(payload.decode('utf-8'))
+        if not isinstance(event, dict):
+            raise ValueError('event must be an object')
     except Exception as e:
         return Response({'detail': f'webhook_error: {e}'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # 正規化
-    ev_type = getattr(event, 'type', None) or (event.get('type') if isinstance(event, dict) else None)
-    ev_id = getattr(event, 'id', None) or (event.get('id') if isinstance(event, dict) else None)
-    try:
-        data_object = event['data']['object'] if isinstance(event, dict) else event.data.object
-    except Exception:
-        data_object = None
+    # 正規化（id のないイベントは本文のハッシュで重複を判定する）
+    ev_type = str(event.get('type') or '')
+    ev_id = str(event.get('id') or '') or f"noid:{hashlib.sha256(payload).hexdigest()}"
 
-    # 冪等性チェック
     try:
-        if ev_id:
-            from .models import ActivityLog
-            if ActivityLog.objects.filter(details__stripe_event_id=ev_id).exists():
-                return Response({'detail': 'duplicate_event_ignored'}, status=status.HTTP_200_OK)
+        stripe_event, created = record(ev_id, ev_type, event)
     except Exception:
-        pass
-
-    # 追加クレジット/プラン/求人チケットの処理
-    if ev_type == 'checkout.session.completed' and isinstance(data_object, dict):
-        metadata = data_object.get('metadata') or {}
-        plan_type = str(metadata.get('plan_type') or '')
-        target_user_id = metadata.get('user_id')
-
-        # 1) 固定: credits100 -> スカウトクレジット+100
-        if plan_type == 'credits100' and target_user_id:
-            try:
-                user = User.objects.get(id=target_user_id)
-                user.scout_credits_total = int(user.scout_credits_total) + 100
-                user.save(update_fields=['scout_credits_total', 'updated_at'])
-                try:
-                    from .models import ActivityLog
-                    ActivityLog.objects.create(
-                        user=user,
-                        action='message',
-                        details={'stripe_event_id': ev_id or '', 'plan_type': plan_type, 'delta': 100}
-                    )
-                except Exception:
-                    pass
-            except User.DoesNotExist:
-                return Response({'detail': 'user_not_found'}, status=status.HTTP_200_OK)
-            except Exception:
-                return Response({'detail': 'update_failed'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        # 2) プラン（standard/premium）: 求職者・企業共通で当月末+30日などに設定
-        if plan_type in ('standard', 'premium') and target_user_id:
-            try:
-                user = User.objects.get(id=target_user_id)
-                user.plan_tier = plan_type
-                user.is_premium = True
-                user.premium_expiry = timezone.now() + datetime.timedelta(days=30)
-                user.save(update_fields=['plan_tier', 'is_premium', 'premium_expiry', 'updated_at'])
-                try:
-                    from .models import ActivityLog
-                    ActivityLog.objects.create(
-                        user=user,
-                        action='message',
-                        details={'stripe_event_id': ev_id or '', 'plan_type': plan_type}
-                    )
-                except Exception:
-                    pass
-            except User.DoesNotExist:
-                return Response({'detail': 'user_not_found'}, status=status.HTTP_200_OK)
-            except Exception:
-                return Response({'detail': 'update_failed'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        # 3) 求人チケット購入（metadata: job_id, tickets_add）
-        if plan_type == 'job_tickets':
-            job_id = metadata.get('job_id')
-            tickets_add = metadata.get('tickets_add')
-            try:
-                tickets_add = int(tickets_add)
-                if tickets_add <= 0:
-                    tickets_add = None
-            except Exception:
-                tickets_add = None
-            if job_id and tickets_add:
-                try:
-                    job = JobPosting.objects.get(id=job_id)
-                except JobPosting.DoesNotExist:
-                    job = None
-                try:
-                    user = User.objects.get(id=target_user_id) if target_user_id else None
-                except User.DoesNotExist:
-                    user = None
-                # 所有者チェック（ベストエフォート）
-                if job is not None and user is not None and str(job.company_id) == str(user.id):
-                    try:
-                        ledger, _ = JobTicketLedger.objects.get_or_create(job_posting=job)
-                        ledger.tickets_total = int(ledger.tickets_total or 0) + int(tickets_add)
-                        ledger.save(update_fields=['tickets_total', 'updated_at'])
-                        try:
-                            from .models import ActivityLog
-                            ActivityLog.objects.create(
-                                user=user,
-                                action='message',
-                                details={'stripe_event_id': ev_id or '', 'plan_type': plan_type, 'job_id': str(job.id), 'delta': tickets_add}
-                            )
-                        except Exception:
-                            pass
-                    except Exception:
-                        return Response({'detail': 'update_failed'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
+        # 登録できなければ Stripe に再送させる
+        return Response({'detail': 'enqueue_failed'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    if not created:
+        return Response({'detail': 'duplicate_event_ignored'}, status=status.HTTP_200_OK)
+    if getattr(dj_settings, 'STRIPE_EVENTS_PROCESS_INLINE', False):
+        # ワーカーを動かせない環境向け: コミット後にその場で反映する
+        process_inline(stripe_event.pk)
     return Response({'status': 'ok'}, status=status.HTTP_200_OK)
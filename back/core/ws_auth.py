@@ -0,0 +1,91 @@
+"""
+WebSocket（ASGI）用のトークン認証ミドルウェア
+
+接続時に1回だけトークンからユーザーを解決し scope['user'] に入れる。
+コンシューマーは接続中このユーザーを使い回す（メッセージごとに User を取得しない）。
+
+トークンの渡し方（ブラウザの WebSocket は任意ヘッダーを付けられないため複数に対応）:
+    - クエリ文字列: ws/notifications/?token=<token>
+    - サブプロトコル: new WebSocket(url, ['bearer', '<token>'])（accept 時に 'bearer' を返す）
+    - Authorization ヘッダー: 'Bearer <jwt>' / 'Token <key>'（ブラウザ以外のクライアント）
+トークンは JWT（views_api_v2.generate_jwt_token）または DRF Token のキー。
+トークンがなければセッション（AuthMiddlewareStack）のユーザーをそのまま使う。
+"""
+import logging
+from typing import Optional, Tuple
+from urllib.parse import parse_qs
+
+import jwt
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+
+from .authentication import JWT_ALGORITHM, JWT_SECRET
+
+logger = logging.getLogger(__name__)
+
+BEARER_SUBPROTOCOL = 'bearer'
+
+
+def extract_token(scope) -> Tuple[Optional[str], Optional[str]]:
+    """(トークン, accept 時に返すサブプロトコル) を返す"""
+    query = parse_qs((scope.get('query_string') or b'').decode('latin-1'))
+    if query.get('token'):
+        return query['token'][0], None
+
+    subprotocols = list(scope.get('subprotocols') or [])
+    if BEARER_SUBPROTOCOL in subprotocols:
+        index = subprotocols.index(BEARER_SUBPROTOCOL)
+        if index + 1 < len(subprotocols):
+            return subprotocols[index + 1], BEARER_SUBPROTOCOL
+
+    for name, value in scope.get('headers') or []:
+        if name == b'authorization':
+            parts = value.decode('latin-1').split()
+            if len(parts) == 2 and parts[0].lower() in ('bearer', 'token'):
+                return parts[1], None
+    return None, None
+
+
+def resolve_token(token: str):
+    """トークンから (有効なユーザー or None, 失効時刻の UNIX 秒 or None) を返す"""
+    from rest_framework.authtoken.models import Token
+    from .models import User
+
+    if token.count('.') == 2:
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except jwt.InvalidTokenError:
+            return None, None
+        user_id = payload.get('user_id')
+        user = User.objects.filter(id=user_id, is_active=True).first() if user_id else None
+        return user, payload.get('exp')
+
+    row = Token.objects.select_related('user').filter(key=token).first()
+    if row is None or not row.user.is_active:
+        return None, None
+    return row.user, None
+
+
+class TokenAuthMiddleware(BaseMiddleware):
+    """トークンがあればそのユーザーで scope['user'] を上書きする（無効なトークンは匿名扱い）"""
+
+    async def __call__(self, scope, receive, send):
+        token, subprotocol = extract_token(scope)
+        if token:
+            scope = dict(scope)
+            try:
+                user, expires_at = await database_sync_to_async(resolve_token)(token)
+            except Exception as e:
+                logger.warning(f'WebSocket token resolution failed: {e}')
+                user, expires_at = None, None
+            scope['user'] = user or AnonymousUser()
+            scope['auth_expires_at'] = expires_at
+            scope['auth_subprotocol'] = subprotocol
+        return await super().__call__(scope, receive, send)
+
+
+def TokenAuthMiddlewareStack(inner):
+    """セッション認証（AuthMiddlewareStack）の内側でトークン認証を行う"""
+    return AuthMiddlewareStack(TokenAuthMiddleware(inner))
@@ -7,6 +7,9 @@ echo "PORT=${PORT:-8000}"
 export DJANGO_SETTINGS_MODULE=back.settings
 export PYTHONUNBUFFERED=1
 
+# Start background workers (email outbox などのキュー)
+./start_workers.sh
+
 # Start Gunicorn (WSGIは確実に動作する)
 exec gunicorn back.wsgi:application \
     --bind 0.0.0.0:${PORT:-8000} \
@@ -0,0 +1,30 @@
+#!/bin/bash
+# 非同期キューのワーカーを Web と同じコンテナ内でバックグラウンド起動する
+# （Dockerfile / railway の起動コマンドから呼ぶ。Procfile 構成では worker プロセスが同じ処理を行う）
+# ワーカーを別サービスで動かす場合は RUN_WORKERS=false を設定する
+# （その場合も PDF_CACHE_DIR は Web と共有のボリュームにする。共有しないとメール添付の PDF をワーカーが作り直す）
+
+if [ "${RUN_WORKERS:-true}" = "false" ]; then
+    echo "RUN_WORKERS=false: background workers are not started"
+    exit 0
+fi
+
+export DJANGO_SETTINGS_MODULE=${DJANGO_SETTINGS_MODULE:-back.settings}
+export PYTHONUNBUFFERED=1
+
+# 異常終了しても5秒後に起動し直す
+run_forever() {
+    while true; do
+        python manage.py "$@"
+        echo "worker '$1' exited with status $?, restarting in 5s" >&2
+        sleep 5
+    done
+}
+
+echo "Starting background workers..."
+# メール送信キュー（EmailOutbox）
+run_forever send_outbox_emails --loop &
+# Stripe Webhook イベント（StripeEvent）の反映
+run_forever process_stripe_events --loop &
+# マッチングのベクトル（保存で再計算待ちになった求職者・求人）の再計算
+run_forever build_matching_vectors --stale --loop &
@@ -7,6 +7,7 @@ import useAuthV2 from '@/hooks/useAuthV2';
 import StepNavigation from '../components/StepNavigation';
 import StepLayout from '../components/StepLayout';
 import { API_CONFIG, buildApiUrl } from '@/config/api';
+import { resolvePdfResponse } from '@/utils/resume-pdf';
 import toast from 'react-hot-toast';
 import Link from 'next/link';
 
@@ -43,7 +44,7 @@ export default function Step6DownloadPage() {
     setIsDownloading(true);
     
     try {
-      const response = await fetch(buildApiUrl('/resumes/download-pdf/'), {
+      const response = await resolvePdfResponse(await fetch(buildApiUrl('/resumes/download-pdf/'), {
         method: 'POST',
         headers: {
           ...getAuthHeaders(),
@@ -52,7 +53,7 @@ export default function Step6DownloadPage() {
         body: JSON.stringify({
           resumeData: formState.stepData,
         }),
-      });
+      }));
 
       if (response.ok) {
         // Get the blob from response
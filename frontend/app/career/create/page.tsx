@@ -5,6 +5,7 @@ import { useRouter, usePathname } from 'next/navigation';
 import toast from 'react-hot-toast';
 import { getAuthHeaders } from '@/utils/auth';
 import { buildApiUrl } from '@/config/api';
+import { resolvePdfResponse } from '@/utils/resume-pdf';
 
 interface WorkExperience {
   company: string;
@@ -293,14 +294,14 @@ export default function CreateResumePage() {
   const handleDownloadPdf = async () => {
     try {
       setDownloading(true);
-      const response = await fetch(buildApiUrl('/resumes/download-pdf/'), {
+      const response = await resolvePdfResponse(await fetch(buildApiUrl('/resumes/download-pdf/'), {
         method: 'POST',
         headers: {
           ...getAuthHeaders(),
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({ resumeData: buildPdfPayload() }),
-      });
+      }));
       if (!response.ok) {
         const t = await response.text();
         throw new Error(t?.slice(0, 160) || 'PDF生成に失敗しました');
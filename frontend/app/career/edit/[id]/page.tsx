@@ -6,6 +6,7 @@ import { useRouter, useParams, usePathname } from 'next/navigation';
 import toast from 'react-hot-toast';
 import { getAuthHeaders } from '@/utils/auth';
 import { buildApiUrl } from '@/config/api';
+import { resolvePdfResponse } from '@/utils/resume-pdf';
 
 interface WorkExperience {
   company: string;
@@ -808,14 +809,14 @@ case 4:
 
   const handleDownloadPdf = async () => {
     try {
-      const response = await fetch(buildApiUrl('/resumes/download-pdf/'), {
+      const response = await resolvePdfResponse(await fetch(buildApiUrl('/resumes/download-pdf/'), {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
           ...getAuthHeaders(),
         },
         body: JSON.stringify({ resumeData: buildPdfPayload() }),
-      });
+      }));
       if (!response.ok) {
         const err = await response.text();
         throw new Error(err?.slice(0,120) || 'PDF生成に失敗しました');
@@ -7,6 +7,7 @@ import { usePathname } from 'next/navigation';
 import useAuthV2 from '@/hooks/useAuthV2';
 import { getAuthHeaders } from '@/utils/auth';
 import { buildApiUrl } from '@/config/api';
+import { resolvePdfResponse } from '@/utils/resume-pdf';
 import toast from 'react-hot-toast';
 import { FaPlus, FaEdit, FaEye, FaPrint, FaTrash, FaClock, FaFileAlt, FaDownload, FaSpinner } from 'react-icons/fa';
 
@@ -143,14 +144,14 @@ export default function CareerPage() {
       }
       const detail = await detailResponse.json();
       const payload = buildResumeData(detail);
-      const pdfResponse = await fetch(buildApiUrl('/resumes/download-pdf/'), {
+      const pdfResponse = await resolvePdfResponse(await fetch(buildApiUrl('/resumes/download-pdf/'), {
         method: 'POST',
         headers: {
           ...getAuthHeaders(),
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({ resumeData: payload }),
-      });
+      }));
       if (!pdfResponse.ok) {
         const errText = await pdfResponse.text();
         throw new Error(`${pdfResponse.status} ${errText}`);
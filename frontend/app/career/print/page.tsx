@@ -8,6 +8,7 @@ import { FaPrint, FaDownload, FaEye, FaEdit, FaArrowLeft } from 'react-icons/fa'
 import '../print.css';
 import { getAuthHeaders } from '@/utils/auth';
 import { buildApiUrl } from '@/config/api';
+import { resolvePdfResponse } from '@/utils/resume-pdf';
 
 interface Resume {
   id: string;
@@ -167,14 +168,14 @@ export default function PrintPage() {
       return;
     }
     try {
-      const response = await fetch(buildApiUrl('/resumes/download-pdf/'), {
+      const response = await resolvePdfResponse(await fetch(buildApiUrl('/resumes/download-pdf/'), {
         method: 'POST',
         headers: {
           ...getAuthHeaders(),
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({ resumeData: buildResumeData(selectedResume) }),
-      });
+      }));
       if (!response.ok) {
         const errText = await response.text();
         throw new Error(`PDF生成に失敗しました: ${response.status} ${errText?.slice(0, 120)}`);
@@ -198,14 +199,14 @@ export default function PrintPage() {
   const handlePreview = async () => {
     if (!selectedResume) return;
     try {
-      const response = await fetch(buildApiUrl('/resumes/download-pdf/'), {
+      const response = await resolvePdfResponse(await fetch(buildApiUrl('/resumes/download-pdf/'), {
         method: 'POST',
         headers: {
           ...getAuthHeaders(),
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({ resumeData: buildResumeData(selectedResume) }),
-      });
+      }));
       if (!response.ok) {
         const errText = await response.text();
         throw new Error(`PDF生成に失敗しました: ${response.status} ${errText?.slice(0, 120)}`);
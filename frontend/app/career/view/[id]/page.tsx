@@ -6,6 +6,7 @@ import toast from 'react-hot-toast';
 import { FaEdit, FaDownload, FaPrint } from 'react-icons/fa';
 import { getAuthHeaders } from '@/utils/auth';
 import { buildApiUrl } from '@/config/api';
+import { resolvePdfResponse } from '@/utils/resume-pdf';
 
 export default function ViewResumePage() {
   const router = useRouter();
@@ -81,14 +82,14 @@ export default function ViewResumePage() {
         },
       };
 
-      const response = await fetch(buildApiUrl('/resumes/download-pdf/'), {
+      const response = await resolvePdfResponse(await fetch(buildApiUrl('/resumes/download-pdf/'), {
         method: 'POST',
         headers: {
           ...getAuthHeaders(),
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({ resumeData }),
-      });
+      }));
 
       if (!response.ok) {
         const t = await response.text();
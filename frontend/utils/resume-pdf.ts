@@ -0,0 +1,30 @@
+/**
+ * 履歴書PDFのダウンロード（download-pdf の 202 応答に対応）
+ *
+ * download-pdf はキャッシュ済みなら PDF を返し、未作成なら 202 + ジョブID を返してレンダリングを待たない。
+ * 202 の場合は download_url（作成中は 202、完了で PDF）をポーリングして PDF の Response を返す。
+ */
+
+const POLL_INTERVAL_MS = 1000;
+const POLL_TIMEOUT_MS = 120_000;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+export const resolvePdfResponse = async (response: Response): Promise<Response> => {
+  if (response.status !== 202) {
+    return response;
+  }
+  const job = await response.json();
+  if (!job?.download_url) {
+    throw new Error('PDF生成ジョブの情報を取得できませんでした');
+  }
+  const deadline = Date.now() + POLL_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    await sleep(POLL_INTERVAL_MS);
+    const result = await fetch(job.download_url);
+    if (result.status !== 202) {
+      return result;
+    }
+  }
+  throw new Error('PDF生成がタイムアウトしました');
+};